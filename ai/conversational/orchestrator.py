@@ -1,12 +1,331 @@
+import asyncio
+import time
 import traceback
-from typing import List, Dict, Any, Optional
-from ai.retrieval.orchestrator import retrieve_releveant_context
-from ai.generation.orchestrator import generate_response, summarise_query_from_chat_history
+from typing import List, Dict, Any, Callable, Iterator, NamedTuple, Optional
+from ai.event_loop import run_sync
+from ai.retrieval.orchestrator import aretrieve_releveant_context, retrieve_releveant_context
+from ai.retrieval.embeddings_helper import encode_queries, get_collection_fingerprint, get_sentence_transformer
+from ai.generation.orchestrator import (
+    agenerate_response,
+    asummarise_query_from_chat_history,
+    generate_response,
+    stream_generate_response,
+    summarise_query_from_chat_history
+)
+from ai.generation.token_counting import count_document_tokens
+from ai.conversational import semantic_cache, speculative_retrieval
+from ai.retrieval import rerank
 
+RETRIEVAL_TOP_K = 20
 
-def process_chat_history(
+
+class PipelineStages(NamedTuple):
+    """The summarise, retrieve and generate stages of a turn, as coroutine functions."""
+    summarise: Callable
+    retrieve: Callable
+    generate: Callable
+
+
+def async_stages():
+    """The async stages: LLM calls and retrieval are awaited on the running loop."""
+    return PipelineStages(
+        summarise=lambda chat_history: asummarise_query_from_chat_history(chat_history),
+        retrieve=lambda query, **kwargs: aretrieve_releveant_context(query, **kwargs),
+        generate=lambda **kwargs: agenerate_response(**kwargs)
+    )
+
+
+def sync_stages():
+    """
+    The synchronous stage functions, each run in a worker thread; used by the synchronous
+    entry points (process_chat_history, stream_chat_history).
+    """
+    return PipelineStages(
+        summarise=lambda chat_history: asyncio.to_thread(summarise_query_from_chat_history, chat_history),
+        retrieve=lambda query, **kwargs: asyncio.to_thread(retrieve_releveant_context, query, **kwargs),
+        generate=lambda **kwargs: asyncio.to_thread(generate_response, **kwargs)
+    )
+
+
+def lookup_semantic_cache(chat_history, summarised_query, enable_reasoning):
+    """
+    Check the semantic answer cache for a first-turn query.
+
+    Returns (cached_response or None, query_vector or None). The query vector is only set
+    when the conversation is cacheable, so the caller knows whether to store the answer.
+    """
+    if not semantic_cache.semantic_cache_enabled:
+        return None, None
+    # Later turns depend on the conversation so far, not only on the summarised query
+    if sum(1 for message in chat_history if message.get("role") == "user") != 1:
+        return None, None
+    try:
+        cache = semantic_cache.get_semantic_cache()
+        cache.check_collection(get_collection_fingerprint)
+        query_vector = encode_queries(get_sentence_transformer(), [summarised_query])[0]
+        hit = cache.lookup(query_vector, enable_reasoning=enable_reasoning)
+    except Exception:
+        traceback.print_exc()
+        return None, None
+    if hit is None:
+        return None, query_vector
+    response, similarity = hit
+    response["summarised_query"] = summarised_query
+    response["evaluations"] = dict(response.get("evaluations") or {}, cached=True, cache_similarity=similarity)
+    if not enable_reasoning:
+        response.pop("reasoning", None)
+    return response, query_vector
+
+
+def rerank_relevant_context(summarised_query, relevant_context):
+    """
+    Rerank the top RERANK_CANDIDATES retrieved items with the cross-encoder and keep the
+    best RERANK_TOP_K, within RERANK_BUDGET_MS.
+
+    Returns (relevant_context, rerank evaluations or None). On a timeout the dense order is
+    kept (still truncated); on an error the context is returned unchanged.
+    """
+    if not rerank.rerank_enabled or not relevant_context:
+        return relevant_context, None
+    tracker = rerank.get_rerank_stats_tracker()
+    try:
+        # Loaded outside the budget: only the first request pays for it
+        model = rerank.get_cross_encoder()
+        kept, info = rerank.rerank(
+            summarised_query,
+            relevant_context[:rerank.rerank_candidates],
+            model,
+            top_k=rerank.rerank_top_k,
+            budget_ms=rerank.rerank_budget_ms,
+            batch_size=rerank.rerank_batch_size
+        )
+    except Exception:
+        traceback.print_exc()
+        tracker.record_error()
+        return relevant_context, None
+    tokens_before = count_document_tokens(item["document"] for item in relevant_context)
+    tokens_after = count_document_tokens(item["document"] for item in kept)
+    tracker.record(info["rerank_ms"], info["timed_out"], tokens_before - tokens_after)
+    return kept, {
+        "rerank_ms": info["rerank_ms"],
+        "rerank_timed_out": info["timed_out"],
+        "documents_before_rerank": len(relevant_context),
+        "documents_after_rerank": len(kept),
+        "prompt_tokens_saved": tokens_before - tokens_after
+    }
+
+
+def validate_chat_history(chat_history):
+    if not isinstance(chat_history, list):
+        raise ValueError("chat_history must be a list of dicts")
+    for message in chat_history:
+        if not isinstance(message, dict) or 'role' not in message or 'content' not in message:
+            raise ValueError("Each message must be a dict with 'role' and 'content' keys")
+
+
+def no_user_message_response():
+    return {
+        "answer": "",
+        "reasoning": "No user message found in chat history.",
+        "relevant_documents": None,
+        "summarised_query": "",
+        "evaluations": None,
+        "success": False
+    }
+
+
+async def retrieve_context_failsafe(stages, query, query_filter=None):
+    """
+    The retrieve stage for the generation prompt; on error no documents and no similarity
+    statistics. Returns the 5-tuple of retrieve_releveant_context.
+    """
+    retrieve_kwargs = {"top_k": RETRIEVAL_TOP_K}
+    if query_filter is not None:
+        retrieve_kwargs["query_filter"] = query_filter
+    try:
+        return tuple(await stages.retrieve(query, **retrieve_kwargs))
+    except Exception:
+        return [], None, None, None, None
+
+
+async def timed_retrieval(stages, query, query_filter=None):
+    start = time.perf_counter()
+    retrieved = await retrieve_context_failsafe(stages, query, query_filter)
+    return retrieved, (time.perf_counter() - start) * 1000.0
+
+
+def start_speculative_retrieval(chat_history, query_filter=None, stages=None):
+    """
+    Start retrieving for the raw latest user message in the background while the query is
+    summarised. Returns (raw query, task of timed_retrieval) or None when not speculating.
+    """
+    if not speculative_retrieval.should_speculate(chat_history):
+        return None
+    raw_query = speculative_retrieval.latest_user_message(chat_history)
+    try:
+        task = asyncio.ensure_future(timed_retrieval(stages or async_stages(), raw_query, query_filter))
+    except Exception:
+        traceback.print_exc()
+        return None
+    return raw_query, task
+
+
+def cancel_speculation(speculation):
+    if speculation is not None:
+        speculation[1].cancel()
+
+
+def speculation_similarity(raw_query, summarised_query):
+    """Embedding similarity of the raw and summarised queries (failsafe: 0, i.e. never reuse)."""
+    if raw_query.strip().lower() == summarised_query.strip().lower():
+        return 1.0
+    try:
+        return speculative_retrieval.query_similarity(
+            encode_queries(get_sentence_transformer(), [raw_query, summarised_query])
+        )
+    except Exception:
+        traceback.print_exc()
+        return 0.0
+
+
+async def retrieve_with_timings(stages, summarised_query, query_filter=None, speculation=None):
+    """
+    Retrieve for the summarised query, resolving a speculative retrieval if one was started.
+
+    The speculative hits are reused as they are when the raw and summarised queries embed
+    within SPECULATIVE_REUSE_THRESHOLD of each other; otherwise the summarised query is
+    retrieved as well and both rankings are fused, keeping the summarised query's similarity
+    statistics. Returns (retrieve_releveant_context 5-tuple, stage timings for evaluations).
+    """
+    if speculation is None:
+        retrieved, retrieval_ms = await timed_retrieval(stages, summarised_query, query_filter)
+        return retrieved, {"retrieval_ms": retrieval_ms}
+
+    start = time.perf_counter()
+    raw_query, task = speculation
+    similarity = await asyncio.to_thread(speculation_similarity, raw_query, summarised_query)
+    wait_start = time.perf_counter()
+    try:
+        speculative, speculative_ms = await task
+    except Exception:
+        traceback.print_exc()
+        speculative, speculative_ms = ([], None, None, None, None), None
+    wait_ms = (time.perf_counter() - wait_start) * 1000.0
+
+    reused = speculative_ms is not None and similarity >= speculative_retrieval.speculative_reuse_threshold
+    second_retrieval_ms = None
+    if reused:
+        retrieved = speculative
+    else:
+        fresh, second_retrieval_ms = await timed_retrieval(stages, summarised_query, query_filter)
+        merged = speculative_retrieval.merge_relevant_context(fresh[0], speculative[0], RETRIEVAL_TOP_K)
+        retrieved = (merged,) + tuple(fresh[1:])
+    retrieval_ms = (time.perf_counter() - start) * 1000.0
+
+    # A sequential request would have paid one full retrieval after the summary
+    sequential_ms = second_retrieval_ms if second_retrieval_ms is not None else speculative_ms
+    return retrieved, {
+        "retrieval_ms": retrieval_ms,
+        "speculative_retrieval_ms": speculative_ms,
+        "speculation_wait_ms": wait_ms,
+        "second_retrieval_ms": second_retrieval_ms,
+        "speculative_reused": reused,
+        "speculation_similarity": similarity,
+        "critical_path_saved_ms": (sequential_ms - retrieval_ms) if sequential_ms is not None else None
+    }
+
+
+def generation_context(summarised_query, retrieved):
+    """
+    Rerank a retrieve_releveant_context 5-tuple into the generation context.
+
+    Returns (relevant_documents or None, similarity evaluations, rerank evaluations or None).
+    """
+    (
+        relevant_context, 
+        mean_inter_document_similarity, 
+        median_inter_document_similarity, 
+        mean_document_query_similarity, 
+        median_document_query_similarity
+    ) = retrieved
+
+    relevant_context, rerank_evaluations = rerank_relevant_context(summarised_query, relevant_context)
+    relevant_documents = [item["document"] for item in relevant_context] if relevant_context else None
+    similarity_evaluations = {
+        "mean_inter_document_similarity": mean_inter_document_similarity,
+        "median_inter_document_similarity": median_inter_document_similarity,
+        "mean_document_query_similarity": mean_document_query_similarity,
+        "median_document_query_similarity": median_document_query_similarity
+    }
+    return relevant_documents, similarity_evaluations, rerank_evaluations
+
+
+async def asummarise_and_retrieve(stages, chat_history, enable_reasoning, query_filter=None):
+    """
+    Summarise the query, check the semantic cache and retrieve the generation context, with
+    retrieval for the raw latest message overlapping summarisation when speculating. The
+    semantic cache and reranking block, so they run in a worker thread.
+
+    Returns (summarised_query, cached_response, cache_query_vector, retrieval context or None,
+    stage timings). The retrieval context is (relevant_documents, similarity evaluations,
+    rerank evaluations) and is None when there is no query or the cache answered.
+    """
+    speculation = start_speculative_retrieval(chat_history, query_filter, stages)
+    summarise_start = time.perf_counter()
+    # Summarise the query from chat history (failsafe: returns "" if not possible)
+    summarised_query = await stages.summarise(chat_history)
+    timings = {"summarise_ms": (time.perf_counter() - summarise_start) * 1000.0}
+    if not summarised_query:
+        cancel_speculation(speculation)
+        return summarised_query, None, None, None, timings
+
+    # Cached answers were grounded in unfiltered retrieval, so filtered requests neither read nor fill the cache
+    cached_response, cache_query_vector = (None, None) if query_filter is not None \
+        else await asyncio.to_thread(lookup_semantic_cache, chat_history, summarised_query, enable_reasoning)
+    if cached_response is not None:
+        cancel_speculation(speculation)
+        return summarised_query, cached_response, cache_query_vector, None, timings
+
+    retrieved, retrieval_timings = await retrieve_with_timings(stages, summarised_query, query_filter, speculation)
+    timings.update(retrieval_timings)
+    context = await asyncio.to_thread(generation_context, summarised_query, retrieved)
+    return summarised_query, None, cache_query_vector, context, timings
+
+
+def summarise_and_retrieve(chat_history, enable_reasoning, query_filter=None):
+    """Synchronous asummarise_and_retrieve over the synchronous stage functions (sync_stages)."""
+    return run_sync(asummarise_and_retrieve(sync_stages(), chat_history, enable_reasoning, query_filter))
+
+
+def finalise_response(response, relevant_documents, summarised_query, similarity_evaluations, rerank_evaluations,
+                      stage_timings=None):
+    response['relevant_documents'] = relevant_documents
+    response['summarised_query'] = summarised_query
+    response["evaluations"] = dict(similarity_evaluations, cached=False)
+    if rerank_evaluations:
+        response["evaluations"].update(rerank_evaluations)
+    if stage_timings:
+        response["evaluations"].update(stage_timings)
+    response["success"] = True
+    return response
+
+
+def generation_error_response(error, relevant_documents, summarised_query, similarity_evaluations):
+    return {
+        "answer": "An error occurred while generating the response!",
+        "reasoning": f"An error occurred while generating the response: {str(error)}",
+        "relevant_documents": relevant_documents,
+        "summarised_query": summarised_query,
+        "evaluations": dict(similarity_evaluations),
+        "success": False
+    }
+
+
+async def aprocess_chat_history(
     chat_history: List[Dict[str, str]], 
-    enable_reasoning: bool = False
+    enable_reasoning: bool = False,
+    query_filter: Optional[Any] = None,
+    stages: Optional[PipelineStages] = None
 ) -> Dict[str, Any]:
     """
     Processes chat history, retrieves relevant context, and generates a response.
@@ -14,6 +333,10 @@ def process_chat_history(
     Args:
         chat_history (List[Dict[str, str]]): List of messages, each a dict with 'role' and 'content' keys.
         enable_reasoning (bool, optional): Whether to enable reasoning in the response. Defaults to False.
+        query_filter (models.Filter, optional): Restricts retrieval to matching payloads, e.g.
+            brand_filter("amazon"). Filtered requests bypass the semantic answer cache.
+        stages (PipelineStages, optional): The summarise/retrieve/generate stages; by default
+            the async ones (async_stages), which keep the event loop free while they wait.
 
     Returns:
         Dict[str, Any]: A response dictionary containing:
@@ -24,73 +347,116 @@ def process_chat_history(
             - evaluations (Optional[Dict[str, float]]): Similarity evaluation metrics, if available.
             - success (bool): Whether the response was successfully generated.
     """
-    if not isinstance(chat_history, list):
-        raise ValueError("chat_history must be a list of dicts")
-    for message in chat_history:
-        if not isinstance(message, dict) or 'role' not in message or 'content' not in message:
-            raise ValueError("Each message must be a dict with 'role' and 'content' keys")
+    validate_chat_history(chat_history)
+    stages = stages or async_stages()
+    start = time.perf_counter()
 
-    # Summarise the query from chat history (failsafe: returns "" if not possible)
-    summarised_query = summarise_query_from_chat_history(chat_history)
+    summarised_query, cached_response, cache_query_vector, context, stage_timings = await asummarise_and_retrieve(
+        stages, chat_history, enable_reasoning, query_filter
+    )
     if not summarised_query:
-        return {
-            "answer": "",
-            "reasoning": "No user message found in chat history.",
-            "relevant_documents": None,
-            "summarised_query": "",
-            "evaluations": None,
-            "success": False
-        }
-
-    # Retrieve relevant context (failsafe: returns [] if not possible)
-    try:
-        (
-            relevant_context, 
-            mean_inter_document_similarity, 
-            median_inter_document_similarity, 
-            mean_document_query_similarity, 
-            median_document_query_similarity
-        ) = retrieve_releveant_context(summarised_query, top_k=20)
-    except Exception:
-        relevant_context = []
-        mean_inter_document_similarity = None
-        median_inter_document_similarity = None
-        mean_document_query_similarity = None
-        median_document_query_similarity = None
-
-    relevant_documents = [item["document"] for item in relevant_context] if relevant_context else None
+        return no_user_message_response()
+    if cached_response is not None:
+        return cached_response
+    relevant_documents, similarity_evaluations, rerank_evaluations = context
 
     # Generate the response (failsafe: returns default if error)
     try:
-        response = generate_response(
+        response = await stages.generate(
             chat_history=chat_history,
             relevant_documents=relevant_documents,
             summarised_query=summarised_query,
             enable_reasoning=enable_reasoning
         )
-        response['relevant_documents'] = relevant_documents
-        response['summarised_query'] = summarised_query
-        response["evaluations"] = {
-            "mean_inter_document_similarity": mean_inter_document_similarity,
-            "median_inter_document_similarity": median_inter_document_similarity,
-            "mean_document_query_similarity": mean_document_query_similarity,
-            "median_document_query_similarity": median_document_query_similarity
-        }
-        response["success"] = True
+        finalise_response(
+            response, relevant_documents, summarised_query, similarity_evaluations, rerank_evaluations, stage_timings
+        )
+        if cache_query_vector is not None:
+            # What a hit saves: a hit still pays for the summary
+            semantic_cache.get_semantic_cache().store(
+                cache_query_vector,
+                response,
+                has_reasoning=enable_reasoning,
+                latency_seconds=time.perf_counter() - start - stage_timings["summarise_ms"] / 1000.0
+            )
     except Exception as e:
-        response = {
-            "answer": "An error occurred while generating the response!",
-            "reasoning": f"An error occurred while generating the response: {str(e)}",
-            "relevant_documents": relevant_documents,
-            "summarised_query": summarised_query,
-            "evaluations": {
-                "mean_inter_document_similarity": mean_inter_document_similarity,
-                "median_inter_document_similarity": median_inter_document_similarity,
-                "mean_document_query_similarity": mean_document_query_similarity,
-                "median_document_query_similarity": median_document_query_similarity
-            },
-            "success": False
-        }
+        response = generation_error_response(e, relevant_documents, summarised_query, similarity_evaluations)
         traceback.print_exc()
 
     return response
+
+
+def process_chat_history(
+    chat_history: List[Dict[str, str]], 
+    enable_reasoning: bool = False,
+    query_filter: Optional[Any] = None
+) -> Dict[str, Any]:
+    """
+    Synchronous aprocess_chat_history over the synchronous stage functions (sync_stages), with
+    the same arguments and return value; it runs on the shared event loop (ai/event_loop.py).
+    """
+    return run_sync(aprocess_chat_history(chat_history, enable_reasoning, query_filter, stages=sync_stages()))
+
+
+def stream_chat_history(
+    chat_history: List[Dict[str, str]],
+    enable_reasoning: bool = False,
+    query_filter: Optional[Any] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of process_chat_history.
+
+    Yields {"event": "token", "text": <str>} as answer text is generated, then exactly one
+    {"event": "done", "response": <dict>} holding the process_chat_history response. Its
+    evaluations add "time_to_first_token_ms" (from the call to the first answer token) and
+    "generation_ms". A semantic cache hit is sent as a single token.
+    """
+    start = time.perf_counter()
+    validate_chat_history(chat_history)
+    summarised_query, cached_response, cache_query_vector, context, stage_timings = summarise_and_retrieve(
+        chat_history, enable_reasoning, query_filter
+    )
+    if not summarised_query:
+        yield {"event": "done", "response": no_user_message_response()}
+        return
+    if cached_response is not None:
+        if cached_response.get("answer"):
+            yield {"event": "token", "text": cached_response["answer"]}
+        cached_response["evaluations"]["time_to_first_token_ms"] = (time.perf_counter() - start) * 1000.0
+        yield {"event": "done", "response": cached_response}
+        return
+    relevant_documents, similarity_evaluations, rerank_evaluations = context
+
+    first_token_ms = None
+    response = None
+    try:
+        generation_start = time.perf_counter()
+        for event in stream_generate_response(
+            chat_history=chat_history,
+            relevant_documents=relevant_documents,
+            summarised_query=summarised_query,
+            enable_reasoning=enable_reasoning
+        ):
+            if event["event"] == "token":
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000.0
+                yield event
+            else:
+                response = event["response"]
+        response = finalise_response(
+            response, relevant_documents, summarised_query, similarity_evaluations, rerank_evaluations, stage_timings
+        )
+        response["evaluations"]["time_to_first_token_ms"] = first_token_ms
+        response["evaluations"]["generation_ms"] = (time.perf_counter() - generation_start) * 1000.0
+        if cache_query_vector is not None:
+            # What a hit saves: a hit still pays for the summary
+            semantic_cache.get_semantic_cache().store(
+                cache_query_vector,
+                response,
+                has_reasoning=enable_reasoning,
+                latency_seconds=time.perf_counter() - start - stage_timings["summarise_ms"] / 1000.0
+            )
+    except Exception as e:
+        response = generation_error_response(e, relevant_documents, summarised_query, similarity_evaluations)
+        traceback.print_exc()
+    yield {"event": "done", "response": response}
@@ -0,0 +1,160 @@
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ai.retrieval.embeddings_helper import QDRANT_COLLECTION, add_collection_write_listener
+from ai.retrieval.retrieval_statistics import normalize_rows
+
+semantic_cache_enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+semantic_cache_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+semantic_cache_ttl_seconds = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", 3600))
+semantic_cache_max_entries = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+semantic_cache_collection_check_seconds = float(os.getenv("SEMANTIC_CACHE_COLLECTION_CHECK_SECONDS", 60))
+
+_semantic_cache = None
+
+
+class SemanticResponseCache:
+    """
+    Answer cache keyed by the summarised-query embedding.
+
+    A lookup hits when the cosine similarity to a stored query is at least `threshold`, the
+    entry is younger than `ttl_seconds`, and it was generated with reasoning if reasoning is
+    requested. Entries are evicted least-recently-used beyond `max_entries`, and the whole
+    cache is dropped when a write path calls invalidate_collection, or when the polled
+    collection fingerprint changes (new, deleted or compacted points written elsewhere).
+    """
+
+    def __init__(self, threshold=0.95, ttl_seconds=3600.0, max_entries=5000, collection_check_seconds=60.0):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.collection_check_seconds = collection_check_seconds
+        self._entries = OrderedDict()  # id -> (unit vector, response, created_at, has_reasoning)
+        self._matrix = None
+        self._matrix_ids = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._collection_fingerprint = None
+        self._last_collection_check = 0.0
+        self._miss_latency_ewma = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.latency_saved_seconds = 0.0
+
+    def lookup(self, query_vector, enable_reasoning=True):
+        """
+        Returns (response, similarity) for the closest compatible entry, or None.
+        """
+        query = normalize_rows(query_vector)[0]
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_ids = list(self._entries.keys())
+                    self._matrix = np.vstack([self._entries[i][0] for i in self._matrix_ids])
+                similarities = self._matrix @ query
+                for position in np.argsort(-similarities):
+                    similarity = float(similarities[position])
+                    if similarity < self.threshold:
+                        break
+                    entry_id = self._matrix_ids[position]
+                    _, response, _, has_reasoning = self._entries[entry_id]
+                    if enable_reasoning and not has_reasoning:
+                        continue
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    if self._miss_latency_ewma is not None:
+                        self.latency_saved_seconds += self._miss_latency_ewma
+                    return copy.deepcopy(response), similarity
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, response, has_reasoning, latency_seconds=None):
+        """
+        Cache a generated response. `latency_seconds` is the retrieval + generation time the
+        miss cost, used to estimate the latency saved by later hits.
+        """
+        vector = normalize_rows(query_vector)[0]
+        with self._lock:
+            if latency_seconds is not None:
+                self._miss_latency_ewma = latency_seconds if self._miss_latency_ewma is None \
+                    else 0.9 * self._miss_latency_ewma + 0.1 * latency_seconds
+            self._entries[self._next_id] = (vector, copy.deepcopy(response), time.time(), has_reasoning)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def check_collection(self, fingerprint_fn):
+        """
+        Drop every entry if the collection fingerprint changed. `fingerprint_fn` is called
+        at most once per `collection_check_seconds`.
+        """
+        now = time.monotonic()
+        if now - self._last_collection_check < self.collection_check_seconds:
+            return
+        self._last_collection_check = now
+        fingerprint = fingerprint_fn()
+        with self._lock:
+            if self._collection_fingerprint is not None and fingerprint != self._collection_fingerprint:
+                self._clear()
+                self.invalidations += 1
+            self._collection_fingerprint = fingerprint
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._matrix = None
+
+    def _expire(self, now):
+        expired = [i for i, entry in self._entries.items() if now - entry[2] > self.ttl_seconds]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": semantic_cache_enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations,
+                "latency_saved_seconds": round(self.latency_saved_seconds, 3)
+            }
+
+
+def get_semantic_cache():
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticResponseCache(
+            threshold=semantic_cache_threshold,
+            ttl_seconds=semantic_cache_ttl_seconds,
+            max_entries=semantic_cache_max_entries,
+            collection_check_seconds=semantic_cache_collection_check_seconds
+        )
+        add_collection_write_listener(_invalidate_on_write)
+    return _semantic_cache
+
+
+def _invalidate_on_write(collection_name):
+    if collection_name == QDRANT_COLLECTION and _semantic_cache is not None:
+        _semantic_cache.invalidate()
+
+
+def get_semantic_cache_stats():
+    return get_semantic_cache().stats()
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+
+speculative_retrieval_enabled = os.getenv("SPECULATIVE_RETRIEVAL_ENABLED", "false").lower() == "true"
+speculative_reuse_threshold = float(os.getenv("SPECULATIVE_REUSE_THRESHOLD", 0.9))
+
+
+def should_speculate(chat_history):
+    """
+    Speculate only when summarisation is an LLM call (more than two messages, see
+    summarise_query_from_chat_history) and there is a user message to retrieve for.
+    """
+    return speculative_retrieval_enabled and len(chat_history) > 2 and latest_user_message(chat_history) is not None
+
+
+def latest_user_message(chat_history):
+    for message in reversed(chat_history):
+        if message.get("role") == "user" and str(message.get("content") or "").strip():
+            return message["content"].strip()
+    return None
+
+
+def query_similarity(query_vectors):
+    """Cosine similarity of two query embeddings (rows of `query_vectors`)."""
+    first, second = np.asarray(query_vectors, dtype=np.float32)[:2]
+    return float(first @ second / max(np.linalg.norm(first) * np.linalg.norm(second), 1e-12))
+
+
+def merge_relevant_context(primary, secondary, top_k, rrf_k=60):
+    """
+    Reciprocal-rank fusion of two relevant_context lists, keyed by the document. The primary
+    (summarised-query) item is kept when both lists hold a document, and wins ties; at most
+    `top_k` items.
+    """
+    fused, items = {}, {}
+    for ranking in (primary, secondary):
+        for rank, item in enumerate(ranking or [], start=1):
+            key = repr(item.get("document"))
+            fused[key] = fused.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            items.setdefault(key, item)
+    order = sorted(fused, key=lambda key: -fused[key])
+    return [items[key] for key in order[:top_k]]
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_shared_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Background event loop shared by the synchronous wrappers of the async retrieval and LLM
+    layers, so sync callers on any thread share one pooled async client per backend.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="shared-event-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def run_sync(coroutine):
+    """
+    Run `coroutine` on the shared event loop and block the calling thread until it finishes.
+    Raises RuntimeError when called from the shared loop itself, which would deadlock.
+    """
+    loop = get_shared_event_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("A synchronous wrapper was called on the shared event loop; await the async variant instead.")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+llm_cache_enabled = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+llm_cache_path = os.getenv("LLM_CACHE_PATH")  # unset disables the SQLite tier
+llm_cache_size = int(os.getenv("LLM_CACHE_SIZE", 1000))
+llm_cache_max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 100000))
+llm_cache_ttl_seconds = float(os.getenv("LLM_CACHE_TTL_SECONDS", 86400))
+# Sampled (temperature > 0) completions are not reproducible, so they bypass the cache unless set
+llm_cache_sampled = os.getenv("LLM_CACHE_SAMPLED", "false").lower() == "true"
+
+_PRUNE_EVERY = 256
+_llm_cache = None
+
+
+def make_llm_cache_key(provider, create_kwargs):
+    """
+    Content address of a chat completion request: sha256 of the provider and the canonical
+    JSON of its `chat.completions.create` arguments (model, messages, tools, temperature, ...).
+    """
+    payload = json.dumps({"provider": provider, **create_kwargs}, sort_keys=True, separators=(",", ":"),
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cacheable_response(response):
+    """The JSON-serialisable part of a generate_response_from_llm result (drops "raw")."""
+    return {key: value for key, value in response.items() if key != "raw"}
+
+
+class PersistentLLMCacheStore:
+    """
+    SQLite table of cached responses in WAL mode, so several workers can read while one
+    writes. Rows older than `ttl_seconds` are misses; every few hundred writes expired rows
+    are deleted and the oldest beyond `max_entries` are evicted.
+    """
+
+    def __init__(self, path, max_entries=100_000, ttl_seconds=86400.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)")
+            self._connection.commit()
+
+    def get(self, key):
+        """Returns (value JSON, created_at) or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return row
+
+    def put(self, key, value, created_at):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)", (key, value, created_at)
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                self._prune()
+            self._connection.commit()
+
+    def _prune(self):
+        self._connection.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._connection.execute(
+            "DELETE FROM llm_cache WHERE key IN "
+            "(SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        )
+
+    def prune(self):
+        with self._lock:
+            self._prune()
+            self._connection.commit()
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class LLMResponseCache:
+    """
+    Exact-match cache of LLM responses keyed by make_llm_cache_key.
+
+    Tier 1 is a bounded in-process LRU of JSON values; tier 2 is an optional
+    PersistentLLMCacheStore shared between workers and restarts. Entries expire after
+    `ttl_seconds` in both tiers. Hits return a fresh dict marked "cached": True.
+    """
+
+    def __init__(self, max_size=1000, persistent_path=None, max_entries=100_000, ttl_seconds=86400.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()  # key -> (value JSON, created_at)
+        self._persistent = PersistentLLMCacheStore(persistent_path, max_entries, ttl_seconds) \
+            if persistent_path else None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self._hit_seconds = 0.0
+
+    def get(self, key):
+        start = time.perf_counter()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self._hit_seconds += time.perf_counter() - start
+                return self._decode(entry[0])
+            if entry is not None:
+                del self._memory[key]
+        entry = self._persistent.get(key) if self._persistent is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, *entry)
+            self.persistent_hits += 1
+            self._hit_seconds += time.perf_counter() - start
+        return self._decode(entry[0])
+
+    def put(self, key, response):
+        value = json.dumps(cacheable_response(response), ensure_ascii=False)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, value, created_at)
+            self.stores += 1
+        if self._persistent is not None:
+            self._persistent.put(key, value, created_at)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    @staticmethod
+    def _decode(value):
+        return dict(json.loads(value), cached=True)
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.memory_hits = 0
+            self.persistent_hits = 0
+            self.misses = 0
+            self.bypassed = 0
+            self.stores = 0
+            self._hit_seconds = 0.0
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "mean_hit_us": self._hit_seconds / hits * 1e6 if hits else None,
+                "memory_size": len(self._memory),
+                "persistent_enabled": self._persistent is not None
+            }
+
+
+def get_llm_cache():
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache(
+            max_size=llm_cache_size,
+            persistent_path=llm_cache_path,
+            max_entries=llm_cache_max_entries,
+            ttl_seconds=llm_cache_ttl_seconds
+        )
+    return _llm_cache
+
+
+def get_llm_cache_stats():
+    return get_llm_cache().stats()
+
+
+def lookup_llm_cache(provider, create_kwargs, use_cache=None):
+    """
+    Returns (cache key or None, cached response or None) for a completion request.
+
+    The key is None when the request bypasses the cache: the cache is disabled, `use_cache`
+    is False, or the request samples (temperature > 0) and neither LLM_CACHE_SAMPLED nor
+    `use_cache=True` allow caching it.
+    """
+    if not llm_cache_enabled:
+        return None, None
+    cache = get_llm_cache()
+    if use_cache is None:
+        use_cache = llm_cache_sampled or not create_kwargs.get("temperature")
+    if not use_cache:
+        cache.record_bypass()
+        return None, None
+    key = make_llm_cache_key(provider, create_kwargs)
+    return key, cache.get(key)
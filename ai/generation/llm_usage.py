@@ -1,44 +1,356 @@
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
 from typing import Any, Dict, List, Optional, Union
+import asyncio
+import importlib.util
 import os
+import threading
+import time
+import weakref
 
+import httpx
+
+from ai.event_loop import run_sync
+from ai.generation.llm_cache import get_llm_cache, lookup_llm_cache
+
+llm_connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+llm_read_timeout = float(os.getenv("LLM_READ_TIMEOUT", 60))
+llm_max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+llm_max_keepalive_connections = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+llm_keepalive_seconds = float(os.getenv("LLM_KEEPALIVE_SECONDS", 30))
+llm_http2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+llm_max_retries = int(os.getenv("LLM_MAX_RETRIES", 2))
+llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+
+DEFAULT_MODELS = {"openai": "gpt-3.5-turbo", "groq": "mixtral-8x7b-32768"}
+
+# (provider, api_key) -> client; the async clients are bound to the event loop they were created on
 _LLM_CLIENTS = {}
+_ASYNC_LLM_CLIENTS = weakref.WeakKeyDictionary()
+_LLM_LIMITS = {}  # provider -> the one limit shared by completions and streams
+_llm_lock = threading.Lock()
 
-def get_llm_client(provider: str, api_key: Optional[str] = None, **kwargs) -> Any:
+
+def provider_max_concurrency(provider: str) -> int:
+    """In-flight LLM calls allowed per provider: LLM_MAX_CONCURRENCY_<PROVIDER>, else LLM_MAX_CONCURRENCY."""
+    return int(os.getenv(f"LLM_MAX_CONCURRENCY_{provider.upper()}", llm_max_concurrency))
+
+
+def llm_timeout() -> httpx.Timeout:
+    return httpx.Timeout(llm_read_timeout, connect=llm_connect_timeout)
+
+
+def create_llm_http_client(asynchronous: bool = False):
     """
-    Create or get an LLM client for the given provider.
-    Supported providers: 'openai', 'groq'
+    Long-lived pooled HTTP client for an LLM SDK client: keep-alive connections, explicit
+    connect/read timeouts and HTTP/2 when LLM_HTTP2 is set and the h2 package is installed.
     """
-    provider = provider.lower()
-    if provider in _LLM_CLIENTS:
-        return _LLM_CLIENTS[provider]
+    client_class = httpx.AsyncClient if asynchronous else httpx.Client
+    return client_class(
+        http2=llm_http2 and importlib.util.find_spec("h2") is not None,
+        timeout=llm_timeout(),
+        limits=httpx.Limits(
+            max_connections=llm_max_connections,
+            max_keepalive_connections=llm_max_keepalive_connections,
+            keepalive_expiry=llm_keepalive_seconds
+        )
+    )
+
 
+def _llm_client_classes(provider: str, api_key: Optional[str]):
+    """Returns the (sync, async) SDK client classes of a provider."""
     if provider == "openai":
         try:
             import openai
         except ImportError:
             raise ImportError("openai package is required for OpenAI provider.")
-        if api_key:
-            openai.api_key = api_key
-        client = openai
-    elif provider == "groq":
+        return openai.OpenAI, openai.AsyncOpenAI
+    if provider == "groq":
         try:
             import groq
         except ImportError:
             raise ImportError("groq package is required for Groq provider.")
         if not api_key:
             raise ValueError("api_key is required for Groq provider.")
-        client = groq.Client(api_key)
-    else:
+        return groq.Groq, groq.AsyncGroq
+    raise ValueError(f"Unsupported provider: {provider}")
+
+
+def get_llm_client(provider: str, api_key: Optional[str] = None, **kwargs) -> Any:
+    """
+    Create or get a pooled synchronous LLM client for the given provider and API key (used
+    by streams); it is thread-safe and shared by every request of the worker.
+    Supported providers: 'openai', 'groq'
+    """
+    provider = provider.lower()
+    key = (provider, api_key or None)
+    with _llm_lock:
+        if key not in _LLM_CLIENTS:
+            client_class, _ = _llm_client_classes(provider, api_key)
+            _LLM_CLIENTS[key] = client_class(
+                api_key=api_key or None,
+                http_client=create_llm_http_client(),
+                timeout=llm_timeout(),
+                max_retries=llm_max_retries
+            )
+        return _LLM_CLIENTS[key]
+
+
+def get_async_llm_client(provider: str, api_key: Optional[str] = None) -> Any:
+    """
+    Create or get a pooled async LLM client for the given provider and API key on the
+    running event loop (an httpx.AsyncClient cannot be shared across loops).
+    """
+    provider = provider.lower()
+    clients = _ASYNC_LLM_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    key = (provider, api_key or None)
+    if key not in clients:
+        _, client_class = _llm_client_classes(provider, api_key)
+        clients[key] = client_class(
+            api_key=api_key or None,
+            http_client=create_llm_http_client(asynchronous=True),
+            timeout=llm_timeout(),
+            max_retries=llm_max_retries
+        )
+    return clients[key]
+
+
+class ConcurrencyLimit:
+    """
+    A counting limit that threads (streams) and coroutines on any event loop (completions)
+    wait on together. Waiters are served in arrival order; a released slot is handed
+    directly to the next waiter.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiters = deque()  # threading.Event for threads, (loop, future) for coroutines
+
+    def _try_acquire(self, waiter):
+        """Take a free slot, or queue `waiter`; True when a slot was taken."""
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def acquire(self):
+        event = threading.Event()
+        if not self._try_acquire(event):
+            event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        if self._try_acquire(waiter):
+            return
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                handed_over = waiter not in self._waiters
+                if not handed_over:
+                    self._waiters.remove(waiter)
+            if handed_over:
+                self.release()  # the slot arrived as the wait was cancelled
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._in_use -= 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+
+def get_llm_limit(provider: str) -> ConcurrencyLimit:
+    """The provider's concurrency limit, shared by completions and streams on every thread and loop."""
+    provider = provider.lower()
+    with _llm_lock:
+        if provider not in _LLM_LIMITS:
+            _LLM_LIMITS[provider] = ConcurrencyLimit(provider_max_concurrency(provider))
+        return _LLM_LIMITS[provider]
+
+
+class LLMStatsTracker:
+    """Per-provider LLM call counters: calls, errors, in flight, waiting for a slot and latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _provider(self, provider):
+        return self._stats.setdefault(provider, {
+            "calls": 0, "errors": 0, "in_flight": 0, "waiting": 0, "queue_ms": 0.0, "call_ms": 0.0
+        })
+
+    def waiting(self, provider, delta):
+        with self._lock:
+            self._provider(provider)["waiting"] += delta
+
+    def started(self, provider, queue_ms):
+        with self._lock:
+            stats = self._provider(provider)
+            stats["in_flight"] += 1
+            stats["queue_ms"] += queue_ms
+
+    def finished(self, provider, call_ms, error=False):
+        with self._lock:
+            stats = self._provider(provider)
+            stats["in_flight"] -= 1
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["call_ms"] += call_ms
+
+    def stats(self):
+        with self._lock:
+            return {
+                provider: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "in_flight": stats["in_flight"],
+                    "waiting": stats["waiting"],
+                    "max_concurrency": provider_max_concurrency(provider),
+                    "mean_queue_ms": stats["queue_ms"] / stats["calls"] if stats["calls"] else None,
+                    "mean_call_ms": stats["call_ms"] / stats["calls"] if stats["calls"] else None
+                }
+                for provider, stats in self._stats.items()
+            }
+
+
+_llm_stats = LLMStatsTracker()
+
+
+def get_llm_stats():
+    return _llm_stats.stats()
+
+
+@contextmanager
+def llm_slot(provider: str):
+    """
+    Hold one of the provider's concurrency slots for a whole stream, and record it in the
+    LLM stats (waiting, in flight, queueing and call time, errors).
+    """
+    limit = get_llm_limit(provider)
+    queued = time.perf_counter()
+    _llm_stats.waiting(provider, 1)
+    try:
+        limit.acquire()
+    finally:
+        _llm_stats.waiting(provider, -1)
+    started = time.perf_counter()
+    _llm_stats.started(provider, (started - queued) * 1000.0)
+    error = True
+    try:
+        yield
+        error = False
+    except GeneratorExit:
+        error = False  # a stream closed early by its consumer
+        raise
+    finally:
+        limit.release()
+        _llm_stats.finished(provider, (time.perf_counter() - started) * 1000.0, error=error)
+
+
+@asynccontextmanager
+async def allm_slot(provider: str):
+    """Async counterpart of llm_slot for completions: the same limit and stats, awaited."""
+    limit = get_llm_limit(provider)
+    queued = time.perf_counter()
+    _llm_stats.waiting(provider, 1)
+    try:
+        await limit.aacquire()
+    finally:
+        _llm_stats.waiting(provider, -1)
+    started = time.perf_counter()
+    _llm_stats.started(provider, (started - queued) * 1000.0)
+    error = True
+    try:
+        yield
+        error = False
+    finally:
+        limit.release()
+        _llm_stats.finished(provider, (time.perf_counter() - started) * 1000.0, error=error)
+
+
+def build_chat_kwargs(
+    provider: str,
+    prompt: Optional[str],
+    model: Optional[str],
+    messages: Optional[List[Dict]],
+    temperature: float,
+    top_p: float,
+    tools: Optional[List[Dict]] = None,
+    function_call: Optional[Any] = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """`chat.completions.create` arguments; OpenAI and Groq share the OpenAI-compatible API."""
+    if provider not in DEFAULT_MODELS:
         raise ValueError(f"Unsupported provider: {provider}")
+    msgs = messages
+    if not msgs:
+        if prompt:
+            msgs = [{"role": "user", "content": prompt}]
+        else:
+            raise ValueError("Either messages or prompt must be provided.")
+    create_kwargs = {
+        "model": model or DEFAULT_MODELS[provider],
+        "messages": msgs,
+        "temperature": temperature,
+        "top_p": top_p,
+    }
+    if tools:
+        create_kwargs["tools"] = tools
+    if function_call:
+        create_kwargs["function_call"] = function_call
+    # Accept extra kwargs
+    create_kwargs.update({k: v for k, v in kwargs.items() if k not in create_kwargs})
+    return create_kwargs
 
-    _LLM_CLIENTS[provider] = client
-    return client
 
-def generate_response_from_llm(
+def parse_chat_response(response) -> Dict[str, Any]:
+    """
+    Normalise a chat completion into the generate_response_from_llm dict. Tool calls are
+    listed under "tool_calls" as {"id", "name", "arguments"} dicts next to the message content.
+    """
+    msg = response.choices[0].message
+    if getattr(msg, "function_call", None):
+        # Legacy function calling returns function_call as an object with name and arguments
+        return {
+            "type": "function_call",
+            "function_call": {
+                "name": getattr(msg.function_call, "name", None),
+                "arguments": getattr(msg.function_call, "arguments", None)
+            },
+            "raw": response
+        }
+    result = {
+        "type": "message",
+        "content": msg.content.strip() if msg.content else "",
+        "raw": response
+    }
+    tool_calls = getattr(msg, "tool_calls", None)
+    if tool_calls:
+        result["tool_calls"] = [{
+            "id": getattr(tool_call, "id", None),
+            "name": getattr(tool_call.function, "name", None),
+            "arguments": getattr(tool_call.function, "arguments", None)
+        } for tool_call in tool_calls]
+    return result
+
+
+async def agenerate_response_from_llm(
     provider: str,
     prompt: Optional[str] = None,
     api_key: Optional[str] = os.getenv('OPENAI_API_KEY', ''),
-    # api_key: Optional[str] = '',
     model: Optional[str] = None,
     messages: Optional[List[Dict]] = None,
     temperature: float = 0.7,
@@ -46,14 +358,15 @@ def generate_response_from_llm(
     tools: Optional[List[Dict]] = None,
     functions: Optional[List[Dict]] = None,  # for backward compatibility
     function_call: Optional[Any] = None,
+    use_cache: Optional[bool] = None,
     **kwargs
 ) -> Dict[str, Any]:
     """
-    Generate a response from the LLM, supporting multiple providers.
+    Generate a response from the LLM without blocking the event loop, supporting multiple providers.
 
     Args:
         provider: The LLM provider name ('openai', 'groq', etc.)
-        prompt: The input prompt string (for completion endpoints).
+        prompt: The input prompt string, sent as a single user message.
         api_key: API key for the provider.
         model: Model name to use (optional).
         messages: List of chat messages (for chat endpoints).
@@ -62,14 +375,18 @@ def generate_response_from_llm(
         tools: List of function/tool definitions for function calling (OpenAI/groq).
         functions: (Deprecated) Alias for tools.
         function_call: Function call control (OpenAI/groq).
+        use_cache: Force (True) or skip (False) the LLM response cache; by default only
+            temperature-0 calls use it (see ai/generation/llm_cache.py).
         kwargs: Additional parameters for the provider's API.
 
     Returns:
         Dict with the following keys:
             - "type": "message" or "function_call"
             - "content": The message content (if type == "message")
+            - "tool_calls": List of {"id", "name", "arguments"} (if the model called tools)
             - "function_call": Dict with function call details (if type == "function_call")
-            - "raw": The raw response object from the provider
+            - "raw": The raw response object from the provider (not on cache hits)
+            - "cached": True when served from the LLM response cache
 
     Response format details:
         - If the LLM returns a normal message, the return dict will be:
@@ -78,7 +395,8 @@ def generate_response_from_llm(
                 "content": <string>,
                 "raw": <raw response object>
             }
-        - If the LLM returns a function call (function/tool call), the return dict will be:
+          plus "tool_calls" when the model called tools; "arguments" is the JSON string.
+        - If the LLM returns a legacy function call, the return dict will be:
             {
                 "type": "function_call",
                 "function_call": {
@@ -87,128 +405,103 @@ def generate_response_from_llm(
                 },
                 "raw": <raw response object>
             }
-        - The "raw" key always contains the full provider response for further inspection.
+        - The "raw" key contains the full provider response for further inspection.
 
     Notes:
-        - For OpenAI, function calling is supported via the 'tools' or 'functions' parameter.
-        - For Groq, function calling is supported if the client and model support it.
+        - Calls share one pooled client per provider and API key on the running loop, and at
+          most LLM_MAX_CONCURRENCY(_<PROVIDER>) calls and streams are in flight per provider
+          (see allm_slot); the rest wait. Cache hits return before taking a slot.
         - If neither a message nor a function call is found, "content" will be an empty string.
     """
-    print(f"api_key: {api_key} {os.getenv('OPENAI_API_KEY','not found')}")  # Print the api_key as requested
+    provider = provider.lower()
+    # Prefer 'tools', fallback to 'functions' for backward compatibility
+    create_kwargs = build_chat_kwargs(
+        provider, prompt, model, messages, temperature, top_p,
+        tools=tools if tools is not None else functions, function_call=function_call, **kwargs
+    )
+    cache_key, cached = lookup_llm_cache(provider, create_kwargs, use_cache)
+    if cached is not None:
+        return cached
+    client = get_async_llm_client(provider, api_key=api_key)
+    async with allm_slot(provider):
+        response = await client.chat.completions.create(**create_kwargs)
+    result = parse_chat_response(response)
+    if cache_key is not None:
+        get_llm_cache().put(cache_key, result)
+    return result
+
+
+def generate_response_from_llm(
+    provider: str,
+    prompt: Optional[str] = None,
+    api_key: Optional[str] = os.getenv('OPENAI_API_KEY', ''),
+    # api_key: Optional[str] = '',
+    model: Optional[str] = None,
+    messages: Optional[List[Dict]] = None,
+    temperature: float = 0.7,
+    top_p: float = 1.0,
+    tools: Optional[List[Dict]] = None,
+    functions: Optional[List[Dict]] = None,  # for backward compatibility
+    function_call: Optional[Any] = None,
+    use_cache: Optional[bool] = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """
+    Synchronous wrapper of agenerate_response_from_llm, with the same arguments and return value.
+
+    The call runs on the shared background loop (ai/event_loop.py) and blocks only the calling
+    thread. Async code should await agenerate_response_from_llm instead.
+    """
+    return run_sync(agenerate_response_from_llm(
+        provider, prompt=prompt, api_key=api_key, model=model, messages=messages, temperature=temperature,
+        top_p=top_p, tools=tools, functions=functions, function_call=function_call, use_cache=use_cache, **kwargs
+    ))
+
+
+def stream_response_from_llm(
+    provider: str,
+    prompt: Optional[str] = None,
+    api_key: Optional[str] = os.getenv('OPENAI_API_KEY', ''),
+    model: Optional[str] = None,
+    messages: Optional[List[Dict]] = None,
+    temperature: float = 0.7,
+    top_p: float = 1.0,
+    tools: Optional[List[Dict]] = None,
+    **kwargs
+):
+    """
+    Stream a chat completion, yielding deltas as the provider sends them.
+
+    Takes the same arguments as generate_response_from_llm. Yields dicts:
+        - {"type": "content", "delta": <str>} for message text
+        - {"type": "tool_call", "index": <int>, "name": <str or None>, "delta": <str>} for
+          fragments of a tool call's JSON arguments (the name arrives with the first fragment)
+    Both OpenAI and Groq expose the OpenAI-compatible `chat.completions.create(stream=True)`.
+    Streams use the pooled client and hold one of the provider's concurrency slots (see
+    llm_slot) until they end.
+    """
+    provider = provider.lower()
+    create_kwargs = build_chat_kwargs(provider, prompt, model, messages, temperature, top_p, tools=tools,
+                                      stream=True, **kwargs)
     client = get_llm_client(provider, api_key=api_key)
+    with llm_slot(provider):
+        yield from _stream_deltas(client.chat.completions.create(**create_kwargs))
 
-    if provider.lower() == "openai":
-        # Prefer ChatCompletion with function calling if tools/functions provided
-        chat_completion = client.chat.completions
-        if chat_completion is None :
-            chat_completion = client.chat.completions
-        if chat_completion:
-            # Prepare messages
-            msgs = messages
-            if not msgs:
-                if prompt:
-                    msgs = [{"role": "user", "content": prompt}]
-                else:
-                    raise ValueError("Either messages or prompt must be provided.")
-            # Prefer 'tools', fallback to 'functions' for backward compatibility
-            tools_param = tools if tools is not None else functions
-            create_kwargs = {
-                "model": model or "gpt-3.5-turbo",
-                "messages": msgs,
-                "temperature": temperature,
-                "top_p": top_p,
-            }
-            if tools_param:
-                create_kwargs["tools"] = tools_param
-            if function_call:
-                create_kwargs["function_call"] = function_call
-            # Accept extra kwargs
-            create_kwargs.update({k: v for k, v in kwargs.items() if k not in create_kwargs})
-            response = chat_completion.create(**create_kwargs)
-            msg = response.choices[0].message
-            if hasattr(msg, "function_call") and msg.function_call:
-                # OpenAI returns function_call as an object with name and arguments
-                return {
-                    "type": "function_call",
-                    "function_call": {
-                        "name": getattr(msg.function_call, "name", None),
-                        "arguments": getattr(msg.function_call, "arguments", None)
-                    },
-                    "raw": response
-                }
-            return {
-                "type": "message",
-                "content": msg.content.strip() if msg.content else "",
-                "raw": response
-            }
-        else:
-            # OpenAI Completion API (legacy)
-            completion = client.chat.completions.create(
-                model=model or "text-davinci-003",
-                prompt=prompt,
-                temperature=temperature,
-                top_p=top_p,
-                **kwargs
-            )
-            return {
-                "type": "message",
-                "content": completion.choices[0].text.strip(),
-                "raw": completion
-            }
-    elif provider.lower() == "groq":
-        # Try to use function calling if supported
-        # Assume groq client has a .chat method with tools/function_call support
-        if hasattr(client, "chat"):
-            msgs = messages
-            if not msgs:
-                if prompt:
-                    msgs = [{"role": "user", "content": prompt}]
-                else:
-                    raise ValueError("Either messages or prompt must be provided.")
-            chat_kwargs = {
-                "model": model or "mixtral-8x7b-32768",
-                "messages": msgs,
-                "temperature": temperature,
-                "top_p": top_p,
-            }
-            # Try to pass tools/function_call if supported
-            if tools:
-                chat_kwargs["tools"] = tools
-            if function_call:
-                chat_kwargs["function_call"] = function_call
-            chat_kwargs.update({k: v for k, v in kwargs.items() if k not in chat_kwargs})
-            response = client.chat(**chat_kwargs)
-            msg = response.choices[0].message
-            if hasattr(msg, "function_call") and msg.function_call:
-                return {
-                    "type": "function_call",
-                    "function_call": {
-                        "name": getattr(msg.function_call, "name", None),
-                        "arguments": getattr(msg.function_call, "arguments", None)
-                    },
-                    "raw": response
-                }
-            return {
-                "type": "message",
-                "content": msg.content.strip() if msg.content else "",
-                "raw": response
-            }
-        elif hasattr(client, "complete"):
-            # Fallback to completion endpoint
-            completion = client.complete(
-                model=model or "mixtral-8x7b-32768",
-                prompt=prompt,
-                temperature=temperature,
-                top_p=top_p,
-                **kwargs
-            )
-            return {
-                "type": "message",
-                "content": completion.choices[0].text.strip(),
-                "raw": completion
-            }
-        else:
-            raise NotImplementedError("Groq client does not support chat or complete methods.")
-    else:
-        raise ValueError(f"Unsupported provider: {provider}")
 
+def _stream_deltas(chunks):
+    for chunk in chunks:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta is None:
+            continue
+        if getattr(delta, "content", None):
+            yield {"type": "content", "delta": delta.content}
+        for tool_call in getattr(delta, "tool_calls", None) or []:
+            function = getattr(tool_call, "function", None)
+            yield {
+                "type": "tool_call",
+                "index": getattr(tool_call, "index", 0) or 0,
+                "name": getattr(function, "name", None),
+                "delta": getattr(function, "arguments", None) or ""
+            }
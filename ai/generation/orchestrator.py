@@ -1,8 +1,17 @@
-from ai.generation.llm_usage import generate_response_from_llm 
-from ai.generation.query_response_generation import get_prompt_for_generation , get_user_query_and_reasoning_tool_definition , handle_llm_response
+from ai.event_loop import run_sync
+from ai.generation.llm_usage import agenerate_response_from_llm, stream_response_from_llm
+from ai.generation.query_response_generation import (
+    MessageAnswerStreamer,
+    StrippedTextStreamer,
+    ToolArgumentFieldStreamer,
+    build_generation_prompt,
+    get_user_query_and_reasoning_tool_definition,
+    handle_llm_response,
+)
+import json
 import os
 
-def generate_response(chat_history, relevant_documents=None, summarised_query=None, enable_reasoning=True):
+async def agenerate_response(chat_history, relevant_documents=None, summarised_query=None, enable_reasoning=True):
     """
     Accepts chat history, relevant documents, a summarised query, and an enable_reasoning flag. Returns a dictionary with answer, reasoning (optional).
 
@@ -29,16 +38,12 @@ def generate_response(chat_history, relevant_documents=None, summarised_query=No
             response.pop("reasoning", None)
         return response
 
-    # Compose the prompt for the LLM
-    prompt = get_prompt_for_generation(chat_history, relevant_documents, summarised_query)
-   
-    # Compose the reasoning instruction if enabled
-    if enable_reasoning:
-        prompt += "\n\nAlso, provide a step-by-step explanation of your reasoning for the answer."
+    # Compose the prompt for the LLM within the token budget, with the reasoning instruction if enabled
+    prompt, _ = build_generation_prompt(chat_history, relevant_documents, summarised_query, enable_reasoning)
 
     print(f"{prompt=}")
     # Call the LLM to generate the response
-    llm_response = generate_response_from_llm(
+    llm_response = await agenerate_response_from_llm(
         provider="openai",
         prompt=prompt,
         api_key=os.getenv('OPENAI_API_KEY'),
@@ -64,7 +69,74 @@ def generate_response(chat_history, relevant_documents=None, summarised_query=No
 
     return response
 
-def summarise_query_from_chat_history(chat_history):
+def generate_response(chat_history, relevant_documents=None, summarised_query=None, enable_reasoning=True):
+    """Synchronous wrapper of agenerate_response, with the same arguments and return value."""
+    return run_sync(agenerate_response(chat_history, relevant_documents, summarised_query, enable_reasoning))
+
+def stream_generate_response(chat_history, relevant_documents=None, summarised_query=None, enable_reasoning=True):
+    """
+    Streaming variant of generate_response.
+
+    Yields {"event": "token", "text": <str>} for each piece of the answer as the LLM writes it,
+    then one {"event": "done", "response": <dict>} with the same keys generate_response
+    returns. Tool-call arguments are parsed incrementally, so the "response" field streams
+    before "reasoning" is generated; a plain-message completion streams up to where
+    handle_llm_response cuts the answer. The final answer is the streamed text, stripped as
+    handle_llm_response strips it, so it always matches the token events.
+    """
+    if not chat_history or not isinstance(chat_history, list):
+        yield {"event": "done", "response": generate_response(
+            chat_history, relevant_documents, summarised_query, enable_reasoning
+        )}
+        return
+
+    prompt, _ = build_generation_prompt(chat_history, relevant_documents, summarised_query, enable_reasoning)
+
+    tool_streamer = ToolArgumentFieldStreamer("response")
+    message_streamer = MessageAnswerStreamer()
+    answer_streamer = StrippedTextStreamer()
+    content, arguments = [], []
+    for delta in stream_response_from_llm(
+        provider="openai",
+        prompt=prompt,
+        api_key=os.getenv('OPENAI_API_KEY'),
+        model="gpt-4.1",
+        tools=get_user_query_and_reasoning_tool_definition()
+    ):
+        if delta["type"] == "tool_call":
+            if delta["index"] != 0:
+                continue  # only the first tool call is used, as in handle_llm_response
+            arguments.append(delta["delta"])
+            text = tool_streamer.feed(delta["delta"])
+        else:
+            content.append(delta["delta"])
+            text = message_streamer.feed(delta["delta"])
+        text = answer_streamer.feed(text)
+        if text:
+            yield {"event": "token", "text": text}
+    if not arguments:
+        text = answer_streamer.feed(message_streamer.flush())
+        if text:
+            yield {"event": "token", "text": text}
+
+    if arguments:
+        try:
+            reasoning = json.loads("".join(arguments)).get("reasoning")
+        except (ValueError, AttributeError):
+            reasoning = None
+    else:
+        _, reasoning = handle_llm_response({"type": "message", "content": "".join(content)})
+
+    response = {
+        "answer": answer_streamer.text,
+        "relevant_documents": relevant_documents,
+        "summarised_query": summarised_query
+    }
+    if enable_reasoning:
+        response["reasoning"] = reasoning
+    yield {"event": "done", "response": response}
+
+async def asummarise_query_from_chat_history(chat_history):
     """
     Summarises the user's query from the chat history.
 
@@ -77,9 +149,13 @@ def summarise_query_from_chat_history(chat_history):
     if not chat_history or not isinstance(chat_history, list):
         return ""
     if len(chat_history) > 2:
-        from ai.generation.summarized_query_generation import summarise_query_from_chat_history as summarise_query_llm
-        return summarise_query_llm(chat_history)
+        from ai.generation.summarized_query_generation import asummarise_query_from_chat_history as summarise_query_llm
+        return await summarise_query_llm(chat_history)
     for message in reversed(chat_history):
         if message.get("role") == "user":
             return message.get("content", "")
     return ""
+
+def summarise_query_from_chat_history(chat_history):
+    """Synchronous wrapper of asummarise_query_from_chat_history."""
+    return run_sync(asummarise_query_from_chat_history(chat_history))
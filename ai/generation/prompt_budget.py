@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+
+from ai.generation.token_counting import count_tokens, render_document, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+prompt_token_budget = int(os.getenv("PROMPT_TOKEN_BUDGET", 6000))
+prompt_document_share = float(os.getenv("PROMPT_DOCUMENT_SHARE", 0.6))
+prompt_max_document_tokens = int(os.getenv("PROMPT_MAX_DOCUMENT_TOKENS", 400))
+prompt_min_document_tokens = int(os.getenv("PROMPT_MIN_DOCUMENT_TOKENS", 32))
+summary_prompt_token_budget = int(os.getenv("SUMMARY_PROMPT_TOKEN_BUDGET", 2000))
+
+_ELLIPSIS = " …"
+_prompt_budget_stats = None
+
+
+def line_tokens(line):
+    """Tokens of one prompt line, counting its newline so the parts never undercount the prompt."""
+    return count_tokens(f"{line}\n")
+
+
+def truncate_document(document, max_tokens):
+    """
+    Render a document within `max_tokens`, shortening the answer of a QnA dict (the question
+    is kept whole) or the whole line otherwise. Returns None when it cannot fit.
+    """
+    if isinstance(document, dict) and "question" in document and "answer" in document:
+        base = line_tokens(render_document(dict(document, answer=_ELLIPSIS)))
+        answer = truncate_to_tokens(document["answer"], max_tokens - base)
+        line = render_document(dict(document, answer=answer + _ELLIPSIS)) if answer else None
+    else:
+        line = truncate_to_tokens(render_document(document), max_tokens - line_tokens(_ELLIPSIS)) + _ELLIPSIS
+    if line is None or line_tokens(line) > max_tokens:
+        return None
+    return line
+
+
+def fit_documents(documents, budget, max_document_tokens=None, min_document_tokens=None):
+    """
+    Fill `budget` with retrieved documents best-first (in the given order). Documents longer
+    than `max_document_tokens`, or than the budget left, are truncated while at least
+    `min_document_tokens` remain; otherwise they are left out.
+
+    Returns (prompt lines, section report).
+    """
+    max_document_tokens = prompt_max_document_tokens if max_document_tokens is None else max_document_tokens
+    min_document_tokens = prompt_min_document_tokens if min_document_tokens is None else min_document_tokens
+    lines, used, needed, truncated = [], 0, 0, 0
+    for document in documents or []:
+        line = render_document(document)
+        tokens = line_tokens(line)
+        needed += tokens
+        limit = min(max_document_tokens, budget - used)
+        if tokens > limit:
+            line = truncate_document(document, limit) if limit >= min_document_tokens else None
+            if line is None:
+                continue
+            tokens = line_tokens(line)
+            truncated += 1
+        lines.append(line)
+        used += tokens
+    return lines, {
+        "used": used,
+        "dropped": needed - used,
+        "kept": len(lines),
+        "omitted": len(documents or []) - len(lines),
+        "truncated": truncated
+    }
+
+
+def history_lines(chat_history):
+    return [f"{message.get('role', 'user').capitalize()}: {message.get('content', '')}" for message in chat_history or []]
+
+
+def fit_history(chat_history, budget):
+    """
+    Keep the most recent messages that fit in `budget`, in their original order. The latest
+    message is always kept, truncated if it alone exceeds the budget.
+
+    Returns (prompt lines, section report).
+    """
+    lines = history_lines(chat_history)
+    needed = sum(line_tokens(line) for line in lines)
+    kept, used = [], 0
+    for position, line in enumerate(reversed(lines)):
+        tokens = line_tokens(line)
+        if used + tokens > budget:
+            if position > 0:
+                break
+            line = truncate_to_tokens(line, max(budget - line_tokens(_ELLIPSIS), 1)) + _ELLIPSIS
+            tokens = line_tokens(line)
+        kept.append(line)
+        used += tokens
+    kept.reverse()
+    return kept, {"used": used, "dropped": max(needed - used, 0), "kept": len(kept), "omitted": len(lines) - len(kept)}
+
+
+def fixed_section_report(text):
+    return {"used": count_tokens(text), "dropped": 0}
+
+
+def allocate_budget(budget, fixed_tokens, documents, chat_history, document_share=None):
+    """
+    Split what `fixed_tokens` leave of `budget` between documents and history. Documents are
+    guaranteed up to `document_share` of it and history the rest; whatever one section does
+    not need goes to the other. Returns (document budget, history budget).
+    """
+    document_share = prompt_document_share if document_share is None else document_share
+    remaining = max(budget - fixed_tokens, 0)
+    documents_needed = sum(min(line_tokens(render_document(doc)), prompt_max_document_tokens) for doc in documents or [])
+    history_needed = sum(line_tokens(line) for line in history_lines(chat_history))
+    reserved = min(documents_needed, int(remaining * document_share))
+    history_budget = min(history_needed, remaining - reserved)
+    return remaining - history_budget, history_budget
+
+
+def budget_report(kind, budget, sections, prompt):
+    """Report of a budgeted prompt; recorded in the prompt budget stats and logged when anything was dropped."""
+    report = {"budget": budget, "prompt_tokens": count_tokens(prompt), "sections": sections}
+    get_prompt_budget_stats_tracker().record(kind, report)
+    dropped = {name: section["dropped"] for name, section in sections.items() if section["dropped"]}
+    if dropped:
+        logger.info("%s prompt: %d tokens of a %d budget; dropped tokens per section: %s",
+                    kind, report["prompt_tokens"], budget, dropped)
+    return report
+
+
+class PromptBudgetStats:
+    """Budgeted prompts per kind, how many dropped anything, and tokens used / dropped per section."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds = {}
+
+    def record(self, kind, report):
+        with self._lock:
+            stats = self._kinds.setdefault(kind, {"prompts": 0, "trimmed_prompts": 0, "sections": {}})
+            stats["prompts"] += 1
+            stats["trimmed_prompts"] += int(any(section["dropped"] for section in report["sections"].values()))
+            for name, section in report["sections"].items():
+                totals = stats["sections"].setdefault(name, {"used": 0, "dropped": 0})
+                totals["used"] += section["used"]
+                totals["dropped"] += section["dropped"]
+
+    def stats(self):
+        with self._lock:
+            return {
+                kind: {
+                    "prompts": stats["prompts"],
+                    "trimmed_prompts": stats["trimmed_prompts"],
+                    "sections": {
+                        name: {
+                            "mean_used": totals["used"] / stats["prompts"],
+                            "mean_dropped": totals["dropped"] / stats["prompts"]
+                        }
+                        for name, totals in stats["sections"].items()
+                    }
+                }
+                for kind, stats in self._kinds.items()
+            }
+
+
+def get_prompt_budget_stats_tracker():
+    global _prompt_budget_stats
+    if _prompt_budget_stats is None:
+        _prompt_budget_stats = PromptBudgetStats()
+    return _prompt_budget_stats
+
+
+def get_prompt_budget_stats():
+    return get_prompt_budget_stats_tracker().stats()
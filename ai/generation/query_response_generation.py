@@ -1,48 +1,90 @@
-def get_prompt_for_generation(chat_history, relevant_documents=None, summarised_query=None):
+from ai.generation import prompt_budget
+
+GENERATION_INSTRUCTIONS = (
+    """Based on the above, provide a helpful, accurate, and concise answer to address the user's query in order to resolve the issue.\n"
+        "Instructuons to follow strictly:\n"
+        "1. You must ONLY use information from the relevant QnA and the past conversation above.\n"
+        "2. If the answer is not present in the provided `QnA exmples or chat history, respond with: 'I'm sorry, I do not have enough information to answer that question.'\n"
+        "3. Do NOT use any external knowledge or make up information.\n"
+        "4. If your response contains multiple steps, please use numbers to enumerate the steps and order them with the highest priority step first and in chronological order of execution.\n"
+        "5. Avoid use of obsene language or words, ensure a tone of empathy and care.\n"
+        "6. Handle the greeting and farewell messages with care and empathy.\n"
+        """
+)
+REASONING_INSTRUCTION = "\n\nAlso, provide a step-by-step explanation of your reasoning for the answer."
+
+
+def build_generation_prompt(chat_history, relevant_documents=None, summarised_query=None, enable_reasoning=False,
+                            budget=None):
     """
-    Constructs a prompt for LLM generation based on chat history, relevant documents, and a summarised query.
+    Constructs the generation prompt within a token budget (PROMPT_TOKEN_BUDGET by default).
 
-    Args:
-        chat_history (list of dict): List of chat messages, each dict should have at least 'role' and 'content' keys.
-        relevant_documents (list of str, optional): List of relevant documents to inform the response.
-        summarised_query (str, optional): A summarised version of the user's query.
+    The instructions and the summarised query are always included. What they leave is split
+    between the relevant documents, best-first with long answers truncated, and the chat
+    history, most recent first (see prompt_budget.allocate_budget).
 
     Returns:
-        str: The constructed prompt string.
+        tuple: (prompt string, report) where the report holds the budget, the prompt's tokens
+        and per section ("instructions", "query", "documents", "history") the tokens used and
+        dropped, plus documents / messages kept and omitted.
     """
+    budget = prompt_budget.prompt_token_budget if budget is None else budget
+    instructions = GENERATION_INSTRUCTIONS + (REASONING_INSTRUCTION if enable_reasoning else "")
+    query_text = f"Summarised user query: {summarised_query}\n" if summarised_query else ""
+    document_header = "Relevant QnA to refer:" if relevant_documents else ""
+    history_header = "Chat history:" if chat_history else ""
+    fixed_tokens = sum(prompt_budget.line_tokens(text) for text in (instructions, query_text, document_header,
+                                                                    history_header) if text)
+    document_budget, history_budget = prompt_budget.allocate_budget(
+        budget, fixed_tokens, relevant_documents, chat_history
+    )
+    document_lines, documents_report = prompt_budget.fit_documents(relevant_documents, document_budget)
+    # History can use whatever the documents left over
+    chat_lines, history_report = prompt_budget.fit_history(
+        chat_history, history_budget + document_budget - documents_report["used"]
+    )
+
     prompt_parts = []
 
     # Add summarised query if available
-    if summarised_query:
-        prompt_parts.append(f"Summarised user query: {summarised_query}\n")
+    if query_text:
+        prompt_parts.append(query_text)
 
     # Add relevant documents if available
-    if relevant_documents:
-        docs_text = "\n".join([f"- {doc}" for doc in relevant_documents])
-        prompt_parts.append(f"Relevant QnA to refer:\n{docs_text}\n")
+    if document_lines:
+        docs_text = "\n".join(document_lines)
+        prompt_parts.append(f"{document_header}\n{docs_text}\n")
 
     # Add chat history
-    if chat_history:
-        prompt_parts.append("Chat history:")
-        for message in chat_history:
-            role = message.get("role", "user")
-            content = message.get("content", "")
-            prompt_parts.append(f"{role.capitalize()}: {content}")
+    if chat_lines:
+        prompt_parts.append(history_header)
+        prompt_parts.extend(chat_lines)
         prompt_parts.append("")  # Add a blank line
-    base_prompt = (
-        """Based on the above, provide a helpful, accurate, and concise answer to address the user's query in order to resolve the issue.\n"
-        "Instructuons to follow strictly:\n"
-        "1. You must ONLY use information from the relevant QnA and the past conversation above.\n"
-        "2. If the answer is not present in the provided `QnA exmples or chat history, respond with: 'I'm sorry, I do not have enough information to answer that question.'\n"
-        "3. Do NOT use any external knowledge or make up information.\n"
-        "4. If your response contains multiple steps, please use numbers to enumerate the steps and order them with the highest priority step first and in chronological order of execution.\n"
-        "5. Avoid use of obsene language or words, ensure a tone of empathy and care.\n"
-        "6. Handle the greeting and farewell messages with care and empathy.\n"
-        """
-    )
-    prompt_parts.append(base_prompt)
+    prompt_parts.append(instructions)
+
+    prompt = "\n".join(prompt_parts)
+    report = prompt_budget.budget_report("generation", budget, {
+        "instructions": prompt_budget.fixed_section_report(instructions),
+        "query": prompt_budget.fixed_section_report(query_text),
+        "documents": documents_report,
+        "history": history_report
+    }, prompt)
+    return prompt, report
+
+
+def get_prompt_for_generation(chat_history, relevant_documents=None, summarised_query=None):
+    """
+    Constructs a prompt for LLM generation based on chat history, relevant documents, and a summarised query.
 
-    return "\n".join(prompt_parts)
+    Args:
+        chat_history (list of dict): List of messages, each dict should have at least 'role' and 'content' keys.
+        relevant_documents (list of str, optional): List of relevant documents to inform the response.
+        summarised_query (str, optional): A summarised version of the user's query.
+
+    Returns:
+        str: The constructed prompt string, within PROMPT_TOKEN_BUDGET (see build_generation_prompt).
+    """
+    return build_generation_prompt(chat_history, relevant_documents, summarised_query)[0]
 
 
 def get_user_query_and_reasoning_tool_definition():
@@ -91,8 +133,18 @@ def handle_llm_response(response, enable_reasoning=True):
 
     if response and response.get("type") == "message":
         content = response.get("content", "")
+        if not content and response.get("tool_calls"):
+            # Normalised by generate_response_from_llm; only the first tool call is used
+            arguments = response["tool_calls"][0].get("arguments") or {}
+            if isinstance(arguments, str):
+                try:
+                    arguments = json.loads(arguments)
+                except Exception:
+                    arguments = {}
+            answer = arguments.get("response") or arguments.get("user_query") or ""
+            reasoning = arguments.get("reasoning", None)
         # If content is empty, check for tool_calls in the raw message (OpenAI v1+)
-        if not content and response.get("raw"):
+        elif not content and response.get("raw"):
             try:
                 raw = response["raw"]
                 # OpenAI v1+ tool call format
@@ -136,3 +188,167 @@ def handle_llm_response(response, enable_reasoning=True):
         reasoning = None
 
     return answer, reasoning
+
+
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class ToolArgumentFieldStreamer:
+    """
+    Incrementally extracts one top-level string field (default "response") from tool-call
+    arguments that arrive as JSON fragments, so the answer can be forwarded while the model
+    is still writing it.
+
+    `feed(fragment)` returns the newly decoded text of the field (possibly ""). Escapes,
+    including \\uXXXX and surrogate pairs split across fragments, are decoded. Once the
+    field's closing quote is seen nothing more is returned; other fields such as "reasoning"
+    are left to a json.loads of the complete arguments.
+    """
+
+    def __init__(self, field="response"):
+        self.field = field
+        self.done = False
+        self._state = "search"  # search -> before_value -> value -> done
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string = []
+        self._last_string = None
+        self._pending = ""  # an incomplete escape sequence inside the value
+        self._high_surrogate = None
+
+    def feed(self, fragment):
+        output = []
+        for char in fragment or "":
+            if self._state == "value":
+                self._value_char(char, output)
+            elif self._state == "before_value":
+                if char == '"':
+                    self._state = "value"
+                elif not char.isspace():
+                    self._state = "search"  # null or a non-string value
+                    self._search_char(char)
+            elif self._state == "search":
+                self._search_char(char)
+        return "".join(output)
+
+    def _search_char(self, char):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                self._last_string = "".join(self._string)
+                return
+            self._string.append(char)
+            return
+        if char == '"':
+            self._in_string = True
+            self._string = []
+        elif char in "{[":
+            self._depth += 1
+            self._last_string = None
+        elif char in "}]":
+            self._depth -= 1
+            self._last_string = None
+        elif char == ":" and self._depth == 1 and self._last_string == self.field:
+            self._state = "before_value"
+        elif not char.isspace():
+            self._last_string = None
+
+    def _value_char(self, char, output):
+        if self._pending:
+            self._pending += char
+            if self._pending[1] == "u":
+                if len(self._pending) < 6:
+                    return
+                self._emit_code_point(int(self._pending[2:], 16), output)
+            else:
+                output.append(_JSON_ESCAPES.get(char, char))
+            self._pending = ""
+        elif char == "\\":
+            self._pending = char
+        elif char == '"':
+            self._state = "done"
+            self.done = True
+        else:
+            output.append(char)
+
+    def _emit_code_point(self, code_point, output):
+        if 0xD800 <= code_point < 0xDC00:
+            self._high_surrogate = code_point
+            return
+        if 0xDC00 <= code_point < 0xE000 and self._high_surrogate is not None:
+            code_point = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code_point - 0xDC00)
+        self._high_surrogate = None
+        output.append(chr(code_point))
+
+
+class MessageAnswerStreamer:
+    """
+    Streams the answer part of a plain-text completion, cut where handle_llm_response cuts
+    it: at "Reasoning:" if the completion has one, otherwise at "Explanation:". Text is
+    withheld once any marker is seen (a later "Reasoning:" still takes precedence over an
+    earlier "Explanation:"), and the last few characters are held back until it is clear
+    they do not start a marker.
+    """
+
+    def __init__(self, markers=("Reasoning:", "Explanation:")):
+        self.markers = markers  # in order of precedence
+        self.done = False
+        self._text = ""
+        self._sent = 0
+        self._hold = max(len(marker) for marker in markers) - 1
+
+    def feed(self, fragment):
+        if self.done:
+            return ""
+        self._text += fragment or ""
+        if self.markers[0] in self._text:
+            self.done = True
+            return self._send(self._text.find(self.markers[0]))
+        end = len(self._text) - self._hold
+        for marker in self.markers[1:]:
+            if marker in self._text:
+                end = min(end, self._text.find(marker))
+        return self._send(end)
+
+    def flush(self):
+        """The rest of the answer, once the completion has ended."""
+        if self.done:
+            return ""
+        self.done = True
+        end = len(self._text)
+        for marker in self.markers[1:]:
+            if marker in self._text:
+                end = self._text.find(marker)
+                break
+        return self._send(end)
+
+    def _send(self, end):
+        text = self._text[self._sent:end] if end > self._sent else ""
+        self._sent = max(self._sent, end)
+        return text
+
+
+class StrippedTextStreamer:
+    """
+    Applies the str.strip() that handle_llm_response applies to a whole answer to text that
+    arrives in pieces: leading whitespace is dropped and trailing whitespace is held back
+    until more text follows, so the pieces join to the stripped answer.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pending = ""
+
+    def feed(self, fragment):
+        fragment = self._pending + (fragment or "")
+        if not self.text:
+            fragment = fragment.lstrip()
+        stripped = fragment.rstrip()
+        self._pending = fragment[len(stripped):]
+        self.text += stripped
+        return stripped
@@ -1,10 +1,15 @@
 import os
-from ai.generation.llm_usage import generate_response_from_llm
+from ai.generation import prompt_budget
+from ai.event_loop import run_sync
+from ai.generation.llm_usage import agenerate_response_from_llm
 
-def get_prompt_for_query_summarization(chat_history):
+def get_prompt_for_query_summarization(chat_history, budget=None):
     """
     Constructs a prompt for the LLM to summarize the user's query as crisply as possible.
+    The chat history is trimmed, most recent messages first, to fit SUMMARY_PROMPT_TOKEN_BUDGET
+    (or `budget`) tokens with the instructions.
     """
+    budget = prompt_budget.summary_prompt_token_budget if budget is None else budget
     prompt = """
     You are a helpful assistant that summarizes the user's latest query as crisply and concisely as possible. 
     Point of view is from the user's perspective.
@@ -15,18 +20,23 @@ def get_prompt_for_query_summarization(chat_history):
     USER: I see 'unable to login' in the error message.
     Summarized query: While logging in, I am seeing 'unable to login' in the error message.
     """
+    instruction = "Summarize the user's latest query as crisp and detailed ."
+    fixed_tokens = sum(prompt_budget.line_tokens(text) for text in (prompt, "Chat history:", "", instruction))
+    chat_lines, history_report = prompt_budget.fit_history(chat_history, max(budget - fixed_tokens, 0))
     prompt_parts = []
     prompt_parts.append(prompt)
     prompt_parts.append("Chat history:")
-    for message in chat_history:
-        role = message.get("role", "user")
-        content = message.get("content", "")
-        prompt_parts.append(f"{role.capitalize()}: {content}")
+    prompt_parts.extend(chat_lines)
     prompt_parts.append("")
-    prompt_parts.append("Summarize the user's latest query as crisp and detailed .")
-    return "\n".join(prompt_parts)
+    prompt_parts.append(instruction)
+    summary_prompt = "\n".join(prompt_parts)
+    prompt_budget.budget_report("summarisation", budget, {
+        "instructions": prompt_budget.fixed_section_report(prompt + instruction),
+        "history": history_report
+    }, summary_prompt)
+    return summary_prompt
 
-def summarise_query_from_chat_history(chat_history):
+async def asummarise_query_from_chat_history(chat_history):
     """
     Uses the LLM to summarize the user's query from the chat history as crisply as possible.
 
@@ -39,11 +49,13 @@ def summarise_query_from_chat_history(chat_history):
     if not chat_history or not isinstance(chat_history, list):
         return ""
     prompt = get_prompt_for_query_summarization(chat_history)
-    llm_response = generate_response_from_llm(
+    llm_response = await agenerate_response_from_llm(
         provider="openai",
         prompt=prompt,
         api_key=os.getenv('OPENAI_API_KEY'),
-        model="gpt-4.1" #TODO: model and its provider details ideally must come from the env
+        model="gpt-4.1", #TODO: model and its provider details ideally must come from the env
+        # Deterministic, so repeated chat histories are served from the LLM response cache
+        temperature=0
     )
     # Try to extract the summary from the LLM response
     if isinstance(llm_response, dict):
@@ -53,3 +65,7 @@ def summarise_query_from_chat_history(chat_history):
     elif isinstance(llm_response, str):
         return llm_response.strip()
     return ""
+
+def summarise_query_from_chat_history(chat_history):
+    """Synchronous wrapper of asummarise_query_from_chat_history."""
+    return run_sync(asummarise_query_from_chat_history(chat_history))
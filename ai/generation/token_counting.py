@@ -0,0 +1,65 @@
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+_cached_encoding = None
+_encoding_unavailable = False
+
+
+def get_encoding():
+    """
+    The tiktoken encoding used to count prompt tokens, or None when tiktoken (or the
+    encoding file) is not available; that is logged once, as a warning.
+    """
+    global _cached_encoding, _encoding_unavailable
+    if _cached_encoding is None and not _encoding_unavailable:
+        try:
+            import tiktoken
+            _cached_encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            # tiktoken downloads its encodings on first use, which fails on offline hosts
+            _encoding_unavailable = True
+            logger.warning(
+                f"tiktoken encoding {TOKENIZER_ENCODING} is unavailable ({e}); prompt tokens are "
+                f"estimated at ~4 characters each, so prompt budgets are approximate."
+            )
+    return _cached_encoding
+
+
+def count_tokens(text):
+    """
+    Number of tokens in `text`. Falls back to ~4 characters per token without tiktoken.
+    """
+    text = str(text or "")
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """The longest prefix of `text` within `max_tokens` tokens (~4 characters each without tiktoken)."""
+    text = str(text or "")
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def render_document(document):
+    """One generation-prompt line for a retrieved document; QnA dicts render as question and answer."""
+    if isinstance(document, dict) and "question" in document and "answer" in document:
+        return f"- Question: {document['question']} | Answer: {document['answer']}"
+    return f"- {document}"
+
+
+def count_document_tokens(documents):
+    """Tokens the documents take in the generation prompt, one render_document line each."""
+    return sum(count_tokens(render_document(doc)) for doc in documents or [])
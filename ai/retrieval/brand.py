@@ -0,0 +1,63 @@
+import re
+
+from qdrant_client.http import models
+
+BRAND_FIELD = "brand"
+
+# Record fields that already name the company, checked before falling back to @mentions
+_BRAND_RECORD_FIELDS = ("brand", "company", "author_id")
+_MENTION_PATTERN = re.compile(r"@([A-Za-z0-9_]{2,15})")
+# Support-handle decorations: "AmazonHelp", "comcastcares", "Ask_Spectrum", "Uber_Support"
+_HANDLE_PREFIXES = ("ask",)
+_HANDLE_SUFFIXES = ("support", "help", "cares", "care", "service", "services", "team", "official",
+                    "hq", "uk", "us", "usa")
+_GENERIC_HANDLES = {"user", "username", "customer", "support", "help"}
+
+
+def normalize_brand(value):
+    """
+    Canonical brand key: lower-case alphanumerics with support-handle decorations removed,
+    so "@AmazonHelp", "amazon" and "Amazon" all map to "amazon". Returns None for empty input.
+    """
+    brand = re.sub(r"[^a-z0-9]", "", str(value or "").lower().lstrip("@"))
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in _HANDLE_PREFIXES:
+            if brand.startswith(prefix) and len(brand) > len(prefix) + 1:
+                brand, stripped = brand[len(prefix):], True
+        for suffix in _HANDLE_SUFFIXES:
+            if brand.endswith(suffix) and len(brand) > len(suffix) + 1:
+                brand, stripped = brand[:-len(suffix)], True
+    return brand or None
+
+
+def extract_brand(record, input_field="input"):
+    """
+    The brand a support exchange belongs to: an explicit brand/company/author field when the
+    record has a non-numeric one, else the first non-generic @mention in the customer message.
+    Returns None when neither is present.
+    """
+    for field in _BRAND_RECORD_FIELDS:
+        value = record.get(field)
+        if value and not str(value).isdigit():
+            return normalize_brand(value)
+    for handle in _MENTION_PATTERN.findall(str(record.get(input_field) or "")):
+        if handle.lower() not in _GENERIC_HANDLES and not handle.isdigit():
+            return normalize_brand(handle)
+    return None
+
+
+def brand_payload_builder(input_field="input"):
+    """An ingest `payload_builder` adding the extracted brand to each point's payload."""
+    def build(record):
+        return {BRAND_FIELD: extract_brand(record, input_field)}
+    return build
+
+
+def brand_filter(brand):
+    """Qdrant filter restricting a search to one brand, or None when `brand` is empty."""
+    brand = normalize_brand(brand)
+    if brand is None:
+        return None
+    return models.Filter(must=[models.FieldCondition(key=BRAND_FIELD, match=models.MatchValue(value=brand))])
@@ -1,10 +1,25 @@
+import asyncio
+import functools
+import inspect
 import logging
-import pandas as pd
 # from datasets import load_dataset
 from sentence_transformers import SentenceTransformer
 from qdrant_client.http import models  # <-- ADD THIS IMPORT
 from qdrant_client.http.models import VectorParams
 import numpy as np
+from ai.event_loop import run_sync
+from ai.generation.token_counting import count_document_tokens
+from ai.retrieval.retrieval_statistics import compute_retrieval_statistics, normalize_rows
+from ai.retrieval.embeddings_helper import (
+    aencode_queries,
+    awith_qdrant_retries,
+    encode_queries,
+    get_embedding_executor,
+    with_qdrant_retries
+)
+from ai.retrieval.local_index import payload_matches
+
+logger = logging.getLogger(__name__)
 
 def top_p_filtering_with_temperature(results, p=0.9, temperature=0.1, score_key="score"):
     """
@@ -12,84 +27,371 @@ def top_p_filtering_with_temperature(results, p=0.9, temperature=0.1, score_key=
     """
     if not results:
         return []
-    scores = np.array([r[score_key] for r in results])
-    # Apply temperature to scores
+    order, keep = top_p_filter_matrix(np.array([[r[score_key] for r in results]]), p=p, temperature=temperature)
+    return [results[i] for i in order[0, :keep[0]]]
+
+def top_p_filter_matrix(scores, p=0.9, temperature=0.1, lengths=None):
+    """
+    Vectorised top-p over a (queries, hits) score matrix.
+    Row i holds lengths[i] real scores followed by padding. Returns (order, keep): per row the
+    hit indices by descending probability, and how many of them survive, i.e. the smallest
+    prefix whose cumulative softmax probability reaches p.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n_rows, n_cols = scores.shape
+    if lengths is None:
+        lengths = np.full(n_rows, n_cols)
+    lengths = np.asarray(lengths)
+    valid = np.arange(n_cols)[None, :] < lengths[:, None]
     if temperature != 1.0:
         scores = scores / temperature
-    # Softmax to get probabilities
-    exp_scores = np.exp(scores - np.max(scores))  # for numerical stability
-    probs = exp_scores / np.sum(exp_scores)
-    # Sort results by probability descending
-    sorted_indices = np.argsort(probs)[::-1]
-    sorted_results = [results[i] for i in sorted_indices]
-    sorted_probs = probs[sorted_indices]
-    # Top-p filtering
-    cumulative = 0.0
-    filtered = []
-    for r, prob in zip(sorted_results, sorted_probs):
-        filtered.append(r)
-        cumulative += prob
-        if cumulative >= p:
-            break
-    return filtered
-
-def search_similar(client, model, query, collection_name, top_k=5):
-    """
-    Given a query string, embed and search in Qdrant.
+    scores = np.where(valid, scores, -np.inf)
+    row_max = np.max(scores, axis=1, keepdims=True)
+    row_max[~np.isfinite(row_max)] = 0.0
+    exp_scores = np.where(valid, np.exp(scores - row_max), 0.0)
+    probs = exp_scores / np.clip(exp_scores.sum(axis=1, keepdims=True), 1e-300, None)
+    # Padding sorts last; descending order matches argsort(probs)[::-1] of a single row
+    order = np.argsort(np.where(valid, probs, -1.0), axis=1)[:, ::-1]
+    cumulative = np.cumsum(np.take_along_axis(probs, order, axis=1), axis=1)
+    keep = np.minimum((cumulative < p).sum(axis=1) + 1, lengths)
+    return order, keep
+
+def mmr_select(relevance, doc_vectors, k, lambda_mult=0.5):
+    """
+    Greedy maximal-marginal-relevance selection of `k` documents.
+    Each step picks the document maximising
+        lambda_mult * relevance - (1 - lambda_mult) * max cosine similarity to those already picked,
+    so near-copies of a selected document lose to less similar ones. The pairwise similarity
+    matrix is computed once and the running max similarity is updated with one vector op per
+    step. Returns the selected indices in selection order.
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    unit_vectors = normalize_rows(doc_vectors)
+    similarities = unit_vectors @ unit_vectors.T
+    # Nothing is redundant before the first pick
+    max_similarity = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    selected = []
+    for _ in range(k):
+        marginal = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        marginal[~available] = -np.inf
+        best = int(np.argmax(marginal))
+        max_similarity = similarities[best] if not selected else np.maximum(max_similarity, similarities[best])
+        selected.append(best)
+        available[best] = False
+    return selected
+
+def mmr_filter_results(results, k, lambda_mult=0.5, model=None):
+    """
+    MMR over result dicts, using the vector returned with each hit (`with_vectors=True`) and
+    "score" as relevance. Falls back to the model, then to the first k by score, when vectors
+    are missing. Returns the selected results, schema unchanged.
+    """
+    if len(results) <= k:
+        return list(results)
+    if all(r.get("vector") is not None for r in results):
+        doc_vectors = np.asarray([r["vector"] for r in results], dtype=np.float32)
+    elif model is not None:
+        texts = [f"Question : {r.get('input')} Answer : {r.get('reply')}" for r in results]
+        doc_vectors = np.asarray(model.encode(texts, batch_size=32, show_progress_bar=False), dtype=np.float32)
+    else:
+        return sorted(results, key=lambda r: -r["score"])[:k]
+    return [results[i] for i in mmr_select([r["score"] for r in results], doc_vectors, k, lambda_mult)]
+
+def result_document_tokens(results):
+    """Prompt tokens of the results as the generation prompt renders them."""
+    return count_document_tokens({"question": r.get("input"), "answer": r.get("reply")} for r in results)
+
+async def call_backend(method, **kwargs):
+    """
+    Await a read-only search backend method with Qdrant retries: AsyncQdrantClient methods on
+    the loop, synchronous ones (QdrantClient, the local index) in the embedding executor.
+    """
+    if inspect.iscoroutinefunction(method):
+        return await awith_qdrant_retries(method, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_embedding_executor(), functools.partial(with_qdrant_retries, method, **kwargs))
+
+
+async def search_similar_async(client, model, query, collection_name, top_k=5, search_params=None,
+                               query_filter=None, mmr_k=None, mmr_lambda=0.5):
+    """
+    Given a query string, embed and search in Qdrant without blocking the event loop.
+    Embedding runs in the shared embedding executor; an AsyncQdrantClient is awaited and a
+    synchronous backend (QdrantClient, the local index) is searched in the same executor.
+    `search_params` (models.SearchParams: hnsw_ef, exact, quantization rescoring) is passed to Qdrant,
+    and `query_filter` (models.Filter, e.g. brand_filter) restricts the search to matching payloads.
+    With `mmr_k`, the `mmr_k` most relevant non-redundant hits are kept by MMR instead of top-p.
     Returns list of matched documents with scores, and mean/median distances for all and top_p results.
     """
-    query_vec = model.encode([query])[0].tolist()
-    hits = client.search(
+    query_vec = (await aencode_queries(model, [query]))[0].tolist()
+    hits = await call_backend(
+        client.search,
         collection_name=collection_name,
         query_vector=query_vec,
-        limit=top_k
+        limit=top_k,
+        query_filter=query_filter,
+        search_params=search_params,
+        with_vectors=True
+    )
+    return process_search_hits(hits, model, mmr_k=mmr_k, mmr_lambda=mmr_lambda)
+
+
+def search_similar(client, model, query, collection_name, top_k=5, search_params=None, query_filter=None,
+                   mmr_k=None, mmr_lambda=0.5):
+    """
+    Synchronous wrapper of search_similar_async, run on the shared event loop (ai/event_loop.py).
+    """
+    return run_sync(search_similar_async(
+        client, model, query, collection_name, top_k=top_k, search_params=search_params,
+        query_filter=query_filter, mmr_k=mmr_k, mmr_lambda=mmr_lambda
+    ))
+
+
+def search_similar_batch(client, model, queries, collection_name, top_k=5, search_params=None, query_filter=None,
+                         mmr_k=None, mmr_lambda=0.5):
+    """
+    search_similar for many queries: one encode call, one search_batch request.
+    Returns one search_similar tuple per query, in order.
+    """
+    if not queries:
+        return []
+    query_vectors = encode_queries(model, list(queries))
+    requests = [
+        models.SearchRequest(
+            vector=vector.tolist(), limit=top_k, filter=query_filter, params=search_params,
+            with_payload=True, with_vector=True
+        )
+        for vector in query_vectors
+    ]
+    hits_per_query = with_qdrant_retries(client.search_batch, collection_name=collection_name, requests=requests)
+    return process_search_hits_batch(hits_per_query, model, mmr_k=mmr_k, mmr_lambda=mmr_lambda)
+
+
+def process_search_hits(hits, model=None, mmr_k=None, mmr_lambda=0.5):
+    """
+    Turn raw search hits into the search_similar result tuple: top-p filtered (or MMR-selected)
+    results plus inter-document and document-query similarity statistics.
+    """
+    return process_search_hits_batch([hits], model, mmr_k=mmr_k, mmr_lambda=mmr_lambda)[0]
+
+
+def process_search_hits_batch(hits_per_query, model=None, p=0.9, temperature=0.1, mmr_k=None, mmr_lambda=0.5):
+    """
+    process_search_hits for several hit lists, with top-p applied to all of them at once.
+    """
+    results_per_query = [
+        [
+            {
+                "id": hit.id,
+                "score": hit.score,
+                "input": hit.payload.get("input"),
+                "reply": hit.payload.get("reply"),
+                "vector": hit.vector
+            }
+            for hit in (hits or [])
+        ]
+        for hits in hits_per_query
+    ]
+    return summarise_results_batch(
+        results_per_query, model, p=p, temperature=temperature, mmr_k=mmr_k, mmr_lambda=mmr_lambda
+    )
+
+
+def summarise_results_batch(results_per_query, model=None, p=0.9, temperature=0.1, apply_top_p=True,
+                            mmr_k=None, mmr_lambda=0.5):
+    """
+    Result dicts -> search_similar tuples: optional top-p (applied to all lists at once), then
+    inter-document and document-query similarity statistics per list.
+    With `mmr_k`, MMR selects the documents instead of top-p, and the prompt tokens saved
+    against the selection top-p would have made are logged per query.
+    """
+    lengths = np.array([len(results) for results in results_per_query])
+    if apply_top_p:
+        scores = np.zeros((len(results_per_query), max(lengths.max(initial=0), 1)))
+        for row, results in enumerate(results_per_query):
+            scores[row, :len(results)] = [r["score"] for r in results]
+        order, keep = top_p_filter_matrix(scores, p=p, temperature=temperature, lengths=lengths)
+    else:
+        order, keep = np.tile(np.arange(max(lengths.max(initial=0), 1)), (len(lengths), 1)), lengths
+
+    output = []
+    for row, results in enumerate(results_per_query):
+        if not results:
+            output.append(([], None, None, None, None))
+            continue
+        mean_inter_document_similarity, median_inter_document_similarity = find_inter_document_similarity(results, model)
+        top_p_results = [results[i] for i in order[row, :keep[row]]]
+        if mmr_k:
+            mmr_results = mmr_filter_results(results, mmr_k, mmr_lambda, model)
+            logger.info(
+                f"MMR kept {len(mmr_results)} of {len(results)} documents "
+                f"(top-p: {len(top_p_results)}), saving "
+                f"{result_document_tokens(top_p_results) - result_document_tokens(mmr_results)} prompt tokens."
+            )
+            top_p_results = mmr_results
+        # Calculate mean/median of query-to-document similarity (score) for top_p_results
+        top_p_scores = [r["score"] for r in top_p_results]
+        output.append((
+            top_p_results,
+            mean_inter_document_similarity,
+            median_inter_document_similarity,
+            float(np.mean(top_p_scores)),
+            float(np.median(top_p_scores))
+        ))
+    return output
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse ranked id lists: score(id) = sum over lists of 1 / (k + rank), ranks starting at 1.
+    Returns [(id, fused score)] best first; ties keep the order in which ids were first seen.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, point_id in enumerate(ranking, start=1):
+            fused[point_id] = fused.get(point_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+async def search_similar_hybrid_async(client, model, query, collection_name, lexical_index, top_k=5, candidates=50,
+                                      rrf_k=60, search_params=None, query_filter=None, mmr_k=None, mmr_lambda=0.5):
+    """
+    Dense + BM25 retrieval fused with reciprocal-rank fusion.
+
+    The best `candidates` dense hits and lexical hits are fused and the first `top_k` kept, in
+    fused order: exact tokens (order numbers, error strings) surface even when their embedding
+    is far off, so a small top_k holds the recall a large dense top_k needed. Top-p is not
+    applied on top of the fusion. Lexical-only hits are fetched with `retrieve` and scored with
+    the query cosine, so "score" keeps its meaning for every result. The lexical index holds no
+    payloads, so with `query_filter` its hits are fetched before fusion and dropped unless their
+    payload matches. With `mmr_k`, MMR then keeps the `mmr_k` least redundant of the fused hits.
+    The lexical search runs in the embedding executor while the dense search is in flight.
+    """
+    loop = asyncio.get_running_loop()
+    query_vector = (await aencode_queries(model, [query]))[0]
+    lexical_future = loop.run_in_executor(
+        get_embedding_executor(), functools.partial(lexical_index.search, query, limit=candidates)
+    )
+    dense_hits = await call_backend(
+        client.search,
+        collection_name=collection_name,
+        query_vector=query_vector.tolist(),
+        limit=max(candidates, top_k),
+        query_filter=query_filter,
+        search_params=search_params,
+        with_vectors=True
     )
-    if not hits or len(hits) == 0:
-        return [], None, None, None, None
+    lexical_ids, lexical_scores = await lexical_future
+    records = []
+    if query_filter is not None:
+        outside = lexical_only_ids(dense_hits, lexical_ids)
+        records = await call_backend(
+            client.retrieve, collection_name=collection_name, ids=outside, with_payload=True, with_vectors=True
+        ) if outside else []
+        lexical_ids, records = filter_lexical_hits(dense_hits, lexical_ids, records, query_filter)
+    fused, missing = fuse_hybrid_hits(dense_hits, lexical_ids, top_k, rrf_k)
+    fetched = {record.id for record in records}
+    missing = [point_id for point_id in missing if point_id not in fetched]
+    if missing:
+        records = records + await call_backend(
+            client.retrieve, collection_name=collection_name, ids=missing, with_payload=True, with_vectors=True
+        )
+    results = hybrid_results(query_vector, fused, dense_hits, records, dict(zip(lexical_ids, lexical_scores)))
+    return summarise_results_batch([results], model, apply_top_p=False, mmr_k=mmr_k, mmr_lambda=mmr_lambda)[0]
+
+
+def search_similar_hybrid(client, model, query, collection_name, lexical_index, top_k=5, candidates=50, rrf_k=60,
+                          search_params=None, query_filter=None, mmr_k=None, mmr_lambda=0.5):
+    """
+    Synchronous wrapper of search_similar_hybrid_async, run on the shared event loop (ai/event_loop.py).
+    """
+    return run_sync(search_similar_hybrid_async(
+        client, model, query, collection_name, lexical_index, top_k=top_k, candidates=candidates, rrf_k=rrf_k,
+        search_params=search_params, query_filter=query_filter, mmr_k=mmr_k, mmr_lambda=mmr_lambda
+    ))
+
+
+def lexical_only_ids(dense_hits, lexical_ids):
+    dense_id_set = {hit.id for hit in dense_hits}
+    return [point_id for point_id in lexical_ids if point_id not in dense_id_set]
+
+
+def filter_lexical_hits(dense_hits, lexical_ids, records, query_filter):
+    """
+    Keep the lexical ids that are dense hits (already filtered by Qdrant) or whose fetched
+    record matches `query_filter`. Returns (lexical ids, matching records).
+    """
+    records = [record for record in records if payload_matches(record.payload, query_filter)]
+    allowed = {hit.id for hit in dense_hits} | {record.id for record in records}
+    return [point_id for point_id in lexical_ids if point_id in allowed], records
+
+
+def fuse_hybrid_hits(dense_hits, lexical_ids, top_k, rrf_k=60):
+    """
+    Returns the fused top_k [(id, fused score)] and the ids among them with no dense hit.
+    """
+    dense_ids = [hit.id for hit in dense_hits]
+    fused = reciprocal_rank_fusion([dense_ids, lexical_ids], k=rrf_k)[:top_k]
+    dense_id_set = set(dense_ids)
+    return fused, [point_id for point_id, _ in fused if point_id not in dense_id_set]
+
+
+def hybrid_results(query_vector, fused, dense_hits, records, lexical_scores):
+    by_id = {hit.id: hit for hit in dense_hits}
+    by_id.update({record.id: record for record in records})
+    query_unit = query_vector / max(np.linalg.norm(query_vector), 1e-12)
     results = []
-    for hit in hits:
+    stale = 0
+    for point_id, fused_score in fused:
+        point = by_id.get(point_id)
+        if point is None:  # deleted since the lexical index was built
+            stale += 1
+            continue
+        score = getattr(point, "score", None)
+        if score is None:
+            vector = np.asarray(point.vector, dtype=np.float32)
+            score = float(vector @ query_unit / max(np.linalg.norm(vector), 1e-12))
         results.append({
-            "id": hit.id,
-            "score": hit.score,
-            "input": hit.payload.get("input"),
-            "reply": hit.payload.get("reply")
+            "id": point.id,
+            "score": score,
+            "input": point.payload.get("input"),
+            "reply": point.payload.get("reply"),
+            "vector": point.vector,
+            "lexical_score": lexical_scores.get(point_id),
+            "fused_score": fused_score
         })
-
-    top_p_results = top_p_filtering_with_temperature(results=results)
-    mean_inter_document_similarity, median_inter_document_similarity = find_inter_document_similarity(results, model)
-    # Calculate mean/median of query-to-document similarity (score) for top_p_results
-    if top_p_results:
-        scores = [r["score"] for r in top_p_results]
-        mean_document_query_similarity = float(np.mean(scores)) if scores else None
-        median_document_query_similarity = float(np.median(scores)) if scores else None
-    else:
-        mean_document_query_similarity, median_document_query_similarity = None, None
-    return top_p_results, mean_inter_document_similarity, median_inter_document_similarity, mean_document_query_similarity, median_document_query_similarity
+    if stale:
+        logger.warning(f"{stale} of {len(fused)} fused hits are no longer in the collection; "
+                       f"the lexical index is stale and should be rebuilt.")
+    return results
 
 
 def find_inter_document_similarity(results, model=None):
     """
     Find inter-document similarity within a collection.
     Returns mean and median of pairwise cosine similarities between documents.
-    """
-    df_documents = pd.DataFrame(results)
-    df_documents['input'] = df_documents['input'].astype(str)
-    df_documents['reply'] = df_documents['reply'].astype(str)
-    df_documents['text'] = 'Question : ' + df_documents['input'] + " Answer : " + df_documents['reply']
-    doc_vectors = model.encode(df_documents['text'].to_list(),
-                          batch_size=32,  # Adjust batch_size based on your GPU memory
-                          show_progress_bar=True,
-                          convert_to_tensor=True, # Returns torch.Tensor, can be faster for some downstream tasks
-                    )
 
-    # Compute pairwise cosine similarity
-    similarities = np.dot(doc_vectors.cpu().numpy(), np.transpose(doc_vectors.cpu().numpy()))
-    np.fill_diagonal(similarities, np.nan)  # Ignore self-similarity
-
-    # Flatten the similarity matrix and remove NaN values
-    similarity_values = similarities[np.isfinite(similarities)].flatten()
+    Uses the vectors Qdrant returned with each hit (`with_vectors=True`) and stores the
+    per-document centrality (mean similarity to the other hits) on each result under
+    "centrality". The model is only used as a fallback when a result carries no vector.
+    """
+    if not results:
+        return None, None
+    if all(r.get("vector") is not None for r in results):
+        doc_vectors = np.asarray([r["vector"] for r in results], dtype=np.float32)
+    elif model is not None:
+        texts = [f"Question : {r.get('input')} Answer : {r.get('reply')}" for r in results]
+        doc_vectors = np.asarray(model.encode(texts, batch_size=32, show_progress_bar=False), dtype=np.float32)
+    else:
+        return None, None
 
-    mean_similarity = np.mean(similarity_values) if similarity_values.size > 0 else None
-    median_similarity = np.median(similarity_values) if similarity_values.size > 0 else None
+    statistics = compute_retrieval_statistics(doc_vectors)
+    for r, centrality in zip(results, statistics["centrality"]):
+        r["centrality"] = float(centrality)
 
-    return mean_similarity, median_similarity
+    return statistics["mean_inter_document_similarity"], statistics["median_inter_document_similarity"]
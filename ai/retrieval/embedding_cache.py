@@ -0,0 +1,242 @@
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+_HEADER_SLOTS = 4
+_MAGIC = 0x454D4243  # "EMBC"
+_VERSION = 1
+_MAX_PROBES = 16
+
+
+def normalize_query_text(text):
+    """
+    Normalise query text for cache lookups: unicode NFKC, collapsed whitespace, casefolded.
+    The embedding models used here are uncased, so casing does not change the vector.
+    """
+    text = unicodedata.normalize("NFKC", str(text))
+    return " ".join(text.split()).casefold()
+
+
+def make_cache_key(text, model_name):
+    """
+    Returns a non-zero 64-bit key for (model_name, normalised text).
+    """
+    digest = hashlib.blake2b(
+        f"{model_name}\x00{normalize_query_text(text)}".encode("utf-8"),
+        digest_size=8
+    ).digest()
+    key = int.from_bytes(digest, "little")
+    return key or 1  # 0 marks an empty slot in the persistent tier
+
+
+class PersistentEmbeddingStore:
+    """
+    Fixed-capacity, open-addressing hash table of embeddings in a memory-mapped file.
+
+    Layout: int64 header (magic, version, dim, capacity), uint64 keys[capacity],
+    float32 vectors[capacity, dim]. Several processes can map the same file; writes are
+    serialised with an advisory file lock, and readers re-check the key after copying a
+    vector so a concurrent overwrite is treated as a miss.
+    """
+
+    def __init__(self, path, dim=None, capacity=100_000):
+        self.path = path
+        self.dim = int(dim) if dim is not None else None
+        self.capacity = int(capacity)
+        header_bytes = _HEADER_SLOTS * 8
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock_path = f"{path}.lock"
+        with self._file_lock():
+            exists = os.path.exists(path) and os.path.getsize(path) > 0
+            if exists:
+                header = np.memmap(path, dtype=np.int64, mode="r", shape=(_HEADER_SLOTS,))
+                magic, version, stored_dim, stored_capacity = (int(v) for v in header)
+                del header
+                if magic != _MAGIC or version != _VERSION:
+                    raise ValueError(f"{path} is not an embedding cache file.")
+                if self.dim is None:
+                    self.dim = stored_dim
+                elif stored_dim != self.dim:
+                    raise ValueError(
+                        f"Embedding cache {path} holds {stored_dim}-d vectors, got {self.dim}-d."
+                    )
+                self.capacity = stored_capacity
+            else:
+                if self.dim is None:
+                    raise ValueError(f"Embedding cache {path} does not exist and no dimension was given.")
+                # Sparse file: pages are only allocated when a slot is written
+                with open(path, "wb") as f:
+                    f.truncate(header_bytes + self.capacity * (8 + self.dim * 4))
+                header = np.memmap(path, dtype=np.int64, mode="r+", shape=(_HEADER_SLOTS,))
+                header[:] = [_MAGIC, _VERSION, self.dim, self.capacity]
+                header.flush()
+                del header
+
+        keys_bytes = self.capacity * 8
+        self._keys = np.memmap(
+            path, dtype=np.uint64, mode="r+", offset=header_bytes, shape=(self.capacity,)
+        )
+        self._vectors = np.memmap(
+            path, dtype=np.float32, mode="r+", offset=header_bytes + keys_bytes,
+            shape=(self.capacity, self.dim)
+        )
+
+    def _file_lock(self):
+        return _FileLock(self._lock_path)
+
+    def _probe_slots(self, key):
+        start = key % self.capacity
+        return [(start + i) % self.capacity for i in range(min(_MAX_PROBES, self.capacity))]
+
+    def get(self, key):
+        key = np.uint64(key)
+        for slot in self._probe_slots(int(key)):
+            stored = self._keys[slot]
+            if stored == 0:
+                return None
+            if stored == key:
+                vector = np.array(self._vectors[slot])
+                if self._keys[slot] == key:
+                    return vector
+                return None
+        return None
+
+    def put(self, key, vector):
+        key = np.uint64(key)
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Expected a {self.dim}-d vector, got {vector.shape[0]}-d.")
+        slots = self._probe_slots(int(key))
+        with self._file_lock():
+            target = slots[0]  # when the probe window is full the home slot is overwritten
+            for slot in slots:
+                stored = self._keys[slot]
+                if stored == 0 or stored == key:
+                    target = slot
+                    break
+            self._keys[target] = 0
+            self._vectors[target] = vector
+            self._keys[target] = key
+
+    def flush(self):
+        self._keys.flush()
+        self._vectors.flush()
+
+
+class _FileLock:
+    """Exclusive advisory lock on a side file (no-op where fcntl is unavailable)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        try:
+            import fcntl
+        except ImportError:
+            return self
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._fd is not None:
+            import fcntl
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        return False
+
+
+class EmbeddingCache:
+    """
+    Two-tier query-embedding cache keyed by normalised text and model name.
+
+    Tier 1 is a bounded in-process LRU. Tier 2 is an optional PersistentEmbeddingStore,
+    opened lazily once the embedding dimension is known, so it survives restarts and is
+    shared between uvicorn workers.
+    """
+
+    def __init__(self, max_size=10_000, persistent_path=None, persistent_capacity=100_000):
+        self.max_size = max_size
+        self.persistent_path = persistent_path
+        self.persistent_capacity = persistent_capacity
+        self._memory = OrderedDict()
+        self._persistent = None
+        self._persistent_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def _get_persistent(self, dim=None):
+        if self.persistent_path is None:
+            return None
+        if self._persistent is None and (dim is not None or os.path.exists(self.persistent_path)):
+            with self._persistent_lock:
+                if self._persistent is None:
+                    self._persistent = PersistentEmbeddingStore(
+                        self.persistent_path, dim, capacity=self.persistent_capacity
+                    )
+        return self._persistent
+
+    def get(self, text, model_name):
+        key = make_cache_key(text, model_name)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+        persistent = self._get_persistent()
+        if persistent is not None:
+            vector = persistent.get(key)
+            if vector is not None:
+                with self._lock:
+                    self.persistent_hits += 1
+                    self._remember(key, vector)
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, model_name, vector):
+        key = make_cache_key(text, model_name)
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._remember(key, vector)
+        persistent = self._get_persistent(dim=vector.shape[0])
+        if persistent is not None:
+            persistent.put(key, vector)
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.memory_hits = 0
+            self.persistent_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_size": len(self._memory),
+                "persistent_enabled": self.persistent_path is not None
+            }
@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching scheduler around a sentence embedding model.
+
+    Concurrent callers submit texts; a single worker thread gathers them until either
+    `max_batch_size` texts are pending or `max_wait_ms` has passed since the first one
+    arrived, runs one `model.encode` over the whole batch and resolves each caller's
+    future with its own rows.
+    """
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=3.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()  # no submission is queued behind the shutdown marker
+        self.batches = 0
+        self.items = 0
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, texts):
+        """
+        Queue texts for embedding. Returns a Future resolving to an array of shape (len(texts), dim).
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed.")
+            self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts):
+        """Blocking helper: submit and wait for the embeddings."""
+        return self.submit(texts).result()
+
+    def close(self):
+        """Embed what is already queued, then stop the worker. Safe to call more than once."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0
+        }
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        pending = [first]
+        size = len(first[0])
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # let the outer loop see the shutdown after this batch
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            if pending is None:
+                return
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                vectors = np.asarray(self.model.encode(texts), dtype=np.float32)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(texts)
+            offset = 0
+            for item_texts, future in pending:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
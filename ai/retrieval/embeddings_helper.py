@@ -1,28 +1,302 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
 from sentence_transformers import SentenceTransformer
+import asyncio
+import httpx
+import json
+import logging
+import numpy as np
 import os
+import threading
+import time
+import weakref
+from ai.retrieval.embedding_cache import EmbeddingCache
+from ai.retrieval.embedding_scheduler import EmbeddingBatcher
+from ai.retrieval.index_config import (
+    collection_index_settings,
+    create_collection_kwargs,
+    load_index_config,
+    search_params
+)
+from ai.retrieval.lexical_index import LexicalIndex
+from ai.retrieval.local_index import LocalIndexBackend
+from ai.retrieval.onnx_embedding import load_onnx_embedder, onnx_model_dir
 
-QDRANT_COLLECTION = "customer_support_tweets"
+logger = logging.getLogger(__name__)
+
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "customer_support_tweets")  # a collection or an alias
 
 _cached_client = None
+_cached_local_backend = None
+_cached_lexical_indexes = {}
+_cached_index_config = None
+_cached_async_clients = weakref.WeakKeyDictionary()  # one pooled client per event loop
+_embedding_executor = None
 _cached_model = None
+_cached_model_name = None
+_embedding_cache = None
+_embedding_batcher = None
+_embedding_batcher_lock = threading.Lock()
+_collection_write_listeners = []
 qdrant_host = os.getenv("QDRANT_HOST", "qdrant")
 qdrant_port = int(os.getenv("QDRANT_PORT", 6333))
+qdrant_grpc_port = int(os.getenv("QDRANT_GRPC_PORT", 6334))
+qdrant_prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+qdrant_timeout = int(os.getenv("QDRANT_TIMEOUT", 10))  # seconds, per request
+qdrant_retries = int(os.getenv("QDRANT_RETRIES", 2))  # retries of transient search failures / UNAVAILABLE calls
+qdrant_keepalive_seconds = float(os.getenv("QDRANT_KEEPALIVE_SECONDS", 30))
+retrieval_backend = os.getenv("RETRIEVAL_BACKEND", "qdrant")  # "qdrant" or "local"
+local_index_path = os.getenv("LOCAL_INDEX_PATH", "local_index")
+local_index_nprobe = int(os.getenv("LOCAL_INDEX_NPROBE", 0)) or None  # IVF lists to scan; unset = exact
+retrieval_mode = os.getenv("RETRIEVAL_MODE", "dense")  # "dense" or "hybrid" (dense + BM25, rank-fused)
+lexical_index_path = os.getenv("LEXICAL_INDEX_PATH", "lexical_index")
+hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", 50))
+hybrid_rrf_k = int(os.getenv("HYBRID_RRF_K", 60))
+hybrid_top_k = int(os.getenv("HYBRID_TOP_K", 8))
+mmr_top_k = int(os.getenv("MMR_TOP_K", 0)) or None  # documents kept by MMR instead of top-p; unset = top-p
+mmr_lambda = float(os.getenv("MMR_LAMBDA", 0.5))  # 1.0 = relevance only, 0.0 = diversity only
+qdrant_index_config = os.getenv("QDRANT_INDEX_CONFIG")  # inline JSON or a JSON file, see index_config
+qdrant_snapshot_location = os.getenv("QDRANT_SNAPSHOT_LOCATION")  # snapshot URL to recover a missing collection from
+qdrant_snapshot_checksum = os.getenv("QDRANT_SNAPSHOT_CHECKSUM")  # its sha256, verified by Qdrant before recovery
+qdrant_max_connections = int(os.getenv("QDRANT_MAX_CONNECTIONS", 32))
+embedding_executor_workers = int(os.getenv("EMBEDDING_EXECUTOR_WORKERS", 4))
+embedding_engine = os.getenv("EMBEDDING_ENGINE", "sentence-transformers")  # or "onnx-int8"
+embedding_onnx_dir = os.getenv("EMBEDDING_ONNX_DIR", "onnx_models")
+embedding_cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH")  # unset disables the persistent tier
+embedding_cache_capacity = int(os.getenv("EMBEDDING_CACHE_PERSISTENT_CAPACITY", 100000))
+embedding_batch_enabled = os.getenv("EMBEDDING_BATCH_ENABLED", "false").lower() == "true"
+embedding_batch_max_size = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", 64))
+embedding_batch_max_wait_ms = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", 3))
 
 def get_sentence_transformer(model_name="all-MiniLM-L6-v2"): #TODO: IN actual use, "bge-large-en-v1.5". Avoided due to computational resource constraints
-    global _cached_model
+    global _cached_model, _cached_model_name
     if _cached_model is None:
-        _cached_model = SentenceTransformer(model_name)
+        if embedding_engine == "onnx-int8":
+            _cached_model = load_onnx_embedder(model_name, onnx_model_dir(embedding_onnx_dir, model_name), quantized=True)
+        else:
+            _cached_model = SentenceTransformer(model_name)
+        # The engine is part of the cache key: int8 vectors must not be served as fp32 ones
+        _cached_model_name = f"{model_name}:{embedding_engine}"
     return _cached_model
 
-def initialize_qdrant(collection_name, vector_size, client=None):
+def get_embedding_cache():
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            max_size=embedding_cache_size,
+            persistent_path=embedding_cache_path,
+            persistent_capacity=embedding_cache_capacity
+        )
+    return _embedding_cache
+
+def get_embedding_cache_stats():
+    return get_embedding_cache().stats()
+
+def get_embedding_batcher(model):
+    """
+    Returns the shared micro-batching scheduler around the cached model, or None when
+    batching is disabled (EMBEDDING_BATCH_ENABLED). A scheduler built around a previous
+    model is closed when it is replaced.
+    """
+    global _embedding_batcher
+    if not embedding_batch_enabled:
+        return None
+    previous = None
+    with _embedding_batcher_lock:
+        if _embedding_batcher is None or _embedding_batcher.model is not model:
+            previous = _embedding_batcher
+            _embedding_batcher = EmbeddingBatcher(
+                model,
+                max_batch_size=embedding_batch_max_size,
+                max_wait_ms=embedding_batch_max_wait_ms
+            )
+        batcher = _embedding_batcher
+    if previous is not None:
+        # Finishes the batches already queued, then stops its worker thread (and releases the old model)
+        previous.close()
+    return batcher
+
+def encode_queries(model, queries):
+    """
+    Embed query strings, serving repeats from the embedding cache.
+    Only the shared model from get_sentence_transformer is cached, since its name is known;
+    any other (e.g. injected) model is called directly. Cache misses from concurrent callers
+    are coalesced into one model call when micro-batching is enabled.
+    Returns a float32 array of shape (len(queries), dim).
+    """
+    if model is not _cached_model or _cached_model_name is None:
+        return np.asarray(model.encode(queries), dtype=np.float32)
+    cache = get_embedding_cache()
+    vectors = [cache.get(query, _cached_model_name) for query in queries]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_queries = [queries[i] for i in missing]
+        batcher = get_embedding_batcher(model)
+        if batcher is not None:
+            encoded = batcher.encode(missing_queries)
+        else:
+            encoded = np.asarray(model.encode(missing_queries), dtype=np.float32)
+        for i, vector in zip(missing, encoded):
+            cache.put(queries[i], _cached_model_name, vector)
+            vectors[i] = vector
+    return np.vstack(vectors)
+
+def get_embedding_executor():
+    global _embedding_executor
+    if _embedding_executor is None:
+        _embedding_executor = ThreadPoolExecutor(
+            max_workers=embedding_executor_workers, thread_name_prefix="embedding"
+        )
+    return _embedding_executor
+
+async def aencode_queries(model, queries):
+    """
+    encode_queries for async callers: the CPU-bound work runs in the embedding executor.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_embedding_executor(), encode_queries, model, queries)
+
+def get_index_settings(collection_name=QDRANT_COLLECTION):
+    """
+    The QDRANT_INDEX_CONFIG settings (HNSW, quantization, on-disk storage, search params)
+    of a collection; {} when none are configured.
+    """
+    global _cached_index_config
+    if _cached_index_config is None:
+        _cached_index_config = load_index_config(qdrant_index_config)
+    return collection_index_settings(_cached_index_config, collection_name)
+
+def get_search_params(collection_name=QDRANT_COLLECTION):
+    """models.SearchParams configured for a collection, or None for Qdrant's defaults."""
+    return search_params(get_index_settings(collection_name))
+
+def qdrant_grpc_options(retries=None, keepalive_seconds=None):
+    """
+    gRPC channel options: HTTP/2 keep-alive pings hold the channel open across idle periods,
+    and calls failing with UNAVAILABLE (server restart, dropped connection) are retried with
+    exponential backoff.
+    """
+    retries = qdrant_retries if retries is None else retries
+    keepalive_seconds = qdrant_keepalive_seconds if keepalive_seconds is None else keepalive_seconds
+    options = {
+        "grpc.keepalive_time_ms": int(keepalive_seconds * 1000),
+        "grpc.keepalive_timeout_ms": 10_000,
+        "grpc.keepalive_permit_without_calls": 1,
+        "grpc.http2.max_pings_without_data": 0,
+        "grpc.enable_retries": int(retries > 0),
+    }
+    if retries > 0:
+        options["grpc.service_config"] = json.dumps({
+            "methodConfig": [{
+                "name": [{"service": "qdrant.Points"}, {"service": "qdrant.Collections"}],
+                "retryPolicy": {
+                    "maxAttempts": min(retries + 1, 5),  # gRPC caps attempts at 5
+                    "initialBackoff": "0.1s",
+                    "maxBackoff": "2s",
+                    "backoffMultiplier": 2,
+                    "retryableStatusCodes": ["UNAVAILABLE"]
+                }
+            }]
+        })
+    return options
+
+def qdrant_client_kwargs(host=None, port=None, prefer_grpc=None):
+    """
+    Keyword arguments for QdrantClient / AsyncQdrantClient built from the QDRANT_* settings.
+
+    REST requests share one keep-alive httpx connection pool (QDRANT_MAX_CONNECTIONS); with
+    prefer_grpc, point and collection operations use one multiplexed gRPC channel on
+    QDRANT_GRPC_PORT instead, with keep-alive pings and retries (qdrant_grpc_options).
+    """
+    return {
+        "host": host or qdrant_host,
+        "port": port or qdrant_port,
+        "grpc_port": qdrant_grpc_port,
+        "prefer_grpc": qdrant_prefer_grpc if prefer_grpc is None else prefer_grpc,
+        "timeout": qdrant_timeout,
+        "grpc_options": qdrant_grpc_options(),
+        "limits": qdrant_rest_limits()
+    }
+
+def qdrant_rest_limits():
+    return httpx.Limits(
+        max_connections=qdrant_max_connections,
+        max_keepalive_connections=qdrant_max_connections,
+        keepalive_expiry=qdrant_keepalive_seconds
+    )
+
+def is_transient_qdrant_error(error):
+    """
+    Whether a failed REST call is worth retrying: the connection failed or timed out, or the
+    server answered 502/503/504. gRPC calls are retried by the channel (qdrant_grpc_options).
+    """
+    if isinstance(error, ResponseHandlingException):
+        error = error.source
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, UnexpectedResponse) and error.status_code in (502, 503, 504)
+
+def with_qdrant_retries(method, *args, retries=None, backoff_seconds=0.1, **kwargs):
+    """
+    Call a read-only client method (search, search_batch, retrieve), retrying transient
+    failures QDRANT_RETRIES times with exponential backoff. Other errors are raised at once.
+    """
+    retries = qdrant_retries if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return method(*args, **kwargs)
+        except Exception as error:
+            if attempt == retries or not is_transient_qdrant_error(error):
+                raise
+            logger.warning(f"Qdrant call failed ({error!r}); retry {attempt + 1} of {retries}.")
+            time.sleep(backoff_seconds * 2 ** attempt)
+
+async def awith_qdrant_retries(method, *args, retries=None, backoff_seconds=0.1, **kwargs):
+    """with_qdrant_retries for AsyncQdrantClient methods; the backoff does not block the loop."""
+    retries = qdrant_retries if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return await method(*args, **kwargs)
+        except Exception as error:
+            if attempt == retries or not is_transient_qdrant_error(error):
+                raise
+            logger.warning(f"Qdrant call failed ({error!r}); retry {attempt + 1} of {retries}.")
+            await asyncio.sleep(backoff_seconds * 2 ** attempt)
+
+def create_qdrant_client(host=None, port=None, prefer_grpc=None):
+    """A QdrantClient configured from the QDRANT_* transport settings."""
+    return QdrantClient(**qdrant_client_kwargs(host, port, prefer_grpc))
+
+def initialize_qdrant(collection_name, vector_size, client=None, index_settings=None, snapshot_location=None,
+                      snapshot_checksum=None):
+    """
+    Create the collection if it does not exist yet, with the vector storage, HNSW and
+    quantization settings of `index_settings` (default: QDRANT_INDEX_CONFIG). Settings of an
+    existing collection are left as they are.
+    With `snapshot_location` (a URL or a file:// path on the Qdrant host, see
+    ai.retrieval.load.snapshot), a missing collection is recovered from that snapshot instead,
+    so a new replica starts with the full corpus without re-embedding it.
+    """
     if client is None:
-        client = QdrantClient(host=qdrant_host, port=qdrant_port)
+        client = create_qdrant_client()
     if client.collection_exists(collection_name) == False:
+        if snapshot_location:
+            client.recover_snapshot(
+                collection_name=collection_name,
+                location=snapshot_location,
+                checksum=snapshot_checksum,
+                priority=models.SnapshotPriority.SNAPSHOT,
+                wait=True
+            )
+            return client
+        if index_settings is None:
+            index_settings = get_index_settings(collection_name)
         client.create_collection(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=vector_size, distance="Cosine")
+            **create_collection_kwargs(index_settings, vector_size)
         )
     return client
 
@@ -32,10 +306,88 @@ def get_qdrant_client(collection_name=QDRANT_COLLECTION, model_name="all-MiniLM-
         return _cached_client
     model = get_sentence_transformer(model_name)
     vector_size = model.get_sentence_embedding_dimension()
-    _cached_client = initialize_qdrant(collection_name, vector_size)
+    _cached_client = initialize_qdrant(
+        collection_name, vector_size,
+        snapshot_location=qdrant_snapshot_location, snapshot_checksum=qdrant_snapshot_checksum
+    )
     return _cached_client
 
+def get_async_qdrant_client():
+    """
+    Returns the AsyncQdrantClient for the running event loop. Its httpx connection pool
+    (QDRANT_MAX_CONNECTIONS), or its gRPC channel with QDRANT_PREFER_GRPC, is shared by every
+    in-flight retrieval on that loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _cached_async_clients.get(loop)
+    if client is None:
+        client = AsyncQdrantClient(**qdrant_client_kwargs())
+        _cached_async_clients[loop] = client
+    return client
+
+def get_local_index_backend():
+    global _cached_local_backend
+    if _cached_local_backend is None:
+        _cached_local_backend = LocalIndexBackend(local_index_path, nprobe=local_index_nprobe)
+    return _cached_local_backend
+
+def get_lexical_index(collection_name=QDRANT_COLLECTION):
+    """
+    The memory-mapped BM25 index of a collection (`<LEXICAL_INDEX_PATH>/<collection>`),
+    or None if it has not been built.
+    """
+    if collection_name not in _cached_lexical_indexes:
+        path = os.path.join(lexical_index_path, collection_name)
+        _cached_lexical_indexes[collection_name] = LexicalIndex(path) if os.path.exists(path) else None
+    return _cached_lexical_indexes[collection_name]
+
 def init_embeddings_helperions(collection_name=QDRANT_COLLECTION, model_name="all-MiniLM-L6-v2"):
-    client = get_qdrant_client(collection_name, model_name)
+    # RETRIEVAL_BACKEND selects who answers `search`: the remote Qdrant or the in-process index
+    if retrieval_backend == "local":
+        client = get_local_index_backend()
+    else:
+        client = get_qdrant_client(collection_name, model_name)
     model = get_sentence_transformer(model_name)
     return client, model
+
+async def init_async_embeddings_helperions(collection_name=QDRANT_COLLECTION, model_name="all-MiniLM-L6-v2"):
+    """
+    Async counterpart of init_embeddings_helperions; must be called from a running event loop.
+    The first call loads the model and creates (or recovers) the collection in the embedding
+    executor. The local index backend is synchronous and is searched in that executor too.
+    """
+    if _cached_model is None or (retrieval_backend != "local" and _cached_client is None):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(get_embedding_executor(), init_embeddings_helperions, collection_name, model_name)
+    if retrieval_backend == "local":
+        client = get_local_index_backend()
+    else:
+        client = get_async_qdrant_client()
+    return client, get_sentence_transformer(model_name)
+
+def get_collection_fingerprint(collection_name=QDRANT_COLLECTION):
+    """
+    A value that changes when points are added to or removed from the collection, or when
+    its alias is switched to another collection (compaction); polled by caches built on top
+    of it to notice writes made by other processes. Writes that keep the point count (e.g.
+    payload updates) are only seen through invalidate_collection.
+    """
+    client, _ = init_embeddings_helperions(collection_name)
+    if hasattr(client, "get_collection"):
+        target = next((alias.collection_name for alias in client.get_aliases().aliases
+                       if alias.alias_name == collection_name), collection_name)
+        return target, client.get_collection(collection_name).points_count
+    return collection_name, client.count(collection_name).count
+
+def add_collection_write_listener(listener):
+    """Register `listener(collection_name)`, called by invalidate_collection."""
+    _collection_write_listeners.append(listener)
+
+def invalidate_collection(collection_name=QDRANT_COLLECTION):
+    """
+    Called by the write paths (ingest, compaction) once `collection_name` has changed: drops
+    its cached lexical index and notifies the caches built on top of it.
+    """
+    _cached_lexical_indexes.pop(collection_name, None)
+    for listener in list(_collection_write_listeners):
+        listener(collection_name)
@@ -0,0 +1,128 @@
+"""
+Per-collection Qdrant index settings: vector storage, HNSW graph, quantization and search params.
+
+QDRANT_INDEX_CONFIG holds a JSON object (inline, or the path of a JSON file) mapping collection
+names to settings; "default" applies to collections without an entry of their own:
+
+    {
+      "default": {"search": {"hnsw_ef": 128}},
+      "customer_support_tweets": {
+        "on_disk": true,
+        "hnsw": {"m": 16, "ef_construct": 100},
+        "quantization": {"type": "scalar", "quantile": 0.99, "always_ram": true},
+        "search": {"hnsw_ef": 128, "rescore": true, "oversampling": 2.0}
+      }
+    }
+
+Creation settings (`on_disk`, `on_disk_payload`, `hnsw`, `quantization`) apply when
+initialize_qdrant creates a collection; `search` is passed to every search on it.
+"""
+import json
+import os
+
+from qdrant_client.http import models
+
+_TOP_LEVEL_KEYS = {"on_disk", "on_disk_payload", "hnsw", "quantization", "search"}
+_HNSW_KEYS = {"m", "ef_construct", "full_scan_threshold", "on_disk"}
+_QUANTIZATION_KEYS = {"type", "quantile", "always_ram", "compression"}
+_SEARCH_KEYS = {"hnsw_ef", "exact", "rescore", "oversampling", "ignore_quantization"}
+
+
+def load_index_config(value):
+    """
+    Parse QDRANT_INDEX_CONFIG: inline JSON or a path to a JSON file. Empty means no settings.
+    """
+    if not value:
+        return {}
+    if os.path.isfile(value):
+        with open(value) as f:
+            config = json.load(f)
+    else:
+        config = json.loads(value)
+    if not isinstance(config, dict):
+        raise ValueError("QDRANT_INDEX_CONFIG must be a JSON object keyed by collection name.")
+    for collection_name, settings in config.items():
+        validate_index_settings(settings, collection_name)
+    return config
+
+
+def validate_index_settings(settings, collection_name="default"):
+    """Reject unknown keys, so a typo does not silently fall back to the defaults."""
+    if not isinstance(settings, dict):
+        raise ValueError(f"Index settings for '{collection_name}' must be a JSON object.")
+    for section, allowed in ((None, _TOP_LEVEL_KEYS), ("hnsw", _HNSW_KEYS),
+                             ("quantization", _QUANTIZATION_KEYS), ("search", _SEARCH_KEYS)):
+        values = settings if section is None else settings.get(section) or {}
+        unknown = set(values) - allowed
+        if unknown:
+            where = collection_name if section is None else f"{collection_name}.{section}"
+            raise ValueError(f"Unknown index settings {sorted(unknown)} for '{where}'.")
+    quantization = settings.get("quantization")
+    if quantization and quantization.get("type") not in ("scalar", "binary", "product"):
+        raise ValueError(
+            f"Unsupported quantization type {quantization.get('type')!r} for '{collection_name}'; "
+            f"expected 'scalar', 'binary' or 'product'."
+        )
+
+
+def collection_index_settings(config, collection_name):
+    """The settings of one collection, falling back to the "default" entry."""
+    return config.get(collection_name, config.get("default", {}))
+
+
+def quantization_config(settings):
+    quantization = settings.get("quantization")
+    if not quantization:
+        return None
+    always_ram = quantization.get("always_ram", True)
+    if quantization["type"] == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=quantization.get("quantile"),
+            always_ram=always_ram
+        ))
+    if quantization["type"] == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=always_ram))
+    return models.ProductQuantization(product=models.ProductQuantizationConfig(
+        compression=models.CompressionRatio(quantization.get("compression", "x16")),
+        always_ram=always_ram
+    ))
+
+
+def create_collection_kwargs(settings, vector_size):
+    """Keyword arguments for QdrantClient.create_collection."""
+    hnsw = settings.get("hnsw")
+    kwargs = {
+        "vectors_config": models.VectorParams(
+            size=vector_size,
+            distance=models.Distance.COSINE,
+            on_disk=settings.get("on_disk")
+        )
+    }
+    if hnsw:
+        kwargs["hnsw_config"] = models.HnswConfigDiff(**hnsw)
+    quantization = quantization_config(settings)
+    if quantization is not None:
+        kwargs["quantization_config"] = quantization
+    if settings.get("on_disk_payload") is not None:
+        kwargs["on_disk_payload"] = settings["on_disk_payload"]
+    return kwargs
+
+
+def search_params(settings):
+    """models.SearchParams for searches on the collection, or None to use Qdrant's defaults."""
+    search = settings.get("search")
+    if not search:
+        return None
+    quantization = None
+    if any(key in search for key in ("rescore", "oversampling", "ignore_quantization")):
+        quantization = models.QuantizationSearchParams(
+            ignore=search.get("ignore_quantization", False),
+            rescore=search.get("rescore"),
+            oversampling=search.get("oversampling")
+        )
+    return models.SearchParams(
+        hnsw_ef=search.get("hnsw_ef"),
+        exact=search.get("exact", False),
+        quantization=quantization
+    )
@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+_META_FILE = "meta.json"
+_VOCAB_FILE = "vocab.json"
+_DOC_IDS_FILE = "doc_ids.json"
+_TERM_OFFSETS_FILE = "term_offsets.npy"
+_POSTINGS_DOCS_FILE = "postings_docs.npy"
+_POSTINGS_TF_FILE = "postings_tf.npy"
+_DOC_LENGTHS_FILE = "doc_lengths.npy"
+
+# Keeps order numbers, versions and error codes ("#A-1234", "v2.1", "err_503") as one token
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/#][a-z0-9]+)*")
+_PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """
+    Lower-cased alphanumeric tokens. Compound tokens are kept whole and also split into their
+    parts, so "ERR_503" matches both "err_503" and "503".
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(str(text or "").lower()):
+        tokens.append(token)
+        parts = _PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def document_text(payload):
+    """The text indexed for a point: its question and its reply."""
+    return f"{payload.get('input') or ''} {payload.get('reply') or ''}"
+
+
+def build_lexical_index(path, ids, texts, k1=1.2, b=0.75):
+    """
+    Build a BM25 inverted index under `path`.
+
+    Postings are stored term-major in flat arrays (doc rows int32, term frequencies uint16)
+    with one offset per term, so a query term's postings are a contiguous memory-mapped slice.
+    """
+    os.makedirs(path, exist_ok=True)
+    vocab = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.int32)
+    term_chunks, row_chunks, term_ids, doc_rows = [], [], [], []
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths[row] = len(tokens)
+        term_ids.extend(vocab.setdefault(token, len(vocab)) for token in tokens)
+        doc_rows.extend([row] * len(tokens))
+        if len(term_ids) >= 1 << 20:  # flush to compact arrays instead of growing Python int lists
+            term_chunks.append(np.asarray(term_ids, dtype=np.int64))
+            row_chunks.append(np.asarray(doc_rows, dtype=np.int64))
+            term_ids, doc_rows = [], []
+    term_ids = np.concatenate(term_chunks + [np.asarray(term_ids, dtype=np.int64)])
+    doc_rows = np.concatenate(row_chunks + [np.asarray(doc_rows, dtype=np.int64)])
+
+    # One posting per (term, doc) pair with its count, sorted by term then doc
+    keys, tf = np.unique(term_ids * max(len(texts), 1) + doc_rows, return_counts=True)
+    posting_terms = keys // max(len(texts), 1)
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(posting_terms, minlength=len(vocab)), out=term_offsets[1:])
+
+    np.save(os.path.join(path, _POSTINGS_DOCS_FILE), (keys % max(len(texts), 1)).astype(np.int32))
+    np.save(os.path.join(path, _POSTINGS_TF_FILE), np.minimum(tf, np.iinfo(np.uint16).max).astype(np.uint16))
+    np.save(os.path.join(path, _TERM_OFFSETS_FILE), term_offsets)
+    np.save(os.path.join(path, _DOC_LENGTHS_FILE), doc_lengths)
+    with open(os.path.join(path, _VOCAB_FILE), "w") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(path, _DOC_IDS_FILE), "w") as f:
+        json.dump(list(ids), f)
+    with open(os.path.join(path, _META_FILE), "w") as f:
+        json.dump({
+            "documents": len(texts),
+            "terms": len(vocab),
+            "postings": int(keys.size),
+            "average_length": float(doc_lengths.mean()) if len(texts) else 0.0,
+            "k1": k1,
+            "b": b
+        }, f)
+    return LexicalIndex(path)
+
+
+def build_lexical_index_from_collection(client, collection_name, path, scroll_limit=10_000, k1=1.2, b=0.75):
+    """
+    Scroll every payload of a collection (no vectors) and index its question and reply text.
+    """
+    ids, texts = [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=scroll_limit,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        ids.extend(p.id for p in points)
+        texts.extend(document_text(p.payload or {}) for p in points)
+        if offset is None:
+            break
+    return build_lexical_index(path, ids, texts, k1=k1, b=b)
+
+
+def rebuild_lexical_index_from_collection(client, collection_name, path, **kwargs):
+    """
+    build_lexical_index_from_collection into a staging directory that then replaces `path`
+    by rename, so processes that memory-mapped the old files keep reading them intact.
+    """
+    staging, previous = f"{path}.building", f"{path}.previous"
+    for leftover in (staging, previous):
+        shutil.rmtree(leftover, ignore_errors=True)
+    build_lexical_index_from_collection(client, collection_name, staging, **kwargs)
+    if os.path.exists(path):
+        os.rename(path, previous)
+    os.rename(staging, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    return LexicalIndex(path)
+
+
+def index_size_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+class LexicalIndex:
+    """
+    Memory-mapped BM25 index written by build_lexical_index. Only the vocabulary and the
+    point ids are loaded into RAM; postings are paged in from disk as queries touch them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, _META_FILE)) as f:
+            meta = json.load(f)
+        self.documents = meta["documents"]
+        self.average_length = meta["average_length"] or 1.0
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        with open(os.path.join(path, _VOCAB_FILE)) as f:
+            self.vocab = json.load(f)
+        with open(os.path.join(path, _DOC_IDS_FILE)) as f:
+            self.doc_ids = json.load(f)
+        self.term_offsets = np.load(os.path.join(path, _TERM_OFFSETS_FILE), mmap_mode="r")
+        self.postings_docs = np.load(os.path.join(path, _POSTINGS_DOCS_FILE), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(path, _POSTINGS_TF_FILE), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, _DOC_LENGTHS_FILE), mmap_mode="r")
+
+    def search(self, query, limit=10, max_doc_fraction=0.25):
+        """
+        Returns (point ids, BM25 scores) of the best `limit` documents, best first.
+        Terms in more than `max_doc_fraction` of the documents ("the", "my") are skipped: their
+        idf is near zero and their postings would dominate query latency.
+        """
+        docs, contributions = [], []
+        for token in set(tokenize(query)):
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, stop = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+            doc_freq = stop - start
+            if doc_freq > max_doc_fraction * self.documents:
+                continue
+            rows = np.asarray(self.postings_docs[start:stop])
+            tf = np.asarray(self.postings_tf[start:stop], dtype=np.float32)
+            idf = np.log(1.0 + (self.documents - doc_freq + 0.5) / (doc_freq + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * np.asarray(self.doc_lengths[rows]) / self.average_length)
+            docs.append(rows)
+            contributions.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        if not docs:
+            return [], []
+        unique_rows, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        top = np.argsort(-scores, kind="stable")[:limit] if scores.size <= limit \
+            else np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.doc_ids[row] for row in unique_rows[top].tolist()], scores[top].tolist()
+
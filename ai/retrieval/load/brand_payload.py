@@ -0,0 +1,86 @@
+"""
+Add the `brand` payload field and its keyword index to an already-loaded collection.
+
+    python -m ai.retrieval.load.brand_payload --collection customer_support_tweets
+    python -m ai.retrieval.load.brand_payload --collection customer_support_tweets --dry-run
+
+New loads get the field from `ai.retrieval.load.ingest`. This backfill scrolls the payloads
+(no vectors), extracts the brand from each question and writes it with one set_payload call per
+brand and scroll page. Searches then pass brand_filter(...) as `query_filter`.
+"""
+import argparse
+import json
+import logging
+import os
+from collections import Counter
+
+from qdrant_client.http import models
+
+from ai.retrieval.brand import BRAND_FIELD, extract_brand
+from ai.retrieval.embeddings_helper import QDRANT_COLLECTION, create_qdrant_client
+from ai.retrieval.load.ingest import create_payload_indexes
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_brand(client, collection_name=QDRANT_COLLECTION, input_field="input", scroll_limit=5000,
+                   overwrite=False, dry_run=False):
+    """
+    Extract and store the brand of every point. Returns {brand: point count}, with None
+    counting the points where no brand was found. Points that already carry the field are left
+    alone unless `overwrite`.
+    """
+    if not dry_run:
+        create_payload_indexes(client, collection_name, {BRAND_FIELD: models.PayloadSchemaType.KEYWORD})
+    counts = Counter()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name, limit=scroll_limit, offset=offset,
+            with_payload=True, with_vectors=False
+        )
+        by_brand = {}
+        for point in points:
+            payload = point.payload or {}
+            if BRAND_FIELD in payload and not overwrite:
+                counts[payload[BRAND_FIELD]] += 1
+                continue
+            brand = extract_brand(payload, input_field)
+            counts[brand] += 1
+            by_brand.setdefault(brand, []).append(point.id)
+        if not dry_run:
+            for brand, ids in by_brand.items():
+                client.set_payload(collection_name=collection_name, payload={BRAND_FIELD: brand}, points=ids, wait=False)
+        if offset is None:
+            break
+    return dict(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default=QDRANT_COLLECTION)
+    parser.add_argument("--host", default=os.getenv("QDRANT_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("QDRANT_PORT", 6333)))
+    parser.add_argument("--grpc", action="store_true", default=None,
+                        help="Use gRPC (QDRANT_GRPC_PORT) instead of REST; default: QDRANT_PREFER_GRPC.")
+    parser.add_argument("--input-field", default="input")
+    parser.add_argument("--overwrite", action="store_true", help="Re-extract brands already stored.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the brands that would be written.")
+    parser.add_argument("--top", type=int, default=30, help="Brands to print.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    client = create_qdrant_client(host=args.host, port=args.port, prefer_grpc=args.grpc)
+    counts = backfill_brand(client, args.collection, input_field=args.input_field,
+                            overwrite=args.overwrite, dry_run=args.dry_run)
+    total = sum(counts.values())
+    print(json.dumps({
+        "points": total,
+        "without_brand": counts.get(None, 0),
+        "brands": len([b for b in counts if b is not None]),
+        "top_brands": Counter({b: n for b, n in counts.items() if b is not None}).most_common(args.top)
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
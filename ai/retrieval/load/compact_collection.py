@@ -0,0 +1,314 @@
+"""
+Collapse duplicate Q/A groups into one canonical point each and switch the serving alias.
+
+    python -m ai.retrieval.load.compact_collection --collection customer_support_tweets_live
+    python -m ai.retrieval.load.compact_collection --collection customer_support_tweets --alias customer_support_tweets_live
+
+Groups come from flag_duplicate_sentences_from_qdrant. Each group keeps its most connected
+member, whose payload gains `member_count` and `representative_replies`. The compacted
+collection is written next to the source and the alias is re-pointed in a single
+update_collection_aliases call, so searches never see a half-built collection. The backend
+reads the alias through QDRANT_COLLECTION.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+from qdrant_client.http import models
+
+from ai.retrieval.embeddings_helper import QDRANT_COLLECTION, create_qdrant_client, invalidate_collection
+from ai.retrieval.lexical_index import rebuild_lexical_index_from_collection
+from ai.retrieval.load.flag_duplicate_data import flag_duplicate_sentences_from_qdrant
+from ai.retrieval.load.ingest import create_payload_indexes, wait_for_collection_ready
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_alias(client, name):
+    """Returns the collection an alias points to, or None if `name` is not an alias."""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == name:
+            return alias.collection_name
+    return None
+
+
+def plan_compaction(flagged_df, max_representative_replies=3):
+    """
+    Pick one canonical point per duplicate group.
+
+    The canonical member is the one with the most above-threshold neighbours (ties: highest
+    mean similarity, then scroll order). Ungrouped points are kept as they are.
+    Returns {canonical qdrant_id: payload additions}.
+    """
+    if flagged_df.empty:
+        return {}
+    df = flagged_df.copy()
+    df["degree"] = df["grouped_with"].map(len)
+    df["mean_score"] = df["grouped_with"].map(lambda n: float(np.mean([x["score"] for x in n])) if n else 0.0)
+    df["position"] = np.arange(len(df))
+    # Ungrouped points get a group of their own
+    df["group_key"] = df["group"].where(df["group"].notna(), -(df["position"] + 1))
+
+    plan = {}
+    for _, members in df.sort_values(["degree", "mean_score", "position"], ascending=[False, False, True]) \
+            .groupby("group_key", sort=False):
+        canonical = members.iloc[0]
+        replies = [canonical["reply"]] + members["reply"].iloc[1:].value_counts().index.tolist()
+        representative = []
+        for reply in replies:
+            if reply and reply not in representative:
+                representative.append(reply)
+            if len(representative) == max_representative_replies:
+                break
+        plan[canonical["qdrant_id"]] = {
+            "member_count": int(len(members)),
+            "representative_replies": representative
+        }
+    return plan
+
+
+def collection_create_kwargs(config):
+    """
+    QdrantClient.create_collection arguments that reproduce a collection's config: vector
+    params, sparse vectors, replication, on-disk payload, HNSW, optimizer, WAL and
+    quantization settings.
+    """
+    params = config.params
+    kwargs = {
+        "vectors_config": params.vectors,
+        "sparse_vectors_config": params.sparse_vectors,
+        # The copy upserts without shard keys, so a custom sharding method is not carried over
+        "shard_number": params.shard_number,
+        "replication_factor": params.replication_factor,
+        "write_consistency_factor": params.write_consistency_factor,
+        "on_disk_payload": params.on_disk_payload,
+        "quantization_config": config.quantization_config,
+    }
+    for name, value, diff_class in (
+        ("hnsw_config", config.hnsw_config, models.HnswConfigDiff),
+        ("optimizers_config", config.optimizer_config, models.OptimizersConfigDiff),
+        ("wal_config", config.wal_config, models.WalConfigDiff),
+    ):
+        if value is not None:
+            kwargs[name] = diff_class(**value.model_dump(exclude_none=True))
+    return {name: value for name, value in kwargs.items() if value is not None}
+
+
+def payload_index_schemas(payload_schema):
+    """{field: schema} of a collection's payload indexes, as create_payload_indexes takes them."""
+    return {field: info.params or info.data_type for field, info in (payload_schema or {}).items()}
+
+
+def copy_canonical_points(client, source, target, plan, scroll_limit=1000):
+    """Stream the source collection and upsert only the canonical points, with their new payload."""
+    copied = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=source, limit=scroll_limit, offset=offset, with_payload=True, with_vectors=True
+        )
+        batch = [
+            models.PointStruct(id=p.id, vector=p.vector, payload={**(p.payload or {}), **plan[p.id]})
+            for p in points if p.id in plan
+        ]
+        if batch:
+            client.upsert(collection_name=target, points=batch, wait=False)
+            copied += len(batch)
+        if offset is None:
+            break
+    return copied
+
+
+def estimate_index_ram_bytes(points_count, dim):
+    """Qdrant's sizing rule of thumb: float32 vectors plus ~50% for the HNSW graph and metadata."""
+    return int(points_count * dim * 4 * 1.5)
+
+
+def measure_search(client, collection_name, query_vectors, top_k=20):
+    """Search latency percentiles (ms) and the hit ids of every query."""
+    latencies, hit_ids = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        hits = client.search(collection_name=collection_name, query_vector=vector, limit=top_k)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        hit_ids.append([hit.id for hit in hits])
+    latency = {
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+        "p99_ms": float(np.percentile(latencies, 99)) if latencies else None
+    }
+    return latency, hit_ids
+
+
+def duplicate_hits_per_query(hit_ids, group_of):
+    """Mean number of top-k hits that repeat a group already present in the same result list."""
+    if not hit_ids:
+        return 0.0
+    repeats = [len(ids) - len({group_of.get(i, i) for i in ids}) for ids in hit_ids]
+    return float(np.mean(repeats))
+
+
+def switch_alias(client, alias, target):
+    """Point `alias` at `target` in one atomic alias update (delete + create)."""
+    operations = []
+    if resolve_alias(client, alias) is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=target, alias_name=alias)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+
+
+def compact_collection(
+    client,
+    collection=QDRANT_COLLECTION,
+    alias=None,
+    target_name=None,
+    threshold=0.95,
+    engine="matrix",
+    max_representative_replies=3,
+    switch=True,
+    delete_previous=False,
+    sample_queries=200,
+    top_k=20,
+    consistency_timeout=600.0,
+    lexical_index_path=None
+):
+    """
+    Compact `collection` (a collection or an alias) into a new collection and re-point `alias`.
+
+    Args:
+        alias (str): Alias to switch; defaults to `collection`, which must then be an alias
+            (Qdrant cannot alias over an existing collection name).
+        target_name (str): Name of the compacted collection; defaults to a timestamped one.
+        delete_previous (bool): Drop the collection the alias pointed to after the switch.
+        lexical_index_path (str): Rebuild the BM25 index for hybrid retrieval from the
+            compacted collection under `<lexical_index_path>/<alias>` (`<target>` without a
+            switch); the old index would fuse ids that no longer exist. Running workers pick
+            it up on restart.
+
+    Returns:
+        dict: before/after point counts, index RAM estimates, search latency and
+            duplicate hits per top-k query.
+    """
+    wall_start = time.perf_counter()
+    alias = alias or collection
+    source = resolve_alias(client, collection) or collection
+    if switch and resolve_alias(client, alias) is None and client.collection_exists(alias):
+        raise ValueError(
+            f"'{alias}' is a collection, not an alias, so it cannot be switched. "
+            f"Pass a new alias name and point QDRANT_COLLECTION at it."
+        )
+    target = target_name or f"{alias}_compacted_{time.strftime('%Y%m%d%H%M%S')}"
+
+    source_info = client.get_collection(source)
+    vectors_config = source_info.config.params.vectors
+    points_before = source_info.points_count or client.count(source).count
+
+    flagged = flag_duplicate_sentences_from_qdrant(
+        collection_name=source,
+        threshold=threshold,
+        show_progress=False,
+        group_limit=points_before,
+        engine=engine,
+        client=client
+    )
+    plan = plan_compaction(flagged, max_representative_replies=max_representative_replies)
+    group_of = {}
+    if not flagged.empty:
+        grouped = flagged.dropna(subset=["group"])
+        group_of = dict(zip(grouped["qdrant_id"], grouped["group"]))
+
+    # Same index settings and payload indexes as the source, so the alias switch keeps
+    # filtered and tuned searches as fast as they were
+    client.create_collection(collection_name=target, **collection_create_kwargs(source_info.config))
+    create_payload_indexes(client, target, payload_index_schemas(source_info.payload_schema))
+    copied = copy_canonical_points(client, source, target, plan)
+    info = wait_for_collection_ready(client, target, timeout=consistency_timeout)
+    points_after = info.points_count or client.count(target).count
+    if points_after != copied:
+        raise RuntimeError(f"Compacted collection holds {points_after} points, expected {copied}.")
+
+    sample, _ = client.scroll(collection_name=source, limit=sample_queries, with_vectors=True)
+    query_vectors = [p.vector for p in sample]
+    latency_before, hits_before = measure_search(client, source, query_vectors, top_k=top_k)
+    latency_after, hits_after = measure_search(client, target, query_vectors, top_k=top_k)
+
+    previous = resolve_alias(client, alias)
+    if switch:
+        switch_alias(client, alias, target)
+        logger.info(f"Alias '{alias}' now points to '{target}' (was '{previous}').")
+        if delete_previous and previous and previous != target:
+            client.delete_collection(previous)
+    if lexical_index_path:
+        lexical_name = alias if switch else target
+        lexical_index = rebuild_lexical_index_from_collection(
+            client, target, os.path.join(lexical_index_path, lexical_name)
+        )
+        logger.info(f"Rebuilt the lexical index of '{lexical_name}' ({lexical_index.documents} documents).")
+    if switch:
+        invalidate_collection(alias)
+
+    dim = len(query_vectors[0]) if query_vectors else vectors_config.size
+    return {
+        "source_collection": source,
+        "compacted_collection": target,
+        "alias": alias,
+        "switched": switch,
+        "points_before": points_before,
+        "points_after": points_after,
+        "point_reduction": 1.0 - points_after / points_before if points_before else 0.0,
+        "index_ram_mb_before": estimate_index_ram_bytes(points_before, dim) / 2 ** 20,
+        "index_ram_mb_after": estimate_index_ram_bytes(points_after, dim) / 2 ** 20,
+        "search_latency_before": latency_before,
+        "search_latency_after": latency_after,
+        f"duplicate_hits_in_top_{top_k}_before": duplicate_hits_per_query(hits_before, group_of),
+        f"duplicate_hits_in_top_{top_k}_after": duplicate_hits_per_query(hits_after, group_of),
+        "seconds": time.perf_counter() - wall_start
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default=QDRANT_COLLECTION, help="Collection or alias to compact.")
+    parser.add_argument("--alias", default=None, help="Alias to switch (default: --collection).")
+    parser.add_argument("--target", default=None, help="Name of the compacted collection.")
+    parser.add_argument("--host", default=os.getenv("QDRANT_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("QDRANT_PORT", 6333)))
+    parser.add_argument("--grpc", action="store_true", default=None,
+                        help="Use gRPC (QDRANT_GRPC_PORT) instead of REST; default: QDRANT_PREFER_GRPC.")
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--engine", choices=["bfs", "matrix", "lsh"], default="matrix")
+    parser.add_argument("--representative-replies", type=int, default=3)
+    parser.add_argument("--no-switch", action="store_true", help="Build and report, but leave the alias alone.")
+    parser.add_argument("--delete-previous", action="store_true",
+                        help="Delete the collection the alias pointed to after switching.")
+    parser.add_argument("--sample-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--lexical-index", default=None, metavar="PATH",
+                        help="Rebuild the BM25 index for RETRIEVAL_MODE=hybrid under PATH/<alias>.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    client = create_qdrant_client(host=args.host, port=args.port, prefer_grpc=args.grpc)
+    report = compact_collection(
+        client,
+        collection=args.collection,
+        alias=args.alias,
+        target_name=args.target,
+        threshold=args.threshold,
+        engine=args.engine,
+        max_representative_replies=args.representative_replies,
+        switch=not args.no_switch,
+        delete_previous=args.delete_previous,
+        sample_queries=args.sample_queries,
+        top_k=args.top_k,
+        lexical_index_path=args.lexical_index
+    )
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from ai.retrieval.retrieval_statistics import normalize_rows
+
+
+def scroll_collection_vectors(client, collection_name, scroll_limit=10000, dtype=np.float32, show_progress=True,
+                              total=None):
+    """
+    Scroll every point of a collection once. Returns (ids, vectors, payloads), with the
+    vectors L2-normalised in one contiguous array of `dtype` (float32 or float16).
+    """
+    ids, payloads, blocks = [], [], []
+    offset = None
+    with tqdm(total=total, desc="Retrieving points", disable=not show_progress) as pbar:
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=scroll_limit,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                ids.extend(p.id for p in points)
+                payloads.extend(p.payload or {} for p in points)
+                blocks.append(normalize_rows([p.vector for p in points]).astype(dtype))
+            pbar.update(len(points))
+            if offset is None:
+                break
+    if not blocks:
+        return [], np.zeros((0, 0), dtype=dtype), []
+    return ids, np.ascontiguousarray(np.concatenate(blocks)), payloads
+
+
+class UnionFind:
+    """Array-backed union-find whose unions and finds are vectorised over numpy index arrays."""
+
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def find(self, nodes):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        roots = self.parent[nodes]
+        while True:
+            next_roots = self.parent[roots]
+            if np.array_equal(next_roots, roots):
+                break
+            roots = next_roots
+        self.parent[nodes] = roots  # path compression
+        return roots
+
+    def union(self, a, b):
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        while a.size:
+            root_a, root_b = self.find(a), self.find(b)
+            pending = root_a != root_b
+            if not pending.any():
+                break
+            a, b = a[pending], b[pending]
+            low = np.minimum(root_a[pending], root_b[pending])
+            high = np.maximum(root_a[pending], root_b[pending])
+            # Several pairs may target the same root; keep the smallest, the rest retry next round
+            np.minimum.at(self.parent, high, low)
+
+    def roots(self):
+        return self.find(np.arange(self.parent.shape[0]))
+
+
+def _cap_per_source(src, dst, scores, max_neighbors):
+    """Keep at most `max_neighbors` highest-scoring edges per source node."""
+    if src.size == 0 or max_neighbors is None:
+        return src, dst, scores
+    order = np.lexsort((-scores, src))
+    src, dst, scores = src[order], dst[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]])
+    run_lengths = np.diff(np.r_[starts, src.size])
+    rank = np.arange(src.size) - np.repeat(starts, run_lengths)
+    keep = rank < max_neighbors
+    return src[keep], dst[keep], scores[keep]
+
+
+def _tile_pairs(vectors, row_start, row_stop, col_start, col_stop, threshold):
+    rows = np.asarray(vectors[row_start:row_stop], dtype=np.float32)
+    cols = np.asarray(vectors[col_start:col_stop], dtype=np.float32)
+    similarities = rows @ cols.T
+    mask = similarities >= threshold
+    if row_start == col_start:
+        mask &= np.triu(np.ones(mask.shape, dtype=bool), k=1)  # each pair once, no self pairs
+    i, j = np.nonzero(mask)
+    return i + row_start, j + col_start, similarities[i, j]
+
+
+def find_duplicate_pairs(vectors, threshold, chunk_size=4096, workers=None, max_neighbors=1000,
+                         union_find=None, show_progress=True):
+    """
+    All pairs with cosine similarity >= threshold, computed tile by tile on the upper triangle.
+
+    Peak memory per worker is about chunk_size * chunk_size float32 values. Tiles of one row
+    block are processed by one worker; matmul releases the GIL, so row blocks run in parallel.
+    Pairs are merged into `union_find` as they are found; the returned directed edges
+    (src, dst, score) keep at most `max_neighbors` per source, for the `grouped_with` column.
+    """
+    if threshold is None or threshold <= 0.0:
+        raise ValueError("A positive similarity threshold is required; <= 0.0 would pair every point.")
+    n = vectors.shape[0]
+    workers = workers or min(4, os.cpu_count() or 1)
+    union_find = union_find or UnionFind(n)
+    block_starts = list(range(0, n, chunk_size))
+
+    def process_row_block(row_start):
+        row_stop = min(row_start + chunk_size, n)
+        found = [_tile_pairs(vectors, row_start, row_stop, col_start, min(col_start + chunk_size, n), threshold)
+                 for col_start in block_starts if col_start >= row_start]
+        i = np.concatenate([f[0] for f in found])
+        j = np.concatenate([f[1] for f in found])
+        s = np.concatenate([f[2] for f in found])
+        # Both directions, capped per source, so neither end of a dense cluster explodes
+        return _cap_per_source(np.r_[i, j], np.r_[j, i], np.r_[s, s], max_neighbors)
+
+    edges = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for src, dst, scores in tqdm(pool.map(process_row_block, block_starts), total=len(block_starts),
+                                     desc="Comparing blocks", disable=not show_progress):
+            union_find.union(src, dst)
+            edges.append((src, dst, scores))
+
+    if not edges:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float32)
+    src = np.concatenate([e[0] for e in edges])
+    dst = np.concatenate([e[1] for e in edges])
+    scores = np.concatenate([e[2] for e in edges])
+    return _cap_per_source(src, dst, scores, max_neighbors)
+
+
+def label_groups(union_find, n, group_limit=None):
+    """
+    Number connected components 1, 2, ... in order of their smallest member, mirroring the
+    seeded BFS: only components containing one of the first `group_limit` points get a label.
+    """
+    roots = union_find.roots()
+    group_limit = n if group_limit is None else min(group_limit, n)
+    labels = [None] * n
+    root_to_label = {}
+    for idx in range(group_limit):
+        root = roots[idx]
+        if root not in root_to_label:
+            root_to_label[root] = len(root_to_label) + 1
+    for idx in range(n):
+        labels[idx] = root_to_label.get(roots[idx])
+    return labels
+
+
+def build_duplicate_frame(ids, payloads, labels, src, dst, scores):
+    """Assemble the qdrant_id / input_sentence / reply / group / grouped_with DataFrame."""
+    grouped_with = [[] for _ in ids]
+    for s, d, score in zip(src.tolist(), dst.tolist(), scores.tolist()):
+        if labels[s] is not None:
+            grouped_with[s].append({"neighbor_id": ids[d], "score": score})
+    return pd.DataFrame({
+        'qdrant_id': ids,
+        'input_sentence': [p.get('input') for p in payloads],
+        'reply': [p.get('reply') for p in payloads],
+        'group': labels,
+        'grouped_with': grouped_with
+    })
+
+
+def flag_duplicates_matrix(client, collection_name, threshold=0.8, show_progress=True, qdrant_scroll_limit=10000,
+                           group_limit=100, chunk_size=4096, workers=None, dtype=np.float32,
+                           max_neighbors=1000, total_points=None):
+    """
+    Matrix engine behind flag_duplicate_sentences_from_qdrant(engine="matrix"): one scroll,
+    blocked BLAS similarities, union-find grouping. No per-point network searches.
+    """
+    ids, vectors, payloads = scroll_collection_vectors(
+        client, collection_name, scroll_limit=qdrant_scroll_limit, dtype=dtype,
+        show_progress=show_progress, total=total_points
+    )
+    if not ids:
+        return pd.DataFrame()
+    union_find = UnionFind(len(ids))
+    src, dst, scores = find_duplicate_pairs(
+        vectors, threshold, chunk_size=chunk_size, workers=workers, max_neighbors=max_neighbors,
+        union_find=union_find, show_progress=show_progress
+    )
+    labels = label_groups(union_find, len(ids), group_limit=group_limit)
+    return build_duplicate_frame(ids, payloads, labels, src, dst, scores)
+
+
+_SMALL_BUCKET = 64  # buckets up to this size are verified pairwise in one batch, larger ones by matmul
+
+
+class SimHashIndex:
+    """
+    Sign-random-projection (SimHash) buckets over unit vectors, for near-linear duplicate search.
+
+    Each of `n_tables` tables hashes a vector to the sign pattern of `n_bits` random hyperplanes.
+    Two vectors at angle theta share a table's bucket with probability (1 - theta / pi) ** n_bits,
+    so a pair is a candidate with probability 1 - (1 - (1 - theta / pi) ** n_bits) ** n_tables.
+    Candidates are then verified with the exact cosine. Buckets larger than `max_bucket_size`
+    (e.g. thousands of identical "thank you" tweets) are only compared against their first
+    `max_bucket_size` members, which keeps the work linear in the bucket size while still
+    connecting the group through those pivots.
+
+    With `n_bits=None` the first `add` picks ceil(log2(n)) - 1 bits (8..24), about two points per
+    bucket, which keeps candidate generation linear; fewer bits raise recall and cost.
+    Points are added incrementally with `add`; the verified pairs are kept, so grouping after
+    a new load only costs the comparisons involving the new points.
+    """
+
+    def __init__(self, dim, n_bits=None, n_tables=16, max_bucket_size=2000, seed=0, dtype=np.float32):
+        if n_bits is not None and not 1 <= n_bits <= 62:
+            raise ValueError("n_bits must be between 1 and 62.")
+        self.dim = dim
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+        self.max_bucket_size = max_bucket_size
+        self.seed = seed
+        self.dtype = np.dtype(dtype)
+        self.hyperplanes = None
+        self.ids = []
+        self.vectors = np.zeros((0, dim), dtype=self.dtype)
+        self.codes = np.zeros((n_tables, 0), dtype=np.int64)
+        self.pair_src = np.zeros(0, dtype=np.int64)
+        self.pair_dst = np.zeros(0, dtype=np.int64)
+        self.pair_scores = np.zeros(0, dtype=np.float32)
+        self.threshold = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _init_hyperplanes(self, n_points):
+        if self.n_bits is None:
+            self.n_bits = int(np.clip(np.ceil(np.log2(max(n_points, 2))) - 1, 8, 24))
+        self.hyperplanes = np.random.default_rng(self.seed).normal(
+            size=(self.n_tables, self.n_bits, self.dim)).astype(np.float32)
+
+    def _codes(self, vectors, chunk=65536):
+        """Bucket code of every vector in every table, shape (n_tables, n)."""
+        planes = self.hyperplanes.reshape(-1, self.dim).T
+        weights = np.int64(1) << np.arange(self.n_bits, dtype=np.int64)
+        codes = np.empty((self.n_tables, vectors.shape[0]), dtype=np.int64)
+        for start in range(0, vectors.shape[0], chunk):
+            bits = np.asarray(vectors[start:start + chunk], dtype=np.float32) @ planes >= 0
+            codes[:, start:start + chunk] = (bits.reshape(-1, self.n_tables, self.n_bits) @ weights).T
+        return codes
+
+    def add(self, ids, vectors, threshold):
+        """
+        Add points and verify their candidate pairs at `threshold`. Returns the number of new pairs.
+        """
+        if self.threshold is not None and threshold != self.threshold:
+            raise ValueError(f"Index was built with threshold {self.threshold}; rebuild it for {threshold}.")
+        if threshold is None or threshold <= 0.0:
+            raise ValueError("A positive similarity threshold is required; <= 0.0 would pair every point.")
+        self.threshold = threshold
+        if len(ids) == 0:
+            return 0
+        if self.hyperplanes is None:
+            self._init_hyperplanes(len(ids))
+        vectors = normalize_rows(vectors).astype(self.dtype)
+        start = len(self.ids)
+        new_rows = np.arange(start, start + len(ids))
+        self.ids.extend(ids)
+        self.vectors = np.ascontiguousarray(np.concatenate([self.vectors, vectors]))
+
+        self.codes = np.concatenate([self.codes, self._codes(vectors)], axis=1)
+
+        found = []
+        for table_codes in self.codes:
+            # A stable sort keeps each bucket's members in insertion order, so its first
+            # max_bucket_size members (the pivots of an oversized bucket) never change
+            order = np.argsort(table_codes, kind="stable")
+            sorted_codes = table_codes[order]
+            starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+            sizes = np.diff(np.r_[starts, sorted_codes.size])
+            bucket_of_position = np.repeat(np.arange(starts.size), sizes)
+            position_of_row = np.empty_like(order)
+            position_of_row[order] = np.arange(order.size)
+            new_buckets = bucket_of_position[position_of_row[new_rows]]
+            run_start, run_size = starts[new_buckets], sizes[new_buckets]
+            small = (run_size > 1) & (run_size <= min(_SMALL_BUCKET, self.max_bucket_size))
+            found.extend(self._verify_runs(new_rows[small], run_start[small], run_size[small], order))
+            large = run_size > min(_SMALL_BUCKET, self.max_bucket_size)
+            for bucket_start in np.unique(run_start[large]).tolist():
+                rows = new_rows[large][run_start[large] == bucket_start]
+                found.append(self._verify_bucket(order[bucket_start:bucket_start + self.max_bucket_size], rows))
+        if not found:
+            return 0
+        src = np.concatenate([self.pair_src] + [f[0] for f in found])
+        dst = np.concatenate([self.pair_dst] + [f[1] for f in found])
+        scores = np.concatenate([self.pair_scores] + [f[2] for f in found])
+        # The same pair is usually found in several tables; keep one copy
+        _, first = np.unique(src * len(self.ids) + dst, return_index=True)
+        added = first.size - self.pair_src.size
+        self.pair_src, self.pair_dst, self.pair_scores = src[first], dst[first], scores[first]
+        return added
+
+    def _verify_runs(self, rows, run_start, run_size, order, max_pairs=1 << 20):
+        """
+        Exact cosine between each new row and every member of its (small) bucket, generated
+        without a Python loop per bucket. Each pair is kept once, as (older row, newer row).
+        """
+        cumulative = np.cumsum(run_size)
+        lo = 0
+        while lo < rows.size:
+            done = cumulative[lo - 1] if lo else 0
+            hi = max(lo + 1, int(np.searchsorted(cumulative, done + max_pairs, side="right")))
+            rows_chunk, starts, sizes = rows[lo:hi], run_start[lo:hi], run_size[lo:hi]
+            lo = hi
+            total = int(sizes.sum())
+            a = np.repeat(rows_chunk, sizes)
+            offsets = np.repeat(starts - np.r_[0, np.cumsum(sizes)[:-1]], sizes) + np.arange(total)
+            b = order[offsets]
+            keep = b < a  # drops self pairs, and new-new pairs seen from both ends
+            a, b = a[keep], b[keep]
+            scores = np.einsum(
+                "nd,nd->n",
+                np.asarray(self.vectors[a], dtype=np.float32),
+                np.asarray(self.vectors[b], dtype=np.float32),
+            )
+            match = scores >= self.threshold
+            yield b[match], a[match], scores[match]
+
+    def _verify_bucket(self, candidates, new_rows):
+        similarities = np.asarray(self.vectors[new_rows], dtype=np.float32) @ \
+            np.asarray(self.vectors[candidates], dtype=np.float32).T
+        i, j = np.nonzero(similarities >= self.threshold)
+        a, b = new_rows[i], candidates[j]
+        keep = a != b
+        a, b, scores = a[keep], b[keep], similarities[i, j][keep]
+        return np.minimum(a, b), np.maximum(a, b), scores.astype(np.float32)
+
+    def union_find(self):
+        union_find = UnionFind(len(self.ids))
+        union_find.union(self.pair_src, self.pair_dst)
+        return union_find
+
+    def directed_edges(self, max_neighbors=1000):
+        return _cap_per_source(
+            np.r_[self.pair_src, self.pair_dst], np.r_[self.pair_dst, self.pair_src],
+            np.r_[self.pair_scores, self.pair_scores], max_neighbors
+        )
+
+    def save(self, path):
+        """Write the index to `path` (an .npz file) so later loads can add points incrementally."""
+        np.savez(
+            path,
+            config=np.array([self.dim, self.n_bits or 0, self.n_tables, self.max_bucket_size, self.seed]),
+            threshold=np.array(self.threshold if self.threshold is not None else np.nan),
+            dtype=np.array(self.dtype.str),
+            ids=np.array(json.dumps(self.ids)),
+            vectors=self.vectors,
+            pair_src=self.pair_src,
+            pair_dst=self.pair_dst,
+            pair_scores=self.pair_scores,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            dim, n_bits, n_tables, max_bucket_size, seed = (int(v) for v in data["config"])
+            index = cls(dim, n_bits=n_bits or None, n_tables=n_tables, max_bucket_size=max_bucket_size, seed=seed,
+                        dtype=str(data["dtype"]))
+            threshold = float(data["threshold"])
+            index.threshold = None if np.isnan(threshold) else threshold
+            index.ids = json.loads(str(data["ids"]))
+            index.vectors = data["vectors"]
+            index.pair_src, index.pair_dst, index.pair_scores = data["pair_src"], data["pair_dst"], data["pair_scores"]
+        if len(index.ids):
+            index._init_hyperplanes(len(index.ids))
+            index.codes = index._codes(index.vectors)
+        return index
+
+
+def measure_lsh_recall(vectors, threshold, sample_size=20000, n_bits=None, n_tables=16, max_bucket_size=2000,
+                       seed=0, chunk_size=4096, workers=None):
+    """
+    Recall of the SimHash grouping against the exact blocked all-pairs grouping on a random sample.
+
+    Returns pair recall (exact pairs the LSH verified) and grouped recall (exact pairs that
+    still end up in the same LSH group, which is what the flagged groups depend on).
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    sample = np.sort(rng.choice(n, size=min(sample_size, n), replace=False))
+    sample_vectors = normalize_rows(np.asarray(vectors[sample], dtype=np.float32))
+    exact_src, exact_dst, _ = find_duplicate_pairs(sample_vectors, threshold, chunk_size=chunk_size,
+                                                   workers=workers, max_neighbors=None, show_progress=False)
+    upper = exact_src < exact_dst
+    exact_src, exact_dst = exact_src[upper], exact_dst[upper]
+
+    index = SimHashIndex(sample_vectors.shape[1], n_bits=n_bits, n_tables=n_tables,
+                         max_bucket_size=max_bucket_size, seed=seed)
+    index.add(list(range(sample.size)), sample_vectors, threshold)
+    found = set(zip(index.pair_src.tolist(), index.pair_dst.tolist()))
+    roots = index.union_find().roots()
+    exact_pairs = exact_src.size
+    return {
+        "sample_size": int(sample.size),
+        "exact_pairs": int(exact_pairs),
+        "lsh_pairs": int(index.pair_src.size),
+        "pair_recall": sum((a, b) in found for a, b in zip(exact_src.tolist(), exact_dst.tolist())) / exact_pairs
+        if exact_pairs else 1.0,
+        "grouped_recall": float(np.mean(roots[exact_src] == roots[exact_dst])) if exact_pairs else 1.0,
+    }
+
+
+def flag_duplicates_lsh(client, collection_name, threshold=0.8, show_progress=True, qdrant_scroll_limit=10000,
+                        group_limit=100, n_bits=None, n_tables=16, max_bucket_size=2000, dtype=np.float32,
+                        max_neighbors=1000, index_path=None, recall_sample_size=0, total_points=None):
+    """
+    Approximate engine behind flag_duplicate_sentences_from_qdrant(engine="lsh").
+
+    With `index_path`, the SimHash index is loaded from and saved to that file, and only points
+    not already in it are hashed and verified. The index is rebuilt if points were deleted or the
+    threshold changed. With `recall_sample_size`, recall against the exact engine is measured on
+    a sample of that size and stored in `df.attrs["lsh_recall"]`.
+    """
+    ids, vectors, payloads = scroll_collection_vectors(
+        client, collection_name, scroll_limit=qdrant_scroll_limit, dtype=dtype,
+        show_progress=show_progress, total=total_points
+    )
+    if not ids:
+        return pd.DataFrame()
+
+    index = None
+    if index_path and os.path.exists(index_path):
+        index = SimHashIndex.load(index_path)
+        if index.threshold != threshold or (n_bits and index.n_bits != n_bits) or index.n_tables != n_tables \
+                or not set(index.ids) <= set(ids):
+            index = None
+    if index is None:
+        index = SimHashIndex(vectors.shape[1], n_bits=n_bits, n_tables=n_tables,
+                             max_bucket_size=max_bucket_size, dtype=dtype)
+    known = set(index.ids)
+    new_positions = [i for i, point_id in enumerate(ids) if point_id not in known]
+    added = index.add([ids[i] for i in new_positions], vectors[new_positions], threshold)
+    if show_progress:
+        print(f"LSH: hashed {len(new_positions)} new points, {added} new duplicate pairs, "
+              f"{index.pair_src.size} pairs in total.")
+    if index_path:
+        index.save(index_path)
+
+    # Index rows follow insertion order; map them onto this scroll's order
+    position_of = {point_id: i for i, point_id in enumerate(ids)}
+    to_position = np.array([position_of[point_id] for point_id in index.ids], dtype=np.int64)
+    union_find = UnionFind(len(ids))
+    union_find.union(to_position[index.pair_src], to_position[index.pair_dst])
+    src, dst, scores = index.directed_edges(max_neighbors)
+    labels = label_groups(union_find, len(ids), group_limit=group_limit)
+    df = build_duplicate_frame(ids, payloads, labels, to_position[src], to_position[dst], scores)
+
+    if recall_sample_size:
+        df.attrs["lsh_recall"] = measure_lsh_recall(
+            vectors, threshold, sample_size=recall_sample_size, n_bits=index.n_bits, n_tables=n_tables,
+            max_bucket_size=max_bucket_size
+        )
+        if show_progress:
+            print(f"LSH recall on a sample: {df.attrs['lsh_recall']}")
+    return df
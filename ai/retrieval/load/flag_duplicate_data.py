@@ -5,6 +5,8 @@ from tqdm import tqdm
 from collections import deque
 import uuid
 
+from ai.retrieval.load.duplicate_engine import flag_duplicates_lsh, flag_duplicates_matrix
+
 def flag_duplicate_sentences_from_qdrant(
     qdrant_host: str = "localhost",
     qdrant_port: int = 6333,
@@ -12,7 +14,16 @@ def flag_duplicate_sentences_from_qdrant(
     threshold: float = 0.8,
     show_progress: bool = True,
     qdrant_scroll_limit: int = 10000,
-    group_limit: int = 100
+    group_limit: int = 100,
+    engine: str = "bfs",
+    chunk_size: int = 4096,
+    workers: int = None,
+    vector_dtype: str = "float32",
+    lsh_bits: int = None,
+    lsh_tables: int = 16,
+    lsh_index_path: str = None,
+    recall_sample_size: int = 0,
+    client: QdrantClient = None
 ) -> pd.DataFrame:
     """
     Retrieves sentences and their embeddings from an existing Qdrant collection
@@ -22,8 +33,17 @@ def flag_duplicate_sentences_from_qdrant(
     Returns:
         pd.DataFrame: A DataFrame with 'qdrant_id', 'input_sentence', 'reply', 'group', and 'grouped_with' columns.
                       'grouped_with' is a list of (neighbor_id, similarity_score) for each point in the same group.
+
+    engine="bfs" runs one Qdrant search per visited point. engine="matrix" scrolls the vectors
+    once and compares them locally in chunk_size x chunk_size blocks on `workers` threads
+    (see duplicate_engine); vector_dtype="float16" halves the memory of the vector array.
+    engine="lsh" only verifies SimHash bucket candidates (near-linear, approximate); with
+    lsh_index_path the buckets are kept on disk and only newly loaded points are hashed, and
+    recall_sample_size > 0 stores the measured recall against the exact engine in df.attrs["lsh_recall"].
     """
-    client = QdrantClient(host=qdrant_host, port=qdrant_port)
+    if engine not in ("bfs", "matrix", "lsh"):
+        raise ValueError(f"Unknown duplicate detection engine '{engine}'. Use 'bfs', 'matrix' or 'lsh'.")
+    client = client or QdrantClient(host=qdrant_host, port=qdrant_port)
     if show_progress:
         print(f"Connecting to Qdrant at {qdrant_host}:{qdrant_port}")
 
@@ -37,6 +57,39 @@ def flag_duplicate_sentences_from_qdrant(
         print(f"Error: Collection '{collection_name}' not found or inaccessible. {e}")
         return pd.DataFrame()
 
+    if engine == "lsh":
+        results_df = flag_duplicates_lsh(
+            client,
+            collection_name,
+            threshold=threshold,
+            show_progress=show_progress,
+            qdrant_scroll_limit=qdrant_scroll_limit,
+            group_limit=group_limit,
+            n_bits=lsh_bits,
+            n_tables=lsh_tables,
+            dtype=np.dtype(vector_dtype),
+            index_path=lsh_index_path,
+            recall_sample_size=recall_sample_size,
+            total_points=total_points_count
+        )
+    elif engine == "matrix":
+        results_df = flag_duplicates_matrix(
+            client,
+            collection_name,
+            threshold=threshold,
+            show_progress=show_progress,
+            qdrant_scroll_limit=qdrant_scroll_limit,
+            group_limit=group_limit,
+            chunk_size=chunk_size,
+            workers=workers,
+            dtype=np.dtype(vector_dtype),
+            total_points=total_points_count
+        )
+    if engine != "bfs":
+        if results_df.empty:
+            print("No points found in the collection.")
+        return results_df
+
     # Retrieve all points (IDs, vectors, and payloads) from Qdrant
     all_points_data = []
     last_id = None
@@ -158,13 +211,21 @@ def flag_duplicate_sentences_from_qdrant(
     return results_df
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Flag duplicate sentences in the customer_support_tweets collection.")
+    parser.add_argument("--engine", choices=["bfs", "matrix", "lsh"], default="bfs",
+                        help="matrix holds every vector in memory; see flag_duplicate_sentences_from_qdrant.")
+    args = parser.parse_args()
+
     group_limit = 1000000
     print("Attempting to flag duplicate sentences from existing Qdrant data (test mode, seeding from first 100)...")
     flagged_df = flag_duplicate_sentences_from_qdrant(
         collection_name="customer_support_tweets",
         threshold=0.95,
         qdrant_scroll_limit=10000,
-        group_limit=group_limit
+        group_limit=group_limit,
+        engine=args.engine
     )
 
     if not flagged_df.empty:
@@ -0,0 +1,427 @@
+"""
+Bulk-load a Q/A corpus into Qdrant.
+
+    python -m ai.retrieval.load.ingest data/tweets.jsonl --collection customer_support_tweets
+    python -m ai.retrieval.load.ingest data/tweets.parquet --encode-workers 4 --upsert-workers 8
+
+Records are streamed from JSONL or Parquet, embedded in a process pool and upserted by a
+thread pool with `wait=False`, followed by a final consistency barrier. Point ids are derived
+from the record content, so re-running a chunk is idempotent, and a checkpoint file lets a
+crashed run resume after the last fully-acknowledged chunk.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from qdrant_client.http import models
+
+from ai.retrieval.brand import BRAND_FIELD, brand_payload_builder
+from ai.retrieval.embeddings_helper import (
+    QDRANT_COLLECTION,
+    create_qdrant_client,
+    initialize_qdrant,
+    invalidate_collection,
+)
+from ai.retrieval.lexical_index import build_lexical_index_from_collection
+
+logger = logging.getLogger(__name__)
+
+# Fixed namespace so the same (input, reply) pair always maps to the same point id
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2a52-8d4e-4c55-9a8e-3f0b7d1e2c41")
+
+_worker_model = None
+
+
+def point_id_for(input_text, reply_text):
+    """Deterministic content-hash point id (UUIDv5) for a Q/A pair."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{input_text}\x00{reply_text}"))
+
+
+def detect_format(source):
+    if source.endswith(".parquet") or source.endswith(".pq"):
+        return "parquet"
+    if source.endswith(".jsonl") or source.endswith(".json") or source.endswith(".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Cannot infer the format of {source}; pass --format jsonl or parquet.")
+
+
+def iter_records(source, source_format=None, parquet_batch_rows=8192):
+    """Stream records (dicts) from a JSONL or Parquet file without materialising it."""
+    source_format = source_format or detect_format(source)
+    if source_format == "jsonl":
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    elif source_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow package is required to read Parquet sources.")
+        parquet_file = pq.ParquetFile(source)
+        for batch in parquet_file.iter_batches(batch_size=parquet_batch_rows):
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f"Unsupported source format: {source_format}")
+
+
+def iter_chunks(records, chunk_size, skip=0, limit=None):
+    """
+    Yield (first_record_offset, records) chunks, skipping the first `skip` records
+    (already ingested according to the checkpoint).
+    """
+    chunk = []
+    offset = 0
+    chunk_start = skip
+    for record in records:
+        if limit is not None and offset >= limit:
+            break
+        offset += 1
+        if offset <= skip:
+            continue
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk_start, chunk
+            chunk_start += len(chunk)
+            chunk = []
+    if chunk:
+        yield chunk_start, chunk
+
+
+def _init_encode_worker(model_name, threads_per_worker):
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    from ai.retrieval import embeddings_helper
+    _worker_model = embeddings_helper.get_sentence_transformer(model_name)
+
+
+def _encode_chunk(texts, batch_size, model=None):
+    model = model or _worker_model
+    start = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+    return vectors, time.perf_counter() - start
+
+
+class _InlineExecutor:
+    """Executor stand-in that encodes in the calling process (encode_workers=0)."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args, model=self.model))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class StageStats:
+    """Records processed and busy seconds per pipeline stage."""
+
+    def __init__(self):
+        self.records = {}
+        self.seconds = {}
+
+    def add(self, stage, records, seconds):
+        self.records[stage] = self.records.get(stage, 0) + records
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self, wall_seconds):
+        report = {}
+        for stage, records in self.records.items():
+            seconds = self.seconds[stage]
+            report[stage] = {
+                "records": records,
+                "busy_seconds": round(seconds, 3),
+                "records_per_sec": round(records / seconds, 1) if seconds else None
+            }
+        total = self.records.get("upsert", 0)
+        report["end_to_end"] = {
+            "records": total,
+            "wall_seconds": round(wall_seconds, 3),
+            "records_per_sec": round(total / wall_seconds, 1) if wall_seconds else None
+        }
+        return report
+
+
+class Checkpoint:
+    """
+    Tracks the contiguous prefix of records whose upserts were acknowledged. Chunks finish out
+    of order, so the watermark only advances over chunks that are done back to back.
+    """
+
+    def __init__(self, path, source, collection_name):
+        self.path = path
+        self.source = source
+        self.collection_name = collection_name
+        self.records_done = 0
+        self._finished = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get("source") == source and state.get("collection") == collection_name:
+                self.records_done = state.get("records_done", 0)
+
+    def mark_done(self, chunk_start, chunk_len):
+        self._finished[chunk_start] = chunk_len
+        advanced = False
+        while self.records_done in self._finished:
+            self.records_done += self._finished.pop(self.records_done)
+            advanced = True
+        if advanced:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"source": self.source, "collection": self.collection_name,
+                       "records_done": self.records_done}, f)
+        os.replace(tmp_path, self.path)
+
+
+def wait_for_collection_ready(client, collection_name, timeout=600.0, poll_interval=1.0):
+    """
+    Consistency barrier after `wait=False` upserts: block until Qdrant reports the collection
+    green (all queued updates applied and optimised) or the timeout expires.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        info = client.get_collection(collection_name)
+        if info.status == models.CollectionStatus.GREEN:
+            return info
+        if time.monotonic() > deadline:
+            logger.warning(f"Collection '{collection_name}' still {info.status} after {timeout}s.")
+            return info
+        time.sleep(poll_interval)
+
+
+def create_payload_indexes(client, collection_name, payload_indexes):
+    """Create the {field: schema} payload indexes; Qdrant treats existing ones as a no-op."""
+    for field_name, field_schema in (payload_indexes or {}).items():
+        client.create_payload_index(
+            collection_name=collection_name, field_name=field_name, field_schema=field_schema, wait=True
+        )
+
+
+def build_points(chunk, vectors, input_field, reply_field, payload_builder=None):
+    points = []
+    for record, vector in zip(chunk, vectors):
+        input_text = record.get(input_field)
+        reply_text = record.get(reply_field)
+        payload = {"input": input_text, "reply": reply_text}
+        if payload_builder is not None:
+            payload.update(payload_builder(record))
+        points.append(models.PointStruct(
+            id=point_id_for(input_text, reply_text),
+            vector=vector.tolist(),
+            payload=payload
+        ))
+    return points
+
+
+def ingest(
+    source,
+    client,
+    collection_name=QDRANT_COLLECTION,
+    model_name="all-MiniLM-L6-v2",
+    source_format=None,
+    input_field="input",
+    reply_field="output",
+    chunk_size=2048,
+    encode_batch_size=256,
+    encode_workers=2,
+    threads_per_worker=1,
+    upsert_batch_size=256,
+    upsert_workers=4,
+    checkpoint_path=None,
+    limit=None,
+    consistency_timeout=600.0,
+    payload_builder=None,
+    model=None,
+    lexical_index_path=None,
+    payload_indexes=None
+):
+    """
+    Stream `source` into `collection_name`. Returns the per-stage throughput report.
+
+    With `encode_workers=0` records are embedded in this process with `model` (or the
+    shared model from embeddings_helper), which suits small loads and tests. With
+    `lexical_index_path`, the collection's BM25 index for hybrid retrieval is rebuilt under
+    `<lexical_index_path>/<collection_name>` once the load is consistent. `payload_indexes`
+    ({field: models.PayloadSchemaType}) are created with the collection, before any upsert,
+    so Qdrant indexes payloads as they arrive instead of in a second pass.
+    """
+    checkpoint = Checkpoint(checkpoint_path, os.path.abspath(source), collection_name)
+    if checkpoint.records_done:
+        logger.info(f"Resuming from checkpoint: {checkpoint.records_done} records already ingested.")
+
+    stats = StageStats()
+    wall_start = time.perf_counter()
+    collection_ready = False
+    max_in_flight = max(2, encode_workers * 2)
+    encode_queue = deque()
+    upsert_futures = deque()
+
+    def submit_upserts(chunk_start, chunk, vectors, upsert_pool):
+        nonlocal collection_ready
+        if not collection_ready:
+            initialize_qdrant(collection_name, vectors.shape[1], client=client)
+            create_payload_indexes(client, collection_name, payload_indexes)
+            collection_ready = True
+        points = build_points(chunk, vectors, input_field, reply_field, payload_builder)
+        batches = [points[i:i + upsert_batch_size] for i in range(0, len(points), upsert_batch_size)]
+
+        def upsert(batch):
+            start = time.perf_counter()
+            client.upsert(collection_name=collection_name, points=batch, wait=False)
+            return len(batch), time.perf_counter() - start
+
+        upsert_futures.append((chunk_start, len(chunk), [upsert_pool.submit(upsert, b) for b in batches]))
+
+    def drain_upserts(block):
+        while upsert_futures and (block or all(f.done() for f in upsert_futures[0][2])):
+            chunk_start, chunk_len, futures = upsert_futures.popleft()
+            for future in futures:
+                records, seconds = future.result()
+                stats.add("upsert", records, seconds)
+            checkpoint.mark_done(chunk_start, chunk_len)
+
+    def drain_encodes(upsert_pool, block):
+        while encode_queue and (block or encode_queue[0][2].done()):
+            chunk_start, chunk, future = encode_queue.popleft()
+            vectors, seconds = future.result()
+            stats.add("encode", len(chunk), seconds)
+            submit_upserts(chunk_start, chunk, vectors, upsert_pool)
+            drain_upserts(block=False)
+
+    if encode_workers > 0:
+        encode_pool = ProcessPoolExecutor(
+            max_workers=encode_workers,
+            initializer=_init_encode_worker,
+            initargs=(model_name, threads_per_worker)
+        )
+    else:
+        if model is None:
+            from ai.retrieval.embeddings_helper import get_sentence_transformer
+            model = get_sentence_transformer(model_name)
+        encode_pool = _InlineExecutor(model)
+
+    chunks_read = 0
+    with encode_pool, ThreadPoolExecutor(max_workers=upsert_workers) as upsert_pool:
+        records = iter_records(source, source_format)
+        chunks = iter_chunks(records, chunk_size, skip=checkpoint.records_done, limit=limit)
+        while True:
+            read_start = time.perf_counter()
+            next_chunk = next(chunks, None)
+            if next_chunk is None:
+                break
+            chunk_start, chunk = next_chunk
+            stats.add("read", len(chunk), time.perf_counter() - read_start)
+            texts = [str(record.get(input_field) or "") for record in chunk]
+            encode_queue.append((chunk_start, chunk, encode_pool.submit(_encode_chunk, texts, encode_batch_size)))
+            # Bounded in-flight work keeps memory flat however large the source is
+            drain_encodes(upsert_pool, block=len(encode_queue) >= max_in_flight)
+            if len(upsert_futures) >= max_in_flight:
+                drain_upserts(block=True)
+            chunks_read += 1
+            if chunks_read % 10 == 0:
+                logger.info(f"Read {stats.records.get('read', 0)} records, "
+                            f"checkpoint at {checkpoint.records_done}.")
+        drain_encodes(upsert_pool, block=True)
+        drain_upserts(block=True)
+
+    if collection_ready:
+        barrier_start = time.perf_counter()
+        info = wait_for_collection_ready(client, collection_name, timeout=consistency_timeout)
+        stats.add("consistency_barrier", 0, time.perf_counter() - barrier_start)
+        logger.info(f"Collection '{collection_name}' holds {info.points_count} points.")
+
+    if lexical_index_path:
+        lexical_start = time.perf_counter()
+        lexical_index = build_lexical_index_from_collection(
+            client, collection_name, os.path.join(lexical_index_path, collection_name)
+        )
+        stats.add("lexical_index", lexical_index.documents, time.perf_counter() - lexical_start)
+
+    if collection_ready:
+        invalidate_collection(collection_name)
+
+    report = stats.report(time.perf_counter() - wall_start)
+    report["checkpoint_records_done"] = checkpoint.records_done
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="JSONL or Parquet file with one Q/A record per row.")
+    parser.add_argument("--format", dest="source_format", choices=["jsonl", "parquet"])
+    parser.add_argument("--collection", default=QDRANT_COLLECTION)
+    parser.add_argument("--host", default=os.getenv("QDRANT_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("QDRANT_PORT", 6333)))
+    parser.add_argument("--grpc", action="store_true", default=None,
+                        help="Use gRPC (QDRANT_GRPC_PORT) instead of REST; default: QDRANT_PREFER_GRPC.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--input-field", default="input")
+    parser.add_argument("--reply-field", default="output")
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--encode-batch-size", type=int, default=256)
+    parser.add_argument("--encode-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--upsert-batch-size", type=int, default=256)
+    parser.add_argument("--upsert-workers", type=int, default=4)
+    parser.add_argument("--checkpoint", default=None, help="Defaults to <source>.<collection>.checkpoint.json")
+    parser.add_argument("--limit", type=int, default=None, help="Only ingest the first N records.")
+    parser.add_argument("--lexical-index", default=None, metavar="PATH",
+                        help="Also build the BM25 index for RETRIEVAL_MODE=hybrid under PATH/<collection>.")
+    parser.add_argument("--no-brand", action="store_true",
+                        help="Do not extract the brand payload field (and its keyword index) for filtered search.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    client = create_qdrant_client(host=args.host, port=args.port, prefer_grpc=args.grpc)
+    report = ingest(
+        args.source,
+        client,
+        collection_name=args.collection,
+        model_name=args.model,
+        source_format=args.source_format,
+        input_field=args.input_field,
+        reply_field=args.reply_field,
+        chunk_size=args.chunk_size,
+        encode_batch_size=args.encode_batch_size,
+        encode_workers=args.encode_workers,
+        threads_per_worker=args.threads_per_worker,
+        upsert_batch_size=args.upsert_batch_size,
+        upsert_workers=args.upsert_workers,
+        checkpoint_path=args.checkpoint or f"{args.source}.{args.collection}.checkpoint.json",
+        limit=args.limit,
+        lexical_index_path=args.lexical_index,
+        payload_builder=None if args.no_brand else brand_payload_builder(args.input_field),
+        payload_indexes=None if args.no_brand else {BRAND_FIELD: models.PayloadSchemaType.KEYWORD}
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Warm-start new retrieval replicas from snapshots instead of re-embedding the corpus.
+
+    python -m ai.retrieval.load.snapshot create --collection customer_support_tweets --output snapshots/
+    python -m ai.retrieval.load.snapshot restore snapshots/customer_support_tweets-<time>.snapshot --host new-node
+    python -m ai.retrieval.load.snapshot export --collection customer_support_tweets --output local_index/customer_support_tweets
+    python -m ai.retrieval.load.snapshot verify local_index/customer_support_tweets
+    python -m ai.retrieval.load.snapshot load local_index/customer_support_tweets --host new-node
+
+`create` has Qdrant write a collection snapshot and downloads it next to a manifest (point
+count, vector size, sha256). `restore` uploads it to another node, which checks the sha256,
+then verifies the restored point count. A node can also recover on its own at startup from
+QDRANT_SNAPSHOT_LOCATION (see initialize_qdrant).
+
+`export` writes the vectors and payloads in the memory-mapped local index layout (served as-is
+with RETRIEVAL_BACKEND=local) plus a manifest with the sha256 of every file. `verify` checks a
+copied export before it is served, and `load` upserts a verified export into a collection
+created by initialize_qdrant.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+
+import httpx
+import numpy as np
+from qdrant_client.http import models
+
+from ai.retrieval.embeddings_helper import QDRANT_COLLECTION, create_qdrant_client, initialize_qdrant
+from ai.retrieval.load.ingest import wait_for_collection_ready
+from ai.retrieval.local_index import LocalVectorIndex, export_collection_to_local_index
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+_CHUNK_BYTES = 1 << 20
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_manifest_path(snapshot_path):
+    return f"{snapshot_path}.manifest.json"
+
+
+def collection_summary(client, collection_name):
+    """Exact point count and vector size of a collection (single unnamed vector)."""
+    info = client.get_collection(collection_name)
+    return {
+        "points": client.count(collection_name=collection_name, exact=True).count,
+        "dim": info.config.params.vectors.size
+    }
+
+
+def verify_point_count(client, collection_name, expected):
+    points = client.count(collection_name=collection_name, exact=True).count
+    if points != expected:
+        raise ValueError(f"Collection '{collection_name}' has {points} points, expected {expected}.")
+    return points
+
+
+def create_snapshot(client, collection_name, output_dir, base_url, http=None):
+    """
+    Snapshot a collection on the server, download it to `output_dir` and write its manifest.
+    The download is hashed while it streams and compared with the checksum Qdrant reports.
+    Returns the manifest.
+    """
+    summary = collection_summary(client, collection_name)
+    description = client.create_snapshot(collection_name=collection_name, wait=True)
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, description.name)
+    http = http or httpx.Client(timeout=None)
+    digest = hashlib.sha256()
+    with http.stream("GET", f"{base_url}/collections/{collection_name}/snapshots/{description.name}") as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in response.iter_bytes(_CHUNK_BYTES):
+                digest.update(chunk)
+                f.write(chunk)
+    sha256 = digest.hexdigest()
+    if description.checksum and description.checksum != sha256:
+        os.remove(path)
+        raise ValueError(f"Snapshot {description.name} checksum mismatch: server {description.checksum}, "
+                         f"downloaded {sha256}.")
+    manifest = {
+        "collection": collection_name,
+        "snapshot": description.name,
+        "bytes": os.path.getsize(path),
+        "sha256": sha256,
+        "points": summary["points"],
+        "dim": summary["dim"],
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+    with open(snapshot_manifest_path(path), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def restore_snapshot(client, snapshot_path, base_url, collection_name=None, http=None, timeout=600.0):
+    """
+    Upload a downloaded snapshot to a (new) node and verify the restored point count against
+    its manifest. The local file is checked against the manifest first; Qdrant checks the
+    uploaded bytes against the same sha256 before replacing the collection.
+    """
+    with open(snapshot_manifest_path(snapshot_path)) as f:
+        manifest = json.load(f)
+    collection_name = collection_name or manifest["collection"]
+    sha256 = file_sha256(snapshot_path)
+    if sha256 != manifest["sha256"]:
+        raise ValueError(f"{snapshot_path} checksum {sha256} does not match its manifest ({manifest['sha256']}).")
+    http = http or httpx.Client(timeout=None)
+    with open(snapshot_path, "rb") as f:
+        response = http.post(
+            f"{base_url}/collections/{collection_name}/snapshots/upload",
+            params={"priority": "snapshot", "wait": "true", "checksum": sha256},
+            files={"snapshot": (os.path.basename(snapshot_path), f, "application/octet-stream")}
+        )
+    response.raise_for_status()
+    wait_for_collection_ready(client, collection_name, timeout=timeout)
+    verify_point_count(client, collection_name, manifest["points"])
+    return manifest
+
+
+def write_export_manifest(path, collection_name, source_points):
+    index = LocalVectorIndex(path)
+    index.close()
+    files = {
+        name: {"bytes": os.path.getsize(os.path.join(path, name)), "sha256": file_sha256(os.path.join(path, name))}
+        for name in sorted(os.listdir(path)) if name != MANIFEST_FILE
+    }
+    manifest = {
+        "collection": collection_name,
+        "points": index.count,
+        "source_points": source_points,
+        "dim": index.dim,
+        "dtype": index.dtype,
+        "files": files,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def export_snapshot(client, collection_name, path, dtype="float32", nlist=None, scroll_limit=10_000):
+    """
+    Export a collection to the local index layout and write its manifest. float32 keeps the
+    vectors exact so the export can be loaded back into Qdrant; float16 / int8 halve or quarter
+    the size for replicas that only serve it locally.
+    """
+    source_points = client.count(collection_name=collection_name, exact=True).count
+    export_collection_to_local_index(client, collection_name, path, dtype=dtype, nlist=nlist,
+                                     scroll_limit=scroll_limit).close()
+    manifest = write_export_manifest(path, collection_name, source_points)
+    if manifest["points"] != source_points:
+        raise ValueError(f"Exported {manifest['points']} points from '{collection_name}', which has {source_points}.")
+    return manifest
+
+
+def verify_export(path):
+    """
+    Check an export against its manifest: every file present with the recorded size and
+    sha256, and the index holding the recorded number of points. Returns the manifest.
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    problems = []
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            problems.append(f"{name} is missing")
+        elif os.path.getsize(file_path) != expected["bytes"]:
+            problems.append(f"{name} has {os.path.getsize(file_path)} bytes, expected {expected['bytes']}")
+        elif file_sha256(file_path) != expected["sha256"]:
+            problems.append(f"{name} checksum mismatch")
+    if not problems:
+        index = LocalVectorIndex(path)
+        try:
+            if index.count != manifest["points"]:
+                problems.append(f"index holds {index.count} points, expected {manifest['points']}")
+            problems.extend(index.consistency_problems())
+        finally:
+            index.close()
+    if problems:
+        raise ValueError(f"Export at {path} failed verification: {'; '.join(problems)}.")
+    return manifest
+
+
+def load_export(client, path, collection_name=None, batch_size=512, timeout=600.0):
+    """
+    Verify an export, create its collection with initialize_qdrant and upsert the stored
+    vectors and payloads, so no text is re-embedded. Returns the manifest.
+    """
+    manifest = verify_export(path)
+    collection_name = collection_name or manifest["collection"]
+    initialize_qdrant(collection_name, manifest["dim"], client=client)
+    index = LocalVectorIndex(path)
+    try:
+        for start in range(0, index.count, batch_size):
+            rows = np.arange(start, min(start + batch_size, index.count))
+            records = [index.read_record(row) for row in rows]
+            client.upsert(collection_name=collection_name, wait=False, points=[
+                models.PointStruct(id=record["id"], vector=vector.tolist(), payload=record["payload"])
+                for record, vector in zip(records, index.vectors(rows))
+            ])
+    finally:
+        index.close()
+    wait_for_collection_ready(client, collection_name, timeout=timeout)
+    verify_point_count(client, collection_name, manifest["points"])
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("QDRANT_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("QDRANT_PORT", 6333)))
+    parser.add_argument("--grpc", action="store_true", default=None,
+                        help="Use gRPC (QDRANT_GRPC_PORT) for point operations; snapshot transfers use REST.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Snapshot a collection and download it.")
+    create.add_argument("--collection", default=QDRANT_COLLECTION)
+    create.add_argument("--output", default="snapshots")
+    restore = commands.add_parser("restore", help="Upload a downloaded snapshot and verify it.")
+    restore.add_argument("snapshot")
+    restore.add_argument("--collection", help="Target collection; default: the snapshot's.")
+    export = commands.add_parser("export", help="Export vectors and payloads to the local index layout.")
+    export.add_argument("--collection", default=QDRANT_COLLECTION)
+    export.add_argument("--output", required=True)
+    export.add_argument("--dtype", choices=["float32", "float16", "int8"], default="float32")
+    export.add_argument("--nlist", type=int, default=None, help="Also train an IVF layer with this many lists.")
+    verify = commands.add_parser("verify", help="Check an export's files and point count.")
+    verify.add_argument("path")
+    load = commands.add_parser("load", help="Upsert a verified export into a new collection.")
+    load.add_argument("path")
+    load.add_argument("--collection", help="Target collection; default: the export's.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    base_url = f"http://{args.host}:{args.port}"
+    if args.command == "verify":
+        manifest = verify_export(args.path)
+    else:
+        client = create_qdrant_client(host=args.host, port=args.port, prefer_grpc=args.grpc)
+        if args.command == "create":
+            manifest = create_snapshot(client, args.collection, args.output, base_url)
+        elif args.command == "restore":
+            manifest = restore_snapshot(client, args.snapshot, base_url, collection_name=args.collection)
+        elif args.command == "export":
+            manifest = export_snapshot(client, args.collection, args.output, dtype=args.dtype, nlist=args.nlist)
+        else:
+            manifest = load_export(client, args.path, collection_name=args.collection)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
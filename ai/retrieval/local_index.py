@@ -0,0 +1,491 @@
+import json
+import os
+from typing import Protocol
+
+import numpy as np
+from qdrant_client.http import models
+
+from ai.retrieval.retrieval_statistics import normalize_rows
+
+_META_FILE = "meta.json"
+_VECTORS_FILE = "vectors.bin"
+_SCALES_FILE = "scales.npy"
+_PAYLOADS_FILE = "payloads.jsonl"
+_PAYLOAD_OFFSETS_FILE = "payload_offsets.npy"
+_IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+_IVF_OFFSETS_FILE = "ivf_offsets.npy"
+_IVF_ROWS_FILE = "ivf_rows.npy"
+_SUPPORTED_DTYPES = ("float16", "int8", "float32")
+
+
+class RetrievalBackend(Protocol):
+    """
+    The subset of the QdrantClient API used by retrieval (`search_similar` and friends).
+
+    QdrantClient satisfies it structurally; in-process backends implement it. Hits are
+    returned as qdrant `ScoredPoint`s so callers cannot tell the backends apart.
+    """
+
+    def collection_exists(self, collection_name):
+        ...
+
+    def count(self, collection_name, exact=True):
+        ...
+
+    def search(self, collection_name, query_vector, limit=10, query_filter=None, search_params=None,
+               with_payload=True, with_vectors=False, score_threshold=None, **kwargs):
+        ...
+
+    def search_batch(self, collection_name, requests, **kwargs):
+        ...
+
+    def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **kwargs):
+        ...
+
+
+def keyword_conditions(query_filter):
+    """
+    A qdrant Filter as [(payload key, accepted values)], all of which must match. Only `must`
+    conditions with MatchValue or MatchAny are supported.
+    """
+    if query_filter.should or query_filter.must_not or query_filter.min_should:
+        raise ValueError("Only `must` payload conditions are supported outside Qdrant.")
+    conditions = []
+    for condition in query_filter.must or []:
+        match = getattr(condition, "match", None)
+        if isinstance(match, models.MatchValue):
+            conditions.append((condition.key, [match.value]))
+        elif isinstance(match, models.MatchAny):
+            conditions.append((condition.key, list(match.any)))
+        else:
+            raise ValueError("Only MatchValue and MatchAny conditions are supported outside Qdrant.")
+    return conditions
+
+
+def payload_matches(payload, query_filter):
+    """Whether a payload satisfies a filter accepted by keyword_conditions."""
+    payload = payload or {}
+    for key, values in keyword_conditions(query_filter):
+        value = payload.get(key)
+        present = value if isinstance(value, list) else [value]
+        if not any(v in values for v in present):
+            return False
+    return True
+
+
+class LocalIndexWriter:
+    """
+    Streams vectors and payloads into the on-disk layout read by LocalVectorIndex.
+
+    Vectors are L2-normalised and stored as float16, float32 (lossless, for exports that are
+    loaded back into Qdrant), or as int8 with one float32 scale per row. Payloads go to a
+    JSON-lines side table with a byte-offset array for random access.
+    """
+
+    def __init__(self, path, dim, dtype="float16"):
+        if dtype not in _SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype}; expected one of {_SUPPORTED_DTYPES}.")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = int(dim)
+        self.dtype = dtype
+        self.count = 0
+        self._vectors_file = open(os.path.join(path, _VECTORS_FILE), "wb")
+        self._payloads_file = open(os.path.join(path, _PAYLOADS_FILE), "wb")
+        self._offsets = [0]
+        self._scales = []
+
+    def add(self, ids, vectors, payloads=None):
+        vectors = normalize_rows(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}-d.")
+        if payloads is None:
+            payloads = [{} for _ in ids]
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+            self._vectors_file.write(quantized.tobytes())
+            self._scales.append(scales.astype(np.float32))
+        else:
+            self._vectors_file.write(vectors.astype(np.dtype(self.dtype)).tobytes())
+        for point_id, payload in zip(ids, payloads):
+            line = json.dumps({"id": point_id, "payload": payload}, ensure_ascii=False).encode("utf-8") + b"\n"
+            self._payloads_file.write(line)
+            self._offsets.append(self._offsets[-1] + len(line))
+        self.count += len(ids)
+
+    def close(self):
+        self._vectors_file.close()
+        self._payloads_file.close()
+        np.save(os.path.join(self.path, _PAYLOAD_OFFSETS_FILE), np.asarray(self._offsets, dtype=np.uint64))
+        if self.dtype == "int8":
+            scales = np.concatenate(self._scales) if self._scales else np.zeros(0, dtype=np.float32)
+            np.save(os.path.join(self.path, _SCALES_FILE), scales)
+        with open(os.path.join(self.path, _META_FILE), "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "dtype": self.dtype, "distance": "Cosine"}, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def build_local_index(path, ids, vectors, payloads=None, dtype="float16", nlist=None):
+    """
+    Write a local index from in-memory arrays, optionally training an IVF layer with `nlist` lists.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    with LocalIndexWriter(path, vectors.shape[1], dtype=dtype) as writer:
+        writer.add(list(ids), vectors, payloads)
+    if nlist:
+        build_ivf(path, nlist)
+    return LocalVectorIndex(path)
+
+
+def build_ivf(path, nlist, sample_size=100_000, iterations=10, block_rows=65_536, seed=0):
+    """
+    Train spherical k-means centroids on a sample of the stored vectors and write the
+    inverted lists (rows grouped by nearest centroid) next to the index.
+    """
+    index = LocalVectorIndex(path)
+    n = index.count
+    nlist = int(min(nlist, n))
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(n, size=min(sample_size, n), replace=False))
+    sample = index.vectors(sample_rows)
+    centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.bincount(assignment, minlength=nlist) == 0
+        sums[empty] = centroids[empty]  # keep empty lists where they were
+        centroids = normalize_rows(sums)
+
+    assignments = np.empty(n, dtype=np.int64)
+    for start in range(0, n, block_rows):
+        rows = np.arange(start, min(start + block_rows, n))
+        assignments[start:start + len(rows)] = np.argmax(index.vectors(rows) @ centroids.T, axis=1)
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+
+    np.save(os.path.join(path, _IVF_CENTROIDS_FILE), centroids.astype(np.float32))
+    np.save(os.path.join(path, _IVF_OFFSETS_FILE), offsets)
+    np.save(os.path.join(path, _IVF_ROWS_FILE), order)
+
+
+class LocalVectorIndex:
+    """
+    Memory-mapped cosine index over one collection written by LocalIndexWriter.
+
+    Exact search scans the matrix in blocks (matmul + argpartition); when IVF lists exist
+    and `nprobe` is set, only the `nprobe` closest lists are scanned. int8 blocks widen to
+    float32 several times faster than float16 ones, so int8 is the better choice for scans.
+    """
+
+    def __init__(self, path, block_rows=16_384, nprobe=None):
+        self.path = path
+        self.block_rows = block_rows
+        self.nprobe = nprobe
+        with open(os.path.join(path, _META_FILE)) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.dtype = meta["dtype"]
+        self._vectors = np.memmap(
+            os.path.join(path, _VECTORS_FILE), dtype=np.dtype(self.dtype), mode="r",
+            shape=(self.count, self.dim)
+        ) if self.count else np.zeros((0, self.dim), dtype=np.dtype(self.dtype))
+        self._scales = np.load(os.path.join(path, _SCALES_FILE), mmap_mode="r") if self.dtype == "int8" else None
+        self._payload_offsets = np.load(os.path.join(path, _PAYLOAD_OFFSETS_FILE), mmap_mode="r")
+        self._payloads_file = open(os.path.join(path, _PAYLOADS_FILE), "rb")
+        self._row_of_id = None
+        self._keyword_rows = {}  # payload field -> {value: ascending rows}
+        self._ivf = None
+        if os.path.exists(os.path.join(path, _IVF_CENTROIDS_FILE)):
+            self._ivf = (
+                np.load(os.path.join(path, _IVF_CENTROIDS_FILE)),
+                np.load(os.path.join(path, _IVF_OFFSETS_FILE)),
+                np.load(os.path.join(path, _IVF_ROWS_FILE), mmap_mode="r"),
+            )
+
+    @property
+    def has_ivf(self):
+        return self._ivf is not None
+
+    def vectors(self, rows):
+        """float32 vectors of the given rows, with int8 rows rescaled."""
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= np.asarray(self._scales[rows], dtype=np.float32)[:, None]
+        return vectors
+
+    def consistency_problems(self):
+        """
+        Ways the files disagree with the metadata (vector bytes, int8 scales, payload
+        offsets and payload bytes); an empty list for a complete index.
+        """
+        problems = []
+        vectors_bytes = os.path.getsize(os.path.join(self.path, _VECTORS_FILE))
+        expected_bytes = self.count * self.dim * np.dtype(self.dtype).itemsize
+        if vectors_bytes != expected_bytes:
+            problems.append(f"vectors take {vectors_bytes} bytes, expected {expected_bytes}")
+        if self._scales is not None and len(self._scales) != self.count:
+            problems.append(f"{len(self._scales)} int8 scales for {self.count} points")
+        if len(self._payload_offsets) != self.count + 1:
+            problems.append(f"{len(self._payload_offsets) - 1} payload offsets for {self.count} points")
+        elif int(self._payload_offsets[-1]) != os.path.getsize(os.path.join(self.path, _PAYLOADS_FILE)):
+            problems.append("payload offsets do not match the payload file")
+        return problems
+
+    def _block_scores(self, start, stop, queries):
+        block = np.asarray(self._vectors[start:stop], dtype=np.float32)
+        scores = block @ queries.T
+        if self._scales is not None:
+            scores *= np.asarray(self._scales[start:stop], dtype=np.float32)[:, None]
+        return scores
+
+    def _candidate_rows(self, query, nprobe):
+        centroids, offsets, rows = self._ivf
+        nprobe = min(nprobe, centroids.shape[0])
+        lists = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([rows[offsets[l]:offsets[l + 1]] for l in lists])
+        return np.sort(candidates)  # ascending rows keep memmap reads sequential
+
+    def search_vectors(self, query_vectors, limit, exact=False, nprobe=None, rows=None):
+        """
+        Returns (rows, scores) arrays of shape (n_queries, k) sorted by descending cosine similarity.
+        With `rows` (ascending row numbers, e.g. from rows_matching) only those rows are scored.
+        """
+        queries = normalize_rows(query_vectors)
+        k = int(min(limit, self.count if rows is None else len(rows)))
+        if k == 0:
+            empty = np.zeros((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if rows is not None:
+            return self._search_rows(queries, k, np.asarray(rows, dtype=np.int64))
+        nprobe = nprobe or self.nprobe
+        if self.has_ivf and nprobe and not exact:
+            return self._search_ivf(queries, k, nprobe)
+
+        best_rows = np.zeros((queries.shape[0], 0), dtype=np.int64)
+        best_scores = np.zeros((queries.shape[0], 0), dtype=np.float32)
+        for start in range(0, self.count, self.block_rows):
+            stop = min(start + self.block_rows, self.count)
+            scores = self._block_scores(start, stop, queries).T
+            rows = np.broadcast_to(np.arange(start, stop), scores.shape)
+            all_scores = np.concatenate([best_scores, scores], axis=1)
+            all_rows = np.concatenate([best_rows, rows], axis=1)
+            if all_scores.shape[1] > k:
+                keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+                all_scores = np.take_along_axis(all_scores, keep, axis=1)
+                all_rows = np.take_along_axis(all_rows, keep, axis=1)
+            best_scores, best_rows = all_scores, all_rows
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def _search_rows(self, queries, k, rows):
+        best_rows = np.zeros((queries.shape[0], 0), dtype=np.int64)
+        best_scores = np.zeros((queries.shape[0], 0), dtype=np.float32)
+        for start in range(0, rows.shape[0], self.block_rows):
+            block = rows[start:start + self.block_rows]
+            scores = queries @ self.vectors(block).T
+            all_scores = np.concatenate([best_scores, scores], axis=1)
+            all_rows = np.concatenate([best_rows, np.broadcast_to(block, scores.shape)], axis=1)
+            if all_scores.shape[1] > k:
+                keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+                all_scores = np.take_along_axis(all_scores, keep, axis=1)
+                all_rows = np.take_along_axis(all_rows, keep, axis=1)
+            best_scores, best_rows = all_scores, all_rows
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def rows_matching(self, query_filter):
+        """
+        Ascending rows whose payload satisfies a qdrant Filter made of `must` keyword
+        conditions (MatchValue / MatchAny). The value -> rows map of a field is built on first
+        use by scanning the payloads, like Qdrant's keyword payload index.
+        """
+        rows = None
+        for key, values in keyword_conditions(query_filter):
+            value_rows = self._rows_by_value(key)
+            matched = np.unique(np.concatenate(
+                [value_rows.get(v, np.zeros(0, dtype=np.int64)) for v in values] or [np.zeros(0, dtype=np.int64)]
+            ))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return np.arange(self.count, dtype=np.int64) if rows is None else rows
+
+    def _rows_by_value(self, field):
+        if field not in self._keyword_rows:
+            grouped = {}
+            for row in range(self.count):
+                value = (self.read_record(row)["payload"] or {}).get(field)
+                for v in value if isinstance(value, list) else [value]:
+                    if v is not None:
+                        grouped.setdefault(v, []).append(row)
+            self._keyword_rows[field] = {v: np.asarray(r, dtype=np.int64) for v, r in grouped.items()}
+        return self._keyword_rows[field]
+
+    def _search_ivf(self, queries, k, nprobe):
+        all_rows, all_scores = [], []
+        for query in queries:
+            candidates = self._candidate_rows(query, nprobe)
+            scores = self.vectors(candidates) @ query
+            top = min(k, candidates.shape[0])
+            keep = np.argpartition(-scores, top - 1)[:top] if top < candidates.shape[0] else np.arange(top)
+            keep = keep[np.argsort(-scores[keep], kind="stable")]
+            rows = np.full(k, -1, dtype=np.int64)
+            row_scores = np.full(k, -np.inf, dtype=np.float32)
+            rows[:top] = candidates[keep]
+            row_scores[:top] = scores[keep]
+            all_rows.append(rows)
+            all_scores.append(row_scores)
+        return np.vstack(all_rows), np.vstack(all_scores)
+
+    def read_record(self, row):
+        # pread keeps concurrent readers from racing on a shared file position
+        start, stop = int(self._payload_offsets[row]), int(self._payload_offsets[row + 1])
+        return json.loads(os.pread(self._payloads_file.fileno(), stop - start, start))
+
+    def row_of(self, point_id):
+        """Row of a point id, or None. The id map is built on first use by scanning the payloads."""
+        if self._row_of_id is None:
+            self._row_of_id = {self.read_record(row)["id"]: row for row in range(self.count)}
+        return self._row_of_id.get(point_id)
+
+    def to_scored_points(self, rows, scores, with_payload=True, with_vectors=False, score_threshold=None):
+        points = []
+        for row, score in zip(rows, scores):
+            if row < 0 or (score_threshold is not None and score < score_threshold):
+                continue
+            record = self.read_record(row)
+            points.append(models.ScoredPoint(
+                id=record["id"],
+                version=0,
+                score=float(score),
+                payload=record["payload"] if with_payload else None,
+                vector=self.vectors(np.array([row]))[0].tolist() if with_vectors else None
+            ))
+        return points
+
+    def close(self):
+        self._payloads_file.close()
+
+
+class LocalIndexBackend(RetrievalBackend):
+    """
+    In-process RetrievalBackend over a directory holding one LocalVectorIndex per collection
+    (`<root>/<collection_name>`). Stands in for Qdrant when the corpus fits in RAM, and in tests.
+    """
+
+    def __init__(self, root_path, nprobe=None):
+        self.root_path = root_path
+        self.nprobe = nprobe
+        self._indexes = {}
+
+    def get_index(self, collection_name):
+        index = self._indexes.get(collection_name)
+        if index is None:
+            path = os.path.join(self.root_path, collection_name)
+            if not os.path.exists(os.path.join(path, _META_FILE)):
+                raise ValueError(f"Local index for collection '{collection_name}' not found at {path}.")
+            index = LocalVectorIndex(path, nprobe=self.nprobe)
+            self._indexes[collection_name] = index
+        return index
+
+    def collection_exists(self, collection_name):
+        return os.path.exists(os.path.join(self.root_path, collection_name, _META_FILE))
+
+    def count(self, collection_name, exact=True):
+        return models.CountResult(count=self.get_index(collection_name).count)
+
+    def search(self, collection_name, query_vector, limit=10, query_filter=None, search_params=None,
+               with_payload=True, with_vectors=False, score_threshold=None, **kwargs):
+        return self._search_many(
+            collection_name, [query_vector], limit, query_filter, search_params,
+            with_payload, with_vectors, score_threshold
+        )[0]
+
+    def search_batch(self, collection_name, requests, **kwargs):
+        # Requests with the same options are scored together in one blocked pass
+        results = [None] * len(requests)
+        groups = {}
+        for i, request in enumerate(requests):
+            options = (
+                request.limit, repr(request.filter), bool(request.with_payload),
+                bool(request.with_vector), request.score_threshold,
+                bool(request.params and request.params.exact)
+            )
+            groups.setdefault(options, []).append(i)
+        for indices in groups.values():
+            first = requests[indices[0]]
+            hits = self._search_many(
+                collection_name, [requests[i].vector for i in indices], first.limit, first.filter,
+                first.params, first.with_payload, first.with_vector, first.score_threshold
+            )
+            for i, request_hits in zip(indices, hits):
+                results[i] = request_hits
+        return results
+
+    def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **kwargs):
+        index = self.get_index(collection_name)
+        records = []
+        for point_id in ids:
+            row = index.row_of(point_id)
+            if row is None:
+                continue
+            record = index.read_record(row)
+            records.append(models.Record(
+                id=record["id"],
+                payload=record["payload"] if with_payload else None,
+                vector=index.vectors(np.array([row]))[0].tolist() if with_vectors else None
+            ))
+        return records
+
+    def _search_many(self, collection_name, query_vectors, limit, query_filter, search_params,
+                     with_payload, with_vectors, score_threshold):
+        index = self.get_index(collection_name)
+        exact = bool(search_params is not None and search_params.exact)
+        # Filtered searches score only the matching rows (exactly), as Qdrant does for small subsets
+        allowed = index.rows_matching(query_filter) if query_filter is not None else None
+        rows, scores = index.search_vectors(
+            np.asarray(query_vectors, dtype=np.float32), limit, exact=exact, rows=allowed
+        )
+        return [
+            index.to_scored_points(r, s, with_payload=with_payload, with_vectors=with_vectors,
+                                   score_threshold=score_threshold)
+            for r, s in zip(rows, scores)
+        ]
+
+
+def export_collection_to_local_index(client, collection_name, path, dtype="float16", nlist=None,
+                                     scroll_limit=10_000):
+    """
+    Scroll every point (vector + payload) out of a Qdrant collection into a local index.
+    """
+    writer = None
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=scroll_limit,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if points:
+            if writer is None:
+                writer = LocalIndexWriter(path, len(points[0].vector), dtype=dtype)
+            writer.add([p.id for p in points], [p.vector for p in points], [p.payload for p in points])
+        if offset is None:
+            break
+    if writer is None:
+        raise ValueError(f"Collection '{collection_name}' has no points to export.")
+    writer.close()
+    if nlist:
+        build_ivf(path, nlist)
+    return LocalVectorIndex(path)
@@ -0,0 +1,222 @@
+"""
+Int8 ONNX sentence embedder (EMBEDDING_ENGINE=onnx-int8) and its offline export.
+
+    python -m ai.retrieval.onnx_embedding --model all-MiniLM-L6-v2
+
+The export (torch, sentence-transformers, int8 quantization) is a build step; the backend only
+loads an existing export from EMBEDDING_ONNX_DIR and refuses to start without one.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from ai.retrieval.retrieval_statistics import normalize_rows
+
+_FP32_MODEL_FILE = "model.onnx"
+_INT8_MODEL_FILE = "model_int8.onnx"
+_CONFIG_FILE = "embedding_config.json"
+_TOKENIZER_FILE = "tokenizer.json"
+
+
+def export_quantized_onnx(model_name, output_dir, opset=17):
+    """
+    Export a SentenceTransformer's transformer to ONNX and write a dynamically int8-quantized copy.
+
+    The pooling mode, normalisation and max sequence length are read from the
+    SentenceTransformer modules and stored next to the model, so OnnxSentenceEmbedder
+    reproduces the same embeddings without torch at inference time.
+    """
+    try:
+        import torch
+        from sentence_transformers import SentenceTransformer
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        raise ImportError("torch, sentence-transformers and onnxruntime are required to export the ONNX model.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    auto_model = transformer.auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    pooling_mode = "mean"
+    normalize = False
+    for module in st_model:
+        if hasattr(module, "pooling_mode_cls_token") and module.pooling_mode_cls_token:
+            pooling_mode = "cls"
+        if type(module).__name__ == "Normalize":
+            normalize = True
+
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    fp32_path = os.path.join(output_dir, _FP32_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(auto_model),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False,
+        )
+    quantize_dynamic(fp32_path, os.path.join(output_dir, _INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, _CONFIG_FILE), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "dimension": st_model.get_sentence_embedding_dimension(),
+            "max_seq_length": st_model.max_seq_length,
+            "pooling_mode": pooling_mode,
+            "normalize": normalize,
+            "input_names": input_names
+        }, f, indent=2)
+    return output_dir
+
+
+class OnnxSentenceEmbedder:
+    """
+    CPU sentence embedder on onnxruntime with the SentenceTransformer `encode` interface.
+
+    Loads the int8 model written by export_quantized_onnx (or the fp32 one with
+    `quantized=False`) and a fast `tokenizers` tokenizer; torch is not needed at runtime.
+    """
+
+    def __init__(self, model_dir, quantized=True, intra_op_threads=None):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("onnxruntime and tokenizers packages are required for the ONNX embedding engine.")
+        with open(os.path.join(model_dir, _CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        model_file = _INT8_MODEL_FILE if quantized else _FP32_MODEL_FILE
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, _TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding()
+        self.input_names = self.config["input_names"]
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        if not sentences:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        # Length-sorted batches keep padding (and wasted compute) to a minimum
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        embeddings = np.zeros((len(sentences), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            batch_rows = order[start:start + batch_size]
+            embeddings[batch_rows] = self._encode_batch([str(sentences[i]) for i in batch_rows])
+        if self.config["normalize"] or normalize_embeddings:
+            embeddings = normalize_rows(embeddings)
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+        if self.config["pooling_mode"] == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def onnx_model_dir(root, model_name):
+    """Directory of a model's export under `root` (`<root>/<model name>`, "/" replaced by "__")."""
+    return os.path.join(root, model_name.replace("/", "__"))
+
+
+def load_onnx_embedder(model_name, model_dir, quantized=True):
+    """
+    Load the ONNX embedder of `model_name` from `model_dir`.
+
+    Raises FileNotFoundError, naming the export command, when the export is missing; exporting
+    and quantizing need torch and minutes of CPU, so they never happen on the serving path.
+    """
+    model_file = _INT8_MODEL_FILE if quantized else _FP32_MODEL_FILE
+    missing = [name for name in (_CONFIG_FILE, _TOKENIZER_FILE, model_file)
+               if not os.path.exists(os.path.join(model_dir, name))]
+    if missing:
+        raise FileNotFoundError(
+            f"ONNX export of {model_name} is missing {', '.join(missing)} in {model_dir}. Export it "
+            f"offline first: python -m ai.retrieval.onnx_embedding --model {model_name} --output-dir {model_dir}"
+        )
+    return OnnxSentenceEmbedder(model_dir, quantized=quantized)
+
+
+def embedding_drift_report(reference_model, candidate_model, texts, corpus_vectors=None, k=10, batch_size=64):
+    """
+    Measure how far a candidate engine's embeddings drift from the reference (fp32) ones.
+
+    Args:
+        reference_model: Model whose embeddings are treated as ground truth.
+        candidate_model: Model under test (e.g. the int8 ONNX engine).
+        texts (list of str): Query texts embedded by both models.
+        corpus_vectors (array-like, optional): Stored collection vectors; when given, recall@k of
+            the candidate's top-k against the reference top-k over this corpus is reported.
+        k (int): Cut-off for recall@k.
+
+    Returns:
+        dict: cosine agreement statistics and, optionally, recall@k.
+    """
+    reference = normalize_rows(reference_model.encode(texts, batch_size=batch_size))
+    candidate = normalize_rows(candidate_model.encode(texts, batch_size=batch_size))
+    cosine = np.sum(reference * candidate, axis=1)
+    report = {
+        "texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "p5_cosine": float(np.percentile(cosine, 5)),
+        "min_cosine": float(cosine.min())
+    }
+    if corpus_vectors is not None:
+        corpus = normalize_rows(corpus_vectors)
+        k = min(k, corpus.shape[0])
+        reference_top = np.argpartition(-(reference @ corpus.T), k - 1, axis=1)[:, :k]
+        candidate_top = np.argpartition(-(candidate @ corpus.T), k - 1, axis=1)[:, :k]
+        overlaps = [len(set(r) & set(c)) / k for r, c in zip(reference_top, candidate_top)]
+        report[f"recall_at_{k}"] = float(np.mean(overlaps))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a SentenceTransformer to fp32 and int8 ONNX.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--output-dir", help="Default: <EMBEDDING_ONNX_DIR>/<model>.")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    output_dir = args.output_dir or onnx_model_dir(os.getenv("EMBEDDING_ONNX_DIR", "onnx_models"), args.model)
+    print(export_quantized_onnx(args.model, output_dir, opset=args.opset))
+
+
+if __name__ == "__main__":
+    main()
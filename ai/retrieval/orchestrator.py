@@ -1,31 +1,135 @@
 
-from ai.retrieval.document_retrieval import search_similar
+import logging
+from ai.event_loop import run_sync
+from ai.retrieval import embeddings_helper
+from ai.retrieval.document_retrieval import (
+    search_similar_async,
+    search_similar_batch,
+    search_similar_hybrid_async,
+)
 from ai.retrieval.embeddings_helper import (
     QDRANT_COLLECTION,
+    get_lexical_index,
+    get_search_params,
+    init_async_embeddings_helperions,
     init_embeddings_helperions
 )
 
-def retrieve_releveant_context(
+logger = logging.getLogger(__name__)
+
+def hybrid_lexical_index(collection_name):
+    """
+    The lexical index to fuse with, when RETRIEVAL_MODE=hybrid and one is built; else None.
+    """
+    if embeddings_helper.retrieval_mode != "hybrid":
+        return None
+    lexical_index = get_lexical_index(collection_name)
+    if lexical_index is None:
+        logger.warning(f"RETRIEVAL_MODE=hybrid but no lexical index for '{collection_name}'; using dense retrieval.")
+    return lexical_index
+
+def selection_kwargs():
+    """
+    MMR options for the search helpers when MMR_TOP_K is set, so near-duplicate hits are
+    dropped before they cost prompt tokens; empty (top-p selection) otherwise.
+    """
+    if not embeddings_helper.mmr_top_k:
+        return {}
+    return {"mmr_k": embeddings_helper.mmr_top_k, "mmr_lambda": embeddings_helper.mmr_lambda}
+
+async def aretrieve_releveant_context(
     query,
     client=None,
     model=None,
     collection_name=None,
-    top_k=5
+    top_k=5,
+    query_filter=None
 ):
     """
-    Retrieve answers for a given query.
-    In production, only query is required.
-    For testing, client/model/collection_name can be injected.
+    Retrieve answers for a given query without blocking the event loop.
+    In production, only query is required; the pooled AsyncQdrantClient of the running loop
+    is used and embedding runs in the embedding executor.
+    For testing, client/model/collection_name can be injected (a synchronous client is
+    searched in the embedding executor).
+    `query_filter` (models.Filter, e.g. brand_filter("amazon")) restricts the search to
+    matching payloads and is passed to Qdrant as `query_filter`.
     Uses embeddings_helper for all setup/caching.
     """
+    if collection_name is None:
+        collection_name = QDRANT_COLLECTION
+    if client is None or model is None:
+        client, model = await init_async_embeddings_helperions(collection_name)
+    search_params = get_search_params(collection_name)
+    lexical_index = hybrid_lexical_index(collection_name)
+    if lexical_index is not None:
+        # Fusion keeps recall at a smaller k, so fewer documents reach the prompt
+        return format_relevant_context(await search_similar_hybrid_async(
+            client, model, query, collection_name, lexical_index,
+            top_k=min(top_k, embeddings_helper.hybrid_top_k),
+            candidates=embeddings_helper.hybrid_candidates,
+            rrf_k=embeddings_helper.hybrid_rrf_k,
+            search_params=search_params,
+            query_filter=query_filter,
+            **selection_kwargs()
+        ))
+    return format_relevant_context(await search_similar_async(
+        client, model, query, collection_name, top_k=top_k, search_params=search_params, query_filter=query_filter,
+        **selection_kwargs()
+    ))
+
+def retrieve_releveant_context(
+    query,
+    client=None,
+    model=None,
+    collection_name=None,
+    top_k=5,
+    query_filter=None
+):
+    """
+    Synchronous wrapper of aretrieve_releveant_context, with the same arguments and return
+    value. It runs on the shared event loop (ai/event_loop.py), so sync callers on any thread
+    share that loop's pooled AsyncQdrantClient.
+    """
+    return run_sync(aretrieve_releveant_context(
+        query, client=client, model=model, collection_name=collection_name, top_k=top_k, query_filter=query_filter
+    ))
+
+def retrieve_relevant_context_batch(
+    queries,
+    client=None,
+    model=None,
+    collection_name=None,
+    top_k=5,
+    query_filter=None
+):
+    """
+    Retrieve answers for many queries at once (offline evaluation, cache warming).
+    All queries are embedded in one model call and searched in one search_batch request
+    (dense retrieval only, whatever RETRIEVAL_MODE says).
+    Returns a list with one retrieve_releveant_context tuple per query.
+    """
     if collection_name is None:
         collection_name = QDRANT_COLLECTION
     if client is None or model is None:
         client, model = init_embeddings_helperions(collection_name)
-    results, mean_inter_document_similarity, median_inter_document_similarity, mean_document_query_similarity, median_document_query_similarity = search_similar(client, model, query, collection_name, top_k=top_k)
+    return [
+        format_relevant_context(search_result)
+        for search_result in search_similar_batch(
+            client, model, queries, collection_name, top_k=top_k,
+            search_params=get_search_params(collection_name), query_filter=query_filter, **selection_kwargs()
+        )
+    ]
+
+def format_relevant_context(search_result):
+    """
+    Map the search_similar tuple to (relevant_context, mean/median inter-document and
+    document-query similarities) as returned by retrieve_releveant_context.
+    """
+    results, mean_inter_document_similarity, median_inter_document_similarity, mean_document_query_similarity, median_document_query_similarity = search_result
     return [
         {
             "score": r["score"],
+            "centrality": r.get("centrality"),
             "document": {
                 "question": r["input"],
                 "answer": r["reply"]
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+rerank_enabled = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+rerank_model_name = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+rerank_candidates = int(os.getenv("RERANK_CANDIDATES", 20))
+rerank_top_k = int(os.getenv("RERANK_TOP_K", 5))
+rerank_budget_ms = float(os.getenv("RERANK_BUDGET_MS", 200))
+rerank_batch_size = int(os.getenv("RERANK_BATCH_SIZE", 16))
+rerank_max_length = int(os.getenv("RERANK_MAX_LENGTH", 256))
+rerank_workers = int(os.getenv("RERANK_WORKERS", 4))
+
+_cached_cross_encoder = None
+_rerank_executor = None
+_rerank_stats = None
+
+
+def get_cross_encoder():
+    """The CPU cross-encoder, loaded once per process."""
+    global _cached_cross_encoder
+    if _cached_cross_encoder is None:
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            raise ImportError("sentence-transformers is required for reranking.")
+        _cached_cross_encoder = CrossEncoder(rerank_model_name, max_length=rerank_max_length, device="cpu")
+    return _cached_cross_encoder
+
+
+def get_rerank_executor():
+    global _rerank_executor
+    if _rerank_executor is None:
+        _rerank_executor = ThreadPoolExecutor(max_workers=rerank_workers, thread_name_prefix="rerank")
+    return _rerank_executor
+
+
+def candidate_text(candidate):
+    """The text scored against the query: the document's question and answer."""
+    document = candidate.get("document", candidate)
+    if isinstance(document, dict):
+        return f"{document.get('question') or ''} {document.get('answer') or ''}".strip()
+    return str(document)
+
+
+def score_candidates(model, query, texts, batch_size=16, deadline=None, cancelled=None):
+    """
+    Cross-encoder scores of (query, text) pairs, one batch at a time. Returns None as soon as
+    the deadline passes or `cancelled` is set, so an abandoned request stops using the CPU.
+    """
+    scores = []
+    for start in range(0, len(texts), batch_size):
+        if cancelled is not None and cancelled.is_set():
+            return None
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        pairs = [(query, text) for text in texts[start:start + batch_size]]
+        scores.extend(np.asarray(model.predict(pairs, batch_size=batch_size, show_progress_bar=False)).ravel())
+    return np.asarray(scores, dtype=np.float32)
+
+
+def rerank(query, candidates, model, top_k=5, budget_ms=None, batch_size=16):
+    """
+    Reorder retrieval candidates by cross-encoder score and keep the best `top_k`.
+
+    With `budget_ms` set the caller waits at most that long; if scoring has not finished the
+    dense order is kept (truncated to `top_k`) and scoring is abandoned at the next batch.
+
+    Returns:
+        (list, dict): kept candidates (each with a `rerank_score` when reranked) and
+            `rerank_ms`, `timed_out`, `candidates` and `kept`.
+    """
+    if top_k <= 0:
+        raise ValueError("top_k must be positive")
+    start = time.perf_counter()
+    texts = [candidate_text(c) for c in candidates]
+    scores = None
+    timed_out = False
+    if texts:
+        if budget_ms is None:
+            scores = score_candidates(model, query, texts, batch_size=batch_size)
+        else:
+            deadline = start + budget_ms / 1000.0
+            cancelled = threading.Event()
+            future = get_rerank_executor().submit(
+                score_candidates, model, query, texts, batch_size, deadline, cancelled
+            )
+            try:
+                scores = future.result(timeout=max(deadline - time.perf_counter(), 0.0))
+            except FutureTimeoutError:
+                cancelled.set()
+                future.cancel()
+            timed_out = scores is None
+
+    if scores is None:
+        kept = list(candidates[:top_k])
+    else:
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        kept = [dict(candidates[i], rerank_score=float(scores[i])) for i in order.tolist()]
+    return kept, {
+        "rerank_ms": (time.perf_counter() - start) * 1000.0,
+        "timed_out": timed_out,
+        "candidates": len(candidates),
+        "kept": len(kept)
+    }
+
+
+class RerankStats:
+    """Per-worker rerank counters: time spent against prompt tokens saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rerank_ms = 0.0
+        self.prompt_tokens_saved = 0
+
+    def record(self, rerank_ms, timed_out, prompt_tokens_saved):
+        with self._lock:
+            self.requests += 1
+            self.timeouts += int(timed_out)
+            self.rerank_ms += rerank_ms
+            self.prompt_tokens_saved += prompt_tokens_saved
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": rerank_enabled,
+                "requests": self.requests,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "mean_rerank_ms": self.rerank_ms / self.requests if self.requests else 0.0,
+                "prompt_tokens_saved": self.prompt_tokens_saved,
+                "mean_prompt_tokens_saved": self.prompt_tokens_saved / self.requests if self.requests else 0.0,
+                "prompt_tokens_saved_per_rerank_ms":
+                    self.prompt_tokens_saved / self.rerank_ms if self.rerank_ms else 0.0
+            }
+
+
+def get_rerank_stats_tracker():
+    global _rerank_stats
+    if _rerank_stats is None:
+        _rerank_stats = RerankStats()
+    return _rerank_stats
+
+
+def get_rerank_stats():
+    return get_rerank_stats_tracker().stats()
@@ -0,0 +1,59 @@
+import numpy as np
+
+
+def normalize_rows(vectors):
+    """
+    L2-normalise each row of a 2-D array so dot products become cosine similarities.
+    Zero rows are left as zeros.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def compute_retrieval_statistics(doc_vectors):
+    """
+    Compute inter-document similarity statistics from the vectors returned with the hits.
+
+    Only the upper triangle of the cosine similarity matrix is used, so every pair is
+    counted once and self-similarity is ignored.
+
+    Args:
+        doc_vectors (array-like): Matrix of shape (n_documents, dim).
+
+    Returns:
+        dict: {
+            "mean_inter_document_similarity": <float or None>,
+            "median_inter_document_similarity": <float or None>,
+            "centrality": <np.ndarray of shape (n_documents,)>  # mean similarity to the other documents
+        }
+    """
+    if doc_vectors is None or len(doc_vectors) == 0:
+        return {
+            "mean_inter_document_similarity": None,
+            "median_inter_document_similarity": None,
+            "centrality": np.zeros(0, dtype=np.float32)
+        }
+    unit_vectors = normalize_rows(doc_vectors)
+    n = unit_vectors.shape[0]
+    if n < 2:
+        return {
+            "mean_inter_document_similarity": None,
+            "median_inter_document_similarity": None,
+            "centrality": np.zeros(n, dtype=np.float32)
+        }
+
+    similarities = unit_vectors @ unit_vectors.T
+    upper_values = similarities[np.triu_indices(n, k=1)]
+
+    # Row sums minus the diagonal give each document's total similarity to the others
+    centrality = (similarities.sum(axis=1) - np.diag(similarities)) / (n - 1)
+
+    return {
+        "mean_inter_document_similarity": float(np.mean(upper_values)),
+        "median_inter_document_similarity": float(np.median(upper_values)),
+        "centrality": centrality
+    }
@@ -3,12 +3,37 @@
 #      -H "Content-Type: application/json" \
 #      -d '{"user_query": "Hello, how are you?", "enable_reasoning": true}'
 
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+import anyio.to_thread
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Any
-from backend.orchestrator import process_chat_history_api
+from backend.orchestrator import aprocess_chat_history_api, stream_chat_history_api
+from ai.retrieval import embeddings_helper
+from ai.retrieval.embeddings_helper import get_embedding_cache_stats
+from ai.conversational.semantic_cache import get_semantic_cache_stats
+from ai.retrieval.rerank import get_rerank_stats
+from ai.generation.llm_usage import get_llm_stats
+from ai.generation.llm_cache import get_llm_cache_stats
+from ai.generation.prompt_budget import get_prompt_budget_stats
 
-app = FastAPI()
+# Threads that run streamed responses; each holds one streamed conversation, so this bounds
+# the streams a worker serves at once
+api_threadpool_size = int(os.getenv("API_THREADPOOL_SIZE", 40))
+
+@asynccontextmanager
+async def lifespan(app):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = api_threadpool_size
+    if embeddings_helper.embedding_engine == "onnx-int8":
+        # Fail at startup, not on the first query, when the offline ONNX export is missing
+        await asyncio.to_thread(embeddings_helper.get_sentence_transformer)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 class ChatMessage(BaseModel):
     role: str
@@ -19,6 +44,7 @@ class ProcessChatHistoryRequest(BaseModel):
     user_query: str
     enable_reasoning: Optional[bool] = True
     conversation_id: Optional[str] = None
+    brand: Optional[str] = None
 
 class ProcessChatHistoryResponse(BaseModel):
     answer: str
@@ -37,6 +63,7 @@ async def process_chat(request: ProcessChatHistoryRequest):
     - `user_query` (str, required): The user's message.
     - `enable_reasoning` (bool, optional): Whether to enable reasoning in the response (default: True).
     - `conversation_id` (str, optional): The conversation ID to continue, or None to start a new conversation.
+    - `brand` (str, optional): Only retrieve support exchanges of this brand (e.g. "amazon" or "@AmazonHelp").
 
     **Response:**
     - `answer` (str): The generated answer to the user query.
@@ -54,10 +81,13 @@ async def process_chat(request: ProcessChatHistoryRequest):
         raise HTTPException(status_code=400, detail="User query cannot be empty.")
 
     try:
-        operation_result, result, operation_error_message = process_chat_history_api(
+        # Retrieval and the LLM calls are awaited on the async clients and MongoDB runs in a
+        # worker thread, so the event loop keeps serving other conversations meanwhile
+        operation_result, result, operation_error_message = await aprocess_chat_history_api(
             user_query=request.user_query,
             enable_reasoning=request.enable_reasoning,
-            conversation_id=request.conversation_id
+            conversation_id=request.conversation_id,
+            brand=request.brand
         )
         if operation_error_message:
             raise HTTPException(status_code=500, detail=operation_error_message)
@@ -76,4 +106,87 @@ async def process_chat(request: ProcessChatHistoryRequest):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+def sse_event(event: str, data: Any) -> str:
+    """One Server-Sent Events frame; the data is JSON so newlines in tokens survive."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/generate_response/stream")
+async def process_chat_stream(request: ProcessChatHistoryRequest):
+    """
+    Same as `/generate_response`, but the answer is streamed as Server-Sent Events while the
+    LLM writes it.
+
+    **Request Body:** as for `/generate_response`.
+
+    **Events (`text/event-stream`):**
+    - `start`: `{"conversation_id": ...}` once the user message is recorded.
+    - `token`: `{"text": ...}` for each piece of the answer, in order. Concatenated, they form the answer.
+    - `done`: the `/generate_response` response body (answer, reasoning, evaluations with
+      `time_to_first_token_ms`, conversation_id, relevant_documents), sent after the assistant
+      turn has been stored.
+    - `error`: `{"detail": ...}` instead of `done` when processing fails.
+
+    **Possible Errors:**
+    - 400: User query cannot be empty.
+    """
+    if not request.user_query or not request.user_query.strip():
+        raise HTTPException(status_code=400, detail="User query cannot be empty.")
+
+    def events():
+        # A sync generator: Starlette iterates it in a worker thread, so the blocking LLM
+        # stream and MongoDB writes never block the event loop
+        for event in stream_chat_history_api(
+            user_query=request.user_query,
+            enable_reasoning=request.enable_reasoning,
+            conversation_id=request.conversation_id,
+            brand=request.brand
+        ):
+            if event["event"] == "token":
+                yield sse_event("token", {"text": event["text"]})
+            elif event["event"] == "start":
+                yield sse_event("start", {"conversation_id": event["conversation_id"]})
+            elif event["event"] == "done":
+                result = event["result"]
+                yield sse_event("done", ProcessChatHistoryResponse(
+                    answer=result.get("answer"),
+                    reasoning=result.get("reasoning"),
+                    success=True,
+                    evaluations=result.get("evaluations"),
+                    conversation_id=result.get("conversation_id"),
+                    relevant_documents=result.get("relevant_documents")
+                ).model_dump())
+            else:
+                yield sse_event("error", {"detail": event["detail"]})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Cache counters for this worker.
+
+    **Response:**
+    - `embedding_cache` (object): Query-embedding cache hits per tier, misses, hit rate and size.
+    - `semantic_cache` (object): Semantic answer cache hits, misses, hit rate, entries and latency saved.
+    - `rerank` (object): Reranked requests, budget timeouts, mean rerank time and prompt tokens saved.
+    - `llm` (object): Per provider: LLM calls, errors, calls in flight and waiting for a
+      concurrency slot, the limit, and mean queueing and call times.
+    - `llm_cache` (object): LLM response cache hits per tier, misses, bypassed calls, stores,
+      hit rate and mean hit time in microseconds.
+    - `prompt_budget` (object): Per prompt kind (generation, summarisation): prompts built,
+      prompts that had to drop content, and mean tokens used and dropped per section.
+    """
+    return {
+        "embedding_cache": get_embedding_cache_stats(),
+        "semantic_cache": get_semantic_cache_stats(),
+        "rerank": get_rerank_stats(),
+        "llm": get_llm_stats(),
+        "llm_cache": get_llm_cache_stats(),
+        "prompt_budget": get_prompt_budget_stats()
+    }
@@ -1,11 +1,15 @@
+import asyncio
 import logging
-from typing import Tuple, Optional, Dict, Any
+from typing import Tuple, Optional, Dict, Any, Iterator, List
 from backend.conversation_management import (
     get_conversation_history,
     set_new_conversation_history,
     append_conversation_history
 )
-from ai.conversational.orchestrator import process_chat_history as process_chat_history_core
+from ai.conversational.orchestrator import aprocess_chat_history as aprocess_chat_history_core
+from ai.conversational.orchestrator import stream_chat_history as stream_chat_history_core
+from ai.event_loop import run_sync
+from ai.retrieval.brand import brand_filter
 
 logger = logging.getLogger(__name__)
 
@@ -35,28 +39,98 @@ def validate_user_query(user_query: str) -> Tuple[bool, Optional[str]]:
         return False, "User query is too long (max 10000 characters)"
     return True, None
 
-def process_chat_history_api(
+def open_conversation_turn(
+    user_query: str,
+    conversation_id: Optional[str] = None
+) -> Tuple[Optional[Dict], Optional[str], List[Dict], Optional[str]]:
+    """
+    Load (or create) the conversation and record the user's message in it.
+
+    Returns (operation_result, conversation_id, chat_history, operation_error_message).
+    """
+    operation_result = None
+    if conversation_id:
+        logger.info(f"Retrieving conversation history for conversation_id: {conversation_id}")
+        success, chat_history, error_message = get_conversation_history(conversation_id)
+        if not success:
+            operation_error_message = error_message or "Failed to retrieve conversation history."
+            logger.error(f"Failed to retrieve conversation history: {operation_error_message}")
+            return operation_result, conversation_id, [], operation_error_message
+
+        new_chat = [{"role": "user", "content": user_query}]
+        logger.info(f"Appending new user query to conversation_id {conversation_id}: {user_query[:50]}...")
+        
+        append_success, op_result, append_error = append_conversation_history(
+            conversation_id, new_chat
+        )
+        operation_result = op_result
+        if not append_success:
+            operation_error_message = append_error or "Failed to append to conversation history."
+            logger.error(f"Failed to append to conversation history: {operation_error_message}")
+            return operation_result, conversation_id, [], operation_error_message
+        
+        return operation_result, conversation_id, chat_history + new_chat, None
+
+    logger.info("Creating new conversation history.")
+    success, data, error_message = set_new_conversation_history(user_query)
+    if not success or not data:
+        operation_error_message = error_message or "Failed to create new conversation."
+        logger.error(f"Failed to create new conversation: {operation_error_message}")
+        return operation_result, None, [], operation_error_message
+    
+    conversation_id, chat_history = data
+    logger.info(f"New conversation created with conversation_id: {conversation_id}")
+    return operation_result, conversation_id, chat_history, None
+
+def store_assistant_response(conversation_id: str, result: Dict) -> Optional[str]:
+    """
+    Append the assistant turn of `result` to the conversation. Returns an error message, or None.
+    """
+    new_content = [{
+        "role": "assistant",
+        "content": result.get("answer", ""),
+        "summarized_query": result.get("summarised_query", ""),
+        "reference_documents": result.get("relevant_documents", []),
+        "evaluations": result.get("evaluations", {}),
+        "reasoning": result.get("reasoning", "")
+    }]
+    
+ 
+    logger.info(f"Appending assistant response to conversation_id {conversation_id}")
+    append_success, op_result, append_error = append_conversation_history(
+        conversation_id, new_content
+    )
+    
+    if not append_success:
+        operation_error_message = append_error or "Failed to append assistant response to conversation history."
+        logger.error(f"Failed to append assistant response: {operation_error_message}")
+        return operation_error_message
+    return None
+
+async def aprocess_chat_history_api(
     user_query: str, 
     enable_reasoning: bool = True, 
-    conversation_id: Optional[str] = None
+    conversation_id: Optional[str] = None,
+    brand: Optional[str] = None
 ) -> Tuple[Optional[Dict], Optional[Dict], Optional[str]]:
     """
-    Handles chat history processing and conversation management.
+    Handles chat history processing and conversation management without blocking the event
+    loop: MongoDB calls run in a worker thread and the conversational pipeline is awaited.
 
     Args:
         user_query: The user's message
         enable_reasoning: Whether to enable reasoning in the response
         conversation_id: Optional conversation ID to continue an existing conversation
+        brand: Optional brand (e.g. "amazon" or "@AmazonHelp") to restrict retrieval to
 
     Returns:
         Tuple of (operation_result, result, operation_error_message)
         - operation_result: The result of any conversation management operation
-        - result: The result from process_chat_history_core (LLM response etc.), or None if error
+        - result: The result from aprocess_chat_history_core (LLM response etc.), or None if error
         - operation_error_message: Any error message encountered, or None
     """
     operation_result = None
     operation_error_message = None
-    chat_history = []
     result = None
 
     # Validate user query
@@ -70,75 +144,99 @@ def process_chat_history_api(
     user_query = user_query.strip()
 
     try:
-        if conversation_id:
-            logger.info(f"Retrieving conversation history for conversation_id: {conversation_id}")
-            success, chat_history, error_message = get_conversation_history(conversation_id)
-            if not success:
-                operation_error_message = error_message or "Failed to retrieve conversation history."
-                logger.error(f"Failed to retrieve conversation history: {operation_error_message}")
-                return operation_result, result, operation_error_message
-
-            new_chat = [{"role": "user", "content": user_query}]
-            logger.info(f"Appending new user query to conversation_id {conversation_id}: {user_query[:50]}...")
-            
-            append_success, op_result, append_error = append_conversation_history(
-                conversation_id, new_chat
-            )
-            operation_result = op_result
-            if not append_success:
-                operation_error_message = append_error or "Failed to append to conversation history."
-                logger.error(f"Failed to append to conversation history: {operation_error_message}")
-                return operation_result, result, operation_error_message
-            
-            chat_history = chat_history + new_chat
-        else:
-            logger.info("Creating new conversation history.")
-            success, data, error_message = set_new_conversation_history(user_query)
-            if not success or not data:
-                operation_error_message = error_message or "Failed to create new conversation."
-                logger.error(f"Failed to create new conversation: {operation_error_message}")
-                return operation_result, result, operation_error_message
-            
-            conversation_id, chat_history = data
-            logger.info(f"New conversation created with conversation_id: {conversation_id}")
+        operation_result, conversation_id, chat_history, operation_error_message = await asyncio.to_thread(
+            open_conversation_turn, user_query, conversation_id
+        )
+        if operation_error_message:
+            return operation_result, result, operation_error_message
 
         # Process the chat history
         logger.info(f"Processing chat history for conversation_id: {conversation_id}")
-        result = process_chat_history_core(chat_history, enable_reasoning=enable_reasoning)
+        result = await aprocess_chat_history_core(
+            chat_history, enable_reasoning=enable_reasoning, query_filter=brand_filter(brand)
+        )
         
         if not result or not isinstance(result, dict):
             operation_error_message = "Invalid response from chat processing"
-            logger.error(f"Invalid response from process_chat_history_core for conversation {conversation_id}")
+            logger.error(f"Invalid response from aprocess_chat_history_core for conversation {conversation_id}")
             return operation_result, result, operation_error_message
         
         # Convert numpy types for JSON serialization
         result = convert_numpy_types(result)
         result["conversation_id"] = conversation_id
         
-        # Prepare assistant response for storage
-        new_content = [{
-            "role": "assistant",
-            "content": result.get("answer", ""),
-            "summarized_query": result.get("summarised_query", ""),
-            "reference_documents": result.get("relevant_documents", []),
-            "evaluations": result.get("evaluations", {}),
-            "reasoning": result.get("reasoning", "")
-        }]
-        
-     
-        logger.info(f"Appending assistant response to conversation_id {conversation_id}")
-        append_success, op_result, append_error = append_conversation_history(
-            conversation_id, new_content
-        )
-        
-        if not append_success:
-            operation_error_message = append_error or "Failed to append assistant response to conversation history."
-            logger.error(f"Failed to append assistant response: {operation_error_message}")
-
-        logger.info(f"Successfully processed conversation {conversation_id}")
+        operation_error_message = await asyncio.to_thread(store_assistant_response, conversation_id, result)
+        if not operation_error_message:
+            logger.info(f"Successfully processed conversation {conversation_id}")
         
     except Exception as e:
         operation_error_message = f"Unexpected error during chat processing: {str(e)}"
         logger.exception(f"Exception occurred during chat history processing: {operation_error_message}")
 
     return operation_result, result, operation_error_message
+
+def process_chat_history_api(
+    user_query: str, 
+    enable_reasoning: bool = True, 
+    conversation_id: Optional[str] = None,
+    brand: Optional[str] = None
+) -> Tuple[Optional[Dict], Optional[Dict], Optional[str]]:
+    """Synchronous wrapper of aprocess_chat_history_api, with the same arguments and return value."""
+    return run_sync(aprocess_chat_history_api(user_query, enable_reasoning, conversation_id, brand))
+
+def stream_chat_history_api(
+    user_query: str,
+    enable_reasoning: bool = True,
+    conversation_id: Optional[str] = None,
+    brand: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of process_chat_history_api.
+
+    Yields events:
+        - {"event": "start", "conversation_id": <str>} once the user turn is recorded
+        - {"event": "token", "text": <str>} for each piece of the answer
+        - {"event": "done", "result": <dict>} with the JSON-ready result, after the assembled
+          assistant turn has been appended to the conversation
+        - {"event": "error", "detail": <str>} instead of "done" when processing fails
+    """
+    is_valid, validation_error = validate_user_query(user_query)
+    if not is_valid:
+        logger.error(f"Invalid user query: {validation_error}")
+        yield {"event": "error", "detail": validation_error}
+        return
+    user_query = user_query.strip()
+
+    try:
+        _, conversation_id, chat_history, operation_error_message = open_conversation_turn(user_query, conversation_id)
+        if operation_error_message:
+            yield {"event": "error", "detail": operation_error_message}
+            return
+        yield {"event": "start", "conversation_id": conversation_id}
+
+        logger.info(f"Streaming chat history for conversation_id: {conversation_id}")
+        result = None
+        for event in stream_chat_history_core(
+            chat_history, enable_reasoning=enable_reasoning, query_filter=brand_filter(brand)
+        ):
+            if event["event"] == "token":
+                yield event
+            else:
+                result = event["response"]
+        if not result or not isinstance(result, dict):
+            logger.error(f"Invalid response from stream_chat_history_core for conversation {conversation_id}")
+            yield {"event": "error", "detail": "Invalid response from chat processing"}
+            return
+
+        result = convert_numpy_types(result)
+        result["conversation_id"] = conversation_id
+        operation_error_message = store_assistant_response(conversation_id, result)
+        if operation_error_message:
+            yield {"event": "error", "detail": operation_error_message}
+            return
+        logger.info(f"Successfully streamed conversation {conversation_id}")
+        yield {"event": "done", "result": result}
+    except Exception as e:
+        operation_error_message = f"Unexpected error during chat processing: {str(e)}"
+        logger.exception(f"Exception occurred during chat history streaming: {operation_error_message}")
+        yield {"event": "error", "detail": operation_error_message}
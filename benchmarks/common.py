@@ -0,0 +1,84 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def latency_summary(latencies_s):
+    """
+    Returns p50/p95/p99/mean latency in milliseconds for a list of durations in seconds.
+    """
+    if not latencies_s:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    values = np.asarray(latencies_s) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean())
+    }
+
+
+def print_table(rows, columns):
+    """Print a list of dicts as a fixed-width table."""
+    widths = {c: max(len(c), *(len(_format(r.get(c))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for r in rows:
+        print("  ".join(_format(r.get(c)).ljust(widths[c]) for c in columns))
+
+
+def _format(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def write_json(path, payload):
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, default=str)
+
+
+class HashingEncoder:
+    """
+    Deterministic bag-of-words encoder with the SentenceTransformer `encode` interface.
+
+    Token hashes are projected into `dim` buckets and rows are L2-normalised, so texts
+    sharing words are close. Used when no transformer model is available (CI, sandboxes).
+    `call_overhead_ms` and `per_item_ms` emulate the cost profile of a real model: every
+    call pays a fixed cost and calls are serialised, as they are on a CPU-bound model.
+    `ignore_numeric` drops tokens containing digits, mimicking how sentence embeddings blur
+    order numbers and error codes.
+    """
+
+    def __init__(self, dim=384, call_overhead_ms=0.0, per_item_ms=0.0, ignore_numeric=False):
+        self.dim = dim
+        self.ignore_numeric = ignore_numeric
+        self.call_overhead_ms = call_overhead_ms
+        self.per_item_ms = per_item_ms
+        self._compute_lock = threading.Lock()
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        vectors = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for row, text in enumerate(sentences):
+            for token in _TOKEN_PATTERN.findall(str(text).lower()):
+                if self.ignore_numeric and any(c.isdigit() for c in token):
+                    continue
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        if self.call_overhead_ms or self.per_item_ms:
+            with self._compute_lock:
+                time.sleep((self.call_overhead_ms + self.per_item_ms * len(sentences)) / 1000.0)
+        return vectors / norms
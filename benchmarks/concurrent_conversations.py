@@ -0,0 +1,82 @@
+"""
+Concurrent conversations one backend worker sustains, measured on a running backend.
+
+    python -m benchmarks.concurrent_conversations --base-url http://localhost:8000 --concurrency 1 8 32 64
+    python -m benchmarks.concurrent_conversations --requests 128 --output concurrency.json
+
+Each level keeps `concurrency` first-turn conversations in flight against `/generate_response`
+until `requests` have completed, and reports throughput and latency percentiles. The worker's
+LLM counters from `/metrics` (calls waiting for a concurrency slot, mean queueing time) are
+read after each level to show where requests queued. Turns are awaited on the worker's event
+loop, so levels above the per-provider LLM limit queue for a concurrency slot.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import latency_summary, print_table, write_json
+from benchmarks.streaming_latency import DEFAULT_QUERIES
+
+
+async def run_level(client, base_url, queries, concurrency, requests):
+    latencies, errors = [], 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{base_url}/generate_response",
+                                             json={"user_query": queries[i % len(queries)]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    llm = (await client.get(f"{base_url}/metrics")).json().get("llm", {}).get("openai", {})
+    return {
+        "concurrency": concurrency,
+        "requests_per_s": len(latencies) / elapsed,
+        "errors": errors,
+        **latency_summary(latencies),
+        "llm_mean_queue_ms": llm.get("mean_queue_ms"),
+        "llm_mean_call_ms": llm.get("mean_call_ms")
+    }
+
+
+async def run(args, queries):
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(timeout=300.0, limits=limits) as client:
+        return [await run_level(client, args.base_url, queries, concurrency, args.requests)
+                for concurrency in args.concurrency]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Completed requests per concurrency level.")
+    parser.add_argument("--queries", help="Text file with one query per line.")
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    rows = asyncio.run(run(args, queries))
+    print_table(rows, ["concurrency", "requests_per_s", "errors", "p50_ms", "p95_ms", "llm_mean_queue_ms",
+                       "llm_mean_call_ms"])
+    if args.output:
+        write_json(args.output, {"args": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Duplicate flagging: per-point Qdrant search BFS vs the scroll-once matrix engine vs SimHash LSH.
+
+Uses an in-memory Qdrant collection of clustered synthetic vectors unless --host is given.
+
+    python -m benchmarks.duplicate_detection --points 2000 5000
+    python -m benchmarks.duplicate_detection --host localhost --collection customer_support_tweets --skip-bfs
+"""
+import argparse
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from ai.retrieval.load.flag_duplicate_data import flag_duplicate_sentences_from_qdrant
+from benchmarks.common import print_table, write_json
+
+
+def synthetic_collection(client, name, n_points, dim, duplicate_fraction=0.3, seed=0):
+    rng = np.random.default_rng(seed)
+    n_dupes = int(n_points * duplicate_fraction)
+    base = rng.normal(size=(n_points - n_dupes, dim))
+    sources = rng.integers(0, len(base), size=n_dupes)
+    vectors = np.vstack([base, base[sources] + rng.normal(scale=0.02, size=(n_dupes, dim))]).astype(np.float32)
+    client.create_collection(
+        collection_name=name,
+        vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+    )
+    for start in range(0, n_points, 1000):
+        client.upsert(collection_name=name, points=[
+            models.PointStruct(id=i, vector=vectors[i].tolist(), payload={"input": f"q{i}", "reply": f"a{i}"})
+            for i in range(start, min(start + 1000, n_points))
+        ])
+
+
+def pair_recall(reference, candidate):
+    """Fraction of point pairs grouped together by `reference` that `candidate` also groups together."""
+    together = same = 0
+    for _, members in reference.dropna().groupby(reference.dropna()).groups.items():
+        labels = candidate.loc[members].fillna(-1).value_counts()
+        size = len(members)
+        together += size * (size - 1) // 2
+        same += int(sum(c * (c - 1) // 2 for c in labels if c > 0))
+    return same / together if together else 1.0
+
+
+def same_partition(a, b):
+    """True if both group labellings put exactly the same points together."""
+    a, b = a.fillna(0).tolist(), b.fillna(0).tolist()
+    return len(set(a)) == len(set(b)) == len(set(zip(a, b)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", help="Benchmark an existing Qdrant server instead of synthetic data.")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--collection", default="duplicate_benchmark")
+    parser.add_argument("--points", type=int, nargs="+", default=[2000, 5000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--group-limit", type=int, default=1000000)
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--lsh-bits", type=int, default=None, help="Default: sized from the collection.")
+    parser.add_argument("--lsh-tables", type=int, default=16)
+    parser.add_argument("--skip-bfs", action="store_true", help="Only time the matrix and LSH engines.")
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    rows = []
+    sizes = [None] if args.host else args.points
+    for n_points in sizes:
+        if args.host:
+            client = QdrantClient(host=args.host, port=args.port)
+        else:
+            client = QdrantClient(":memory:")
+            synthetic_collection(client, args.collection, n_points, args.dim)
+        kwargs = dict(collection_name=args.collection, threshold=args.threshold, show_progress=False,
+                      group_limit=args.group_limit, client=client)
+        results = {}
+        engines = ([] if args.skip_bfs else [("bfs", None)]) + \
+            [("matrix", "float32"), ("matrix", "float16"), ("lsh", "float32")]
+        for engine, dtype in engines:
+            extra = {}
+            if engine == "matrix":
+                extra = {"chunk_size": args.chunk_size, "workers": args.workers, "vector_dtype": dtype}
+            elif engine == "lsh":
+                extra = {"lsh_bits": args.lsh_bits, "lsh_tables": args.lsh_tables, "vector_dtype": dtype}
+            start = time.perf_counter()
+            df = flag_duplicate_sentences_from_qdrant(engine=engine, **kwargs, **extra)
+            elapsed = time.perf_counter() - start
+            label = engine if dtype is None else f"{engine}-{dtype}"
+            results[label] = df
+            rows.append({
+                "points": len(df),
+                "engine": label,
+                "seconds": elapsed,
+                "groups": int(df["group"].nunique()),
+                "same_groups_as_bfs": same_partition(df["group"], results["bfs"]["group"]) if "bfs" in results else None,
+                "pair_recall_vs_matrix": pair_recall(results["matrix-float32"]["group"], df["group"])
+                if engine == "lsh" else None
+            })
+    print_table(rows, ["points", "engine", "seconds", "groups", "same_groups_as_bfs", "pair_recall_vs_matrix"])
+    if args.output:
+        write_json(args.output, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Throughput vs p99 latency of query embedding with and without micro-batching.
+
+    python -m benchmarks.embedding_microbatch --concurrency 1 4 16 64
+    python -m benchmarks.embedding_microbatch --synthetic --max-wait-ms 2 5
+"""
+import argparse
+import threading
+import time
+
+from ai.retrieval.embedding_scheduler import EmbeddingBatcher
+from benchmarks.common import HashingEncoder, latency_summary, print_table, write_json
+
+
+def run_load(encode_one, concurrency, requests_per_worker, queries):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        local = []
+        for i in range(requests_per_worker):
+            query = queries[(worker_id * requests_per_worker + i) % len(queries)]
+            start = time.perf_counter()
+            encode_one(query)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latency_summary(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--synthetic", action="store_true", help="Use a hashing encoder with an emulated per-call cost.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests-per-worker", type=int, default=50)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[2.0, 5.0])
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        model = HashingEncoder(call_overhead_ms=4.0, per_item_ms=0.2)
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+    # Unique texts so the comparison measures the model, not the embedding cache
+    queries = [f"customer question number {i} about order {i * 7 % 1000}" for i in range(5000)]
+    model.encode(queries[:8])  # warm up
+
+    rows = []
+    for concurrency in args.concurrency:
+        throughput, latency = run_load(
+            lambda q: model.encode([q]), concurrency, args.requests_per_worker, queries
+        )
+        rows.append({"mode": "direct", "max_wait_ms": None, "concurrency": concurrency,
+                     "req_per_s": throughput, **latency})
+        for max_wait_ms in args.max_wait_ms:
+            batcher = EmbeddingBatcher(model, max_batch_size=args.max_batch_size, max_wait_ms=max_wait_ms)
+            throughput, latency = run_load(lambda q: batcher.encode([q]), concurrency, args.requests_per_worker, queries)
+            stats = batcher.stats()
+            batcher.close()
+            rows.append({"mode": "batched", "max_wait_ms": max_wait_ms, "concurrency": concurrency,
+                         "req_per_s": throughput, "mean_batch": stats["mean_batch_size"], **latency})
+
+    print_table(rows, ["mode", "max_wait_ms", "concurrency", "req_per_s", "mean_batch", "p50_ms", "p99_ms"])
+    if args.output:
+        write_json(args.output, {"model": "synthetic" if args.synthetic else args.model, "results": rows})
+
+
+if __name__ == "__main__":
+    main()
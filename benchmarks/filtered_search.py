@@ -0,0 +1,128 @@
+"""
+Filtered vs unfiltered search: latency, and how many of the returned hits belong to another
+brand than the one the query is about.
+
+Points are spread over `--brands` companies with a Zipf-like skew, like the support tweets, and
+carry the `brand` keyword payload (indexed on Qdrant servers). Each query is a noisy copy of a
+point, so its brand is known; "off_brand_hits" is the share of unfiltered hits from other brands.
+
+    python -m benchmarks.filtered_search --backend local
+    python -m benchmarks.filtered_search --backend qdrant --host localhost --points 200000
+    python -m benchmarks.filtered_search --backend memory --points 5000 --output filtered.json
+
+`memory` (the in-process qdrant-client) checks behaviour only: it has no payload indexes, so
+its latencies do not reflect a server.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from ai.retrieval.brand import BRAND_FIELD, brand_filter
+from ai.retrieval.embeddings_helper import create_qdrant_client
+from ai.retrieval.load.ingest import create_payload_indexes
+from ai.retrieval.local_index import LocalIndexBackend, build_local_index
+from ai.retrieval.retrieval_statistics import normalize_rows
+from benchmarks.common import latency_summary, print_table, write_json
+
+COLLECTION = "filtered_search_benchmark"
+
+
+def make_corpus(n, dim, n_brands, seed=0):
+    """Brand-clustered unit vectors: each brand has a centre, points scatter around it."""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, n_brands + 1)
+    brands = rng.choice(n_brands, size=n, p=weights / weights.sum())
+    centres = normalize_rows(rng.standard_normal((n_brands, dim)).astype(np.float32))
+    vectors = normalize_rows(centres[brands] * 0.5 + rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim))
+    payloads = [{"input": f"question {i}", "reply": f"answer {i}", BRAND_FIELD: f"brand{b}"}
+                for i, b in enumerate(brands)]
+    return vectors, payloads
+
+
+def make_queries(vectors, payloads, n_queries, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=n_queries, replace=False)
+    noise = rng.standard_normal((n_queries, vectors.shape[1])).astype(np.float32) / np.sqrt(vectors.shape[1])
+    return normalize_rows(vectors[rows] + noise), [payloads[row][BRAND_FIELD] for row in rows]
+
+
+def load_qdrant(client, vectors, payloads, payload_index=True, batch_size=512):
+    if client.collection_exists(COLLECTION):
+        client.delete_collection(COLLECTION)
+    client.create_collection(
+        collection_name=COLLECTION,
+        vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE)
+    )
+    if payload_index:
+        create_payload_indexes(client, COLLECTION, {BRAND_FIELD: models.PayloadSchemaType.KEYWORD})
+    for offset in range(0, len(vectors), batch_size):
+        client.upsert(collection_name=COLLECTION, wait=True, points=[
+            models.PointStruct(id=i, vector=vectors[i].tolist(), payload=payloads[i])
+            for i in range(offset, min(offset + batch_size, len(vectors)))
+        ])
+
+
+def run(client, queries, brands, top_k, filtered):
+    latencies, off_brand, returned = [], 0, 0
+    for query, brand in zip(queries, brands):
+        query_filter = brand_filter(brand) if filtered else None
+        start = time.perf_counter()
+        hits = client.search(collection_name=COLLECTION, query_vector=query.tolist(), limit=top_k,
+                             query_filter=query_filter, with_payload=True)
+        latencies.append(time.perf_counter() - start)
+        returned += len(hits)
+        off_brand += sum(hit.payload[BRAND_FIELD] != brand for hit in hits)
+    return {
+        "mode": "filtered" if filtered else "unfiltered",
+        **latency_summary(latencies),
+        "hits_per_query": returned / len(queries),
+        "off_brand_hits": off_brand / max(returned, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["qdrant", "local", "memory"], default="local")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--brands", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    vectors, payloads = make_corpus(args.points, args.dim, args.brands)
+    queries, brands = make_queries(vectors, payloads, args.queries)
+
+    root = None
+    if args.backend == "local":
+        root = tempfile.mkdtemp(prefix="filtered_search_")
+        build_local_index(f"{root}/{COLLECTION}", list(range(args.points)), vectors, payloads)
+        client = LocalIndexBackend(root)
+    else:
+        client = QdrantClient(":memory:") if args.backend == "memory" \
+            else create_qdrant_client(host=args.host, port=args.port)
+        load_qdrant(client, vectors, payloads, payload_index=args.backend == "qdrant")
+
+    run(client, queries[:20], brands[:20], args.top_k, filtered=True)  # warm up caches
+    rows = [run(client, queries, brands, args.top_k, filtered) for filtered in (False, True)]
+    print_table(rows, ["mode", "p50_ms", "p95_ms", "p99_ms", "hits_per_query", "off_brand_hits"])
+    if args.output:
+        write_json(args.output, {"args": vars(args), "results": rows})
+
+    if root is not None:
+        client.get_index(COLLECTION).close()
+        shutil.rmtree(root, ignore_errors=True)
+    elif args.backend == "qdrant":
+        client.delete_collection(COLLECTION)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Dense vs hybrid (dense + BM25, reciprocal-rank fused) retrieval: recall@k, latency, and the
+lexical index's build time and size.
+
+The synthetic corpus is support tickets that differ mostly by order number, product and error
+code; each query paraphrases one ticket and repeats its identifier. --synthetic uses a hashing
+encoder that ignores tokens with digits, as sentence embeddings largely do.
+
+    python -m benchmarks.hybrid_retrieval --synthetic --documents 20000
+    python -m benchmarks.hybrid_retrieval --documents 5000 --k 1 3 5 10 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from ai.retrieval.document_retrieval import search_similar, search_similar_hybrid
+from ai.retrieval.lexical_index import build_lexical_index, index_size_bytes
+from benchmarks.common import HashingEncoder, latency_summary, print_table, write_json
+
+PRODUCTS = ["router", "headphones", "laptop", "phone case", "smart watch", "charger", "camera", "speaker"]
+ISSUES = ["never arrived", "arrived damaged", "was charged twice", "is missing parts", "stopped working"]
+ERRORS = ["ERR_503", "E-1042", "timeout 408", "code 0x80070005", "ERR_CONN_RESET"]
+
+
+def synthetic_corpus(n_documents, seed=0):
+    rng = np.random.default_rng(seed)
+    documents, queries = [], []
+    for i in range(n_documents):
+        order = f"#{rng.integers(100000, 999999)}-{i}"
+        product = PRODUCTS[rng.integers(len(PRODUCTS))]
+        issue = ISSUES[rng.integers(len(ISSUES))]
+        error = ERRORS[rng.integers(len(ERRORS))]
+        documents.append({
+            "input": f"my {product} order {order} {issue}, app shows {error}",
+            "reply": f"Sorry about order {order}. We have escalated the {product} issue."
+        })
+        queries.append((f"any update on {order}? the {product} {issue}", i))
+    return documents, queries
+
+
+def recall_at_k(ranked_ids, relevant, ks):
+    return {f"recall@{k}": float(np.mean([rel in ids[:k] for ids, rel in zip(ranked_ids, relevant)])) for k in ks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--synthetic", action="store_true", help="Use the hashing encoder instead of a model.")
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10, 20])
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        model = HashingEncoder(ignore_numeric=True)
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+    documents, queries = synthetic_corpus(args.documents)
+    texts = [f"{d['input']} {d['reply']}" for d in documents]
+    vectors = np.asarray(model.encode(texts, batch_size=256), dtype=np.float32)
+
+    client = QdrantClient(":memory:")
+    client.create_collection("bench", vectors_config=models.VectorParams(size=vectors.shape[1], distance="Cosine"))
+    for start in range(0, len(documents), 1000):
+        client.upsert("bench", points=[
+            models.PointStruct(id=i, vector=vectors[i].tolist(), payload=documents[i])
+            for i in range(start, min(start + 1000, len(documents)))
+        ])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lexical")
+        build_start = time.perf_counter()
+        lexical_index = build_lexical_index(path, list(range(len(documents))), texts)
+        build_seconds = time.perf_counter() - build_start
+        size_mb = index_size_bytes(path) / 2 ** 20
+
+        sample = queries[:args.queries]
+        max_k = max(args.k)
+        runs = {
+            "dense": lambda q: search_similar(client, model, q, "bench", top_k=max_k),
+            "hybrid": lambda q: search_similar_hybrid(client, model, q, "bench", lexical_index,
+                                                      top_k=max_k, candidates=max(args.candidates, max_k)),
+        }
+        lexical_latencies = []
+        for query, _ in sample:
+            start = time.perf_counter()
+            lexical_index.search(query, limit=args.candidates)
+            lexical_latencies.append(time.perf_counter() - start)
+
+        rows = []
+        for name, run in runs.items():
+            ranked, latencies = [], []
+            for query, _ in sample:
+                start = time.perf_counter()
+                results = run(query)[0]
+                latencies.append(time.perf_counter() - start)
+                ranked.append([r["id"] for r in results])
+            rows.append({"retrieval": name, **recall_at_k(ranked, [rel for _, rel in sample], args.k),
+                         **latency_summary(latencies)})
+
+    print(f"Lexical index: {len(documents)} documents, built in {build_seconds:.2f}s, {size_mb:.1f} MB, "
+          f"query p50 {latency_summary(lexical_latencies)['p50_ms']:.2f} ms")
+    columns = ["retrieval"] + [f"recall@{k}" for k in args.k] + ["p50_ms", "p99_ms"]
+    print_table(rows, columns)
+    if args.output:
+        write_json(args.output, {
+            "lexical_build_seconds": build_seconds,
+            "lexical_index_mb": size_mb,
+            "lexical_latency": latency_summary(lexical_latencies),
+            "retrieval": rows
+        })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+LLM response cache: lookup cost per tier, and a replayed summarisation workload.
+
+    python -m benchmarks.llm_cache --prompts 200 --replays 3 --llm-ms 300
+    python -m benchmarks.llm_cache --path /tmp/llm_cache.sqlite --output llm_cache.json
+
+The tier rows time `LLMResponseCache.get` on memory hits, SQLite hits (memory tier
+disabled) and misses. The replay rows send summarisation prompts through
+generate_response_from_llm at temperature 0, against a stand-in client that answers after
+`--llm-ms`: the first pass fills the cache and later passes are served from it.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from ai.generation import llm_cache, llm_usage
+from ai.generation.summarized_query_generation import get_prompt_for_query_summarization
+from benchmarks.common import print_table, write_json
+from benchmarks.hybrid_retrieval import synthetic_corpus
+
+
+def us_summary(durations_s):
+    values = np.asarray(durations_s) * 1e6
+    return {"p50_us": float(np.percentile(values, 50)), "p95_us": float(np.percentile(values, 95)),
+            "mean_us": float(values.mean())}
+
+
+def time_gets(cache, keys):
+    durations = []
+    for key in keys:
+        start = time.perf_counter()
+        cache.get(key)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def stand_in_client(llm_ms):
+    async def create(**kwargs):
+        await asyncio.sleep(llm_ms / 1000.0)
+        message = SimpleNamespace(content=f"summary of {len(kwargs['messages'][0]['content'])} chars",
+                                  tool_calls=None, function_call=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--replays", type=int, default=3)
+    parser.add_argument("--llm-ms", type=float, default=300.0, help="Stand-in LLM latency.")
+    parser.add_argument("--path", help="SQLite file for the persistent tier; default: a temporary file.")
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite")
+    _, queries = synthetic_corpus(args.prompts)
+    prompts = [get_prompt_for_query_summarization([
+        {"role": "user", "content": query},
+        {"role": "assistant", "content": "Could you share more details?"},
+        {"role": "user", "content": "it still has not arrived"}
+    ]) for query, _ in queries]
+    response = {"type": "message", "content": "My order has not arrived."}
+    keys = [llm_cache.make_llm_cache_key("openai", {"model": "gpt-4.1", "prompt": prompt}) for prompt in prompts]
+
+    memory = llm_cache.LLMResponseCache(max_size=len(keys))
+    persistent = llm_cache.LLMResponseCache(max_size=0, persistent_path=path)
+    for key in keys:
+        memory.put(key, response)
+        persistent.put(key, response)
+    rows = [
+        {"measure": "memory_hit", **us_summary(time_gets(memory, keys))},
+        {"measure": "sqlite_hit", **us_summary(time_gets(persistent, keys))},
+        {"measure": "miss", **us_summary(time_gets(memory, [f"missing-{key}" for key in keys]))},
+    ]
+
+    client = stand_in_client(args.llm_ms)
+    llm_usage.get_async_llm_client = lambda provider, api_key=None: client
+    llm_cache.llm_cache_enabled = True
+    llm_cache._llm_cache = llm_cache.LLMResponseCache(persistent_path=path + ".replay")
+    for replay in range(args.replays + 1):
+        durations = []
+        for prompt in prompts:
+            start = time.perf_counter()
+            llm_usage.generate_response_from_llm("openai", prompt=prompt, model="gpt-4.1", temperature=0)
+            durations.append(time.perf_counter() - start)
+        rows.append({"measure": "replay_fill" if replay == 0 else f"replay_{replay}", **us_summary(durations),
+                     "hit_rate": llm_cache.get_llm_cache_stats()["hit_rate"]})
+
+    print_table(rows, ["measure", "p50_us", "p95_us", "mean_us", "hit_rate"])
+    if args.output:
+        write_json(args.output, {"args": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Accuracy drift, latency and RSS of the int8 ONNX embedding engine vs the fp32 SentenceTransformer.
+
+    python -m benchmarks.onnx_embedding --model all-MiniLM-L6-v2 --qdrant-host localhost --sample 2000
+
+Drift is measured on query texts taken from the stored collection: cosine agreement between
+the two engines, and recall@k of the int8 top-k against the fp32 top-k over the stored vectors.
+Each engine's latency and peak RSS are measured in a fresh process so the numbers do not mix.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+
+import numpy as np
+
+from ai.retrieval.onnx_embedding import (
+    OnnxSentenceEmbedder,
+    embedding_drift_report,
+    export_quantized_onnx,
+    load_onnx_embedder,
+    onnx_model_dir,
+)
+from benchmarks.common import latency_summary, print_table, write_json
+
+
+def load_engine(engine, model_name, onnx_dir):
+    if engine == "onnx-int8":
+        return load_onnx_embedder(model_name, onnx_dir, quantized=True)
+    if engine == "onnx-fp32":
+        return OnnxSentenceEmbedder(onnx_dir, quantized=False)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _measure_engine(engine, model_name, onnx_dir, texts, batch_size, queue):
+    start = time.perf_counter()
+    model = load_engine(engine, model_name, onnx_dir)
+    load_s = time.perf_counter() - start
+    model.encode(texts[:8])  # warm up
+    single = []
+    for text in texts[:200]:
+        t0 = time.perf_counter()
+        model.encode([text])
+        single.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    model.encode(texts, batch_size=batch_size)
+    batch_s = time.perf_counter() - t0
+    queue.put({
+        "engine": engine,
+        "load_s": load_s,
+        "batch_texts_per_s": len(texts) / batch_s,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        **{f"single_{k}": v for k, v in latency_summary(single).items()}
+    })
+
+
+def measure_engine(engine, model_name, onnx_dir, texts, batch_size):
+    queue = multiprocessing.get_context("spawn").Queue()
+    process = multiprocessing.get_context("spawn").Process(
+        target=_measure_engine, args=(engine, model_name, onnx_dir, texts, batch_size, queue)
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def sample_collection(host, port, collection_name, sample):
+    from qdrant_client import QdrantClient
+    client = QdrantClient(host=host, port=port)
+    points, _ = client.scroll(collection_name=collection_name, limit=sample, with_payload=True, with_vectors=True)
+    texts = [p.payload.get("input") or "" for p in points]
+    return texts, np.asarray([p.vector for p in points], dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-dir", default=None, help="Defaults to onnx_models/<model>.")
+    parser.add_argument("--qdrant-host", default=os.getenv("QDRANT_HOST", "localhost"))
+    parser.add_argument("--qdrant-port", type=int, default=int(os.getenv("QDRANT_PORT", 6333)))
+    parser.add_argument("--collection", default="customer_support_tweets")
+    parser.add_argument("--sample", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+    onnx_dir = args.onnx_dir or onnx_model_dir("onnx_models", args.model)
+    if not os.path.exists(os.path.join(onnx_dir, "embedding_config.json")):
+        export_quantized_onnx(args.model, onnx_dir)
+
+    texts, corpus_vectors = sample_collection(args.qdrant_host, args.qdrant_port, args.collection, args.sample)
+    int8_model = load_onnx_embedder(args.model, onnx_dir, quantized=True)
+    fp32_model = load_engine("sentence-transformers", args.model, onnx_dir)
+    queries = texts[:args.queries]
+    drift = embedding_drift_report(fp32_model, int8_model, queries, corpus_vectors=corpus_vectors, k=args.k)
+    # The stored vectors come from the fp32 model; also check the int8 model against them directly
+    drift["stored_vector_mean_cosine"] = float(np.mean(np.sum(
+        int8_model.encode(queries, normalize_embeddings=True)
+        * (corpus_vectors[:len(queries)] / np.linalg.norm(corpus_vectors[:len(queries)], axis=1, keepdims=True)),
+        axis=1
+    )))
+    del int8_model, fp32_model
+    print("Drift (int8 vs fp32):")
+    print_table([drift], list(drift.keys()))
+
+    rows = [measure_engine(engine, args.model, onnx_dir, texts, args.batch_size)
+            for engine in ("sentence-transformers", "onnx-fp32", "onnx-int8")]
+    print()
+    print_table(rows, ["engine", "load_s", "single_p50_ms", "single_p99_ms", "batch_texts_per_s", "peak_rss_mb"])
+    if args.output:
+        write_json(args.output, {"model": args.model, "drift": drift, "engines": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Generation and summarisation prompt sizes with and without the token budget.
+
+    python -m benchmarks.prompt_budget --budgets 2000 4000 6000 --turns 2 10 40
+    python -m benchmarks.prompt_budget --documents 20 --reply-words 300 --output prompt_budget.json
+
+Conversations of `--turns` messages are paired with `--documents` retrieved QnA whose
+replies run to `--reply-words` words. Each row reports the prompt tokens, the tokens
+dropped from documents and history, and the time to build the prompt. The summarisation
+prompt is built with a third of the budget. A budget of "none" lifts the total budget;
+PROMPT_MAX_DOCUMENT_TOKENS still truncates single long documents.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ai.generation.query_response_generation import build_generation_prompt
+from ai.generation.summarized_query_generation import get_prompt_for_query_summarization
+from ai.generation.token_counting import count_tokens
+from benchmarks.common import print_table, write_json
+from benchmarks.hybrid_retrieval import synthetic_corpus
+
+UNBOUNDED = 10 ** 9
+
+
+def conversation(turns, rng):
+    words = ["order", "refund", "account", "delivery", "password", "charge", "app", "update", "still", "waiting"]
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": " ".join(rng.choice(words, size=int(rng.integers(10, 120))))} for i in range(turns)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[2000, 4000, 6000])
+    parser.add_argument("--turns", type=int, nargs="+", default=[2, 10, 40])
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--reply-words", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, _ = synthetic_corpus(args.documents * args.samples)
+    rows = []
+    for turns in args.turns:
+        samples = []
+        for i in range(args.samples):
+            documents = [{"question": doc["input"], "answer": f"{doc['reply']} " + "details " * args.reply_words}
+                         for doc in corpus[i * args.documents:(i + 1) * args.documents]]
+            samples.append((conversation(turns, rng), documents))
+        for budget in [UNBOUNDED] + args.budgets:
+            tokens, dropped_documents, dropped_history, build_s, summary_tokens = [], [], [], [], []
+            for history, documents in samples:
+                start = time.perf_counter()
+                _, report = build_generation_prompt(history, documents, "summarised query", True, budget=budget)
+                build_s.append(time.perf_counter() - start)
+                tokens.append(report["prompt_tokens"])
+                dropped_documents.append(report["sections"]["documents"]["dropped"])
+                dropped_history.append(report["sections"]["history"]["dropped"])
+                summary_tokens.append(count_tokens(get_prompt_for_query_summarization(history, budget=budget // 3)))
+            rows.append({
+                "turns": turns,
+                "budget": "none" if budget == UNBOUNDED else budget,
+                "mean_prompt_tokens": float(np.mean(tokens)),
+                "max_prompt_tokens": int(np.max(tokens)),
+                "mean_dropped_documents": float(np.mean(dropped_documents)),
+                "mean_dropped_history": float(np.mean(dropped_history)),
+                "mean_summary_tokens": float(np.mean(summary_tokens)),
+                "build_ms": float(np.mean(build_s) * 1000.0)
+            })
+
+    print_table(rows, ["turns", "budget", "mean_prompt_tokens", "max_prompt_tokens", "mean_dropped_documents",
+                       "mean_dropped_history", "mean_summary_tokens", "build_ms"])
+    if args.output:
+        write_json(args.output, {"args": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
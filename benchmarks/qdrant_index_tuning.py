@@ -0,0 +1,147 @@
+"""
+Recall@k and search latency of Qdrant index configurations against an exact baseline.
+
+Each configuration (the QDRANT_INDEX_CONFIG format: name -> settings) gets its own collection on
+a running Qdrant server, filled with the same vectors. Queries are searched with the
+configuration's search params, and recall is measured against exact (brute-force) neighbours.
+The in-memory client ignores HNSW and quantization, so a server is required.
+
+    python -m benchmarks.qdrant_index_tuning --host localhost --vectors 200000
+    python -m benchmarks.qdrant_index_tuning --configs my_configs.json --k 5 20 --output tuning.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from ai.retrieval.index_config import create_collection_kwargs, search_params, validate_index_settings
+from ai.retrieval.load.ingest import wait_for_collection_ready
+from ai.retrieval.retrieval_statistics import normalize_rows
+from benchmarks.common import latency_summary, print_table, write_json
+
+DEFAULT_CONFIGS = {
+    "exact": {"search": {"exact": True}},
+    "hnsw_default": {},
+    "hnsw_m8_ef64": {"hnsw": {"m": 8, "ef_construct": 64}, "search": {"hnsw_ef": 64}},
+    "hnsw_m32_ef256": {"hnsw": {"m": 32, "ef_construct": 256}, "search": {"hnsw_ef": 256}},
+    "scalar_int8": {
+        "quantization": {"type": "scalar", "quantile": 0.99, "always_ram": True},
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 2.0}
+    },
+    "scalar_int8_on_disk": {
+        "on_disk": True,
+        "quantization": {"type": "scalar", "quantile": 0.99, "always_ram": True},
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 2.0}
+    },
+    "binary_rescore": {
+        "quantization": {"type": "binary", "always_ram": True},
+        "search": {"hnsw_ef": 128, "rescore": True, "oversampling": 3.0}
+    },
+    "binary_no_rescore": {
+        "quantization": {"type": "binary", "always_ram": True},
+        "search": {"hnsw_ef": 128, "rescore": False}
+    },
+}
+
+
+def clustered_vectors(n, dim, n_clusters=256, noise=0.35, seed=0):
+    """Unit vectors around random centroids: denser neighbourhoods than uniform noise, like embeddings."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(n_clusters, size=n)
+    return normalize_rows(centroids[labels] + noise * rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def exact_neighbours(vectors, queries, k, block=1024):
+    neighbours = []
+    for start in range(0, len(queries), block):
+        scores = queries[start:start + block] @ vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        neighbours.append(np.take_along_axis(top, order, axis=1))
+    return np.vstack(neighbours)
+
+
+def vector_ram_mb(settings, n, dim):
+    """RAM for vectors: full float32 unless on disk, plus quantized codes kept in RAM."""
+    quantization = settings.get("quantization") or {}
+    ram = 0 if settings.get("on_disk") else n * dim * 4
+    if quantization.get("always_ram", True):
+        if quantization.get("type") == "scalar":
+            ram += n * dim
+        elif quantization.get("type") == "binary":
+            ram += n * dim / 8
+    return ram / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--configs", help="JSON file of configurations (default: a built-in sweep).")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections.")
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+    else:
+        configs = DEFAULT_CONFIGS
+    for name, settings in configs.items():
+        validate_index_settings(settings, name)
+
+    vectors = clustered_vectors(args.vectors, args.dim)
+    queries = normalize_rows(vectors[:args.queries] + 0.2 * np.random.default_rng(1).standard_normal(
+        (args.queries, args.dim)).astype(np.float32))
+    max_k = max(args.k)
+    truth = exact_neighbours(vectors, queries, max_k)
+
+    client = QdrantClient(host=args.host, port=args.port, timeout=600)
+    rows = []
+    for name, settings in configs.items():
+        collection = f"index_tuning_{name}"
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        client.create_collection(collection_name=collection, **create_collection_kwargs(settings, args.dim))
+        build_start = time.perf_counter()
+        client.upload_collection(collection_name=collection, vectors=vectors, ids=range(len(vectors)),
+                                 batch_size=1024, parallel=2)
+        wait_for_collection_ready(client, collection, timeout=3600.0)
+        build_seconds = time.perf_counter() - build_start
+
+        params = search_params(settings)
+        for query in queries[:20]:  # warm caches and any on-disk pages
+            client.search(collection_name=collection, query_vector=query.tolist(), limit=max_k, search_params=params)
+        found, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            hits = client.search(collection_name=collection, query_vector=query.tolist(), limit=max_k,
+                                 search_params=params, with_payload=False)
+            latencies.append(time.perf_counter() - start)
+            found.append([hit.id for hit in hits])
+
+        row = {"config": name, "build_s": build_seconds, "vector_ram_mb": vector_ram_mb(settings, *vectors.shape)}
+        for k in args.k:
+            row[f"recall@{k}"] = float(np.mean([
+                len(set(ids[:k]) & set(expected[:k].tolist())) / k for ids, expected in zip(found, truth)
+            ]))
+        summary = latency_summary(latencies)
+        row["p50_ms"], row["p99_ms"] = summary["p50_ms"], summary["p99_ms"]
+        rows.append(row)
+        if not args.keep:
+            client.delete_collection(collection)
+
+    print_table(rows, ["config", "build_s", "vector_ram_mb"] + [f"recall@{k}" for k in args.k] + ["p50_ms", "p99_ms"])
+    if args.output:
+        write_json(args.output, {"vectors": args.vectors, "dim": args.dim, "configs": configs, "results": rows})
+
+
+if __name__ == "__main__":
+    main()
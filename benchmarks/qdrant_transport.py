@@ -0,0 +1,121 @@
+"""
+REST vs gRPC against a running Qdrant server: bulk upsert throughput, and `search` /
+`search_batch` latency with vectors and payloads in the response.
+
+Points carry tweet-sized question/reply payloads and 384-d vectors, like the support collection.
+Both transports use clients from create_qdrant_client, so pooling, keep-alive, timeouts and
+retries match the backend's.
+
+    python -m benchmarks.qdrant_transport --host localhost --points 50000
+    python -m benchmarks.qdrant_transport --queries 500 --batch-size 32 --top-k 20 --output transport.json
+"""
+import argparse
+import time
+
+import numpy as np
+from qdrant_client.http import models
+
+from ai.retrieval.embeddings_helper import create_qdrant_client
+from ai.retrieval.retrieval_statistics import normalize_rows
+from benchmarks.common import latency_summary, print_table, write_json
+
+WORDS = ("order delivery refund account password charge app update router phone package late "
+         "missing broken support help please thanks today again still waiting tracking number").split()
+
+
+def tweet(rng, n_chars=240):
+    words = []
+    while sum(len(w) + 1 for w in words) < n_chars:
+        words.append(WORDS[rng.integers(len(WORDS))])
+    return " ".join(words)
+
+
+def make_points(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(rng.standard_normal((n, dim)).astype(np.float32))
+    payloads = [{"input": tweet(rng), "reply": tweet(rng), "author_id": f"user_{i}"} for i in range(n)]
+    return vectors, payloads
+
+
+def bench_upsert(client, collection, vectors, payloads, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch_size):
+        client.upsert(collection_name=collection, wait=True, points=[
+            models.PointStruct(id=i, vector=vectors[i].tolist(), payload=payloads[i])
+            for i in range(offset, min(offset + batch_size, len(vectors)))
+        ])
+    return len(vectors) / (time.perf_counter() - start)
+
+
+def bench_search(client, collection, queries, top_k):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        client.search(collection_name=collection, query_vector=query.tolist(), limit=top_k,
+                      with_payload=True, with_vectors=True)
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+def bench_search_batch(client, collection, queries, top_k, batch_size):
+    latencies = []
+    for offset in range(0, len(queries), batch_size):
+        requests = [
+            models.SearchRequest(vector=q.tolist(), limit=top_k, with_payload=True, with_vector=True)
+            for q in queries[offset:offset + batch_size]
+        ]
+        start = time.perf_counter()
+        client.search_batch(collection_name=collection, requests=requests)
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--upsert-batch-size", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per search_batch request.")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    vectors, payloads = make_points(args.points, args.dim)
+    queries = normalize_rows(np.random.default_rng(1).standard_normal((args.queries, args.dim)).astype(np.float32))
+
+    rows = []
+    for transport, prefer_grpc in (("rest", False), ("grpc", True)):
+        client = create_qdrant_client(host=args.host, port=args.port, prefer_grpc=prefer_grpc)
+        collection = f"transport_benchmark_{transport}"
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        client.create_collection(
+            collection_name=collection,
+            vectors_config=models.VectorParams(size=args.dim, distance=models.Distance.COSINE)
+        )
+        upsert_rate = bench_upsert(client, collection, vectors, payloads, args.upsert_batch_size)
+        bench_search(client, collection, queries[:20], args.top_k)  # warm up connections and caches
+        search = bench_search(client, collection, queries, args.top_k)
+        batch = bench_search_batch(client, collection, queries, args.top_k, args.batch_size)
+        rows.append({
+            "transport": transport,
+            "upsert_points_per_s": upsert_rate,
+            "search_p50_ms": search["p50_ms"],
+            "search_p99_ms": search["p99_ms"],
+            "search_batch_p50_ms": batch["p50_ms"],
+            "search_batch_p99_ms": batch["p99_ms"],
+            "search_batch_ms_per_query": batch["mean_ms"] / args.batch_size
+        })
+        client.delete_collection(collection)
+        client.close()
+
+    print_table(rows, list(rows[0].keys()))
+    if args.output:
+        write_json(args.output, {"args": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Cross-encoder rerank cost against the prompt tokens it saves, across latency budgets.
+
+Each query takes the dense top-N candidates, reranks them within the budget and keeps the
+best k. Reports rerank latency percentiles, how often the budget ran out (dense order kept),
+the prompt tokens saved per query and whether the relevant document survived the cut.
+--synthetic scores pairs by word overlap at a configurable CPU cost per pair instead of
+loading a cross-encoder.
+
+    python -m benchmarks.rerank_budget --synthetic --per-pair-ms 2 --budgets 10 25 50 100
+    python -m benchmarks.rerank_budget --queries 200 --candidates 20 --top-k 5
+"""
+import argparse
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from ai.generation.token_counting import count_document_tokens
+from ai.retrieval.document_retrieval import search_similar
+from ai.retrieval.lexical_index import tokenize
+from ai.retrieval.orchestrator import format_relevant_context
+from ai.retrieval.rerank import rerank
+from benchmarks.common import HashingEncoder, latency_summary, print_table, write_json
+from benchmarks.hybrid_retrieval import synthetic_corpus
+
+
+class OverlapCrossEncoder:
+    """Word-overlap scorer with the CrossEncoder `predict` interface and a per-pair cost."""
+
+    def __init__(self, per_pair_ms=0.0):
+        self.per_pair_ms = per_pair_ms
+
+    def predict(self, pairs, batch_size=16, show_progress_bar=False):
+        time.sleep(self.per_pair_ms * len(pairs) / 1000.0)
+        scores = []
+        for query, text in pairs:
+            query_tokens, text_tokens = set(tokenize(query)), set(tokenize(text))
+            scores.append(len(query_tokens & text_tokens) / (len(query_tokens) or 1))
+        return np.asarray(scores, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--budgets", type=float, nargs="+", default=[10, 25, 50, 100, 200])
+    parser.add_argument("--synthetic", action="store_true", help="Hashing encoder and overlap scorer, no models.")
+    parser.add_argument("--per-pair-ms", type=float, default=2.0, help="Synthetic scorer cost per pair.")
+    parser.add_argument("--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    documents, queries = synthetic_corpus(args.documents)
+    queries = queries[:args.queries]
+    if args.synthetic:
+        encoder = HashingEncoder(ignore_numeric=True)
+        cross_encoder = OverlapCrossEncoder(per_pair_ms=args.per_pair_ms)
+    else:
+        from sentence_transformers import CrossEncoder, SentenceTransformer
+        encoder = SentenceTransformer("all-MiniLM-L6-v2")
+        cross_encoder = CrossEncoder(args.model, max_length=256, device="cpu")
+
+    client = QdrantClient(":memory:")
+    collection = "rerank_benchmark"
+    vectors = encoder.encode([d["input"] for d in documents], batch_size=256)
+    client.create_collection(
+        collection_name=collection,
+        vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE)
+    )
+    client.upload_collection(collection_name=collection, vectors=vectors, payload=documents, ids=list(range(len(documents))))
+
+    candidate_lists = []
+    for query, relevant in queries:
+        context = format_relevant_context(search_similar(
+            client, encoder, query, collection, top_k=args.candidates
+        ))[0]
+        candidate_lists.append((query, relevant, context))
+
+    rows = []
+    for budget in list(args.budgets) + [None]:
+        latencies, timeouts, saved, hits_dense, hits_kept = [], 0, [], 0, 0
+        for query, relevant, context in candidate_lists:
+            kept, info = rerank(query, context, cross_encoder, top_k=args.top_k,
+                                budget_ms=budget, batch_size=args.batch_size)
+            latencies.append(info["rerank_ms"] / 1000.0)
+            timeouts += int(info["timed_out"])
+            saved.append(count_document_tokens(c["document"] for c in context)
+                         - count_document_tokens(c["document"] for c in kept))
+            answer = documents[relevant]["reply"]
+            hits_dense += any(c["document"]["answer"] == answer for c in context)
+            hits_kept += any(c["document"]["answer"] == answer for c in kept)
+        summary = latency_summary(latencies)
+        rows.append({
+            "budget_ms": budget if budget is not None else "none",
+            "rerank_p50_ms": summary["p50_ms"],
+            "rerank_p99_ms": summary["p99_ms"],
+            "timeout_rate": timeouts / len(candidate_lists),
+            "tokens_saved_per_query": float(np.mean(saved)),
+            f"recall@{args.candidates}_dense": hits_dense / len(candidate_lists),
+            f"recall@{args.top_k}_kept": hits_kept / len(candidate_lists)
+        })
+
+    print_table(rows, list(rows[0].keys()))
+    if args.json:
+        write_json(args.json, {"args": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Retrieval quality and speed suite with a regression gate for CI.
+
+Builds a corpus with known relevant pairs (synthetic support tickets, or a sample of a JSON-lines
+file whose queries are perturbed copies of their own question), loads it into Qdrant's local
+in-memory mode and runs every retrieval configuration over the same queries. Reports embedding
+throughput, search latency percentiles, recall@k, MRR and the prompt tokens of the returned
+documents per configuration, as JSON.
+
+With --baseline, results are compared to an earlier JSON report and the exit code is 1 when a
+quality metric drops by more than --tolerance (absolute) or, with --latency-tolerance, when p95
+latency grows by more than that fraction.
+
+    python -m benchmarks.retrieval_suite --synthetic --output retrieval.json
+    python -m benchmarks.retrieval_suite --synthetic --baseline retrieval.json --tolerance 0.02
+    python -m benchmarks.retrieval_suite --corpus-file tweets.jsonl --documents 20000 --configs dense_top_p hybrid
+    python -m benchmarks.retrieval_suite --synthetic --configs dense_top_p dense_mmr --mmr-k 5 --mmr-lambda 0.7
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from ai.retrieval.document_retrieval import (
+    result_document_tokens,
+    search_similar,
+    search_similar_batch,
+    search_similar_hybrid,
+)
+from ai.retrieval.embeddings_helper import encode_queries
+from ai.retrieval.lexical_index import build_lexical_index
+from ai.retrieval.local_index import LocalIndexBackend, build_local_index
+from benchmarks.common import HashingEncoder, latency_summary, print_table, write_json
+from benchmarks.hybrid_retrieval import synthetic_corpus
+
+CONFIGS = ["dense_raw", "dense_top_p", "dense_mmr", "dense_batch", "hybrid", "local_index"]
+QUALITY_METRICS = ("recall@", "mrr")
+
+
+def sampled_corpus(path, n_documents, drop_fraction=0.3, seed=0):
+    """
+    Sample `n_documents` {"input", "reply"} records from a JSON-lines file. Each query drops a
+    random share of its question's words and shuffles neighbours, so it is not an exact copy.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    picked = rng.choice(len(records), size=min(n_documents, len(records)), replace=False)
+    documents = [{"input": records[i].get("input"), "reply": records[i].get("reply")} for i in picked]
+    queries = []
+    for i, document in enumerate(documents):
+        words = str(document["input"] or "").split()
+        kept = [w for w in words if rng.random() >= drop_fraction] or words
+        if len(kept) > 2:
+            j = int(rng.integers(len(kept) - 1))
+            kept[j], kept[j + 1] = kept[j + 1], kept[j]
+        queries.append((" ".join(kept), i))
+    return documents, queries
+
+
+def ranking_metrics(ranked_ids, relevant, ks):
+    """recall@k for each k and mean reciprocal rank (0 when the relevant id is not returned)."""
+    metrics = {f"recall@{k}": float(np.mean([rel in ids[:k] for ids, rel in zip(ranked_ids, relevant)])) for k in ks}
+    reciprocal = [1.0 / (ids.index(rel) + 1) if rel in ids else 0.0 for ids, rel in zip(ranked_ids, relevant)]
+    metrics["mrr"] = float(np.mean(reciprocal)) if reciprocal else 0.0
+    return metrics
+
+
+def find_regressions(results, baseline, tolerance=0.02, latency_tolerance=None):
+    """
+    Compare two reports' per-configuration rows. Returns human-readable regressions: quality
+    metrics that dropped by more than `tolerance`, and (if set) p95 latencies that grew by more
+    than `latency_tolerance` as a fraction of the baseline. Configurations missing from either
+    report are skipped.
+    """
+    baseline_rows = {row["config"]: row for row in baseline.get("retrieval", [])}
+    regressions = []
+    for row in results.get("retrieval", []):
+        before = baseline_rows.get(row["config"])
+        if before is None:
+            continue
+        for metric, value in row.items():
+            if metric.startswith(QUALITY_METRICS) and metric in before and value < before[metric] - tolerance:
+                regressions.append(f"{row['config']}: {metric} {before[metric]:.4f} -> {value:.4f}")
+        if latency_tolerance is not None and before.get("p95_ms") and row.get("p95_ms") is not None:
+            if row["p95_ms"] > before["p95_ms"] * (1.0 + latency_tolerance):
+                regressions.append(f"{row['config']}: p95_ms {before['p95_ms']:.2f} -> {row['p95_ms']:.2f}")
+    return regressions
+
+
+def measure_embedding(model, texts, queries):
+    """Corpus encoding throughput (texts/s, batched) and single-query encoding latency."""
+    start = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, batch_size=256), dtype=np.float32)
+    corpus_seconds = time.perf_counter() - start
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        encode_queries(model, [query])
+        latencies.append(time.perf_counter() - start)
+    return vectors, {
+        "corpus_texts_per_second": len(texts) / corpus_seconds if corpus_seconds else None,
+        "query_encode": latency_summary(latencies)
+    }
+
+
+def run_config(name, client, model, collection, lexical_index, local_backend, queries, top_k, candidates,
+               mmr_k=5, mmr_lambda=0.5):
+    """Returns (ranked ids per query, per-query latencies in seconds, mean results returned)."""
+    texts = [query for query, _ in queries]
+    if name == "dense_batch":
+        # One request for every query: report the amortised per-query latency
+        start = time.perf_counter()
+        batch = search_similar_batch(client, model, texts, collection, top_k=top_k)
+        per_query = (time.perf_counter() - start) / max(len(texts), 1)
+        ranked = [[r["id"] for r in results] for results, *_ in batch]
+        return ranked, [per_query] * len(texts), float(np.mean([len(r) for r in ranked]))
+
+    ranked, latencies = [], []
+    for query in texts:
+        start = time.perf_counter()
+        if name == "dense_raw":
+            vector = encode_queries(model, [query])[0].tolist()
+            ids = [hit.id for hit in client.search(collection_name=collection, query_vector=vector, limit=top_k)]
+        elif name == "dense_top_p":
+            ids = [r["id"] for r in search_similar(client, model, query, collection, top_k=top_k)[0]]
+        elif name == "dense_mmr":
+            ids = [r["id"] for r in search_similar(
+                client, model, query, collection, top_k=top_k, mmr_k=mmr_k, mmr_lambda=mmr_lambda
+            )[0]]
+        elif name == "hybrid":
+            ids = [r["id"] for r in search_similar_hybrid(
+                client, model, query, collection, lexical_index, top_k=top_k, candidates=candidates
+            )[0]]
+        elif name == "local_index":
+            ids = [r["id"] for r in search_similar(local_backend, model, query, collection, top_k=top_k)[0]]
+        else:
+            raise ValueError(f"Unknown configuration '{name}'; expected one of {CONFIGS}.")
+        latencies.append(time.perf_counter() - start)
+        ranked.append(ids)
+    return ranked, latencies, float(np.mean([len(r) for r in ranked]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--synthetic", action="store_true", help="Use the hashing encoder instead of a model.")
+    parser.add_argument("--corpus-file", help="JSON-lines file with input/reply records to sample from.")
+    parser.add_argument("--documents", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--candidates", type=int, default=50, help="Hybrid candidates per retriever.")
+    parser.add_argument("--configs", nargs="+", default=CONFIGS, choices=CONFIGS)
+    parser.add_argument("--mmr-k", type=int, default=5, help="Documents kept by dense_mmr.")
+    parser.add_argument("--mmr-lambda", type=float, default=0.5, help="dense_mmr relevance/diversity tradeoff.")
+    parser.add_argument("--output", help="JSON report path.")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Allowed absolute drop in recall@k / MRR.")
+    parser.add_argument("--latency-tolerance", type=float, default=None,
+                        help="Allowed relative p95 latency growth (e.g. 0.25); unset skips latency checks.")
+    args = parser.parse_args()
+
+    if args.corpus_file:
+        documents, queries = sampled_corpus(args.corpus_file, args.documents)
+    else:
+        documents, queries = synthetic_corpus(args.documents)
+    queries = queries[:args.queries]
+    if args.synthetic:
+        # Digits are kept: near-identical tickets would otherwise tie and rank arbitrarily
+        model = HashingEncoder()
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+
+    texts = [f"{d['input']} {d['reply']}" for d in documents]
+    vectors, embedding = measure_embedding(model, texts, [q for q, _ in queries])
+    ids = list(range(len(documents)))
+    collection = "retrieval_suite"
+    client = QdrantClient(":memory:")
+    client.create_collection(collection, vectors_config=models.VectorParams(size=vectors.shape[1], distance="Cosine"))
+    client.upload_collection(collection_name=collection, vectors=vectors, payload=documents, ids=ids)
+
+    max_k = max(args.k)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        lexical_index = build_lexical_index(os.path.join(tmp, "lexical"), ids, texts) \
+            if "hybrid" in args.configs else None
+        local_backend = None
+        if "local_index" in args.configs:
+            build_local_index(os.path.join(tmp, "local", collection), ids, vectors, documents)
+            local_backend = LocalIndexBackend(os.path.join(tmp, "local"))
+        for name in args.configs:
+            ranked, latencies, mean_results = run_config(
+                name, client, model, collection, lexical_index, local_backend, queries, max_k, args.candidates,
+                args.mmr_k, args.mmr_lambda
+            )
+            summary = latency_summary(latencies)
+            rows.append({
+                "config": name,
+                **ranking_metrics(ranked, [rel for _, rel in queries], args.k),
+                "mean_results": mean_results,
+                "mean_prompt_tokens": float(np.mean([result_document_tokens(documents[i] for i in ids) for ids in ranked])),
+                "p50_ms": summary["p50_ms"],
+                "p95_ms": summary["p95_ms"],
+                "p99_ms": summary["p99_ms"],
+                "queries_per_second": 1.0 / summary["mean_ms"] * 1000.0 if summary["mean_ms"] else None
+            })
+
+    report = {
+        "corpus": "file" if args.corpus_file else "synthetic",
+        "documents": len(documents),
+        "queries": len(queries),
+        "model": "hashing" if args.synthetic else args.model,
+        "embedding": embedding,
+        "retrieval": rows
+    }
+    print(f"Corpus encoding: {embedding['corpus_texts_per_second']:.0f} texts/s, "
+          f"query encoding p50 {embedding['query_encode']['p50_ms']:.2f} ms")
+    print_table(rows, ["config"] + [f"recall@{k}" for k in args.k] + ["mrr", "mean_results", "mean_prompt_tokens", "p50_ms", "p95_ms", "p99_ms"])
+    if args.output:
+        write_json(args.output, report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance, args.latency_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+End-to-end latency of later conversation turns with and without speculative retrieval.
+
+Summarisation, retrieval and generation are stand-ins with configurable latencies: the
+summariser sleeps and resolves follow-ups to the earlier question, retrieval ranks a
+synthetic corpus with the hashing encoder after sleeping for the vector database round
+trip, and generation returns at once. A share of the turns are follow-ups ("any news?")
+whose raw message differs from the summary, so the speculative hits are merged with a
+second retrieval instead of reused.
+
+    python -m benchmarks.speculative_retrieval --summarise-ms 400 --retrieval-ms 60
+    python -m benchmarks.speculative_retrieval --follow-up-share 0.8 --threshold 0.8 --output speculative.json
+
+Reports latency percentiles per mode, the reuse rate, the mean critical-path saving
+reported in the evaluations and recall@5 of the turn's original question.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ai.conversational import orchestrator, speculative_retrieval
+from benchmarks.common import HashingEncoder, latency_summary, print_table, write_json
+from benchmarks.hybrid_retrieval import synthetic_corpus
+
+FOLLOW_UPS = ["any news?", "still waiting, what now?", "can you check again please", "and?"]
+
+
+def build_turns(queries, follow_up_share, rng):
+    """Returns [(chat_history, summary, relevant document id)] for later turns."""
+    turns = []
+    for i, (query, relevant) in enumerate(queries):
+        if rng.random() < follow_up_share:
+            history = [
+                {"role": "user", "content": query},
+                {"role": "assistant", "content": "Let me look into that order for you."},
+                {"role": "user", "content": FOLLOW_UPS[i % len(FOLLOW_UPS)]}
+            ]
+        else:
+            history = [
+                {"role": "user", "content": "hi, I have a problem with an order"},
+                {"role": "assistant", "content": "Sure, what is the order number?"},
+                {"role": "user", "content": query}
+            ]
+        turns.append((history, query, relevant))
+    return turns
+
+
+def install_stand_ins(documents, encoder, summaries, summarise_ms, retrieval_ms):
+    matrix = encoder.encode([doc["input"] for doc in documents])
+
+    def summarise(chat_history):
+        time.sleep(summarise_ms / 1000.0)
+        return summaries[id(chat_history)]
+
+    def retrieve(query, top_k=5, query_filter=None):
+        time.sleep(retrieval_ms / 1000.0)
+        scores = matrix @ encoder.encode([query])[0]
+        top = np.argsort(-scores)[:top_k]
+        context = [{"document": {"id": int(i), **documents[i]}, "similarity_score": float(scores[i])} for i in top]
+        return context, None, None, float(scores[top].mean()), float(np.median(scores[top]))
+
+    orchestrator.summarise_query_from_chat_history = summarise
+    orchestrator.retrieve_releveant_context = retrieve
+    orchestrator.generate_response = lambda **kwargs: {"answer": "", "reasoning": ""}
+    orchestrator.get_sentence_transformer = lambda: encoder
+
+
+def run(turns, enabled):
+    speculative_retrieval.speculative_retrieval_enabled = enabled
+    latencies, reused, saved, hits = [], [], [], []
+    for chat_history, _, relevant in turns:
+        start = time.perf_counter()
+        response = orchestrator.process_chat_history(chat_history)
+        latencies.append(time.perf_counter() - start)
+        evaluations = response["evaluations"]
+        if enabled:
+            reused.append(evaluations["speculative_reused"])
+            if evaluations["critical_path_saved_ms"] is not None:
+                saved.append(evaluations["critical_path_saved_ms"])
+        ids = [doc["id"] for doc in (response["relevant_documents"] or [])[:5]]
+        hits.append(relevant in ids)
+    return {
+        "mode": "speculative" if enabled else "sequential",
+        **latency_summary(latencies),
+        "reuse_rate": float(np.mean(reused)) if reused else None,
+        "mean_saved_ms": float(np.mean(saved)) if saved else None,
+        "recall@5": float(np.mean(hits))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--summarise-ms", type=float, default=400.0)
+    parser.add_argument("--retrieval-ms", type=float, default=60.0)
+    parser.add_argument("--follow-up-share", type=float, default=0.3)
+    parser.add_argument("--threshold", type=float, default=speculative_retrieval.speculative_reuse_threshold)
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    documents, queries = synthetic_corpus(args.documents)
+    turns = build_turns(queries[:args.turns], args.follow_up_share, np.random.default_rng(0))
+    install_stand_ins(documents, HashingEncoder(), {id(history): summary for history, summary, _ in turns},
+                      args.summarise_ms, args.retrieval_ms)
+    speculative_retrieval.speculative_reuse_threshold = args.threshold
+
+    rows = [run(turns, enabled=False), run(turns, enabled=True)]
+    print_table(rows, ["mode", "p50_ms", "p95_ms", "mean_ms", "reuse_rate", "mean_saved_ms", "recall@5"])
+    if args.output:
+        write_json(args.output, {"args": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
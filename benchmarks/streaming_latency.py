@@ -0,0 +1,88 @@
+"""
+Time-to-first-token of `/generate_response/stream` against the full latency of
+`/generate_response`, measured on a running backend.
+
+    python -m benchmarks.streaming_latency --base-url http://localhost:8000 --requests 20
+    python -m benchmarks.streaming_latency --queries queries.txt --output streaming.json
+
+Requests alternate between the endpoints so both see the same warm caches. The server-side
+`time_to_first_token_ms` (from the `done` event) is reported next to the client-side figure.
+"""
+import argparse
+import json
+import time
+
+import httpx
+
+from benchmarks.common import latency_summary, print_table, write_json
+
+DEFAULT_QUERIES = [
+    "I can't log in to my account, it says my password is wrong",
+    "My package was marked delivered but never arrived",
+    "How do I get a refund for a double charge?",
+    "The app keeps crashing after the last update",
+]
+
+
+def stream_once(client, base_url, query):
+    """Returns (seconds to the first token event, seconds to the done event, done payload)."""
+    start = time.perf_counter()
+    first_token = None
+    event = None
+    with client.stream("POST", f"{base_url}/generate_response/stream", json={"user_query": query}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+            elif line.startswith("data: ") and event in ("done", "error"):
+                return first_token, time.perf_counter() - start, json.loads(line[len("data: "):])
+    return first_token, time.perf_counter() - start, None
+
+
+def blocking_once(client, base_url, query):
+    start = time.perf_counter()
+    client.post(f"{base_url}/generate_response", json={"user_query": query}).raise_for_status()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--queries", help="Text file with one query per line.")
+    parser.add_argument("--output", help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    first_tokens, stream_totals, server_ttft, blocking = [], [], [], []
+    with httpx.Client(timeout=120.0) as client:
+        for i in range(args.requests):
+            query = queries[i % len(queries)]
+            first_token, total, done = stream_once(client, args.base_url, query)
+            if first_token is not None:
+                first_tokens.append(first_token)
+            stream_totals.append(total)
+            ttft_ms = ((done or {}).get("evaluations") or {}).get("time_to_first_token_ms")
+            if ttft_ms is not None:
+                server_ttft.append(ttft_ms / 1000.0)
+            blocking.append(blocking_once(client, args.base_url, query))
+
+    rows = [
+        {"measure": "stream_first_token", **latency_summary(first_tokens)},
+        {"measure": "stream_first_token_server", **latency_summary(server_ttft)},
+        {"measure": "stream_complete", **latency_summary(stream_totals)},
+        {"measure": "blocking_response", **latency_summary(blocking)},
+    ]
+    print_table(rows, ["measure", "p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    if args.output:
+        write_json(args.output, {"args": vars(args), "results": rows})
+
+
+if __name__ == "__main__":
+    main()
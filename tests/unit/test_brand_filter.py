@@ -0,0 +1,149 @@
+import json
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from ai.conversational import orchestrator as conversational_orchestrator
+from ai.retrieval.brand import brand_filter, brand_payload_builder, extract_brand, normalize_brand
+from ai.retrieval.document_retrieval import search_similar, search_similar_hybrid
+from ai.retrieval.lexical_index import build_lexical_index
+from ai.retrieval.load.brand_payload import backfill_brand
+from ai.retrieval.load.ingest import ingest
+from ai.retrieval.local_index import LocalIndexBackend, build_local_index, payload_matches
+
+BRANDS = ("amazon", "comcast", "uber")
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(7)
+    vectors = rng.normal(size=(300, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    payloads = [{"input": f"question {i}", "reply": f"answer {i}", "brand": BRANDS[i % 3]} for i in range(300)]
+    return list(range(300)), vectors, payloads
+
+
+def in_memory_collection(ids, vectors, payloads):
+    client = QdrantClient(":memory:")
+    client.create_collection("tweets", vectors_config=models.VectorParams(size=vectors.shape[1], distance="Cosine"))
+    client.upsert("tweets", points=[
+        models.PointStruct(id=i, vector=v.tolist(), payload=p) for i, v, p in zip(ids, vectors, payloads)
+    ])
+    return client
+
+
+class TestBrandExtraction:
+    def test_support_handles_normalize_to_the_brand(self):
+        assert normalize_brand("@AmazonHelp") == "amazon"
+        assert normalize_brand("Ask_Spectrum") == "spectrum"
+        assert normalize_brand("comcastcares") == "comcast"
+        assert normalize_brand("Uber_Support") == "uber"
+        assert normalize_brand("  ") is None
+
+    def test_record_fields_win_over_mentions(self):
+        assert extract_brand({"company": "AppleSupport", "input": "@uber_support hi"}) == "apple"
+        assert extract_brand({"author_id": "115712", "input": "@user hey @AmazonHelp where is it"}) == "amazon"
+        assert extract_brand({"input": "no mention here"}) is None
+        assert brand_payload_builder("text")({"text": "@SpotifyCares help"}) == {"brand": "spotify"}
+
+    def test_brand_filter(self):
+        query_filter = brand_filter("@AmazonHelp")
+        assert query_filter.must[0].key == "brand"
+        assert query_filter.must[0].match.value == "amazon"
+        assert brand_filter(None) is None
+        assert payload_matches({"brand": "amazon"}, query_filter)
+        assert not payload_matches({"brand": "uber"}, query_filter)
+        assert not payload_matches({}, query_filter)
+
+
+class TestFilteredSearch:
+    def test_local_index_matches_qdrant(self, tmp_path, corpus):
+        ids, vectors, payloads = corpus
+        build_local_index(str(tmp_path / "tweets"), ids, vectors, payloads)
+        backend = LocalIndexBackend(str(tmp_path))
+        client = in_memory_collection(ids, vectors, payloads)
+        query_filter = brand_filter("comcast")
+
+        local_hits = backend.search("tweets", vectors[4].tolist(), limit=5, query_filter=query_filter)
+        qdrant_hits = client.search("tweets", query_vector=vectors[4].tolist(), limit=5, query_filter=query_filter)
+        assert [h.id for h in local_hits] == [h.id for h in qdrant_hits]
+        assert all(h.payload["brand"] == "comcast" for h in local_hits)
+
+        requests = [models.SearchRequest(vector=vectors[i].tolist(), limit=3, with_payload=True,
+                                         filter=brand_filter(BRANDS[i % 3])) for i in (1, 2, 5)]
+        for request, hits in zip(requests, backend.search_batch("tweets", requests)):
+            assert {h.payload["brand"] for h in hits} == {request.filter.must[0].match.value}
+
+    def test_unsupported_conditions_raise(self, tmp_path, corpus):
+        ids, vectors, payloads = corpus
+        build_local_index(str(tmp_path / "tweets"), ids, vectors, payloads)
+        backend = LocalIndexBackend(str(tmp_path))
+        query_filter = models.Filter(must_not=[models.FieldCondition(key="brand", match=models.MatchValue(value="uber"))])
+        with pytest.raises(ValueError):
+            backend.search("tweets", vectors[0].tolist(), limit=3, query_filter=query_filter)
+
+    def test_search_similar_passes_the_filter(self, corpus):
+        ids, vectors, payloads = corpus
+        client = in_memory_collection(ids, vectors, payloads)
+        model = MagicMock()
+        model.encode.return_value = vectors[9:10]
+        results, *_ = search_similar(client, model, "question 9", "tweets", top_k=5, query_filter=brand_filter("uber"))
+        assert results and all(r["id"] % 3 == 2 for r in results)
+
+    def test_hybrid_drops_off_brand_lexical_hits(self, tmp_path, corpus):
+        ids, vectors, payloads = corpus
+        client = in_memory_collection(ids, vectors, payloads)
+        lexical_index = build_lexical_index(str(tmp_path / "lexical"), ids, [p["input"] for p in payloads])
+        model = MagicMock()
+        model.encode.return_value = vectors[10:11]
+        results, *_ = search_similar_hybrid(client, model, "question 11", "tweets", lexical_index, top_k=5,
+                                            candidates=10, query_filter=brand_filter("amazon"))
+        assert results
+        assert all(r["id"] % 3 == 0 for r in results)
+        assert 11 not in [r["id"] for r in results]
+
+
+class TestBrandWiring:
+    def test_filtered_request_skips_the_semantic_cache(self, monkeypatch):
+        query_filter = brand_filter("amazon")
+        captured = {}
+
+        def fake_retrieve(query, top_k=5, query_filter=None):
+            captured["query_filter"] = query_filter
+            return [{"document": "doc"}], None, None, None, None
+
+        lookup = MagicMock()
+        monkeypatch.setattr(conversational_orchestrator, "summarise_query_from_chat_history", lambda chat_history: "q")
+        monkeypatch.setattr(conversational_orchestrator, "lookup_semantic_cache", lookup)
+        monkeypatch.setattr(conversational_orchestrator, "retrieve_releveant_context", fake_retrieve)
+        monkeypatch.setattr(
+            conversational_orchestrator, "generate_response",
+            lambda chat_history, relevant_documents, summarised_query, enable_reasoning: {"answer": "a"}
+        )
+        result = conversational_orchestrator.process_chat_history(
+            [{"role": "user", "content": "q"}], query_filter=query_filter
+        )
+        assert result["success"] is True
+        assert captured["query_filter"] is query_filter
+        lookup.assert_not_called()
+
+    def test_ingest_and_backfill_write_brand_and_index(self, tmp_path):
+        source = tmp_path / "tweets.jsonl"
+        source.write_text("\n".join(json.dumps({"input": f"@AmazonHelp order {i} late", "output": f"sorry {i}"})
+                                    for i in range(6)))
+        model = MagicMock()
+        model.encode.side_effect = lambda texts, **kwargs: np.array([[1.0, float(i), 0.5] for i in range(len(texts))])
+        client = QdrantClient(":memory:")
+        ingest(str(source), client, collection_name="tweets", encode_workers=0, chunk_size=4, model=model,
+               payload_builder=brand_payload_builder(),
+               payload_indexes={"brand": models.PayloadSchemaType.KEYWORD})
+        points, _ = client.scroll("tweets", limit=10)
+        assert {p.payload["brand"] for p in points} == {"amazon"}
+
+        client.overwrite_payload("tweets", payload={"input": "@Uber_Support app down", "reply": "r"}, points=[points[0].id])
+        counts = backfill_brand(client, "tweets")
+        assert counts == {"amazon": 5, "uber": 1}
+        assert client.retrieve("tweets", ids=[points[0].id])[0].payload["brand"] == "uber"
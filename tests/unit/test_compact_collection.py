@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from ai.retrieval import embeddings_helper
+from ai.retrieval.lexical_index import LexicalIndex
+from ai.retrieval.load import compact_collection as compact_module
+from ai.retrieval.load.compact_collection import (
+    collection_create_kwargs,
+    compact_collection,
+    payload_index_schemas,
+    plan_compaction,
+    resolve_alias,
+)
+
+
+def clustered_vectors(n_clusters, per_cluster, singletons, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    rows = [c + rng.normal(scale=0.01, size=(per_cluster, dim)) for c in centers]
+    rows.append(rng.normal(size=(singletons, dim)))
+    return np.vstack(rows).astype(np.float32)
+
+
+@pytest.fixture
+def aliased_collection():
+    vectors = clustered_vectors(n_clusters=6, per_cluster=4, singletons=5)
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        collection_name="tweets_v1",
+        vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE),
+    )
+    client.upsert(collection_name="tweets_v1", points=[
+        models.PointStruct(id=i, vector=v.tolist(), payload={"input": f"q{i}", "reply": f"a{i % 3}"})
+        for i, v in enumerate(vectors)
+    ])
+    client.update_collection_aliases(change_aliases_operations=[
+        models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name="tweets_v1", alias_name="live"))
+    ])
+    return client
+
+
+class TestPlanCompaction:
+    def test_picks_most_connected_member_and_collects_replies(self):
+        df = pd.DataFrame({
+            "qdrant_id": [1, 2, 3, 4],
+            "input_sentence": ["a", "b", "c", "d"],
+            "reply": ["r1", "r2", "r2", "r4"],
+            "group": [1, 1, 1, None],
+            "grouped_with": [
+                [{"neighbor_id": 2, "score": 0.97}],
+                [{"neighbor_id": 1, "score": 0.97}, {"neighbor_id": 3, "score": 0.96}],
+                [{"neighbor_id": 2, "score": 0.96}],
+                [],
+            ],
+        })
+        plan = plan_compaction(df, max_representative_replies=2)
+        assert set(plan) == {2, 4}
+        assert plan[2] == {"member_count": 3, "representative_replies": ["r2", "r1"]}
+        assert plan[4]["member_count"] == 1
+
+    def test_empty_collection_has_nothing_to_plan(self):
+        assert plan_compaction(pd.DataFrame()) == {}
+
+
+class TestCompactCollection:
+    def test_compacts_and_switches_alias(self, aliased_collection):
+        client = aliased_collection
+        report = compact_collection(client, collection="live", target_name="tweets_v2", sample_queries=10, top_k=5)
+
+        assert report["points_before"] == 29
+        assert report["points_after"] == 11  # 6 groups + 5 singletons
+        assert report["index_ram_mb_after"] < report["index_ram_mb_before"]
+        assert report["duplicate_hits_in_top_5_after"] < report["duplicate_hits_in_top_5_before"]
+        assert resolve_alias(client, "live") == "tweets_v2"
+        assert client.count("live").count == 11
+        points, _ = client.scroll("tweets_v2", limit=100, with_payload=True)
+        assert sum(p.payload["member_count"] for p in points) == 29
+        assert client.collection_exists("tweets_v1")
+
+    def test_alias_switch_invalidates_caches_and_changes_the_fingerprint(self, aliased_collection, monkeypatch):
+        client = aliased_collection
+        monkeypatch.setattr(embeddings_helper, "init_embeddings_helperions", lambda collection_name: (client, None))
+        invalidated = []
+        monkeypatch.setattr(compact_module, "invalidate_collection", invalidated.append)
+        before = embeddings_helper.get_collection_fingerprint("live")
+        compact_collection(client, collection="live", target_name="tweets_v2", sample_queries=10, top_k=5)
+        assert invalidated == ["live"]
+        assert before == ("tweets_v1", 29)
+        assert embeddings_helper.get_collection_fingerprint("live") == ("tweets_v2", 11)
+
+    def test_rebuilds_the_lexical_index_of_the_alias(self, aliased_collection, tmp_path):
+        report = compact_collection(aliased_collection, collection="live", target_name="tweets_v2", sample_queries=5,
+                                    lexical_index_path=str(tmp_path))
+        index = LexicalIndex(str(tmp_path / "live"))
+        assert index.documents == report["points_after"]
+        points, _ = aliased_collection.scroll("tweets_v2", limit=100)
+        assert sorted(index.doc_ids) == sorted(p.id for p in points)
+
+    def test_recompaction_can_delete_previous_collection(self, aliased_collection):
+        client = aliased_collection
+        compact_collection(client, collection="live", target_name="tweets_v2", sample_queries=5)
+        compact_collection(client, collection="live", target_name="tweets_v3", sample_queries=5, delete_previous=True)
+        assert resolve_alias(client, "live") == "tweets_v3"
+        assert not client.collection_exists("tweets_v2")
+
+    def test_keeps_index_settings_and_payload_indexes(self, aliased_collection, monkeypatch):
+        client = aliased_collection
+        source_info = client.get_collection("tweets_v1")
+        source_info.config.hnsw_config.m = 32
+        source_info.config.quantization_config = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+        )
+        source_info.config.params.on_disk_payload = True
+        source_info.payload_schema = {
+            "brand": models.PayloadIndexInfo(data_type=models.PayloadSchemaType.KEYWORD, points=29)
+        }
+        get_collection, create_collection, upsert = client.get_collection, client.create_collection, client.upsert
+        calls = []
+
+        def record(name, method):
+            return lambda *args, **kwargs: calls.append((name, kwargs)) or (method(*args, **kwargs) if method else None)
+
+        monkeypatch.setattr(client, "get_collection", lambda collection_name: source_info
+                            if collection_name == "tweets_v1" else get_collection(collection_name))
+        monkeypatch.setattr(client, "create_collection", record("create", create_collection))
+        monkeypatch.setattr(client, "create_payload_index", record("index", None))
+        monkeypatch.setattr(client, "upsert", record("upsert", upsert))
+
+        compact_collection(client, collection="live", target_name="tweets_v2", sample_queries=5)
+        (_, create_kwargs), (_, index_kwargs) = calls[:2]
+        assert [call for call, _ in calls[:3]] == ["create", "index", "upsert"]
+        assert create_kwargs["hnsw_config"].m == 32 and create_kwargs["on_disk_payload"] is True
+        assert create_kwargs["quantization_config"].scalar.type == models.ScalarType.INT8
+        assert index_kwargs["field_name"] == "brand" and index_kwargs["field_schema"] == models.PayloadSchemaType.KEYWORD
+
+    def test_create_kwargs_round_trip(self, aliased_collection):
+        config = aliased_collection.get_collection("tweets_v1").config
+        aliased_collection.create_collection(collection_name="copy", **collection_create_kwargs(config))
+        assert aliased_collection.get_collection("copy").config.params.vectors == config.params.vectors
+        assert payload_index_schemas(None) == {}
+
+    def test_refuses_to_alias_over_a_collection(self, aliased_collection):
+        with pytest.raises(ValueError):
+            compact_collection(aliased_collection, collection="tweets_v1")
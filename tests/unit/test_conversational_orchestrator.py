@@ -1,5 +1,8 @@
+import asyncio
+import time
+
 import pytest
-from ai.conversational.orchestrator import process_chat_history
+from ai.conversational.orchestrator import aprocess_chat_history, process_chat_history
 
 class TestProcessChatHistory:
     def test_basic_success(self, monkeypatch):
@@ -45,4 +48,30 @@ class TestProcessChatHistory:
         ]
         result = process_chat_history(chat_history)
         assert result['answer'] == ''
-        assert 'No user message' in result['reasoning'] 
\ No newline at end of file
+        assert 'No user message' in result['reasoning'] 
+
+    def test_async_turns_share_the_event_loop(self, monkeypatch):
+        async def summarise(chat_history):
+            return chat_history[-1]['content']
+
+        async def retrieve(query, **kwargs):
+            await asyncio.sleep(0.2)
+            return [{'document': f'About {query}.', 'similarity_score': 1.0}], 1.0, 1.0, 1.0, 1.0
+
+        async def generate(chat_history, relevant_documents, summarised_query, enable_reasoning):
+            await asyncio.sleep(0.2)
+            return {'answer': relevant_documents[0], 'reasoning': ''}
+
+        monkeypatch.setattr('ai.conversational.orchestrator.asummarise_query_from_chat_history', summarise)
+        monkeypatch.setattr('ai.conversational.orchestrator.aretrieve_releveant_context', retrieve)
+        monkeypatch.setattr('ai.conversational.orchestrator.agenerate_response', generate)
+
+        async def run():
+            return await asyncio.gather(*(
+                aprocess_chat_history([{'role': 'user', 'content': f'order {i}'}]) for i in range(5)
+            ))
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        assert [result['answer'] for result in results] == [f'About order {i}.' for i in range(5)]
+        assert time.perf_counter() - start < 1.0  # five turns overlap instead of taking 2s in sequence
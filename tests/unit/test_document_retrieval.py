@@ -0,0 +1,167 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from ai.retrieval.document_retrieval import (
+    find_inter_document_similarity,
+    mmr_select,
+    search_similar,
+    search_similar_batch,
+    top_p_filter_matrix,
+    top_p_filtering_with_temperature,
+)
+from ai.retrieval.retrieval_statistics import compute_retrieval_statistics
+
+
+def make_hit(point_id, score, vector):
+    return SimpleNamespace(
+        id=point_id,
+        score=score,
+        payload={"input": f"question {point_id}", "reply": f"answer {point_id}"},
+        vector=vector
+    )
+
+
+class TestRetrievalStatistics:
+    def test_upper_triangle_statistics(self):
+        vectors = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+        stats = compute_retrieval_statistics(vectors)
+        # Pairs: (0,1)=1, (0,2)=0, (1,2)=0
+        assert stats["mean_inter_document_similarity"] == pytest.approx(1 / 3)
+        assert stats["median_inter_document_similarity"] == pytest.approx(0.0)
+        np.testing.assert_allclose(stats["centrality"], [0.5, 0.5, 0.0], atol=1e-6)
+
+    def test_single_document_has_no_pairs(self):
+        stats = compute_retrieval_statistics(np.array([[0.3, 0.4]]))
+        assert stats["mean_inter_document_similarity"] is None
+        assert stats["median_inter_document_similarity"] is None
+
+
+class TestSearchSimilar:
+    def test_uses_returned_vectors_instead_of_reencoding(self):
+        client = MagicMock()
+        client.search.return_value = [
+            make_hit(1, 0.9, [1.0, 0.0]),
+            make_hit(2, 0.8, [0.6, 0.8]),
+        ]
+        model = MagicMock()
+        model.encode.return_value = np.array([[1.0, 0.0]])
+
+        results, mean_inter, median_inter, mean_query, median_query = search_similar(
+            client, model, "reset password", "test_collection", top_k=2
+        )
+
+        model.encode.assert_called_once()
+        assert client.search.call_args.kwargs["with_vectors"] is True
+        assert mean_inter == pytest.approx(0.6)
+        assert median_inter == pytest.approx(0.6)
+        assert all("centrality" in r for r in results)
+        assert mean_query is not None
+
+    def test_falls_back_to_model_without_vectors(self):
+        model = MagicMock()
+        model.encode.return_value = np.array([[1.0, 0.0], [1.0, 0.0]])
+        results = [
+            {"input": "a", "reply": "b", "vector": None},
+            {"input": "c", "reply": "d", "vector": None},
+        ]
+        mean_inter, median_inter = find_inter_document_similarity(results, model)
+        assert mean_inter == pytest.approx(1.0)
+        assert model.encode.call_args.kwargs["show_progress_bar"] is False
+
+
+def loop_top_p(scores, p=0.9, temperature=0.1):
+    """The original per-result loop, kept as the reference for the vectorised version."""
+    scores = np.asarray(scores) / temperature
+    probs = np.exp(scores - scores.max())
+    probs /= probs.sum()
+    kept, cumulative = [], 0.0
+    for i in np.argsort(probs)[::-1]:
+        kept.append(int(i))
+        cumulative += probs[i]
+        if cumulative >= p:
+            break
+    return kept
+
+
+class TestTopPFiltering:
+    def test_matrix_matches_loop_per_row(self):
+        rng = np.random.default_rng(0)
+        lengths = np.array([20, 7, 1, 0, 13])
+        scores = rng.uniform(0.3, 0.9, size=(5, 20))
+        order, keep = top_p_filter_matrix(scores, lengths=lengths)
+        for row, length in enumerate(lengths):
+            expected = loop_top_p(scores[row, :length]) if length else []
+            assert order[row, :keep[row]].tolist() == expected
+
+    def test_single_query_function_is_unchanged(self):
+        results = [{"score": s} for s in (0.8, 0.82, 0.5, 0.79)]
+        filtered = top_p_filtering_with_temperature(results, p=0.5, temperature=0.1)
+        assert [r["score"] for r in filtered] == [0.82, 0.8]
+
+
+class TestSearchSimilarBatch:
+    def test_matches_single_query_results(self):
+        hits = {
+            "reset password": [make_hit(1, 0.9, [1.0, 0.0]), make_hit(2, 0.85, [0.6, 0.8])],
+            "refund": [make_hit(3, 0.7, [0.0, 1.0]), make_hit(4, 0.4, [0.6, 0.8]), make_hit(5, 0.39, [1.0, 0.0])],
+            "nothing": [],
+        }
+        queries = list(hits)
+        model = MagicMock()
+        model.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+        client = MagicMock()
+        client.search_batch.return_value = [hits[q] for q in queries]
+        client.search.side_effect = [hits[q] for q in queries]
+
+        batch = search_similar_batch(client, model, queries, "test_collection", top_k=3)
+        single = [search_similar(client, model, q, "test_collection", top_k=3) for q in queries]
+
+        assert model.encode.call_args_list[0].args[0] == queries  # one encode call for the batch
+        requests = client.search_batch.call_args.kwargs["requests"]
+        assert len(requests) == 3 and requests[0].limit == 3 and requests[0].with_vector
+        for batch_result, single_result in zip(batch, single):
+            assert [r["id"] for r in batch_result[0]] == [r["id"] for r in single_result[0]]
+            assert batch_result[1:] == single_result[1:]
+        assert batch[2] == ([], None, None, None, None)
+
+
+def loop_mmr(relevance, vectors, k, lambda_mult):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    selected = []
+    while len(selected) < k:
+        candidates = [i for i in range(len(relevance)) if i not in selected]
+        selected.append(max(candidates, key=lambda i: lambda_mult * relevance[i] - (1 - lambda_mult) * max(
+            (float(unit[i] @ unit[j]) for j in selected), default=0.0)))
+    return selected
+
+
+class TestMMR:
+    def test_matches_loop_implementation(self):
+        rng = np.random.default_rng(3)
+        vectors = rng.normal(size=(20, 8))
+        relevance = rng.uniform(0.4, 0.9, size=20)
+        for lambda_mult in (0.3, 0.5, 0.8):
+            assert mmr_select(relevance, vectors, 6, lambda_mult) == loop_mmr(relevance, vectors, 6, lambda_mult)
+        assert mmr_select(relevance, vectors, 30) == mmr_select(relevance, vectors, 20)
+        assert mmr_select([], np.zeros((0, 8)), 5) == []
+
+    def test_near_duplicates_are_dropped(self):
+        hits = [
+            make_hit(1, 0.90, [1.0, 0.0, 0.0]),
+            make_hit(2, 0.89, [0.99, 0.01, 0.0]),
+            make_hit(3, 0.88, [0.98, 0.02, 0.0]),
+            make_hit(4, 0.80, [0.0, 1.0, 0.0]),
+            make_hit(5, 0.70, [0.0, 0.0, 1.0]),
+        ]
+        client = MagicMock()
+        client.search.return_value = hits
+        model = MagicMock()
+        model.encode.return_value = np.ones((1, 3))
+        results, mean_inter, *_ = search_similar(client, model, "q", "test_collection", top_k=5, mmr_k=3)
+        assert [r["id"] for r in results] == [1, 4, 5]
+        assert set(results[0]) == {"id", "score", "input", "reply", "vector", "centrality"}
+        assert mean_inter is not None
+
+        results, *_ = search_similar(client, model, "q", "test_collection", top_k=5, mmr_k=3, mmr_lambda=1.0)
+        assert [r["id"] for r in results] == [1, 2, 3]
@@ -0,0 +1,173 @@
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from ai.retrieval.load.duplicate_engine import (
+    SimHashIndex,
+    UnionFind,
+    find_duplicate_pairs,
+    label_groups,
+    measure_lsh_recall,
+)
+from ai.retrieval.load.flag_duplicate_data import flag_duplicate_sentences_from_qdrant
+
+
+def clustered_vectors(n_clusters=12, per_cluster=5, singletons=20, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    rows = [c + rng.normal(scale=0.01, size=(per_cluster, dim)) for c in centers]
+    rows.append(rng.normal(size=(singletons, dim)))
+    vectors = np.vstack(rows).astype(np.float32)
+    return vectors[rng.permutation(len(vectors))]
+
+
+@pytest.fixture
+def qdrant_collection():
+    vectors = clustered_vectors()
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        collection_name="tweets",
+        vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE),
+    )
+    client.upsert(collection_name="tweets", points=[
+        models.PointStruct(id=i, vector=v.tolist(), payload={"input": f"q{i}", "reply": f"a{i}"})
+        for i, v in enumerate(vectors)
+    ])
+    return client, vectors
+
+
+class TestUnionFind:
+    def test_union_merges_chains_to_smallest_root(self):
+        uf = UnionFind(6)
+        uf.union([4, 2, 5], [3, 4, 1])
+        roots = uf.roots()
+        assert roots[2] == roots[3] == roots[4] == 2
+        assert roots[1] == roots[5] == 1
+        assert roots[0] == 0
+
+    def test_label_groups_respects_group_limit(self):
+        uf = UnionFind(5)
+        uf.union([0, 3], [4, 2])
+        assert label_groups(uf, 5, group_limit=2) == [1, 2, None, None, 1]
+
+
+class TestFindDuplicatePairs:
+    @pytest.mark.parametrize("chunk_size", [7, 64, 1000])
+    def test_pairs_match_dense_computation(self, chunk_size):
+        vectors = clustered_vectors()
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        src, dst, scores = find_duplicate_pairs(vectors, 0.9, chunk_size=chunk_size, workers=2,
+                                                show_progress=False)
+        dense = vectors @ vectors.T
+        expected = {(i, j) for i, j in zip(*np.nonzero(dense >= 0.9)) if i != j}
+        assert set(zip(src.tolist(), dst.tolist())) == expected
+        np.testing.assert_allclose(scores, dense[src, dst], rtol=1e-5)
+
+    def test_max_neighbors_caps_edges_per_point(self):
+        vectors = np.ones((10, 4), dtype=np.float32) / 2.0
+        src, _, _ = find_duplicate_pairs(vectors, 0.9, chunk_size=3, max_neighbors=2, show_progress=False)
+        assert np.bincount(src).max() == 2
+
+    def test_rejects_non_positive_threshold(self):
+        with pytest.raises(ValueError):
+            find_duplicate_pairs(np.ones((2, 2), dtype=np.float32), 0.0)
+
+
+class TestMatrixEngine:
+    @pytest.mark.parametrize("group_limit", [10, 1000])
+    def test_matches_bfs_groups(self, qdrant_collection, group_limit):
+        client, _ = qdrant_collection
+        kwargs = dict(collection_name="tweets", threshold=0.95, show_progress=False,
+                      qdrant_scroll_limit=16, group_limit=group_limit, client=client)
+        bfs = flag_duplicate_sentences_from_qdrant(engine="bfs", **kwargs)
+        matrix = flag_duplicate_sentences_from_qdrant(engine="matrix", chunk_size=16, **kwargs)
+
+        assert list(matrix.columns) == list(bfs.columns)
+        assert matrix["qdrant_id"].tolist() == bfs["qdrant_id"].tolist()
+        assert matrix["group"].fillna(0).tolist() == bfs["group"].fillna(0).tolist()
+        for bfs_neighbors, matrix_neighbors in zip(bfs["grouped_with"], matrix["grouped_with"]):
+            # BFS records the edges it traversed; the matrix engine records every edge
+            assert {n["neighbor_id"] for n in bfs_neighbors} <= {n["neighbor_id"] for n in matrix_neighbors}
+
+    def test_float16_vectors_give_same_groups(self, qdrant_collection):
+        client, _ = qdrant_collection
+        kwargs = dict(collection_name="tweets", threshold=0.95, show_progress=False, engine="matrix", client=client)
+        fp32 = flag_duplicate_sentences_from_qdrant(**kwargs)
+        fp16 = flag_duplicate_sentences_from_qdrant(vector_dtype="float16", **kwargs)
+        assert fp16["group"].fillna(0).tolist() == fp32["group"].fillna(0).tolist()
+
+    def test_unknown_engine_raises(self):
+        with pytest.raises(ValueError):
+            flag_duplicate_sentences_from_qdrant(engine="gpu")
+
+
+class TestSimHashIndex:
+    def test_finds_exact_pairs_in_clustered_data(self):
+        vectors = clustered_vectors()
+        index = SimHashIndex(vectors.shape[1], n_bits=8, n_tables=8)
+        index.add(list(range(len(vectors))), vectors, 0.95)
+        unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        dense = unit @ unit.T
+        expected = {(i, j) for i, j in zip(*np.nonzero(dense >= 0.95)) if i < j}
+        assert set(zip(index.pair_src.tolist(), index.pair_dst.tolist())) == expected
+
+    def test_incremental_add_matches_full_build(self, tmp_path):
+        vectors = clustered_vectors()
+        full = SimHashIndex(vectors.shape[1], n_bits=8, n_tables=8)
+        full.add(list(range(len(vectors))), vectors, 0.95)
+
+        path = str(tmp_path / "lsh.npz")
+        partial = SimHashIndex(vectors.shape[1], n_bits=8, n_tables=8)
+        partial.add(list(range(40)), vectors[:40], 0.95)
+        partial.save(path)
+        reloaded = SimHashIndex.load(path)
+        reloaded.add(list(range(40, len(vectors))), vectors[40:], 0.95)
+
+        assert len(reloaded) == len(vectors)
+        assert set(zip(reloaded.pair_src.tolist(), reloaded.pair_dst.tolist())) == \
+            set(zip(full.pair_src.tolist(), full.pair_dst.tolist()))
+
+    def test_oversized_bucket_still_forms_one_group(self):
+        vectors = np.tile(np.array([[1.0, 0.0, 0.0, 0.0]], dtype=np.float32), (50, 1))
+        index = SimHashIndex(4, n_bits=4, n_tables=2, max_bucket_size=5)
+        index.add(list(range(50)), vectors, 0.9)
+        assert len(set(index.union_find().roots().tolist())) == 1
+        assert index.pair_src.size < 50 * 49 / 2
+
+    def test_bits_default_to_collection_size(self):
+        index = SimHashIndex(4)
+        index.add(list(range(5000)), np.random.default_rng(0).normal(size=(5000, 4)), 0.9)
+        assert index.n_bits == 12
+
+    def test_threshold_change_is_rejected(self):
+        index = SimHashIndex(4)
+        index.add([0], np.ones((1, 4)), 0.9)
+        with pytest.raises(ValueError):
+            index.add([1], np.ones((1, 4)), 0.8)
+
+    def test_measure_recall_reports_full_recall_on_separated_clusters(self):
+        report = measure_lsh_recall(clustered_vectors(), 0.95, sample_size=50, n_bits=8, n_tables=8)
+        assert report["sample_size"] == 50
+        assert report["pair_recall"] == 1.0
+        assert report["grouped_recall"] == 1.0
+
+
+class TestLshEngine:
+    def test_matches_matrix_groups_and_reuses_index(self, qdrant_collection, tmp_path):
+        client, vectors = qdrant_collection
+        kwargs = dict(collection_name="tweets", threshold=0.95, show_progress=False, group_limit=1000, client=client)
+        matrix = flag_duplicate_sentences_from_qdrant(engine="matrix", **kwargs)
+        path = str(tmp_path / "lsh.npz")
+        lsh = flag_duplicate_sentences_from_qdrant(engine="lsh", lsh_bits=8, lsh_tables=8, lsh_index_path=path,
+                                                   recall_sample_size=40, **kwargs)
+        assert lsh["group"].tolist() == matrix["group"].tolist()
+        assert lsh.attrs["lsh_recall"]["grouped_recall"] == 1.0
+
+        client.upsert(collection_name="tweets", points=[
+            models.PointStruct(id=1000, vector=vectors[0].tolist(), payload={"input": "copy", "reply": "a"})
+        ])
+        updated = flag_duplicate_sentences_from_qdrant(engine="lsh", lsh_bits=8, lsh_tables=8,
+                                                       lsh_index_path=path, **kwargs)
+        assert len(SimHashIndex.load(path)) == len(vectors) + 1
+        groups = dict(zip(updated["qdrant_id"], updated["group"]))
+        assert groups[1000] == groups[0]
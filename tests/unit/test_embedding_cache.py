@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+import ai.retrieval.embeddings_helper as vdbc
+from ai.retrieval.embedding_cache import EmbeddingCache, PersistentEmbeddingStore, make_cache_key
+
+
+class TestEmbeddingCache:
+    def test_key_uses_normalised_text_and_model(self):
+        assert make_cache_key("Reset  Password ", "m") == make_cache_key("reset password", "m")
+        assert make_cache_key("reset password", "m") != make_cache_key("reset password", "other")
+
+    def test_lru_evicts_oldest_and_counts(self):
+        cache = EmbeddingCache(max_size=2)
+        cache.put("a", "m", [1.0, 0.0])
+        cache.put("b", "m", [0.0, 1.0])
+        assert cache.get("a", "m") is not None
+        cache.put("c", "m", [1.0, 1.0])
+        assert cache.get("b", "m") is None
+        stats = cache.stats()
+        assert stats["memory_hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["memory_size"] == 2
+
+    def test_persistent_tier_survives_new_instance(self, tmp_path):
+        path = str(tmp_path / "embeddings.cache")
+        EmbeddingCache(persistent_path=path, persistent_capacity=8).put("order not delivered", "m", [0.5, 0.25, 0.125])
+        reopened = EmbeddingCache(persistent_path=path, persistent_capacity=8)
+        np.testing.assert_allclose(reopened.get("Order not delivered", "m"), [0.5, 0.25, 0.125])
+        assert reopened.stats()["persistent_hits"] == 1
+
+    def test_persistent_store_rejects_dimension_mismatch(self, tmp_path):
+        path = str(tmp_path / "embeddings.cache")
+        PersistentEmbeddingStore(path, dim=3, capacity=4)
+        with pytest.raises(ValueError):
+            PersistentEmbeddingStore(path, dim=4, capacity=4)
+
+
+class TestEncodeQueries:
+    def test_only_missing_queries_are_encoded(self, monkeypatch):
+        model = MagicMock()
+        model.encode.side_effect = lambda texts: np.array([[float(len(t)), 1.0] for t in texts])
+        monkeypatch.setattr(vdbc, "_cached_model", model)
+        monkeypatch.setattr(vdbc, "_cached_model_name", "mock-model")
+        monkeypatch.setattr(vdbc, "_embedding_cache", EmbeddingCache(max_size=10))
+
+        first = vdbc.encode_queries(model, ["reset password"])
+        second = vdbc.encode_queries(model, ["reset password", "where is my order"])
+
+        np.testing.assert_allclose(first[0], second[0])
+        assert model.encode.call_count == 2
+        assert model.encode.call_args.args[0] == ["where is my order"]
+        assert vdbc.get_embedding_cache_stats()["memory_hits"] == 1
+
+    def test_injected_model_bypasses_cache(self, monkeypatch):
+        model = MagicMock()
+        model.encode.return_value = np.array([[1.0, 0.0]])
+        monkeypatch.setattr(vdbc, "_embedding_cache", EmbeddingCache(max_size=10))
+        vdbc.encode_queries(model, ["hello"])
+        vdbc.encode_queries(model, ["hello"])
+        assert model.encode.call_count == 2
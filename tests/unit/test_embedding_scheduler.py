@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from ai.retrieval import embeddings_helper
+from ai.retrieval.embedding_scheduler import EmbeddingBatcher
+
+
+class TestEmbeddingBatcher:
+    def test_concurrent_requests_share_one_batch(self):
+        model = MagicMock()
+        model.encode.side_effect = lambda texts: np.array([[float(len(t))] for t in texts])
+        batcher = EmbeddingBatcher(model, max_batch_size=3, max_wait_ms=500)
+        futures = [batcher.submit([text]) for text in ["a", "bb", "ccc"]]
+        results = [f.result(timeout=5) for f in futures]
+        batcher.close()
+
+        assert model.encode.call_count == 1
+        assert model.encode.call_args.args[0] == ["a", "bb", "ccc"]
+        assert [r[0][0] for r in results] == [1.0, 2.0, 3.0]
+
+    def test_flushes_after_max_wait(self):
+        model = MagicMock()
+        model.encode.return_value = np.array([[1.0, 2.0]])
+        batcher = EmbeddingBatcher(model, max_batch_size=64, max_wait_ms=1)
+        result = batcher.encode(["single"])
+        batcher.close()
+        assert result.shape == (1, 2)
+
+    def test_model_errors_reach_every_caller(self):
+        model = MagicMock()
+        model.encode.side_effect = RuntimeError("boom")
+        batcher = EmbeddingBatcher(model, max_batch_size=2, max_wait_ms=500)
+        futures = [batcher.submit(["a"]), batcher.submit(["b"])]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+        batcher.close()
+
+    def test_queued_requests_finish_on_close(self):
+        model = MagicMock()
+        model.encode.side_effect = lambda texts: np.ones((len(texts), 2))
+        batcher = EmbeddingBatcher(model, max_batch_size=64, max_wait_ms=200)
+        future = batcher.submit(["a"])
+        batcher.close()
+        batcher.close()
+        assert future.result(timeout=5).shape == (1, 2)
+        assert not batcher._worker.is_alive()
+        with pytest.raises(RuntimeError):
+            batcher.submit(["b"])
+
+    def test_replaced_batcher_is_closed(self, monkeypatch):
+        monkeypatch.setattr(embeddings_helper, "embedding_batch_enabled", True)
+        monkeypatch.setattr(embeddings_helper, "_embedding_batcher", None)
+        first = embeddings_helper.get_embedding_batcher(MagicMock())
+        assert embeddings_helper.get_embedding_batcher(first.model) is first
+        second = embeddings_helper.get_embedding_batcher(MagicMock())
+        assert second is not first and not first._worker.is_alive()
+        second.close()
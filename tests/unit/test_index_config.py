@@ -0,0 +1,118 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+import ai.retrieval.embeddings_helper as embeddings_helper
+from ai.retrieval import orchestrator
+from ai.retrieval.document_retrieval import search_similar
+from ai.retrieval.index_config import (
+    collection_index_settings,
+    create_collection_kwargs,
+    load_index_config,
+    search_params,
+)
+
+SETTINGS = {
+    "on_disk": True,
+    "hnsw": {"m": 8, "ef_construct": 64},
+    "quantization": {"type": "scalar", "quantile": 0.99, "always_ram": True},
+    "search": {"hnsw_ef": 96, "rescore": True, "oversampling": 2.0}
+}
+
+
+class TestIndexConfig:
+    def test_load_inline_json_and_file(self, tmp_path):
+        config = {"default": {"search": {"hnsw_ef": 64}}, "tweets": SETTINGS}
+        assert load_index_config(json.dumps(config)) == config
+        path = tmp_path / "index.json"
+        path.write_text(json.dumps(config))
+        assert load_index_config(str(path)) == config
+        assert load_index_config(None) == {}
+
+    def test_unknown_keys_and_types_are_rejected(self):
+        with pytest.raises(ValueError):
+            load_index_config(json.dumps({"tweets": {"hnsw": {"ef": 10}}}))
+        with pytest.raises(ValueError):
+            load_index_config(json.dumps({"tweets": {"quantisation": {}}}))
+        with pytest.raises(ValueError):
+            load_index_config(json.dumps({"tweets": {"quantization": {"type": "int4"}}}))
+        with pytest.raises(ValueError):
+            load_index_config("[1, 2]")
+
+    def test_collection_settings_fall_back_to_default(self):
+        config = {"default": {"search": {"hnsw_ef": 64}}, "tweets": SETTINGS}
+        assert collection_index_settings(config, "tweets") is SETTINGS
+        assert collection_index_settings(config, "other") == {"search": {"hnsw_ef": 64}}
+        assert collection_index_settings({}, "other") == {}
+
+    def test_create_collection_kwargs(self):
+        kwargs = create_collection_kwargs(SETTINGS, 384)
+        assert kwargs["vectors_config"].size == 384
+        assert kwargs["vectors_config"].on_disk is True
+        assert kwargs["hnsw_config"] == models.HnswConfigDiff(m=8, ef_construct=64)
+        assert kwargs["quantization_config"].scalar.type == models.ScalarType.INT8
+        assert kwargs["quantization_config"].scalar.quantile == 0.99
+        binary = create_collection_kwargs({"quantization": {"type": "binary"}}, 384)
+        assert binary["quantization_config"].binary.always_ram is True
+        assert set(create_collection_kwargs({}, 384)) == {"vectors_config"}
+
+    def test_search_params(self):
+        params = search_params(SETTINGS)
+        assert params.hnsw_ef == 96 and params.exact is False
+        assert params.quantization.rescore is True and params.quantization.oversampling == 2.0
+        assert search_params({"search": {"exact": True}}).quantization is None
+        assert search_params({}) is None
+
+
+class TestIndexConfigWiring:
+    def test_initialize_qdrant_applies_collection_settings(self):
+        client = MagicMock()
+        client.collection_exists.return_value = False
+        embeddings_helper.initialize_qdrant("tweets", 384, client=client, index_settings=SETTINGS)
+        kwargs = client.create_collection.call_args.kwargs
+        assert kwargs["collection_name"] == "tweets"
+        assert kwargs["hnsw_config"].m == 8
+        assert kwargs["quantization_config"] is not None
+
+    def test_initialize_qdrant_reads_env_config(self, monkeypatch):
+        monkeypatch.setattr(embeddings_helper, "qdrant_index_config", json.dumps({"tweets": SETTINGS}))
+        monkeypatch.setattr(embeddings_helper, "_cached_index_config", None)
+        client = MagicMock()
+        client.collection_exists.return_value = False
+        embeddings_helper.initialize_qdrant("tweets", 384, client=client)
+        assert client.create_collection.call_args.kwargs["vectors_config"].on_disk is True
+        assert embeddings_helper.get_search_params("tweets").hnsw_ef == 96
+        assert embeddings_helper.get_search_params("other") is None
+
+    def test_search_params_reach_qdrant(self, monkeypatch):
+        client = QdrantClient(":memory:")
+        client.create_collection("tweets", vectors_config=models.VectorParams(size=2, distance="Cosine"))
+        client.upsert("tweets", points=[
+            models.PointStruct(id=1, vector=[1.0, 0.0], payload={"input": "q", "reply": "a"})
+        ])
+        model = MagicMock()
+        model.encode.return_value = [[1.0, 0.0]]
+        search = MagicMock(side_effect=client.search)
+        monkeypatch.setattr(client, "search", search)
+        params = models.SearchParams(hnsw_ef=32)
+        results, *_ = search_similar(client, model, "q", "tweets", top_k=1, search_params=params)
+        assert results[0]["id"] == 1
+        assert search.call_args.kwargs["search_params"] is params
+
+    def test_orchestrator_uses_collection_search_params(self, monkeypatch):
+        params = models.SearchParams(hnsw_ef=32)
+        captured = {}
+
+        async def fake_search_similar(client, model, query, collection_name, top_k=5, search_params=None,
+                                      query_filter=None):
+            captured["search_params"] = search_params
+            return [], None, None, None, None
+
+        monkeypatch.setattr(orchestrator, "get_search_params", lambda collection_name: params)
+        monkeypatch.setattr(orchestrator, "hybrid_lexical_index", lambda collection_name: None)
+        monkeypatch.setattr(orchestrator, "search_similar_async", fake_search_similar)
+        orchestrator.retrieve_releveant_context("q", client=MagicMock(), model=MagicMock(), collection_name="tweets")
+        assert captured["search_params"] is params
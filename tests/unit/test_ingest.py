@@ -0,0 +1,63 @@
+import json
+import numpy as np
+from unittest.mock import MagicMock
+from qdrant_client import QdrantClient
+from ai.retrieval.load import ingest as ingest_module
+from ai.retrieval.load.ingest import Checkpoint, ingest, iter_chunks, point_id_for
+
+
+def write_jsonl(path, n):
+    with open(path, "w") as f:
+        for i in range(n):
+            f.write(json.dumps({"input": f"question {i}", "output": f"answer {i}"}) + "\n")
+
+
+def make_model():
+    model = MagicMock()
+    model.encode.side_effect = lambda texts, **kwargs: np.array(
+        [[1.0, float(len(t)), float(i)] for i, t in enumerate(texts)]
+    )
+    return model
+
+
+class TestIngest:
+    def test_point_ids_are_content_hashes(self):
+        assert point_id_for("q", "a") == point_id_for("q", "a")
+        assert point_id_for("q", "a") != point_id_for("q", "b")
+
+    def test_iter_chunks_skips_checkpointed_records(self):
+        chunks = list(iter_chunks(iter(range(10)), chunk_size=4, skip=5))
+        assert chunks == [(5, [5, 6, 7, 8]), (9, [9])]
+
+    def test_checkpoint_advances_over_contiguous_chunks(self, tmp_path):
+        checkpoint = Checkpoint(str(tmp_path / "cp.json"), "src", "col")
+        checkpoint.mark_done(4, 4)
+        assert checkpoint.records_done == 0
+        checkpoint.mark_done(0, 4)
+        assert checkpoint.records_done == 8
+        assert Checkpoint(str(tmp_path / "cp.json"), "src", "col").records_done == 8
+        assert Checkpoint(str(tmp_path / "cp.json"), "other", "col").records_done == 0
+
+    def test_ingest_and_resume_are_idempotent(self, tmp_path, monkeypatch):
+        invalidated = []
+        monkeypatch.setattr(ingest_module, "invalidate_collection", invalidated.append)
+        source = str(tmp_path / "tweets.jsonl")
+        write_jsonl(source, 25)
+        client = QdrantClient(":memory:")
+        checkpoint_path = str(tmp_path / "cp.json")
+        kwargs = dict(collection_name="tweets", encode_workers=0, chunk_size=10, upsert_batch_size=4,
+                      checkpoint_path=checkpoint_path, model=make_model())
+
+        report = ingest(source, client, limit=15, **kwargs)
+        assert report["checkpoint_records_done"] == 15
+        assert report["upsert"]["records"] == 15
+        assert invalidated == ["tweets"]
+
+        report = ingest(source, client, **kwargs)
+        assert report["upsert"]["records"] == 10
+        assert client.count("tweets", exact=True).count == 25
+
+        ingest(source, client, **dict(kwargs, checkpoint_path=None))
+        assert client.count("tweets", exact=True).count == 25
+        point = client.retrieve("tweets", ids=[point_id_for("question 3", "answer 3")])[0]
+        assert point.payload == {"input": "question 3", "reply": "answer 3"}
@@ -0,0 +1,156 @@
+import asyncio
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from ai.retrieval import embeddings_helper, orchestrator
+from ai.retrieval.document_retrieval import (
+    reciprocal_rank_fusion,
+    search_similar_hybrid,
+    search_similar_hybrid_async,
+)
+from ai.retrieval.lexical_index import (
+    LexicalIndex,
+    build_lexical_index,
+    build_lexical_index_from_collection,
+    rebuild_lexical_index_from_collection,
+    tokenize,
+)
+from ai.retrieval.local_index import LocalIndexBackend, build_local_index
+
+PAYLOADS = [
+    {"input": "where is my order", "reply": "Please DM us your order number."},
+    {"input": "order #A-7731 never arrived", "reply": "Sorry! We are checking order #A-7731."},
+    {"input": "app crashes with ERR_503", "reply": "Try reinstalling the app."},
+    {"input": "how do I reset my password", "reply": "Use the forgot password link."},
+    {"input": "refund for my order please", "reply": "Refunds take 5 days."},
+]
+# Dense vectors that know nothing about order numbers: point 1 is far from every query
+VECTORS = np.array([
+    [1.0, 0.0, 0.0, 0.0],
+    [0.0, 0.0, 0.0, 1.0],
+    [0.0, 1.0, 0.0, 0.0],
+    [0.0, 0.0, 1.0, 0.0],
+    [0.9, 0.0, 0.1, 0.0],
+], dtype=np.float32)
+
+
+@pytest.fixture
+def lexical_index(tmp_path):
+    texts = [f"{p['input']} {p['reply']}" for p in PAYLOADS]
+    return build_lexical_index(str(tmp_path / "lexical"), list(range(len(PAYLOADS))), texts)
+
+
+@pytest.fixture
+def qdrant_client():
+    client = QdrantClient(":memory:")
+    client.create_collection("tweets", vectors_config=models.VectorParams(size=4, distance="Cosine"))
+    client.upsert("tweets", points=[
+        models.PointStruct(id=i, vector=VECTORS[i].tolist(), payload=PAYLOADS[i]) for i in range(len(PAYLOADS))
+    ])
+    return client
+
+
+def order_query_model():
+    model = MagicMock()
+    model.encode.return_value = np.array([[1.0, 0.0, 0.05, 0.0]], dtype=np.float32)
+    return model
+
+
+class TestLexicalIndex:
+    def test_tokenize_keeps_compound_tokens_and_parts(self):
+        assert tokenize("Order #A-7731, ERR_503!") == ["order", "a-7731", "a", "7731", "err_503", "err", "503"]
+
+    def test_exact_token_ranks_first(self, lexical_index):
+        ids, scores = lexical_index.search("status of a-7731", limit=3)
+        assert ids[0] == 1
+        assert scores == sorted(scores, reverse=True)
+
+    def test_reloads_memory_mapped(self, lexical_index):
+        reloaded = LexicalIndex(lexical_index.path)
+        assert isinstance(reloaded.postings_docs, np.memmap)
+        assert reloaded.search("ERR_503")[0] == [2]
+
+    def test_very_common_terms_are_skipped(self, lexical_index):
+        # "order" appears in 3 of 5 documents
+        assert lexical_index.search("order", max_doc_fraction=0.5) == ([], [])
+        assert len(lexical_index.search("order", max_doc_fraction=1.0)[0]) == 3
+
+    def test_unknown_terms_return_nothing(self, lexical_index):
+        assert lexical_index.search("zzz qqq") == ([], [])
+
+    def test_build_from_collection(self, qdrant_client, tmp_path):
+        index = build_lexical_index_from_collection(qdrant_client, "tweets", str(tmp_path / "from_collection"))
+        assert index.documents == len(PAYLOADS)
+        assert index.search("password")[0] == [3]
+
+    def test_rebuild_replaces_the_index(self, qdrant_client, lexical_index):
+        qdrant_client.delete("tweets", points_selector=models.PointIdsList(points=[1]))
+        rebuilt = rebuild_lexical_index_from_collection(qdrant_client, "tweets", lexical_index.path)
+        assert rebuilt.path == lexical_index.path and rebuilt.documents == len(PAYLOADS) - 1
+        assert 1 not in rebuilt.doc_ids and rebuilt.search("password")[0] == [3]
+
+
+class TestReciprocalRankFusion:
+    def test_items_in_both_lists_win(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+        assert [point_id for point_id, _ in fused] == ["c", "a", "b", "d"]  # b and d tie; b was seen first
+        assert fused[0][1] == pytest.approx(1 / 63 + 1 / 61)
+
+
+class TestHybridSearch:
+    def test_lexical_only_hit_is_fetched_and_scored(self, qdrant_client, lexical_index):
+        results, *_ = search_similar_hybrid(
+            qdrant_client, order_query_model(), "order #A-7731 never arrived", "tweets", lexical_index,
+            top_k=3, candidates=2
+        )
+        by_id = {r["id"]: r for r in results}
+        assert 1 in by_id  # not in the 2 dense candidates, found through BM25
+        assert by_id[1]["score"] == pytest.approx(0.0, abs=1e-6)
+        assert by_id[1]["lexical_score"] > 0
+        assert [r["fused_score"] for r in results] == sorted((r["fused_score"] for r in results), reverse=True)
+
+    def test_stale_lexical_hits_are_logged(self, qdrant_client, lexical_index, caplog):
+        qdrant_client.delete("tweets", points_selector=models.PointIdsList(points=[1]))
+        results, *_ = search_similar_hybrid(
+            qdrant_client, order_query_model(), "order #A-7731 never arrived", "tweets", lexical_index,
+            top_k=3, candidates=2
+        )
+        assert 1 not in [r["id"] for r in results]
+        assert "lexical index is stale" in caplog.text
+
+    def test_async_matches_sync(self, qdrant_client, lexical_index):
+        sync = search_similar_hybrid(qdrant_client, order_query_model(), "order #A-7731", "tweets", lexical_index,
+                                     top_k=3, candidates=2)
+        result = asyncio.run(search_similar_hybrid_async(
+            qdrant_client, order_query_model(), "order #A-7731", "tweets", lexical_index, top_k=3, candidates=2
+        ))
+        assert [r["id"] for r in result[0]] == [r["id"] for r in sync[0]]
+
+    def test_local_backend_retrieve(self, tmp_path, lexical_index):
+        build_local_index(str(tmp_path / "local" / "tweets"), list(range(len(PAYLOADS))), VECTORS, PAYLOADS)
+        backend = LocalIndexBackend(str(tmp_path / "local"))
+        results, *_ = search_similar_hybrid(
+            backend, order_query_model(), "order #A-7731", "tweets", lexical_index, top_k=3, candidates=2
+        )
+        assert 1 in [r["id"] for r in results]
+        assert backend.retrieve("tweets", [4, 99])[0].payload == PAYLOADS[4]
+
+
+class TestHybridOrchestrator:
+    def test_hybrid_mode_caps_top_k_and_falls_back_without_index(self, qdrant_client, lexical_index, monkeypatch):
+        monkeypatch.setattr(embeddings_helper, "retrieval_mode", "hybrid")
+        monkeypatch.setattr(embeddings_helper, "hybrid_top_k", 2)
+        monkeypatch.setattr(orchestrator, "get_lexical_index", lambda collection_name: lexical_index)
+        context, *_ = orchestrator.retrieve_releveant_context(
+            "order #A-7731", client=qdrant_client, model=order_query_model(), collection_name="tweets", top_k=20
+        )
+        assert len(context) == 2
+        assert "A-7731" in " ".join(c["document"]["question"] for c in context)
+
+        monkeypatch.setattr(orchestrator, "get_lexical_index", lambda collection_name: None)
+        context, *_ = orchestrator.retrieve_releveant_context(
+            "order #A-7731", client=qdrant_client, model=order_query_model(), collection_name="tweets", top_k=20
+        )
+        assert "A-7731" not in " ".join(c["document"]["question"] for c in context)
@@ -0,0 +1,77 @@
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from ai.generation import llm_cache, llm_usage
+from ai.generation.llm_cache import LLMResponseCache, make_llm_cache_key
+
+REQUEST = {"model": "gpt-4.1", "messages": [{"role": "user", "content": "summarise"}], "temperature": 0, "top_p": 1.0}
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    """Counts completions sent to a stand-in async client; the cache starts empty and enabled."""
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content=f"summary {len(calls)}", tool_calls=None, function_call=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(llm_usage, "get_async_llm_client", lambda provider, api_key=None: client)
+    monkeypatch.setattr(llm_cache, "llm_cache_enabled", True)
+    monkeypatch.setattr(llm_cache, "_llm_cache", LLMResponseCache())
+    return calls
+
+
+class TestLLMCache:
+    def test_key_covers_model_messages_tools_and_sampling(self):
+        assert make_llm_cache_key("openai", REQUEST) == make_llm_cache_key("openai", dict(reversed(REQUEST.items())))
+        for change in ({"model": "gpt-4.1-mini"}, {"temperature": 0.7}, {"tools": [{"type": "function"}]},
+                       {"messages": [{"role": "user", "content": "other"}]}):
+            assert make_llm_cache_key("openai", dict(REQUEST, **change)) != make_llm_cache_key("openai", REQUEST)
+        assert make_llm_cache_key("groq", REQUEST) != make_llm_cache_key("openai", REQUEST)
+
+    def test_memory_tier_lru_and_ttl(self):
+        cache = LLMResponseCache(max_size=2)
+        for key in ("a", "b"):
+            cache.put(key, {"type": "message", "content": key, "raw": object()})
+        assert cache.get("a") == {"type": "message", "content": "a", "cached": True}
+        cache.put("c", {"type": "message", "content": "c"})
+        assert cache.get("b") is None
+        expired = LLMResponseCache(ttl_seconds=-1)
+        expired.put("a", {"content": "a"})
+        assert expired.get("a") is None
+        stats = cache.stats()
+        assert stats["memory_hits"] == 1 and stats["misses"] == 1 and stats["memory_size"] == 2
+        assert stats["mean_hit_us"] > 0
+
+    def test_sqlite_tier_survives_restarts_and_is_bounded(self, tmp_path):
+        path = str(tmp_path / "llm_cache.sqlite")
+        writer = LLMResponseCache(persistent_path=path, max_entries=3)
+        for i in range(5):
+            writer.put(f"key-{i}", {"type": "message", "content": str(i)})
+        reader = LLMResponseCache(persistent_path=path)
+        assert reader.get("key-4") == {"type": "message", "content": "4", "cached": True}
+        assert reader.stats()["persistent_hits"] == 1
+        assert sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        writer._persistent.prune()
+        assert writer._persistent.count() == 3 and reader.get("key-0") is None
+
+    def test_temperature_zero_calls_are_served_from_the_cache(self, completions):
+        first = llm_usage.generate_response_from_llm("openai", prompt="summarise", model="gpt-4.1", temperature=0)
+        second = llm_usage.generate_response_from_llm("openai", prompt="summarise", model="gpt-4.1", temperature=0)
+        assert len(completions) == 1
+        assert first["content"] == second["content"] == "summary 1"
+        assert "raw" in first and "raw" not in second and second["cached"] is True
+
+    def test_sampled_calls_bypass_unless_forced(self, completions):
+        for _ in range(2):
+            llm_usage.generate_response_from_llm("openai", prompt="answer", temperature=0.7)
+        assert len(completions) == 2 and llm_cache.get_llm_cache_stats()["bypassed"] == 2
+        for _ in range(2):
+            llm_usage.generate_response_from_llm("openai", prompt="answer", temperature=0.7, use_cache=True)
+        llm_usage.generate_response_from_llm("openai", prompt="summarise", temperature=0, use_cache=False)
+        assert len(completions) == 4
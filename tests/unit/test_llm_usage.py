@@ -0,0 +1,168 @@
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from ai.event_loop import run_sync
+from ai.generation import llm_usage
+from ai.generation.query_response_generation import handle_llm_response
+
+ARGUMENTS = json.dumps({"response": "Reset it in Settings.", "reasoning": "The QnA covers it."})
+
+
+def completion(content=None, tool_calls=None):
+    message = SimpleNamespace(content=content, tool_calls=tool_calls, function_call=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def tool_call(arguments=ARGUMENTS):
+    return SimpleNamespace(id="call_1", function=SimpleNamespace(name="generate_response_and_reasoning",
+                                                                 arguments=arguments))
+
+
+def content_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))])
+
+
+def run_in_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Client stand-in recording the peak number of completions and streams in flight."""
+    state = {"in_flight": 0, "peak": 0, "kwargs": []}
+    lock = threading.Lock()
+
+    def enter():
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+
+    def leave():
+        with lock:
+            state["in_flight"] -= 1
+
+    def stream():
+        enter()
+        try:
+            for text in ("Reset ", "it."):
+                time.sleep(0.01)
+                yield content_chunk(text)
+        finally:
+            leave()
+
+    def create_stream(**kwargs):
+        state["kwargs"].append(kwargs)
+        return stream()
+
+    async def create(**kwargs):
+        state["kwargs"].append(kwargs)
+        enter()
+        await asyncio.sleep(0.02)
+        leave()
+        return completion(tool_calls=[tool_call()])
+
+    def client(create):
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    monkeypatch.setattr(llm_usage, "get_llm_client", lambda provider, api_key=None: client(create_stream))
+    monkeypatch.setattr(llm_usage, "get_async_llm_client", lambda provider, api_key=None: client(create))
+    monkeypatch.setattr(llm_usage, "_LLM_LIMITS", {})
+    monkeypatch.setattr(llm_usage, "_llm_stats", llm_usage.LLMStatsTracker())
+    return state
+
+
+class TestLLMLayer:
+    def test_tool_calls_are_normalised(self, fake_llm):
+        response = asyncio.run(llm_usage.agenerate_response_from_llm("openai", prompt="p", model="gpt-4.1",
+                                                                     tools=[{"x": 1}]))
+        assert fake_llm["kwargs"][0]["messages"] == [{"role": "user", "content": "p"}]
+        assert fake_llm["kwargs"][0]["tools"] == [{"x": 1}]
+        assert response["type"] == "message" and response["content"] == ""
+        assert response["tool_calls"] == [{"id": "call_1", "name": "generate_response_and_reasoning",
+                                           "arguments": ARGUMENTS}]
+        assert handle_llm_response(response) == ("Reset it in Settings.", "The QnA covers it.")
+
+    def test_completions_and_streams_share_the_provider_limit(self, fake_llm, monkeypatch):
+        monkeypatch.setenv("LLM_MAX_CONCURRENCY_OPENAI", "3")
+
+        async def burst():
+            await asyncio.gather(*(llm_usage.agenerate_response_from_llm("openai", prompt=str(i)) for i in range(4)))
+
+        completions = [lambda i=i: llm_usage.generate_response_from_llm("openai", prompt=str(i)) for i in range(4)]
+        streams = [lambda i=i: list(llm_usage.stream_response_from_llm("openai", prompt=str(i))) for i in range(4)]
+        run_in_threads(completions + streams + [lambda: asyncio.run(burst())])
+        assert fake_llm["peak"] == 3
+        stats = llm_usage.get_llm_stats()["openai"]
+        assert stats["calls"] == 12 and stats["errors"] == 0
+        assert stats["in_flight"] == 0 and stats["waiting"] == 0 and stats["max_concurrency"] == 3
+
+    def test_cancelled_waiter_does_not_keep_a_slot(self):
+        limit = llm_usage.ConcurrencyLimit(1)
+
+        async def cancel_a_waiter():
+            await limit.aacquire()
+            waiter = asyncio.ensure_future(limit.aacquire())
+            await asyncio.sleep(0)
+            limit.release()  # handed to the waiter...
+            waiter.cancel()  # ...which is cancelled before it runs
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            await asyncio.wait_for(limit.aacquire(), timeout=1)
+            limit.release()
+
+        asyncio.run(cancel_a_waiter())
+        limit.acquire()  # a thread gets the free slot without waiting
+        limit.release()
+
+    def test_sync_wrapper_runs_on_the_shared_loop(self, fake_llm):
+        assert llm_usage.generate_response_from_llm("openai", prompt="p")["tool_calls"][0]["id"] == "call_1"
+
+        async def from_async_code():
+            # Blocks only this loop's thread; the call itself runs on the shared loop
+            return llm_usage.generate_response_from_llm("openai", prompt="p")
+
+        assert asyncio.run(from_async_code())["tool_calls"][0]["name"] == "generate_response_and_reasoning"
+
+        async def on_the_shared_loop():
+            return llm_usage.generate_response_from_llm("openai", prompt="p")
+
+        with pytest.raises(RuntimeError, match="shared event loop"):
+            run_sync(on_the_shared_loop())
+
+    def test_streams_are_counted_and_release_their_slot(self, fake_llm):
+        deltas = list(llm_usage.stream_response_from_llm("openai", prompt="p"))
+        assert [d["delta"] for d in deltas] == ["Reset ", "it."]
+        stream = llm_usage.stream_response_from_llm("openai", prompt="p")
+        next(stream)
+        assert llm_usage.get_llm_stats()["openai"]["in_flight"] == 1
+        stream.close()  # the consumer went away
+        stats = llm_usage.get_llm_stats()["openai"]
+        assert stats["calls"] == 2 and stats["errors"] == 0 and stats["in_flight"] == 0
+        assert stats["mean_call_ms"] > 0
+
+    def test_clients_are_pooled_per_loop_with_timeouts(self, monkeypatch):
+        monkeypatch.setattr(llm_usage, "llm_connect_timeout", 2.0)
+        monkeypatch.setattr(llm_usage, "_LLM_CLIENTS", {})
+
+        async def clients():
+            return llm_usage.get_async_llm_client("openai", "key"), llm_usage.get_async_llm_client("OpenAI", "key")
+
+        first, second = asyncio.run(clients())
+        assert first is second
+        assert first.timeout == httpx.Timeout(llm_usage.llm_read_timeout, connect=2.0)
+        assert asyncio.run(clients())[0] is not first
+        client = llm_usage.get_llm_client("openai", "key")
+        assert llm_usage.get_llm_client("OpenAI", "key") is client
+        assert llm_usage.get_llm_client("openai", "other key") is not client
+        with pytest.raises(ValueError, match="Unsupported provider"):
+            llm_usage.get_llm_client("other", "key")
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from ai.retrieval.document_retrieval import search_similar
+from ai.retrieval.local_index import (
+    LocalIndexBackend,
+    build_local_index,
+    export_collection_to_local_index,
+)
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(42)
+    vectors = rng.normal(size=(500, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    payloads = [{"input": f"question {i}", "reply": f"answer {i}"} for i in range(500)]
+    return list(range(500)), vectors, payloads
+
+
+def exact_top_k(vectors, query, k):
+    scores = vectors @ (query / np.linalg.norm(query))
+    return list(np.argsort(-scores)[:k])
+
+
+class TestLocalVectorIndex:
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_exact_search_matches_brute_force(self, tmp_path, corpus, dtype):
+        ids, vectors, payloads = corpus
+        index = build_local_index(str(tmp_path / "idx"), ids, vectors, payloads, dtype=dtype)
+        index.block_rows = 64  # force several blocks
+        query = vectors[7] + 0.05
+        rows, scores = index.search_vectors(query[None, :], limit=10)
+        expected = exact_top_k(vectors, query, 10)
+        assert len(set(rows[0]) & set(expected)) >= 9
+        assert rows[0][0] == expected[0]
+        assert np.all(np.diff(scores[0]) <= 1e-6)
+
+    def test_ivf_with_all_lists_probed_is_exact(self, tmp_path, corpus):
+        ids, vectors, payloads = corpus
+        index = build_local_index(str(tmp_path / "idx"), ids, vectors, payloads, nlist=8)
+        assert index.has_ivf
+        rows, _ = index.search_vectors(vectors[3:4], limit=5, nprobe=8)
+        exact_rows, _ = index.search_vectors(vectors[3:4], limit=5, exact=True)
+        assert list(rows[0]) == list(exact_rows[0])
+
+    def test_vectors_and_consistency_check(self, tmp_path, corpus):
+        ids, vectors, payloads = corpus
+        index = build_local_index(str(tmp_path / "idx"), ids, vectors, payloads, dtype="int8")
+        np.testing.assert_allclose(index.vectors(np.array([3, 9])), vectors[[3, 9]], atol=0.02)
+        assert index.consistency_problems() == []
+        with open(tmp_path / "idx" / "payloads.jsonl", "ab") as f:
+            f.write(b"{}\n")
+        assert index.consistency_problems() == ["payload offsets do not match the payload file"]
+
+
+class TestLocalIndexBackend:
+    def test_search_returns_qdrant_result_shape(self, tmp_path, corpus):
+        ids, vectors, payloads = corpus
+        build_local_index(str(tmp_path / "tweets"), ids, vectors, payloads)
+        backend = LocalIndexBackend(str(tmp_path))
+        model = MagicMock()
+        model.encode.return_value = vectors[10:11]
+
+        results, mean_inter, median_inter, mean_query, median_query = search_similar(
+            backend, model, "question 10", "tweets", top_k=5
+        )
+
+        assert results[0]["id"] == 10
+        assert results[0]["input"] == "question 10"
+        assert results[0]["score"] == pytest.approx(1.0, abs=1e-2)
+        assert mean_inter is not None
+
+    def test_search_batch_matches_single_search(self, tmp_path, corpus):
+        ids, vectors, payloads = corpus
+        build_local_index(str(tmp_path / "tweets"), ids, vectors, payloads)
+        backend = LocalIndexBackend(str(tmp_path))
+        requests = [models.SearchRequest(vector=vectors[i].tolist(), limit=3, with_payload=True) for i in (1, 2)]
+        batch = backend.search_batch("tweets", requests)
+        assert [h.id for h in batch[1]] == [h.id for h in backend.search("tweets", vectors[2].tolist(), limit=3)]
+
+    def test_export_from_qdrant_round_trip(self, tmp_path, corpus):
+        ids, vectors, payloads = corpus
+        client = QdrantClient(":memory:")
+        client.create_collection("tweets", vectors_config=models.VectorParams(size=16, distance="Cosine"))
+        client.upsert("tweets", points=[
+            models.PointStruct(id=i, vector=v.tolist(), payload=p) for i, v, p in zip(ids, vectors, payloads)
+        ])
+        export_collection_to_local_index(client, "tweets", str(tmp_path / "tweets"), scroll_limit=128)
+        backend = LocalIndexBackend(str(tmp_path))
+        local_hits = backend.search("tweets", vectors[5].tolist(), limit=5)
+        qdrant_hits = client.search("tweets", query_vector=vectors[5].tolist(), limit=5)
+        assert [h.id for h in local_hits] == [h.id for h in qdrant_hits]
+        assert backend.count("tweets").count == 500
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+import ai.retrieval.embeddings_helper as vdbc
+import ai.retrieval.onnx_embedding as onnx_embedding
+import backend.api as api
+from ai.retrieval.onnx_embedding import embedding_drift_report, load_onnx_embedder
+
+
+class TestEmbeddingDriftReport:
+    def test_identical_engines_agree(self):
+        vectors = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        model = MagicMock()
+        model.encode.return_value = vectors
+        corpus = np.eye(3)
+        report = embedding_drift_report(model, model, ["a", "b"], corpus_vectors=corpus, k=1)
+        assert report["mean_cosine"] == pytest.approx(1.0)
+        assert report["recall_at_1"] == pytest.approx(1.0)
+
+    def test_drift_lowers_recall(self):
+        reference = MagicMock()
+        reference.encode.return_value = np.array([[1.0, 0.0, 0.0]])
+        candidate = MagicMock()
+        candidate.encode.return_value = np.array([[0.0, 1.0, 0.0]])
+        report = embedding_drift_report(reference, candidate, ["a"], corpus_vectors=np.eye(3), k=1)
+        assert report["min_cosine"] == pytest.approx(0.0)
+        assert report["recall_at_1"] == pytest.approx(0.0)
+
+
+class TestEmbeddingEngineSelection:
+    def test_onnx_engine_is_loaded_from_configuration(self, monkeypatch):
+        monkeypatch.setattr(vdbc, "_cached_model", None)
+        monkeypatch.setattr(vdbc, "_cached_model_name", None)
+        monkeypatch.setattr(vdbc, "embedding_engine", "onnx-int8")
+        monkeypatch.setattr(vdbc, "embedding_onnx_dir", "/models")
+        with patch("ai.retrieval.embeddings_helper.load_onnx_embedder") as mock_loader, \
+             patch("ai.retrieval.embeddings_helper.SentenceTransformer") as mock_st:
+            mock_loader.return_value = "onnx_model"
+            assert vdbc.get_sentence_transformer("BAAI/bge-large-en-v1.5") == "onnx_model"
+            mock_loader.assert_called_once_with(
+                "BAAI/bge-large-en-v1.5", "/models/BAAI__bge-large-en-v1.5", quantized=True
+            )
+            mock_st.assert_not_called()
+        assert vdbc._cached_model_name == "BAAI/bge-large-en-v1.5:onnx-int8"
+
+    def test_missing_export_is_an_error_naming_the_export_step(self, tmp_path):
+        with patch.object(onnx_embedding, "export_quantized_onnx") as mock_export:
+            with pytest.raises(FileNotFoundError, match="python -m ai.retrieval.onnx_embedding --model m"):
+                load_onnx_embedder("m", str(tmp_path / "m"))
+            mock_export.assert_not_called()
+
+    def test_backend_refuses_to_start_without_the_export(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(vdbc, "_cached_model", None)
+        monkeypatch.setattr(vdbc, "embedding_engine", "onnx-int8")
+        monkeypatch.setattr(vdbc, "embedding_onnx_dir", str(tmp_path))
+        with pytest.raises(FileNotFoundError, match="Export it offline"):
+            with TestClient(api.app):
+                pass
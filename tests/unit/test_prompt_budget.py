@@ -0,0 +1,78 @@
+import sys
+
+import pytest
+
+from ai.generation import prompt_budget, token_counting
+from ai.generation.query_response_generation import build_generation_prompt, get_prompt_for_generation
+from ai.generation.summarized_query_generation import get_prompt_for_query_summarization
+from ai.generation.token_counting import count_tokens, get_encoding
+
+
+@pytest.fixture(autouse=True)
+def character_tokens(monkeypatch):
+    """~4 characters per token, so budgets do not depend on tiktoken being installed."""
+    monkeypatch.setattr(token_counting, "get_encoding", lambda: None)
+
+
+def conversation(turns, words=100):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "word " * words}
+            for i in range(turns)]
+
+
+def qna(i, answer_words=20):
+    return {"question": f"question {i}", "answer": f"answer {i} " + "step " * answer_words}
+
+
+class TestPromptBudget:
+    def test_small_prompts_are_unchanged(self):
+        history = [{"role": "user", "content": "refund?"}]
+        prompt, report = build_generation_prompt(history, [qna(0)], "refund please")
+        assert "Question: question 0 | Answer: answer 0" in prompt and "User: refund?" in prompt
+        assert prompt == get_prompt_for_generation(history, [qna(0)], "refund please")
+        assert all(section["dropped"] == 0 for section in report["sections"].values())
+
+    def test_budget_is_enforced_and_reported_per_section(self):
+        documents = [qna(i, answer_words=400) for i in range(20)]
+        prompt, report = build_generation_prompt(conversation(40), documents, "where is my order", True, budget=3000)
+        sections = report["sections"]
+        assert report["prompt_tokens"] == count_tokens(prompt) <= 3000
+        assert "Also, provide a step-by-step explanation" in prompt and "where is my order" in prompt
+        assert sections["documents"]["truncated"] > 0 and sections["documents"]["omitted"] > 0
+        assert sections["history"]["omitted"] > 0 and sections["history"]["dropped"] > 0
+        for name, section in sections.items():
+            assert section["used"] + section["dropped"] > 0, name
+
+    def test_documents_are_kept_best_first_and_history_most_recent_first(self):
+        lines, report = prompt_budget.fit_documents([qna(0), qna(1, answer_words=2000), qna(2)], budget=150,
+                                                    max_document_tokens=100, min_document_tokens=20)
+        assert lines[0].startswith("- Question: question 0") and lines[1].endswith(" …")
+        assert report["kept"] == 2 and report["truncated"] == 1 and report["omitted"] == 1
+
+        history = conversation(10)
+        lines, report = prompt_budget.fit_history(history, budget=300)
+        assert lines[-1].startswith("Assistant: message 9") and report["omitted"] == 10 - len(lines)
+        lines, _ = prompt_budget.fit_history([{"role": "user", "content": "word " * 1000}], budget=50)
+        assert len(lines) == 1 and count_tokens(lines[0]) <= 50
+
+    def test_unused_share_goes_to_the_other_section(self):
+        assert prompt_budget.allocate_budget(1000, 100, [], conversation(40)) == (0, 900)
+        documents_budget, history_budget = prompt_budget.allocate_budget(1000, 100, [qna(0)], conversation(1, words=5))
+        assert history_budget == prompt_budget.line_tokens(prompt_budget.history_lines(conversation(1, words=5))[0])
+        assert documents_budget == 900 - history_budget
+
+    def test_summarisation_prompt_keeps_the_latest_messages(self):
+        history = conversation(40)
+        prompt = get_prompt_for_query_summarization(history, budget=800)
+        assert count_tokens(prompt) <= 800
+        assert "message 39" in prompt and "message 0 " not in prompt
+        assert prompt.endswith("Summarize the user's latest query as crisp and detailed .")
+        stats = prompt_budget.get_prompt_budget_stats()["summarisation"]
+        assert stats["trimmed_prompts"] >= 1 and stats["sections"]["history"]["mean_dropped"] > 0
+
+    def test_missing_tiktoken_is_logged_once(self, monkeypatch, caplog):
+        monkeypatch.setitem(sys.modules, "tiktoken", None)
+        monkeypatch.setattr(token_counting, "_cached_encoding", None)
+        monkeypatch.setattr(token_counting, "_encoding_unavailable", False)
+        assert get_encoding() is None and get_encoding() is None
+        warnings = [record for record in caplog.records if "~4 characters" in record.getMessage()]
+        assert len(warnings) == 1 and warnings[0].levelname == "WARNING"
@@ -0,0 +1,141 @@
+import time
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from ai.conversational import orchestrator
+from ai.conversational.orchestrator import process_chat_history
+from ai.generation import token_counting
+from ai.retrieval import rerank as rerank_module
+from ai.retrieval.rerank import RerankStats, candidate_text, rerank
+
+
+def make_candidates(n):
+    return [
+        {"score": 1.0 - i / 100, "centrality": None, "document": {"question": f"q{i}", "answer": f"a{i}"}}
+        for i in range(n)
+    ]
+
+
+def scoring_model(delay_s=0.0):
+    """Scores a pair by the number in its text, so later candidates rank first."""
+    model = MagicMock()
+
+    def predict(pairs, batch_size=16, show_progress_bar=False):
+        time.sleep(delay_s)
+        return np.array([float(text.split()[0][1:]) for _, text in pairs])
+
+    model.predict.side_effect = predict
+    return model
+
+
+class TestRerank:
+    def test_reorders_by_cross_encoder_and_keeps_top_k(self):
+        model = scoring_model()
+        kept, info = rerank("query", make_candidates(10), model, top_k=3, batch_size=4)
+        assert [c["document"]["question"] for c in kept] == ["q9", "q8", "q7"]
+        assert kept[0]["rerank_score"] == 9.0
+        assert model.predict.call_count == 3  # batches of 4, 4 and 2
+        assert info["timed_out"] is False
+        assert info["candidates"] == 10 and info["kept"] == 3
+
+    def test_budget_exceeded_keeps_dense_order(self):
+        model = scoring_model(delay_s=0.05)
+        start = time.perf_counter()
+        kept, info = rerank("query", make_candidates(10), model, top_k=3, budget_ms=10, batch_size=2)
+        assert time.perf_counter() - start < 0.05
+        assert info["timed_out"] is True
+        assert [c["document"]["question"] for c in kept] == ["q0", "q1", "q2"]
+        assert "rerank_score" not in kept[0]
+        time.sleep(0.1)
+        # The abandoned scoring stops at the next batch instead of scoring all five
+        assert model.predict.call_count < 5
+
+    def test_budget_met_reranks(self):
+        kept, info = rerank("query", make_candidates(5), scoring_model(), top_k=2, budget_ms=1000)
+        assert info["timed_out"] is False
+        assert [c["document"]["question"] for c in kept] == ["q4", "q3"]
+
+    def test_empty_candidates_and_invalid_top_k(self):
+        model = scoring_model()
+        kept, info = rerank("query", [], model, top_k=3, budget_ms=100)
+        assert kept == [] and info["timed_out"] is False
+        model.predict.assert_not_called()
+        with pytest.raises(ValueError):
+            rerank("query", make_candidates(2), model, top_k=0)
+
+    def test_candidate_text_joins_question_and_answer(self):
+        assert candidate_text({"document": {"question": "Where is it?", "answer": "On its way."}}) \
+            == "Where is it? On its way."
+        assert candidate_text({"document": "plain text"}) == "plain text"
+
+    def test_stats_relate_time_to_tokens_saved(self):
+        stats = RerankStats()
+        stats.record(rerank_ms=20.0, timed_out=False, prompt_tokens_saved=400)
+        stats.record(rerank_ms=30.0, timed_out=True, prompt_tokens_saved=100)
+        summary = stats.stats()
+        assert summary["requests"] == 2 and summary["timeouts"] == 1
+        assert summary["mean_rerank_ms"] == pytest.approx(25.0)
+        assert summary["prompt_tokens_saved"] == 500
+        assert summary["prompt_tokens_saved_per_rerank_ms"] == pytest.approx(10.0)
+
+
+class TestTokenCounting:
+    def test_heuristic_without_tiktoken(self, monkeypatch):
+        monkeypatch.setattr(token_counting, "get_encoding", lambda: None)
+        assert token_counting.count_tokens("abcdefgh") == 2
+        assert token_counting.count_tokens("") == 0
+        assert token_counting.count_document_tokens(["abc", "abcdef"]) == 2 + 2
+
+    def test_uses_encoding_when_available(self, monkeypatch):
+        encoding = MagicMock()
+        encoding.encode.side_effect = lambda text: text.split()
+        monkeypatch.setattr(token_counting, "get_encoding", lambda: encoding)
+        assert token_counting.count_tokens("one two three") == 3
+
+
+class TestRerankInChatProcessing:
+    def test_rerank_shrinks_generation_context(self, monkeypatch):
+        monkeypatch.setattr(rerank_module, "rerank_enabled", True)
+        monkeypatch.setattr(rerank_module, "rerank_top_k", 2)
+        monkeypatch.setattr(rerank_module, "rerank_budget_ms", 1000.0)
+        monkeypatch.setattr(rerank_module, "get_cross_encoder", lambda: scoring_model())
+        monkeypatch.setattr(rerank_module, "_rerank_stats", RerankStats())
+        monkeypatch.setattr(orchestrator, "summarise_query_from_chat_history", lambda chat_history: "where is my order")
+        monkeypatch.setattr(
+            orchestrator, "retrieve_releveant_context",
+            lambda query, top_k=5: (make_candidates(6), 0.1, 0.1, 0.5, 0.5)
+        )
+        generated = {}
+
+        def generate_response(chat_history, relevant_documents, summarised_query, enable_reasoning):
+            generated["documents"] = relevant_documents
+            return {"answer": "It ships today.", "reasoning": ""}
+
+        monkeypatch.setattr(orchestrator, "generate_response", generate_response)
+
+        response = process_chat_history([{"role": "user", "content": "where is my order"}])
+
+        assert generated["documents"] == [{"question": "q5", "answer": "a5"}, {"question": "q4", "answer": "a4"}]
+        evaluations = response["evaluations"]
+        assert evaluations["documents_before_rerank"] == 6 and evaluations["documents_after_rerank"] == 2
+        assert evaluations["prompt_tokens_saved"] > 0
+        assert evaluations["rerank_timed_out"] is False
+        assert rerank_module.get_rerank_stats()["requests"] == 1
+
+    def test_rerank_failure_keeps_retrieved_context(self, monkeypatch):
+        monkeypatch.setattr(rerank_module, "rerank_enabled", True)
+        monkeypatch.setattr(rerank_module, "_rerank_stats", RerankStats())
+
+        def missing_model():
+            raise ImportError("sentence-transformers is required for reranking.")
+
+        monkeypatch.setattr(rerank_module, "get_cross_encoder", missing_model)
+        context = make_candidates(3)
+        kept, evaluations = orchestrator.rerank_relevant_context("query", context)
+        assert kept is context and evaluations is None
+        assert rerank_module.get_rerank_stats()["errors"] == 1
+
+    def test_disabled_by_default(self):
+        context = make_candidates(3)
+        assert orchestrator.rerank_relevant_context("query", context) == (context, None)
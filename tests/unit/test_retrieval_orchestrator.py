@@ -0,0 +1,85 @@
+import asyncio
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models
+from ai.retrieval.local_index import LocalIndexBackend, build_local_index
+from ai.retrieval.orchestrator import (
+    aretrieve_releveant_context,
+    retrieve_relevant_context_batch,
+    retrieve_releveant_context,
+)
+
+
+VECTORS = np.eye(4, dtype=np.float32) + 0.1
+
+
+def make_model():
+    model = MagicMock()
+    model.encode.return_value = VECTORS[:1]
+    return model
+
+
+def make_points():
+    return [
+        models.PointStruct(id=i, vector=VECTORS[i].tolist(), payload={"input": f"q{i}", "reply": f"a{i}"})
+        for i in range(4)
+    ]
+
+
+class TestAsyncRetrieval:
+    def test_async_matches_sync(self):
+        sync_client = QdrantClient(":memory:")
+        sync_client.create_collection("tweets", vectors_config=models.VectorParams(size=4, distance="Cosine"))
+        sync_client.upsert("tweets", points=make_points())
+
+        async def run():
+            client = AsyncQdrantClient(":memory:")
+            await client.create_collection("tweets", vectors_config=models.VectorParams(size=4, distance="Cosine"))
+            await client.upsert("tweets", points=make_points())
+            return await aretrieve_releveant_context(
+                "q0", client=client, model=make_model(), collection_name="tweets", top_k=3
+            )
+
+        async_result = asyncio.run(run())
+        sync_result = retrieve_releveant_context(
+            "q0", client=sync_client, model=make_model(), collection_name="tweets", top_k=3
+        )
+        assert [c["document"] for c in async_result[0]] == [c["document"] for c in sync_result[0]]
+        assert async_result[0][0]["document"]["question"] == "q0"
+        assert async_result[1] == pytest.approx(sync_result[1])
+
+    def test_sync_backend_is_searched_off_the_loop(self):
+        client = QdrantClient(":memory:")
+        client.create_collection("tweets", vectors_config=models.VectorParams(size=4, distance="Cosine"))
+        client.upsert("tweets", points=make_points())
+
+        relevant_context, *_ = asyncio.run(aretrieve_releveant_context(
+            "q0", client=client, model=make_model(), collection_name="tweets", top_k=2
+        ))
+        assert relevant_context[0]["document"]["answer"] == "a0"
+
+
+class TestBatchRetrieval:
+    @pytest.mark.parametrize("backend", ["qdrant", "local"])
+    def test_batch_matches_single_queries(self, backend, tmp_path):
+        if backend == "qdrant":
+            client = QdrantClient(":memory:")
+            client.create_collection("tweets", vectors_config=models.VectorParams(size=4, distance="Cosine"))
+            client.upsert("tweets", points=make_points())
+        else:
+            build_local_index(str(tmp_path / "tweets"), list(range(4)), VECTORS,
+                              [{"input": f"q{i}", "reply": f"a{i}"} for i in range(4)], dtype="float16")
+            client = LocalIndexBackend(str(tmp_path))
+        model = MagicMock()
+        model.encode.side_effect = lambda texts: VECTORS[[int(t[-1]) for t in texts]]
+        queries = ["query 0", "query 2", "query 3"]
+
+        batch = retrieve_relevant_context_batch(queries, client=client, model=model, collection_name="tweets", top_k=3)
+        assert model.encode.call_count == 1
+        for query, batch_result in zip(queries, batch):
+            single = retrieve_releveant_context(query, client=client, model=model, collection_name="tweets", top_k=3)
+            assert batch_result[0] == single[0]
+            assert batch_result[1:] == pytest.approx(single[1:])
+        assert batch[1][0][0]["document"]["question"] == "q2"
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+from benchmarks.retrieval_suite import find_regressions, ranking_metrics, sampled_corpus
+
+
+def report(**rows):
+    return {"retrieval": [{"config": name, **metrics} for name, metrics in rows.items()]}
+
+
+class TestRetrievalSuite:
+    def test_ranking_metrics(self):
+        metrics = ranking_metrics([[3, 1, 2], [5, 6], [9]], [1, 5, 4], ks=[1, 2])
+        assert metrics["recall@1"] == pytest.approx(1 / 3)
+        assert metrics["recall@2"] == pytest.approx(2 / 3)
+        assert metrics["mrr"] == pytest.approx((0.5 + 1.0 + 0.0) / 3)
+
+    def test_quality_drop_beyond_tolerance_is_a_regression(self):
+        baseline = report(dense={"recall@5": 0.90, "mrr": 0.70, "p95_ms": 4.0})
+        assert find_regressions(report(dense={"recall@5": 0.89, "mrr": 0.70, "p95_ms": 9.0}), baseline) == []
+        regressions = find_regressions(report(dense={"recall@5": 0.85, "mrr": 0.70, "p95_ms": 4.0}), baseline)
+        assert regressions == ["dense: recall@5 0.9000 -> 0.8500"]
+
+    def test_latency_checked_only_with_tolerance(self):
+        baseline = report(dense={"mrr": 0.7, "p95_ms": 4.0})
+        current = report(dense={"mrr": 0.7, "p95_ms": 6.0}, hybrid={"mrr": 0.1, "p95_ms": 50.0})
+        assert find_regressions(current, baseline) == []
+        assert find_regressions(current, baseline, latency_tolerance=0.25) == ["dense: p95_ms 4.00 -> 6.00"]
+
+    def test_sampled_corpus_queries_point_at_their_document(self, tmp_path):
+        path = tmp_path / "corpus.jsonl"
+        path.write_text("\n".join(json.dumps({"input": f"my order {i} never arrived at all", "reply": f"r{i}"})
+                                  for i in range(10)))
+        documents, queries = sampled_corpus(str(path), 5)
+        assert len(documents) == 5 and len(queries) == 5
+        for query, relevant in queries:
+            assert set(query.split()) <= set(documents[relevant]["input"].split())
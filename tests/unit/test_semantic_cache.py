@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from ai.conversational import semantic_cache
+from ai.retrieval import embeddings_helper
+from ai.conversational.orchestrator import process_chat_history
+from ai.conversational.semantic_cache import SemanticResponseCache
+
+
+class TestSemanticResponseCache:
+    def test_hit_above_threshold_only(self):
+        cache = SemanticResponseCache(threshold=0.9)
+        cache.store([1.0, 0.0], {"answer": "Reset it from settings."}, has_reasoning=True, latency_seconds=2.0)
+        response, similarity = cache.lookup([1.0, 0.1])
+        assert response["answer"] == "Reset it from settings."
+        assert similarity > 0.9
+        assert cache.lookup([0.0, 1.0]) is None
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["latency_saved_seconds"] == pytest.approx(2.0)
+
+    def test_entry_without_reasoning_does_not_serve_reasoning_request(self):
+        cache = SemanticResponseCache(threshold=0.9)
+        cache.store([1.0, 0.0], {"answer": "a"}, has_reasoning=False)
+        assert cache.lookup([1.0, 0.0], enable_reasoning=True) is None
+        assert cache.lookup([1.0, 0.0], enable_reasoning=False) is not None
+
+    def test_ttl_and_size_eviction(self):
+        cache = SemanticResponseCache(threshold=0.9, ttl_seconds=0.0)
+        cache.store([1.0, 0.0], {"answer": "a"}, has_reasoning=True)
+        assert cache.lookup([1.0, 0.0]) is None
+        cache = SemanticResponseCache(threshold=0.9, max_entries=1)
+        cache.store([1.0, 0.0], {"answer": "a"}, has_reasoning=True)
+        cache.store([0.0, 1.0], {"answer": "b"}, has_reasoning=True)
+        assert cache.lookup([1.0, 0.0]) is None
+        assert cache.stats()["entries"] == 1
+
+    def test_collection_change_invalidates(self):
+        cache = SemanticResponseCache(threshold=0.9, collection_check_seconds=0.0)
+        cache.check_collection(lambda: 100)
+        cache.store([1.0, 0.0], {"answer": "a"}, has_reasoning=True)
+        cache.check_collection(lambda: 100)
+        assert cache.lookup([1.0, 0.0]) is not None
+        cache.check_collection(lambda: 101)
+        assert cache.lookup([1.0, 0.0]) is None
+        assert cache.stats()["invalidations"] == 1
+
+    def test_write_paths_invalidate_the_served_collection(self, monkeypatch):
+        monkeypatch.setattr(semantic_cache, "_semantic_cache", None)
+        monkeypatch.setattr(embeddings_helper, "_collection_write_listeners", [])
+        cache = semantic_cache.get_semantic_cache()
+        cache.store([1.0, 0.0], {"answer": "a"}, has_reasoning=True)
+        embeddings_helper.invalidate_collection("another_collection")
+        assert cache.stats()["entries"] == 1
+        embeddings_helper.invalidate_collection(embeddings_helper.QDRANT_COLLECTION)
+        assert cache.stats()["entries"] == 0 and cache.stats()["invalidations"] == 1
+
+
+class TestProcessChatHistoryWithSemanticCache:
+    def test_second_paraphrase_skips_retrieval_and_generation(self, monkeypatch):
+        calls = {"retrieve": 0, "generate": 0}
+
+        def fake_retrieve(query, top_k=5):
+            calls["retrieve"] += 1
+            return [{"document": {"question": "q", "answer": "a"}}], 0.5, 0.5, 0.8, 0.8
+
+        def fake_generate(chat_history, relevant_documents, summarised_query, enable_reasoning):
+            calls["generate"] += 1
+            return {"answer": "Use the reset link.", "reasoning": "Docs say so."}
+
+        monkeypatch.setattr(semantic_cache, "semantic_cache_enabled", True)
+        monkeypatch.setattr(semantic_cache, "_semantic_cache", SemanticResponseCache(threshold=0.9))
+        monkeypatch.setattr('ai.conversational.orchestrator.summarise_query_from_chat_history', lambda chat_history: chat_history[-1]["content"])
+        monkeypatch.setattr('ai.conversational.orchestrator.retrieve_releveant_context', fake_retrieve)
+        monkeypatch.setattr('ai.conversational.orchestrator.generate_response', fake_generate)
+        monkeypatch.setattr('ai.conversational.orchestrator.get_collection_fingerprint', lambda: 1)
+        monkeypatch.setattr('ai.conversational.orchestrator.get_sentence_transformer', lambda: None)
+        monkeypatch.setattr(
+            'ai.conversational.orchestrator.encode_queries',
+            lambda model, queries: np.array([[1.0, 0.0]]) if "password" in queries[0] else np.array([[0.0, 1.0]])
+        )
+
+        first = process_chat_history([{"role": "user", "content": "reset my password"}], enable_reasoning=True)
+        second = process_chat_history([{"role": "user", "content": "how do I reset the password"}], enable_reasoning=True)
+
+        assert first["evaluations"]["cached"] is False
+        assert second["evaluations"]["cached"] is True
+        assert second["answer"] == "Use the reset link."
+        assert second["reasoning"] == "Docs say so."
+        assert second["summarised_query"] == "how do I reset the password"
+        assert calls == {"retrieve": 1, "generate": 1}
+
+        later_turn = process_chat_history([
+            {"role": "user", "content": "reset my password"},
+            {"role": "assistant", "content": "Use the reset link."},
+            {"role": "user", "content": "reset my password"},
+        ], enable_reasoning=True)
+        assert later_turn["evaluations"]["cached"] is False
+        assert calls == {"retrieve": 2, "generate": 2}
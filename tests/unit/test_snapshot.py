@@ -0,0 +1,120 @@
+import hashlib
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import httpx
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+import ai.retrieval.embeddings_helper as embeddings_helper
+from ai.retrieval.load.snapshot import (
+    create_snapshot,
+    export_snapshot,
+    load_export,
+    restore_snapshot,
+    verify_export,
+)
+
+SNAPSHOT_BYTES = b"qdrant snapshot bytes" * 100
+
+
+@pytest.fixture
+def source():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(120, 8)).astype(np.float32)
+    client = QdrantClient(":memory:")
+    client.create_collection("tweets", vectors_config=models.VectorParams(size=8, distance="Cosine"))
+    client.upsert("tweets", points=[
+        models.PointStruct(id=i, vector=v.tolist(), payload={"input": f"question {i}", "reply": f"answer {i}"})
+        for i, v in enumerate(vectors)
+    ])
+    return client
+
+
+def snapshot_client(points=120, checksum=None):
+    client = MagicMock()
+    client.count.return_value = models.CountResult(count=points)
+    client.get_collection.return_value = SimpleNamespace(
+        status=models.CollectionStatus.GREEN,
+        config=SimpleNamespace(params=SimpleNamespace(vectors=SimpleNamespace(size=8)))
+    )
+    client.create_snapshot.return_value = models.SnapshotDescription(
+        name="tweets-1.snapshot", creation_time=None, size=len(SNAPSHOT_BYTES), checksum=checksum
+    )
+    return client
+
+
+class TestExport:
+    def test_export_verify_and_load_round_trip(self, tmp_path, source):
+        path = str(tmp_path / "tweets")
+        manifest = export_snapshot(source, "tweets", path, scroll_limit=50)
+        assert manifest["points"] == manifest["source_points"] == 120
+        assert {"meta.json", "vectors.bin", "payloads.jsonl"} <= set(manifest["files"])
+        assert verify_export(path)["dim"] == 8
+
+        target = QdrantClient(":memory:")
+        load_export(target, path, collection_name="replica", batch_size=32)
+        assert target.count("replica", exact=True).count == 120
+        original = source.retrieve("tweets", ids=[7], with_vectors=True)[0]
+        restored = target.retrieve("replica", ids=[7], with_vectors=True)[0]
+        assert restored.payload == original.payload
+        np.testing.assert_allclose(restored.vector, original.vector, atol=1e-6)
+
+    def test_corrupted_or_truncated_files_fail_verification(self, tmp_path, source):
+        path = tmp_path / "tweets"
+        export_snapshot(source, "tweets", str(path))
+        data = bytearray((path / "vectors.bin").read_bytes())
+        data[10] ^= 0xFF
+        (path / "vectors.bin").write_bytes(bytes(data))
+        with pytest.raises(ValueError, match="vectors.bin checksum mismatch"):
+            verify_export(str(path))
+        (path / "payloads.jsonl").write_bytes(b"")
+        with pytest.raises(ValueError, match="payloads.jsonl has 0 bytes"):
+            verify_export(str(path))
+
+
+class TestSnapshot:
+    def test_create_downloads_and_writes_manifest(self, tmp_path):
+        http = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=SNAPSHOT_BYTES)))
+        checksum = hashlib.sha256(SNAPSHOT_BYTES).hexdigest()
+        manifest = create_snapshot(snapshot_client(checksum=checksum), "tweets", str(tmp_path), "http://qdrant:6333", http)
+        assert manifest["points"] == 120 and manifest["dim"] == 8 and manifest["sha256"] == checksum
+        assert (tmp_path / "tweets-1.snapshot").read_bytes() == SNAPSHOT_BYTES
+        assert json.loads((tmp_path / "tweets-1.snapshot.manifest.json").read_text()) == manifest
+
+        with pytest.raises(ValueError, match="checksum mismatch"):
+            create_snapshot(snapshot_client(checksum="0" * 64), "tweets", str(tmp_path), "http://qdrant:6333", http)
+
+    def test_restore_uploads_with_checksum_and_verifies_count(self, tmp_path):
+        http = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=SNAPSHOT_BYTES)))
+        create_snapshot(snapshot_client(), "tweets", str(tmp_path), "http://qdrant:6333", http)
+        uploads = []
+
+        def handler(request):
+            uploads.append(request)
+            return httpx.Response(200, json={"result": True})
+
+        upload_http = httpx.Client(transport=httpx.MockTransport(handler))
+        snapshot_path = str(tmp_path / "tweets-1.snapshot")
+        restore_snapshot(snapshot_client(), snapshot_path, "http://replica:6333", http=upload_http)
+        assert uploads[0].url.path == "/collections/tweets/snapshots/upload"
+        assert uploads[0].url.params["checksum"] == hashlib.sha256(SNAPSHOT_BYTES).hexdigest()
+
+        with pytest.raises(ValueError, match="has 119 points, expected 120"):
+            restore_snapshot(snapshot_client(points=119), snapshot_path, "http://replica:6333", http=upload_http)
+        (tmp_path / "tweets-1.snapshot").write_bytes(b"truncated")
+        with pytest.raises(ValueError, match="does not match its manifest"):
+            restore_snapshot(snapshot_client(), snapshot_path, "http://replica:6333", http=upload_http)
+
+    def test_initialize_qdrant_recovers_missing_collection(self):
+        client = MagicMock()
+        client.collection_exists.return_value = False
+        embeddings_helper.initialize_qdrant("tweets", 8, client=client, snapshot_location="http://store/tweets.snapshot",
+                                            snapshot_checksum="abc")
+        client.create_collection.assert_not_called()
+        kwargs = client.recover_snapshot.call_args.kwargs
+        assert kwargs["location"] == "http://store/tweets.snapshot" and kwargs["checksum"] == "abc"
+        assert kwargs["priority"] == models.SnapshotPriority.SNAPSHOT
@@ -0,0 +1,85 @@
+import threading
+
+import numpy as np
+import pytest
+
+from ai.conversational import orchestrator, speculative_retrieval
+
+LATER_TURN = [
+    {"role": "user", "content": "my order never arrived"},
+    {"role": "assistant", "content": "Sorry! What is the order number?"},
+    {"role": "user", "content": "it is 1234"}
+]
+
+
+def context(*documents):
+    return [{"document": document, "similarity_score": 1.0} for document in documents]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Stage stand-ins; summarisation waits until the speculative retrieval has started."""
+    calls = []
+    speculation_started = threading.Event()
+
+    def retrieve(query, top_k=5):
+        calls.append(query)
+        if query == "it is 1234":
+            speculation_started.set()
+            return context("raw hit", "shared hit"), 0.1, 0.1, 0.5, 0.5
+        return context("summary hit", "shared hit"), 0.2, 0.2, 0.9, 0.9
+
+    def summarise(chat_history):
+        speculation_started.wait(timeout=5)
+        return "order 1234 never arrived"
+
+    monkeypatch.setattr(speculative_retrieval, "speculative_retrieval_enabled", True)
+    monkeypatch.setattr(orchestrator, "summarise_query_from_chat_history", summarise)
+    monkeypatch.setattr(orchestrator, "retrieve_releveant_context", retrieve)
+    monkeypatch.setattr(orchestrator, "lookup_semantic_cache", lambda *args: (None, None))
+    monkeypatch.setattr(orchestrator, "generate_response", lambda **kwargs: {"answer": "a", "reasoning": "r"})
+    monkeypatch.setattr(orchestrator, "stream_generate_response",
+                        lambda **kwargs: iter([{"event": "done", "response": {"answer": "a", "reasoning": "r"}}]))
+    return calls
+
+
+class TestSpeculativeRetrieval:
+    def test_merge_fuses_rankings_and_prefers_primary_items(self):
+        primary = [{"document": "a", "similarity_score": 0.9}, {"document": "b", "similarity_score": 0.8}]
+        secondary = [{"document": "b", "similarity_score": 0.1}, {"document": "c", "similarity_score": 0.7}]
+        merged = speculative_retrieval.merge_relevant_context(primary, secondary, top_k=2)
+        assert [item["document"] for item in merged] == ["b", "a"]
+        assert merged[0]["similarity_score"] == 0.8
+        assert speculative_retrieval.query_similarity(np.array([[1.0, 0.0], [2.0, 0.0]])) == pytest.approx(1.0)
+
+    def test_close_queries_reuse_the_speculative_hits(self, pipeline, monkeypatch):
+        monkeypatch.setattr(orchestrator, "speculation_similarity", lambda raw, summarised: 0.95)
+        response = orchestrator.process_chat_history(LATER_TURN)
+        assert pipeline == ["it is 1234"]
+        assert response["relevant_documents"] == ["raw hit", "shared hit"]
+        evaluations = response["evaluations"]
+        assert evaluations["speculative_reused"] is True and evaluations["second_retrieval_ms"] is None
+        assert evaluations["mean_document_query_similarity"] == 0.5
+        for key in ("summarise_ms", "retrieval_ms", "speculative_retrieval_ms", "speculation_wait_ms"):
+            assert evaluations[key] >= 0
+        assert evaluations["critical_path_saved_ms"] is not None
+
+    def test_distant_queries_merge_with_a_second_retrieval(self, pipeline, monkeypatch):
+        monkeypatch.setattr(orchestrator, "speculation_similarity", lambda raw, summarised: 0.2)
+        events = list(orchestrator.stream_chat_history(LATER_TURN))
+        response = events[-1]["response"]
+        assert sorted(pipeline) == ["it is 1234", "order 1234 never arrived"]
+        assert response["relevant_documents"] == ["shared hit", "summary hit", "raw hit"]
+        evaluations = response["evaluations"]
+        assert evaluations["speculative_reused"] is False and evaluations["second_retrieval_ms"] >= 0
+        assert evaluations["speculation_similarity"] == 0.2 and evaluations["mean_document_query_similarity"] == 0.9
+
+    def test_no_speculation_when_disabled_or_on_the_first_turn(self, pipeline, monkeypatch):
+        monkeypatch.setattr(orchestrator, "summarise_query_from_chat_history", lambda chat_history: "order 1234")
+        response = orchestrator.process_chat_history([{"role": "user", "content": "order 1234"}])
+        assert pipeline == ["order 1234"] and "speculative_reused" not in response["evaluations"]
+        assert response["evaluations"]["retrieval_ms"] >= 0
+
+        monkeypatch.setattr(speculative_retrieval, "speculative_retrieval_enabled", False)
+        assert not speculative_retrieval.should_speculate(LATER_TURN)
+        assert orchestrator.start_speculative_retrieval(LATER_TURN) is None
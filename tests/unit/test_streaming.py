@@ -0,0 +1,178 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.api as api
+import backend.orchestrator as backend_orchestrator
+from ai.conversational import orchestrator as conversational_orchestrator
+from ai.generation import llm_usage
+from ai.generation import orchestrator as generation_orchestrator
+from ai.generation.query_response_generation import (
+    MessageAnswerStreamer,
+    StrippedTextStreamer,
+    ToolArgumentFieldStreamer,
+    handle_llm_response,
+)
+
+ANSWER = 'Reset it under "Settings".\nThen log in again 😀 – café'
+ARGUMENTS = json.dumps({"response": ANSWER, "reasoning": "The QnA covers password resets."})
+
+
+def pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def tool_call_deltas(arguments, size=3):
+    return [{"type": "tool_call", "index": 0, "name": "generate_response_and_reasoning" if i == 0 else None,
+             "delta": piece} for i, piece in enumerate(pieces(arguments, size))]
+
+
+class TestAnswerStreamers:
+    @pytest.mark.parametrize("size", [1, 2, 5, 1000])
+    @pytest.mark.parametrize("ensure_ascii", [True, False])
+    def test_response_field_is_decoded_incrementally(self, size, ensure_ascii):
+        arguments = json.dumps({"response": ANSWER, "reasoning": "r"}, ensure_ascii=ensure_ascii)
+        streamer = ToolArgumentFieldStreamer("response")
+        assert "".join(streamer.feed(piece) for piece in pieces(arguments, size)) == ANSWER
+        assert streamer.done
+
+    def test_only_the_top_level_field_is_streamed(self):
+        arguments = json.dumps({"reasoning": 'says "response": "no"', "meta": {"response": "nested"},
+                                "response": "yes"})
+        streamer = ToolArgumentFieldStreamer("response")
+        assert "".join(streamer.feed(piece) for piece in pieces(arguments, 4)) == "yes"
+        assert ToolArgumentFieldStreamer("response").feed('{"response": null}') == ""
+
+    @pytest.mark.parametrize("size", [1, 3, 100])
+    def test_message_stops_at_the_reasoning_section(self, size):
+        streamer = MessageAnswerStreamer()
+        content = "Please reset your password. Reasoning: the QnA says so."
+        text = "".join(streamer.feed(piece) for piece in pieces(content, size)) + streamer.flush()
+        assert text == "Please reset your password. "
+        streamer = MessageAnswerStreamer()
+        assert "".join(streamer.feed(p) for p in pieces("No sections here", size)) + streamer.flush() == "No sections here"
+
+    @pytest.mark.parametrize("size", [1, 3, 100])
+    @pytest.mark.parametrize("content", [
+        "Reset it. Explanation: see QnA. Reasoning: the QnA says so.",
+        "Reset it. Explanation: see QnA.",
+        "  Reset it.  \n",
+        "Reasoning: only reasoning",
+    ])
+    def test_streamed_message_matches_handle_llm_response(self, size, content):
+        message_streamer, answer_streamer = MessageAnswerStreamer(), StrippedTextStreamer()
+        text = "".join(answer_streamer.feed(message_streamer.feed(piece)) for piece in pieces(content, size))
+        text += answer_streamer.feed(message_streamer.flush())
+        answer, _ = handle_llm_response({"type": "message", "content": content})
+        assert text == answer_streamer.text == answer
+
+
+class TestStreamingGeneration:
+    def test_stream_response_from_llm_yields_deltas(self, monkeypatch):
+        def chunk(content=None, tool_calls=None):
+            return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+        created = {}
+
+        def create(**kwargs):
+            created.update(kwargs)
+            function = SimpleNamespace(name="generate_response_and_reasoning", arguments='{"resp')
+            return iter([chunk(content="Hi"), chunk(tool_calls=[SimpleNamespace(index=0, function=function)]),
+                         SimpleNamespace(choices=[])])
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        monkeypatch.setattr(llm_usage, "get_llm_client", lambda provider, api_key=None: client)
+        deltas = list(llm_usage.stream_response_from_llm("openai", prompt="p", model="gpt-4.1", tools=[{"x": 1}]))
+        assert created["stream"] is True and created["tools"] == [{"x": 1}]
+        assert deltas == [
+            {"type": "content", "delta": "Hi"},
+            {"type": "tool_call", "index": 0, "name": "generate_response_and_reasoning", "delta": '{"resp'}
+        ]
+
+    def test_tokens_arrive_before_the_completion_ends(self, monkeypatch):
+        consumed = []
+
+        def fake_stream(**kwargs):
+            for delta in tool_call_deltas(ARGUMENTS):
+                consumed.append(delta)
+                yield delta
+
+        monkeypatch.setattr(generation_orchestrator, "stream_response_from_llm", fake_stream)
+        events = generation_orchestrator.stream_generate_response([{"role": "user", "content": "q"}], ["doc"], "q")
+        first = next(events)
+        assert first["event"] == "token" and len(consumed) < len(tool_call_deltas(ARGUMENTS))
+        rest = list(events)
+        assert first["text"] + "".join(e["text"] for e in rest[:-1]) == ANSWER
+        assert rest[-1] == {"event": "done", "response": {
+            "answer": ANSWER, "reasoning": "The QnA covers password resets.",
+            "relevant_documents": ["doc"], "summarised_query": "q"
+        }}
+
+    @pytest.mark.parametrize("arguments", [
+        json.dumps({"response": "  Reset it.\n", "reasoning": "r"}),
+        json.dumps({"user_query": "q", "reasoning": "r"}),
+        '{"response": "Reset it, then',
+    ])
+    def test_done_answer_is_the_streamed_text(self, monkeypatch, arguments):
+        monkeypatch.setattr(generation_orchestrator, "stream_response_from_llm",
+                            lambda **kwargs: iter(tool_call_deltas(arguments)))
+        events = list(generation_orchestrator.stream_generate_response([{"role": "user", "content": "q"}], ["doc"], "q"))
+        streamed = "".join(e["text"] for e in events[:-1])
+        assert events[-1]["response"]["answer"] == streamed
+        assert streamed == streamed.strip()
+
+    def test_chat_stream_reports_time_to_first_token(self, monkeypatch):
+        monkeypatch.setattr(conversational_orchestrator, "summarise_query_from_chat_history", lambda chat_history: "q")
+        monkeypatch.setattr(conversational_orchestrator, "lookup_semantic_cache", lambda *args: (None, None))
+        monkeypatch.setattr(
+            conversational_orchestrator, "retrieve_releveant_context",
+            lambda query, top_k=5: ([{"document": "doc"}], 0.5, 0.5, 0.8, 0.8)
+        )
+        monkeypatch.setattr(generation_orchestrator, "stream_response_from_llm", lambda **kwargs: iter(tool_call_deltas(ARGUMENTS)))
+        events = list(conversational_orchestrator.stream_chat_history([{"role": "user", "content": "q"}], enable_reasoning=True))
+        response = events[-1]["response"]
+        assert "".join(e["text"] for e in events[:-1]) == response["answer"] == ANSWER
+        assert response["success"] is True and response["relevant_documents"] == ["doc"]
+        assert response["evaluations"]["mean_document_query_similarity"] == 0.8
+        assert 0 < response["evaluations"]["time_to_first_token_ms"] <= response["evaluations"]["generation_ms"] + 1000
+
+
+class TestStreamingEndpoint:
+    @pytest.fixture
+    def conversation(self, monkeypatch):
+        appended = []
+        monkeypatch.setattr(backend_orchestrator, "set_new_conversation_history",
+                            lambda user_query: (True, ("conv-1", [{"role": "user", "content": user_query}]), None))
+        monkeypatch.setattr(backend_orchestrator, "append_conversation_history",
+                            lambda conversation_id, new_chat: appended.append((conversation_id, new_chat)) or (True, {}, None))
+
+        def fake_core(chat_history, enable_reasoning=False, query_filter=None):
+            for piece in ("Reset ", "it."):
+                yield {"event": "token", "text": piece}
+            yield {"event": "done", "response": {
+                "answer": "Reset it.", "reasoning": "r", "relevant_documents": None,
+                "summarised_query": "q", "evaluations": {"time_to_first_token_ms": 1.0}, "success": True
+            }}
+
+        monkeypatch.setattr(backend_orchestrator, "stream_chat_history_core", fake_core)
+        return appended
+
+    def test_sse_events_and_persisted_turn(self, conversation):
+        with TestClient(api.app) as client:
+            response = client.post("/generate_response/stream", json={"user_query": "reset password"})
+        assert response.headers["content-type"].startswith("text/event-stream")
+        frames = [frame.split("\n") for frame in response.text.strip().split("\n\n")]
+        events = [(lines[0][len("event: "):], json.loads(lines[1][len("data: "):])) for lines in frames]
+        assert [name for name, _ in events] == ["start", "token", "token", "done"]
+        assert events[0][1] == {"conversation_id": "conv-1"}
+        assert events[-1][1]["answer"] == "Reset it." and events[-1][1]["conversation_id"] == "conv-1"
+        assert conversation == [("conv-1", [{
+            "role": "assistant", "content": "Reset it.", "summarized_query": "q", "reference_documents": None,
+            "evaluations": {"time_to_first_token_ms": 1.0}, "reasoning": "r"
+        }])]
+
+    def test_empty_query_is_rejected(self, conversation):
+        with TestClient(api.app) as client:
+            assert client.post("/generate_response/stream", json={"user_query": "  "}).status_code == 400
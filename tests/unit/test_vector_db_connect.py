@@ -45,4 +45,50 @@ class TestVectorDBConnect:
             assert client == 'mock_client'
             assert model == 'mock_model'
             mock_get_client.assert_called_once_with('test_collection', 'mock-model')
-            mock_get_model.assert_called_once_with('mock-model') 
\ No newline at end of file
+            mock_get_model.assert_called_once_with('mock-model') 
+
+class TestQdrantTransport:
+    def test_client_kwargs_follow_settings(self, monkeypatch):
+        monkeypatch.setattr(vdbc, "qdrant_prefer_grpc", True)
+        monkeypatch.setattr(vdbc, "qdrant_timeout", 7)
+        kwargs = vdbc.qdrant_client_kwargs(host="qdrant.internal")
+        assert kwargs["host"] == "qdrant.internal"
+        assert kwargs["prefer_grpc"] is True and kwargs["grpc_port"] == vdbc.qdrant_grpc_port
+        assert kwargs["timeout"] == 7
+        assert vdbc.qdrant_client_kwargs(prefer_grpc=False)["prefer_grpc"] is False
+
+    def test_grpc_options_keepalive_and_retries(self):
+        import json
+        options = vdbc.qdrant_grpc_options(retries=9, keepalive_seconds=20)
+        assert options["grpc.keepalive_time_ms"] == 20000
+        assert options["grpc.enable_retries"] == 1
+        policy = json.loads(options["grpc.service_config"])["methodConfig"][0]["retryPolicy"]
+        assert policy["maxAttempts"] == 5
+        assert policy["retryableStatusCodes"] == ["UNAVAILABLE"]
+        no_retries = vdbc.qdrant_grpc_options(retries=0)
+        assert no_retries["grpc.enable_retries"] == 0 and "grpc.service_config" not in no_retries
+
+    def test_create_qdrant_client_uses_the_transport_settings(self):
+        client = vdbc.create_qdrant_client(host="localhost", prefer_grpc=True)
+        try:
+            assert client._client._prefer_grpc is True
+        finally:
+            client.close()
+
+    def test_transient_search_failures_are_retried(self, monkeypatch):
+        import httpx
+        from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+        monkeypatch.setattr(vdbc.time, "sleep", lambda seconds: None)
+        search = MagicMock(side_effect=[ResponseHandlingException(httpx.ConnectError("refused")),
+                                        UnexpectedResponse(503, "Service Unavailable", b"", httpx.Headers()), ["hit"]])
+        assert vdbc.with_qdrant_retries(search, collection_name="tweets", retries=2) == ["hit"]
+        assert search.call_count == 3
+
+        failing = MagicMock(side_effect=httpx.ReadTimeout("slow"))
+        with pytest.raises(httpx.ReadTimeout):
+            vdbc.with_qdrant_retries(failing, retries=1)
+        assert failing.call_count == 2
+        bad_request = MagicMock(side_effect=UnexpectedResponse(400, "Bad Request", b"", httpx.Headers()))
+        with pytest.raises(UnexpectedResponse):
+            vdbc.with_qdrant_retries(bad_request, retries=3)
+        assert bad_request.call_count == 1